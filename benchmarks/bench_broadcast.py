@@ -0,0 +1,110 @@
+'''
+   bench_broadcast.py
+   Benchmark de las emisiones multicast (BROADCAST): compara la CPU del emisor enviando cada frame una
+   vez al grupo multicast con la de repartirlo por unicast a cada espectador (comprimido una vez, como
+   en las llamadas de grupo), y los reportes de perdidas por segundo que le llegan al emisor con el
+   intervalo escalado por espectadores frente a un intervalo fijo de REPORT_REFRESH.
+   Uso: python benchmarks/bench_broadcast.py [frames] [interfaz]
+   El video se envia por la interfaz indicada (127.0.0.1 por defecto) sin que nadie lo lea: solo se mide el emisor.
+   @author Alejandro Bravo, Miguel Gonzalez
+   @version 1.0
+   @date 18-10-2026
+'''
+
+import os
+import sys
+import time
+import random
+import socket
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from config import ConfigParser
+from video import VideoBuffer, PROTOCOLS
+from group import GroupCall, GroupMember, GROUP_EXCLUDED
+from broadcast import Broadcast
+
+VIEWERS = (1, 4, 16, 64) #Espectadores con los que se mide
+
+def synthetic_frames(width, height, count):
+    '''Frames sinteticos: degradado con una figura en movimiento y algo de ruido'''
+    base = np.zeros((height, width, 3), np.uint8)
+    base[:, :, 0] = np.linspace(0, 255, width, dtype=np.uint8)[None, :]
+    base[:, :, 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, None]
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(count):
+        frame = base.copy()
+        cv2.circle(frame, ((i * 7) % width, height // 2), height // 6, (255, 255, 255), -1)
+        frames.append(cv2.add(frame, rng.integers(0, 12, frame.shape, dtype=np.uint8)))
+    return frames
+
+def send_ms(buffer, sock, frames, destination):
+    '''Milisegundos de CPU por frame enviando a destination (None es a los miembros del grupo)'''
+    start = time.process_time()
+    for num, frame in enumerate(frames):
+        buffer.send_frame(sock, destination, frame, num, 75, "640x480", 30)
+    return (time.process_time() - start) * 1000 / len(frames)
+
+def unicast_ms(config, sock, frames, viewers, sink_port):
+    '''CPU por frame repartiendo por unicast a viewers espectadores'''
+    buffer = VideoBuffer(config)
+    group = GroupCall(config, None, None, buffer)
+    buffer.set_group(group)
+    common = [p for p in PROTOCOLS if p not in GROUP_EXCLUDED]
+    group.set_members([GroupMember(group, "v" + str(i), "127.0.0.1", sink_port, common) for i in range(viewers)])
+    group.configure()
+    return send_ms(buffer, sock, frames, None)
+
+def reports_per_second(interval_of, viewers, seconds=60):
+    '''Maximo de reportes que llegan al emisor en un segundo, con cada espectador reportando tras intervalos aleatorios'''
+    arrivals = []
+    for _ in range(viewers):
+        t = random.uniform(0, interval_of(viewers))
+        while t < seconds:
+            arrivals.append(t)
+            t += interval_of(viewers) * random.uniform(0.5, 1.5)
+    counts = np.bincount(np.array(arrivals, dtype=int), minlength=seconds)
+    return len(arrivals) / seconds, counts.max()
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    interface = sys.argv[2] if len(sys.argv) > 2 else "127.0.0.1"
+    random.seed(0)
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    config = ConfigParser()
+    config.ENCODE_WORKERS = 0
+    config.BROADCAST_INTERFACE = interface
+    sys.stdout.close()
+    sys.stdout = stdout
+
+    frames = synthetic_frames(640, 480, count)
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    #Emision: un solo envio por frame al grupo, con las extensiones de la emision
+    buffer = VideoBuffer(config)
+    control = type("Control", (), {"get_connected_username": lambda self: None})()
+    broadcast = Broadcast(config, None, control, buffer)
+    if broadcast.start(sock) == -1:
+        sys.exit(1)
+    send_ms(buffer, sock, frames[:5], broadcast.address) #Calentamiento
+    multicast = send_ms(buffer, sock, frames, broadcast.address)
+
+    print("%d frames 640x480, CPU del emisor por frame" % count)
+    print("%12s %14s %14s" % ("espectadores", "unicast ms", "multicast ms"))
+    for viewers in VIEWERS:
+        print("%12d %14.2f %14.2f" % (viewers, unicast_ms(config, sock, frames, viewers, sink.getsockname()[1]), multicast))
+
+    print("\nReportes de perdidas que recibe el emisor (REPORT_REFRESH %s s, BROADCAST_REPORT_RATE %s/s)" %
+          (config.REPORT_REFRESH, config.BROADCAST_REPORT_RATE))
+    print("%12s %20s %22s" % ("espectadores", "fijo medio/max", "escalado medio/max"))
+    for viewers in VIEWERS + (256,):
+        fixed = reports_per_second(lambda n: config.REPORT_REFRESH, viewers)
+        scaled = reports_per_second(broadcast.report_interval, viewers)
+        print("%12d %13.1f / %4d %15.1f / %4d" % (viewers, fixed[0], fixed[1], scaled[0], scaled[1]))
@@ -0,0 +1,73 @@
+'''
+   bench_codecs.py
+   Benchmark de los codecs y opciones de compresion: para cada codec y ajuste mide el tiempo de
+   compresion, el de descompresion (entera y a 1/2 si el codec lo admite), los bytes por frame
+   y la calidad (PSNR) sobre un conjunto fijo de clips.
+   Uso: python benchmarks/bench_codecs.py [calidad] [frames por clip]
+   Los clips son los de bench_tiles (cara, pantalla, camara en movimiento) a 640x480 y la
+   cara reescalada a 1280x720, donde mas se nota la descompresion reducida.
+   @author Alejandro Bravo, Miguel Gonzalez
+   @version 1.0
+   @date 18-10-2026
+'''
+
+import os
+import sys
+import time
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from codec import OpenCVJpegCodec, TurboJpegCodec, WebPCodec, TurboJPEG
+from bench_tiles import talking_head_clip, screen_clip, panning_clip
+
+def settings():
+    '''Lista de (nombre, codec, admite descompresion reducida) que se comparan'''
+    result = [("opencv 420", OpenCVJpegCodec("420"), True),
+              ("opencv 422", OpenCVJpegCodec("422"), True),
+              ("opencv 444", OpenCVJpegCodec("444"), True),
+              ("opencv opt", OpenCVJpegCodec("420", optimize=True), True),
+              ("opencv rst8", OpenCVJpegCodec("420", restart=8), True)]
+    if TurboJPEG is not None:
+        result += [("turbo 420", TurboJpegCodec("420"), True),
+                   ("turbo 444", TurboJpegCodec("444"), True)]
+    result.append(("webp", WebPCodec(), False))
+    return result
+
+def run(codec, clip, quality, scaled):
+    '''Devuelve (ms de compresion, ms de descompresion, ms de descompresion a 1/2, bytes, PSNR) por frame'''
+    start = time.perf_counter()
+    encimgs = [codec.encode(frame, quality) for frame in clip]
+    encode_ms = (time.perf_counter() - start) * 1000 / len(clip)
+
+    start = time.perf_counter()
+    decimgs = [codec.decode(encimg) for encimg in encimgs]
+    decode_ms = (time.perf_counter() - start) * 1000 / len(clip)
+
+    half_ms = float("nan")
+    if scaled:
+        start = time.perf_counter()
+        for encimg in encimgs:
+            codec.decode(encimg, 2)
+        half_ms = (time.perf_counter() - start) * 1000 / len(clip)
+
+    size = sum(len(encimg) for encimg in encimgs) / len(clip)
+    psnr = sum(cv2.PSNR(frame, decimg) for frame, decimg in zip(clip[::5], decimgs[::5])) / len(clip[::5])
+    return encode_ms, decode_ms, half_ms, size, psnr
+
+if __name__ == '__main__':
+    quality = int(sys.argv[1]) if len(sys.argv) > 1 else 75
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+
+    head = talking_head_clip(frames)
+    clips = [("cara 640x480", head), ("pantalla 640x480", screen_clip(frames)),
+             ("movimiento 640x480", panning_clip(frames)),
+             ("cara 1280x720", [cv2.resize(frame, (1280, 720), interpolation=cv2.INTER_LINEAR) for frame in head])]
+    if TurboJPEG is None:
+        print("PyTurboJPEG no esta instalado: no se mide libjpeg-turbo.")
+    print("Calidad %d, %d frames por clip" % (quality, frames))
+    for name, clip in clips:
+        print(name + ":")
+        print("  %-12s %8s %8s %8s %8s %7s" % ("codec", "comp ms", "desc ms", "1/2 ms", "bytes", "PSNR"))
+        for label, codec, scaled in settings():
+            encode_ms, decode_ms, half_ms, size, psnr = run(codec, clip, quality, scaled)
+            print("  %-12s %8.2f %8.2f %8.2f %8.0f %7.2f" % (label, encode_ms, decode_ms, half_ms, size, psnr))
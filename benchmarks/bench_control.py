@@ -0,0 +1,176 @@
+'''
+   bench_control.py
+   Benchmark de la conexion de control: compara Control (hilos y semaforo) con AsyncControl (asyncio).
+   Mide la latencia de establecimiento de llamada entre dos clientes en local, la misma latencia cuando
+   hay conexiones abiertas que no envian nada, el tiempo en responder a muchos llamantes a la vez
+   mientras hay una llamada en curso y la CPU consumida en reposo, con y sin llamada.
+   Uso: python benchmarks/bench_control.py [llamadas] [segundos de reposo]
+   El servidor de descubrimiento, la interfaz y el modulo de video se sustituyen por objetos
+   minimos que responden al instante y aceptan todas las llamadas.
+   @author Alejandro Bravo, Miguel Gonzalez
+   @version 1.0
+   @date 18-10-2026
+'''
+
+import os
+import sys
+import json
+import time
+import socket
+import tempfile
+import threading
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from control import Control
+from control_async import AsyncControl
+
+STALLED = 3 #Conexiones abiertas que no envian nada
+CALLERS = 20 #Llamantes simultaneos mientras hay una llamada en curso
+
+class FakeDiscovery():
+    '''Descubrimiento en memoria'''
+    def __init__(self):
+        self.users = {}
+    def query_user(self, nickname):
+        return self.users.get(nickname)
+    def invalidate_user(self, nickname):
+        pass
+
+class FakeGui():
+    '''Interfaz que coge todas las llamadas'''
+    def yesNoBox(self, title, message):
+        return True
+    def infoBox(self, title, message):
+        pass
+
+class NullVideo():
+    '''Modulo de video que ignora todo'''
+    def set_peer_protocols(self, protocols):
+        pass
+
+def free_port():
+    '''Puerto TCP libre en local'''
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_client(backend, name, discovery, directory):
+    '''Crea un cliente de control con sus hilos, como VideoClient.register'''
+    port, video_port = free_port(), free_port()
+    user_filename = os.path.join(directory, name + ".json")
+    with open(user_filename, "w") as file:
+        json.dump({"username": name, "udp_port": str(video_port)}, file)
+    discovery.users[name] = ["127.0.0.1", str(port), ["V0", "V1"]]
+    ctl = backend(discovery, 15, user_filename, NullVideo())
+    if backend is Control:
+        #La barrera y el cerrojo de Control son atributos de clase: cada cliente del proceso necesita los suyos
+        ctl.connection_barrier = threading.Semaphore(0)
+        ctl.global_lock = threading.Lock()
+    gui = FakeGui()
+    threads = [threading.Thread(target=ctl.control_listen_loop, args=(str(port), gui)),
+               threading.Thread(target=ctl.control_incoming_loop, args=(gui,))]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    return ctl, threads, port
+
+def stop_client(ctl, threads):
+    '''Para los hilos de un cliente, como VideoClient.async_cleaning'''
+    ctl.control_listen_stop()
+    threads[0].join()
+    ctl.control_incoming_stop()
+    threads[1].join()
+
+def wait_idle(*clients):
+    '''Espera a que ningun cliente este conectado'''
+    deadline = time.time() + 5
+    while any(c.get_connected_username() is not None for c in clients) and time.time() < deadline:
+        time.sleep(0.001)
+
+def hang_up(caller, callee):
+    '''Cuelga como el boton de colgar del cliente'''
+    caller.end_call()
+    caller.control_disconnect()
+    wait_idle(caller, callee)
+
+def setup_latency(caller, callee, calls):
+    '''Milisegundos de cada connect_to hasta CALL_ACCEPTED'''
+    result = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        ret = caller.connect_to("b")
+        result.append((time.perf_counter() - start) * 1000)
+        if ret is None or ret < 0:
+            print("  llamada fallida: " + str(ret))
+        hang_up(caller, callee)
+    return np.array(result)
+
+def stalled_latency(caller, callee, port):
+    '''Milisegundos de una llamada con STALLED conexiones abiertas por delante que no envian nada'''
+    stalled = [socket.create_connection(("127.0.0.1", port)) for _ in range(STALLED)]
+    time.sleep(0.05)
+    start = time.perf_counter()
+    caller.connect_to("b")
+    elapsed = (time.perf_counter() - start) * 1000
+    hang_up(caller, callee)
+    for s in stalled:
+        s.close()
+    return elapsed
+
+def busy_callers(caller, callee, port):
+    '''Milisegundos hasta que CALLERS llamantes simultaneos reciben respuesta con una llamada en curso'''
+    caller.connect_to("b")
+    start = time.perf_counter()
+    sockets = []
+    for _ in range(CALLERS):
+        s = socket.create_connection(("127.0.0.1", port))
+        s.sendall(b"CALLING x 1")
+        sockets.append(s)
+    answered = sum(1 for s in sockets if s.recv(1024).startswith(b"CALL_BUSY"))
+    elapsed = (time.perf_counter() - start) * 1000
+    for s in sockets:
+        s.close()
+    hang_up(caller, callee)
+    return elapsed, answered
+
+def idle_cpu(seconds):
+    '''Milisegundos de CPU del proceso por segundo de reposo'''
+    start = time.process_time()
+    time.sleep(seconds)
+    return (time.process_time() - start) * 1000 / seconds
+
+if __name__ == '__main__':
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    idle = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    #Los clientes imprimen cada paso: lo tiramos para que solo se vean los resultados
+    stdout = sys.stdout
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for label, backend in (("hilos", Control), ("asyncio", AsyncControl)):
+            discovery = FakeDiscovery()
+            sys.stdout = open(os.devnull, "w")
+            base_threads = threading.active_count()
+            a, threads_a, _ = start_client(backend, "a", discovery, directory)
+            b, threads_b, port_b = start_client(backend, "b", discovery, directory)
+            threads = threading.active_count() - base_threads
+            cpu_idle = idle_cpu(idle)
+            latency = setup_latency(a, b, calls)
+            stalled = stalled_latency(a, b, port_b)
+            busy, answered = busy_callers(a, b, port_b)
+            a.connect_to("b")
+            cpu_call = idle_cpu(idle)
+            hang_up(a, b)
+            stop_client(a, threads_a)
+            stop_client(b, threads_b)
+            sys.stdout.close()
+            sys.stdout = stdout
+            results[label] = (latency, stalled, busy, answered, cpu_idle, cpu_call, threads)
+
+    print("%d llamadas entre dos clientes en local, %d conexiones mudas, %d llamantes a la vez" % (calls, STALLED, CALLERS))
+    print("%-8s %9s %9s %11s %13s %10s %10s %6s" % ("control", "media ms", "p95 ms", "mudas ms", "llamantes ms",
+                                                  "CPU ms/s", "llam ms/s", "hilos"))
+    for label, (latency, stalled, busy, answered, cpu_idle, cpu_call, threads) in results.items():
+        print("%-8s %9.2f %9.2f %11.1f %8.1f (%d) %10.2f %10.2f %6d" % (label, latency.mean(), np.percentile(latency, 95),
+              stalled, busy, answered, cpu_idle, cpu_call, threads))
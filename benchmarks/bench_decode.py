@@ -0,0 +1,65 @@
+'''
+   bench_decode.py
+   Benchmark de la descompresion en paralelo del video entrante: mide los FPS maximos
+   que puede sostener la reproduccion con 1 a N hilos de DecodePool, a 640x480 y 1280x720.
+   Uso: python benchmarks/bench_decode.py [max_hilos] [frames]
+   @author Alejandro Bravo, Miguel Gonzalez
+   @version 1.0
+   @date 18-10-2026
+'''
+
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline import DecodePool
+from video import decode
+
+def synthetic_clip(width, height, count, quality=75):
+    '''Genera un clip sintetico (degradado con figuras en movimiento y algo de ruido) ya comprimido en JPEG'''
+    base = np.zeros((height, width, 3), np.uint8)
+    base[:, :, 0] = np.linspace(0, 255, width, dtype=np.uint8)[None, :]
+    base[:, :, 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, None]
+    rng = np.random.default_rng(0)
+    clip = []
+    for i in range(count):
+        frame = base.copy()
+        cv2.circle(frame, ((i * 7) % width, height // 2), height // 6, (255, 255, 255), -1)
+        cv2.rectangle(frame, (width // 4, (i * 5) % height), (width // 2, (i * 5) % height + height // 8), (0, 0, 200), -1)
+        frame = cv2.add(frame, rng.integers(0, 12, frame.shape, dtype=np.uint8))
+        _, encimg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        clip.append(encimg.tobytes())
+    return clip
+
+def sustained_fps(clip, workers, frames):
+    '''Reproduce frames del clip en orden como pop_frame y devuelve los frames por segundo conseguidos'''
+    if workers == 0:
+        start = time.perf_counter()
+        for i in range(frames):
+            decode(clip[i % len(clip)])
+        return frames / (time.perf_counter() - start)
+
+    pool = DecodePool(workers, lambda header, content: decode(content))
+    start = time.perf_counter()
+    for i in range(frames):
+        pool.take(i, None, clip[i % len(clip)])
+        ahead = [(j, None, clip[j % len(clip)]) for j in range(i + 1, i + 2 + workers)]
+        pool.prefetch(ahead)
+    elapsed = time.perf_counter() - start
+    pool.stop()
+    return frames / elapsed
+
+if __name__ == '__main__':
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else (os.cpu_count() or 4)
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+
+    for width, height in ((640, 480), (1280, 720)):
+        clip = synthetic_clip(width, height, 30)
+        size = sum(len(c) for c in clip) // len(clip)
+        print("%dx%d (%d bytes/frame de media):" % (width, height, size))
+        print("  sin pool: %7.1f fps" % sustained_fps(clip, 0, frames))
+        for workers in range(1, max_workers + 1):
+            print("  %2d hilos: %7.1f fps" % (workers, sustained_fps(clip, workers, frames)))
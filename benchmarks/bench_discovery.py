@@ -0,0 +1,142 @@
+'''
+   bench_discovery.py
+   Benchmark del listado de usuarios: compara la recepcion anterior de LIST_USERS (recv de 1024 bytes,
+   volviendo a decodificar y partir toda la respuesta en cada uno) con UsersListParser, y mide lo que
+   tardan las busquedas de UserDirectory por prefijo y por subcadena.
+   Uso: python benchmarks/bench_discovery.py [usuarios...]
+   El servidor de descubrimiento se sustituye por uno local que responde al instante con usuarios
+   inventados, algunos con '#' en el nick.
+   @author Alejandro Bravo, Miguel Gonzalez
+   @version 1.0
+   @date 18-10-2026
+'''
+
+import os
+import sys
+import time
+import random
+import socket
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from discovery import Discovery, UserDirectory
+
+SYLLABLES = ["ma", "ri", "lu", "pe", "jo", "an", "to", "ne", "ka", "si", "ro", "al", "ex", "mi", "gu", "el"]
+SEARCHES = 200 #Busquedas que se miden de cada tipo
+
+class ListServer():
+    '''Servidor de descubrimiento que solo responde a LIST_USERS y QUIT'''
+
+    def __init__(self):
+        self.reply = b""
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    def set_users(self, users):
+        body = "".join("%s %s %s %s#" % tuple(user) for user in users)
+        self.reply = ("OK USERS_LIST %d %s" % (len(users), body)).encode()
+
+    def accept_loop(self):
+        while True:
+            conn, _ = self.sock.accept()
+            threading.Thread(target=self.serve, args=(conn,), daemon=True).start()
+
+    def serve(self, conn):
+        while True:
+            data = conn.recv(1024)
+            if not data or data.startswith(b"QUIT"):
+                if data:
+                    conn.sendall(b"BYE")
+                conn.close()
+                return
+            conn.sendall(self.reply)
+
+def make_users(count):
+    '''Lista de count usuarios [nick ip port ts] con nicks distintos'''
+    rng = random.Random(count)
+    users, nicks = [], set()
+    while len(users) < count:
+        nick = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 5))) + str(rng.randint(0, 99))
+        if rng.random() < 0.01:
+            nick = nick + "#ja#ja"
+        if nick in nicks:
+            continue
+        nicks.add(nick)
+        users.append([nick, "10.0.%d.%d" % (len(users) // 256 % 256, len(users) % 256), str(8000 + len(users) % 1000), "1.0"])
+    return users
+
+def old_list_users(port):
+    '''Reproduccion de la recepcion anterior de LIST_USERS. Devuelve el numero de usuarios'''
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.sendall(b"LIST_USERS")
+    result = bytes()
+    while True:
+        result += sock.recv(1024)
+        words = result.decode(errors="ignore").split()
+        if len(words) >= 3 and int(words[2]) <= len([1 for e in words[3:] if '#' in e]):
+            break
+    sock.close()
+    words = result.decode().split()
+    return len(" ".join(words[3:]).split("#")[:-1])
+
+def new_list_users(discovery):
+    '''Listado con UsersListParser. Devuelve (usuarios, segundos hasta el primer usuario)'''
+    first = []
+    start = time.perf_counter()
+    def on_user(usuario):
+        if not first:
+            first.append(time.perf_counter() - start)
+    users = discovery.list_users(on_user)
+    return len(users), first[0] if first else float("nan")
+
+def timed(function, *args):
+    '''Devuelve (resultado, milisegundos)'''
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+def search_ms(directory, queries):
+    '''Milisegundos medios por busqueda'''
+    start = time.perf_counter()
+    for query in queries:
+        directory.search(query)
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+if __name__ == '__main__':
+    counts = [int(a) for a in sys.argv[1:]] or [1000, 5000, 20000]
+    server = ListServer()
+
+    #Discovery imprime cada usuario: lo tiramos para que solo se vean los resultados
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    discovery = Discovery("127.0.0.1", server.port)
+    sys.stdout = stdout
+
+    print("%8s %11s %11s %12s %9s %10s %12s %12s" % ("usuarios", "bytes", "antes ms", "ahora ms", "1er ms",
+                                                     "indice ms", "prefijo ms", "subcad. ms"))
+    for count in counts:
+        users = make_users(count)
+        server.set_users(users)
+        rng = random.Random(0)
+        nicks = [rng.choice(users)[0] for _ in range(SEARCHES)]
+
+        old_count, old_ms = timed(old_list_users, server.port)
+        sys.stdout = open(os.devnull, "w")
+        (new_count, first), new_ms = timed(new_list_users, discovery)
+        sys.stdout.close()
+        sys.stdout = stdout
+        if old_count < count or new_count != count:
+            print("  usuarios recibidos: antes %d, ahora %d" % (old_count, new_count))
+
+        directory = UserDirectory()
+        _, index_ms = timed(lambda: [directory.add(user) for user in users])
+        prefix = search_ms(directory, [nick[:2] for nick in nicks])
+        substring = search_ms(directory, [nick[1:4] for nick in nicks])
+        print("%8d %11d %11.1f %12.1f %9.2f %10.1f %12.3f %12.3f" % (count, len(server.reply), old_ms, new_ms, first * 1000,
+                                                                    index_ms, prefix, substring))
+
+    sys.stdout = open(os.devnull, "w")
+    discovery.server_quit()
@@ -0,0 +1,100 @@
+'''
+   bench_group.py
+   Benchmark de las llamadas de grupo: compara la CPU del envio comprimiendo cada frame una vez y
+   repartiendolo entre N participantes (GroupCall.send_datagrams) con la de comprimirlo una vez por
+   participante, como harian N llamadas normales, y la de descomprimir el video de N participantes
+   entero o reducido al ancho de su celda en la rejilla.
+   Uso: python benchmarks/bench_group.py [frames] [max_participantes]
+   Los participantes son destinos UDP en local que no leen nada: solo se mide el emisor.
+   @author Alejandro Bravo, Miguel Gonzalez
+   @version 1.0
+   @date 18-10-2026
+'''
+
+import os
+import sys
+import time
+import socket
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from config import ConfigParser
+from video import VideoBuffer, PROTOCOLS, decode
+from codec import decode_scale
+from group import GroupCall, GroupMember, GridCompositor, GROUP_EXCLUDED
+
+def synthetic_frames(width, height, count):
+    '''Frames sinteticos: degradado con una figura en movimiento y algo de ruido'''
+    base = np.zeros((height, width, 3), np.uint8)
+    base[:, :, 0] = np.linspace(0, 255, width, dtype=np.uint8)[None, :]
+    base[:, :, 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, None]
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(count):
+        frame = base.copy()
+        cv2.circle(frame, ((i * 7) % width, height // 2), height // 6, (255, 255, 255), -1)
+        frames.append(cv2.add(frame, rng.integers(0, 12, frame.shape, dtype=np.uint8)))
+    return frames
+
+def make_group(config, peers, sink_port):
+    '''Llamada de grupo con peers participantes que apuntan todos al mismo puerto local'''
+    buffer = VideoBuffer(config)
+    group = GroupCall(config, None, None, buffer)
+    buffer.set_group(group)
+    common = [p for p in PROTOCOLS if p not in GROUP_EXCLUDED]
+    members = [GroupMember(group, "p" + str(i), "127.0.0.1", sink_port, common) for i in range(peers)]
+    group.set_members(members)
+    group.configure()
+    return group, buffer
+
+def send_ms(buffer, sock, frames, destinations):
+    '''Milisegundos de CPU por frame enviando a destinations: None es el grupo (una compresion), si no una por destino'''
+    start = time.process_time()
+    for num, frame in enumerate(frames):
+        for destination in destinations:
+            buffer.send_frame(sock, destination, frame, num, 75, "640x480", 30)
+    return (time.process_time() - start) * 1000 / len(frames)
+
+def decode_ms(clip, streams, scale, compositor):
+    '''Milisegundos de CPU por tick de reproduccion descomprimiendo y componiendo un frame de cada flujo'''
+    members = [type("Member", (), {"nick": "p" + str(i), "frame": None})() for i in range(streams)]
+    start = time.process_time()
+    for encimg in clip:
+        for member in members:
+            member.frame = decode(encimg, None, scale)
+        compositor.compose(members)
+    return (time.process_time() - start) * 1000 / len(clip)
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    max_peers = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    config = ConfigParser()
+    config.ENCODE_WORKERS = 0
+    config.DECODE_WORKERS = 0
+    sys.stdout.close()
+    sys.stdout = stdout
+
+    frames = synthetic_frames(640, 480, count)
+    clip = [cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 75])[1].tobytes() for frame in frames]
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    print("%d frames 640x480 por participante, CPU por frame" % count)
+    print("%6s %14s %16s %9s %14s %16s" % ("otros", "una vez ms", "una por dest ms", "ahorro", "desc. entera ms",
+                                          "desc. celda ms"))
+    for peers in range(1, max_peers + 1):
+        group, buffer = make_group(config, peers, sink.getsockname()[1])
+        send_ms(buffer, sock, frames[:5], [None]) #Calentamiento
+        once = send_ms(buffer, sock, frames, [None])
+        each = send_ms(buffer, sock, frames, [member.address for member in group.members.values()])
+        compositor = GridCompositor(640, 480)
+        cell = compositor.cell_size(peers)[0]
+        full = decode_ms(clip, peers, 1, compositor)
+        scaled = decode_ms(clip, peers, decode_scale(640, cell), compositor)
+        print("%6d %14.2f %16.2f %8.1fx %14.2f %16.2f" % (peers, once, each, each / once, full, scaled))
@@ -0,0 +1,134 @@
+'''
+   bench_jitter.py
+   Microbenchmark del buffer de reproduccion: compara el heap con cerrojo que usaba
+   VideoBuffer con el buffer en anillo sin cerrojos de jitter.py.
+   Uso: python benchmarks/bench_jitter.py [segundos_por_prueba]
+   @author Alejandro Bravo, Miguel Gonzalez
+   @version 1.0
+   @date 18-10-2026
+'''
+
+import os
+import sys
+import time
+import heapq
+import random
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from jitter import RingBuffer
+
+CAPACITY = 256 #Tamano del buffer (BUFFER_SIZE por defecto)
+REPORT_EVERY = 30 #Cada cuantos frames reproducidos se simula el envio de un reporte de perdidas por TCP
+REPORT_SEND_TIME = 0.002 #Segundos que se simula que tarda el send del reporte
+LOSS = 0.02 #Fraccion de frames perdidos
+REORDER = 0.1 #Fraccion de frames que llegan intercambiados con el siguiente
+
+class HeapBuffer():
+    '''Reproduccion del buffer anterior: heap protegido por un cerrojo que se mantiene durante todo pop_frame'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.heap = []
+        self.last = -1
+
+    def push(self, num):
+        with self.lock:
+            if self.last < num and len(self.heap) < CAPACITY:
+                heapq.heappush(self.heap, (num, None, None))
+
+    def pop(self, report):
+        with self.lock:
+            if not self.heap:
+                return None
+            if report:
+                time.sleep(REPORT_SEND_TIME)
+            self.last = self.heap[0][0]
+            if len(self.heap) == 1:
+                return self.heap[0]
+            return heapq.heappop(self.heap)
+
+class RingAdapter():
+    '''Mismo interfaz sobre el anillo. El reporte se envia sin cerrojo, como hace ahora pop_frame'''
+
+    def __init__(self):
+        self.ring = RingBuffer(CAPACITY)
+
+    def push(self, num):
+        self.ring.push(num, None, None)
+
+    def pop(self, report):
+        if report:
+            time.sleep(REPORT_SEND_TIME)
+        if len(self.ring) == 1:
+            return self.ring.peek()
+        return self.ring.pop()
+
+def arrival_order(count):
+    '''Numeros de orden en el orden en que llegan, con perdidas y desorden'''
+    order = [n for n in range(count) if random.random() > LOSS]
+    for i in range(len(order) - 1):
+        if random.random() < REORDER:
+            order[i], order[i + 1] = order[i + 1], order[i]
+    return order
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def run_threaded(buffer, fps, seconds):
+    '''Productor y consumidor reales a ritmo de fps. Devuelve las latencias de insercion del productor'''
+    order = arrival_order(int(fps * seconds))
+    latencies = []
+    done = threading.Event()
+
+    def producer():
+        period = 1 / fps
+        for num in order:
+            start = time.perf_counter()
+            buffer.push(num)
+            latencies.append(time.perf_counter() - start)
+            time.sleep(period)
+        done.set()
+
+    def consumer():
+        period = 1 / fps
+        popped = 0
+        while not done.is_set():
+            popped += 1
+            buffer.pop(popped % REPORT_EVERY == 0)
+            time.sleep(period)
+
+    threads = [threading.Thread(target=producer), threading.Thread(target=consumer)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies
+
+def run_ops(buffer, count):
+    '''Coste puro de insercion + extraccion sin hilos. Devuelve microsegundos por frame'''
+    order = arrival_order(count)
+    start = time.perf_counter()
+    for i, num in enumerate(order):
+        buffer.push(num)
+        if i >= 10:
+            buffer.pop(False)
+    return (time.perf_counter() - start) / len(order) * 1e6
+
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    random.seed(0)
+
+    print("Coste por frame sin hilos (insercion + extraccion):")
+    for name, cls in (("heap", HeapBuffer), ("anillo", RingAdapter)):
+        print("  %-7s %.2f us" % (name, run_ops(cls(), 200000)))
+
+    print("Latencia de insercion del hilo de recepcion (%.1f s por prueba, reporte de %d ms cada %d frames):"
+          % (seconds, REPORT_SEND_TIME * 1000, REPORT_EVERY))
+    print("  %-7s %5s %10s %10s %10s" % ("buffer", "fps", "p50 (us)", "p99 (us)", "max (us)"))
+    for fps in (30, 60, 120):
+        for name, cls in (("heap", HeapBuffer), ("anillo", RingAdapter)):
+            lat = run_threaded(cls(), fps, seconds)
+            print("  %-7s %5d %10.1f %10.1f %10.1f" % (name, fps, percentile(lat, 0.5) * 1e6,
+                                                    percentile(lat, 0.99) * 1e6, max(lat) * 1e6))
@@ -0,0 +1,92 @@
+'''
+   bench_quality.py
+   Benchmark de la eleccion de calidad por presupuesto de bytes: compara comprimir con calidad fija
+   (como el QoS por escalones) con elegir la calidad de cada frame con el modelo en linea de
+   QualitySelector. Mide los bytes por frame (media, percentil 95 y maximo), los frames que se pasan
+   del presupuesto, las compresiones por frame, el tiempo y la calidad (PSNR). Los frames que el modelo
+   salta cuentan como 0 bytes.
+   Uso: python benchmarks/bench_quality.py [kbps] [fps]
+   El clip encadena escenas de bench_tiles (cara, pantalla, camara en movimiento) para que el
+   modelo tenga que seguir cambios de escena bruscos.
+   @author Alejandro Bravo, Miguel Gonzalez
+   @version 1.0
+   @date 18-10-2026
+'''
+
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from config import ConfigParser
+from video import VideoBuffer, compress, decode
+from bench_tiles import talking_head_clip, screen_clip, panning_clip
+
+SCENE_FRAMES = 90 #Frames de cada escena
+
+def run_fixed(clip, quality):
+    '''Calidad fija. Devuelve (lista de bytes por frame, compresiones, ms por frame, PSNR medio)'''
+    sizes, psnr = [], 0.0
+    start = time.perf_counter()
+    for frame in clip:
+        encimg = compress(frame, quality)
+        sizes.append(len(encimg))
+    elapsed = time.perf_counter() - start
+    for frame in clip[::10]:
+        psnr += cv2.PSNR(frame, decode(compress(frame, quality)))
+    return sizes, len(clip), elapsed * 1000 / len(clip), psnr / len(clip[::10])
+
+def run_budget(clip, budget, fps):
+    '''Calidad elegida por el modelo, como enviaVideo y VideoBuffer.encode_frame con MAX_KBPS: si ni con la
+    calidad minima cabe se baja la resolucion, y si aun asi se acumula exceso se saltan frames (0 bytes)'''
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    config = ConfigParser()
+    sys.stdout.close()
+    sys.stdout = stdout
+    config.MAX_KBPS = budget * 8 * fps / 1000
+    buffer_video = VideoBuffer(config)
+    selector = buffer_video.quality_selector
+    sizes, encimgs, reduced = [], [], 0
+    start = time.perf_counter()
+    for frame in clip:
+        if buffer_video.skip_frame(fps):
+            sizes.append(0)
+            encimgs.append(None)
+            continue
+        image, resolution = buffer_video.fit_resolution(frame, budget, "640x480")
+        reduced += image is not frame
+        encimg = buffer_video.compress_to_budget(image, budget)
+        sizes.append(len(encimg))
+        encimgs.append(encimg)
+    elapsed = time.perf_counter() - start
+    #El PSNR se mide sobre los frames enviados, ampliados a 640x480 como en la pantalla del receptor
+    sent = [(frame, encimg) for frame, encimg in zip(clip[::10], encimgs[::10]) if encimg is not None]
+    psnr = sum(cv2.PSNR(frame, cv2.resize(decode(encimg), (frame.shape[1], frame.shape[0]))) for frame, encimg in sent)
+    return sizes, len(clip) - selector.skipped + selector.reencodes, elapsed * 1000 / len(clip), psnr / max(1, len(sent)), reduced, selector.skipped
+
+def report(name, sizes, encodes, ms, psnr, budget, fps):
+    '''Imprime una fila de resultados'''
+    sizes = np.array(sizes)
+    over = np.count_nonzero(sizes > budget * 1.1) * 100 / len(sizes)
+    print("%-10s %8.0f %8.0f %8.0f %8.0f %7.1f%% %8.2f %7.2f %7.2f" %
+          (name, sizes.mean(), np.percentile(sizes, 95), sizes.max(), sizes.mean() * 8 * fps / 1000,
+           over, encodes / len(sizes), ms, psnr))
+
+if __name__ == '__main__':
+    kbps = float(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    fps = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+    budget = kbps * 1000 / 8 / fps
+
+    clip = (talking_head_clip(SCENE_FRAMES) + screen_clip(SCENE_FRAMES) + panning_clip(SCENE_FRAMES) +
+            talking_head_clip(SCENE_FRAMES))
+    print("Tope de %.0f kbit/s a %.0f fps: %.0f bytes por frame, %d frames de 640x480" % (kbps, fps, budget, len(clip)))
+    print("%-10s %8s %8s %8s %8s %8s %8s %7s %7s" %
+          ("modo", "media", "p95", "maximo", "kbit/s", ">110%", "comp/fr", "ms/fr", "PSNR"))
+    for quality in (25, 50, 75):
+        report("fija %d" % quality, *run_fixed(clip, quality), budget, fps)
+    *result, reduced, skipped = run_budget(clip, budget, fps)
+    report("modelo", *result, budget, fps)
+    print("Con el modelo, %d frames a menor resolucion y %d saltados" % (reduced, skipped))
@@ -0,0 +1,93 @@
+'''
+   bench_send.py
+   Benchmark del camino de envio: compara el envio anterior (tostring del JPEG, concatenacion
+   cabecera + JPEG y concatenacion de cada fragmento, enviados con sendto) con el envio actual
+   (memoryview sobre el buffer de OpenCV y sendmsg con la lista de buffers de cada datagrama).
+   Mide los bytes copiados en Python por frame, el pico de memoria extra y el tiempo por frame.
+   Uso: python benchmarks/bench_send.py [frames]
+   @author Alejandro Bravo, Miguel Gonzalez
+   @version 1.0
+   @date 18-10-2026
+'''
+
+import os
+import sys
+import time
+import socket
+import tracemalloc
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from packet import FRAGMENT_HEADER, FRAGMENT_MAGIC, fragment_message, byte_view, pack_video_header
+
+MAX_DATAGRAM_SIZE = 1400 #Como en config.json
+
+def legacy_send(sock, address, encimg, num, width, height):
+    '''Envio anterior. Devuelve los bytes copiados en Python'''
+    payload = encimg.tobytes() #Antes encimg.tostring()
+    message = pack_video_header(num, time.time(), width, height, 30) + payload
+    copied = len(payload) + len(message)
+    chunk_size = MAX_DATAGRAM_SIZE - FRAGMENT_HEADER.size
+    count = max(1, -(-len(message) // chunk_size))
+    view = memoryview(message)
+    for index in range(count):
+        datagram = FRAGMENT_HEADER.pack(FRAGMENT_MAGIC, num, index, count) + view[index*chunk_size:(index+1)*chunk_size]
+        copied += len(datagram)
+        sock.sendto(datagram, address)
+    return copied
+
+def scatter_send(sock, address, encimg, num, width, height):
+    '''Envio actual, como VideoBuffer.encode_frame + send_datagrams. Devuelve los bytes copiados en Python'''
+    header = pack_video_header(num, time.time(), width, height, 30)
+    datagrams = fragment_message([header, b"", byte_view(encimg)], num, MAX_DATAGRAM_SIZE)
+    copied = len(header)
+    for datagram in datagrams:
+        copied += len(datagram[0]) #Solo la cabecera de fragmento es un objeto nuevo
+        sock.sendmsg(datagram, (), 0, address)
+    return copied
+
+def measure(function, sock, address, clip, width, height):
+    '''Devuelve (bytes copiados por frame, pico de memoria extra en bytes, microsegundos por frame)'''
+    copied = 0
+    start = time.perf_counter()
+    for num, encimg in enumerate(clip):
+        copied += function(sock, address, encimg, num, width, height)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    peak = 0
+    for num, encimg in enumerate(clip[:20]):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        function(sock, address, encimg, num, width, height)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return copied / len(clip), peak, elapsed * 1000000 / len(clip)
+
+if __name__ == '__main__':
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+
+    #Receptor que no lee: el kernel descarta lo que no cabe, igual para los dos caminos
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = receiver.getsockname()
+
+    print("%-10s %-9s %12s %12s %12s %8s" % ("tamano", "envio", "JPEG bytes", "copiados/fr", "pico extra", "us/fr"))
+    for width, height in ((640, 480), (1280, 720)):
+        rng = np.random.default_rng(0)
+        base = cv2.resize(rng.integers(0, 255, (height // 8, width // 8, 3), dtype=np.uint8), (width, height))
+        clip = []
+        for i in range(30):
+            frame = np.roll(base, i * 4, axis=1)
+            clip.append(cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 75])[1])
+        clip = (clip * (frames // len(clip) + 1))[:frames]
+        jpeg = sum(len(e) for e in clip) / len(clip)
+
+        for name, function in (("anterior", legacy_send), ("sendmsg", scatter_send)):
+            copied, peak, micros = measure(function, sender, address, clip, width, height)
+            print("%-10s %-9s %12.0f %12.0f %12.0f %8.0f" % ("%dx%d" % (width, height), name, jpeg, copied, peak, micros))
+
+    sender.close()
+    receiver.close()
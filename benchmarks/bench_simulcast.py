@@ -0,0 +1,86 @@
+'''
+   bench_simulcast.py
+   Benchmark del envio en capas (SIMULCAST): mide el coste por frame de enviar una sola capa de 640x480
+   frente a las capas de SIMULCAST_LAYERS, comprimiendolas en el hilo de captura o en paralelo en el
+   pool de compresion, y los bytes de cada capa.
+   Uso: python benchmarks/bench_simulcast.py [frames] [hilos]
+   Los participantes son destinos UDP en local que no leen nada: solo se mide el emisor.
+   @author Alejandro Bravo, Miguel Gonzalez
+   @version 1.0
+   @date 18-10-2026
+'''
+
+import os
+import sys
+import time
+import socket
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from config import ConfigParser
+from video import VideoBuffer, PROTOCOLS, compress, resize_to
+from group import GroupCall, GroupMember
+
+def synthetic_frames(width, height, count):
+    '''Frames sinteticos: degradado con una figura en movimiento y algo de ruido'''
+    base = np.zeros((height, width, 3), np.uint8)
+    base[:, :, 0] = np.linspace(0, 255, width, dtype=np.uint8)[None, :]
+    base[:, :, 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, None]
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(count):
+        frame = base.copy()
+        cv2.circle(frame, ((i * 7) % width, height // 2), height // 6, (255, 255, 255), -1)
+        frames.append(cv2.add(frame, rng.integers(0, 12, frame.shape, dtype=np.uint8)))
+    return frames
+
+def make_group(config, sink_port, simulcast):
+    '''Llamada de grupo con un participante suscrito a cada capa'''
+    config.SIMULCAST = simulcast
+    buffer = VideoBuffer(config)
+    group = GroupCall(config, None, None, buffer)
+    buffer.set_group(group)
+    members = [GroupMember(group, "p" + str(i), "127.0.0.1", sink_port, PROTOCOLS) for i in range(len(group.layers))]
+    for layer, member in enumerate(members):
+        member.layer = layer
+    group.set_members(members)
+    group.configure()
+    return group, buffer
+
+def send_ms(group, buffer, sock, frames):
+    '''Milisegundos de reloj y de CPU por frame enviando todos los frames, hasta que se envia el ultimo'''
+    start, start_cpu = time.perf_counter(), time.process_time()
+    for num, frame in enumerate(frames):
+        group.send_frame(sock, frame, num, 75, "640x480", 30)
+    buffer.stop_workers()
+    return (time.perf_counter() - start) * 1000 / len(frames), (time.process_time() - start_cpu) * 1000 / len(frames)
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    config = ConfigParser()
+    sys.stdout.close()
+    sys.stdout = stdout
+
+    frames = synthetic_frames(640, 480, count)
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    print("%d frames 640x480, calidad 75, capas %s" % (count, config.SIMULCAST_LAYERS))
+    print("%-24s %14s %12s" % ("envio", "reloj ms/frame", "CPU ms/frame"))
+    for label, simulcast, encode_workers in (("una capa, sin pool", False, 0), ("una capa, pool", False, workers),
+                                             ("capas, sin pool", True, 0), ("capas, pool", True, workers)):
+        config.ENCODE_WORKERS = encode_workers
+        group, buffer = make_group(config, sink.getsockname()[1], simulcast)
+        send_ms(group, buffer, sock, frames[:5]) #Calentamiento
+        wall, cpu = send_ms(group, buffer, sock, frames)
+        print("%-24s %14.2f %12.2f" % (label, wall, cpu))
+
+    sizes = [np.mean([len(compress(resize_to(frame, layer, cv2.INTER_AREA), 75)) for frame in frames]) for layer in group.layers]
+    print("KB por frame: " + ", ".join("%s %.1f" % (layer, size / 1024) for layer, size in zip(group.layers, sizes)))
@@ -0,0 +1,155 @@
+'''
+   bench_tiles.py
+   Benchmark de la codificacion delta por tiles (extension TILES): compara, frente a enviar
+   siempre el JPEG completo, los bytes por frame, el tiempo de CPU del emisor (comparacion de
+   tiles + compresion) y del receptor (descompresion + reconstruccion) y la calidad (PSNR).
+   Uso: python benchmarks/bench_tiles.py [video1 video2 ...]
+   Sin argumentos usa clips sinteticos de 640x480 a 30 fps: cara hablando sobre fondo
+   estatico con ruido de camara, pantalla con texto y cursor, y camara en movimiento (peor caso).
+   @author Alejandro Bravo, Miguel Gonzalez
+   @version 1.0
+   @date 18-10-2026
+'''
+
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from config import ConfigParser
+from packet import VIDEO_FLAG_DELTA, parse_tile_directory
+from tiles import TileEncoder, TileDecoder
+
+FPS = 30 #Ritmo al que se supone grabado el clip
+QUALITY = 75 #Calidad JPEG de los dos modos
+
+def talking_head_clip(count, width=640, height=480):
+    '''Fondo fijo con ruido de camara y una cara que se balancea y abre la boca'''
+    rng = np.random.default_rng(0)
+    background = rng.integers(60, 200, (height // 8, width // 8, 3), dtype=np.uint8)
+    background = cv2.resize(background, (width, height), interpolation=cv2.INTER_CUBIC)
+    clip = []
+    for i in range(count):
+        frame = background.copy()
+        x = width // 2 + int(15 * np.sin(i / 10))
+        y = height // 2 + int(5 * np.sin(i / 7))
+        cv2.ellipse(frame, (x, y), (80, 105), 0, 0, 360, (140, 170, 210), -1)
+        cv2.circle(frame, (x - 30, y - 25), 9, (40, 40, 40), -1)
+        cv2.circle(frame, (x + 30, y - 25), 9, (40, 40, 40), -1)
+        cv2.ellipse(frame, (x, y + 45), (28, 4 + (i * 3) % 14), 0, 0, 360, (60, 40, 120), -1)
+        noise = rng.integers(-2, 3, frame.shape, dtype=np.int16)
+        clip.append(np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8))
+    return clip
+
+def screen_clip(count, width=640, height=480):
+    '''Pantalla con texto estatico en la que se escribe una linea y parpadea el cursor'''
+    base = np.full((height, width, 3), 245, np.uint8)
+    for line in range(20):
+        cv2.putText(base, "linea %02d del documento compartido en la llamada" % line, (10, 20 + line * 22),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (30, 30, 30), 1, cv2.LINE_AA)
+    text = "texto que se esta escribiendo ahora mismo..."
+    clip = []
+    for i in range(count):
+        frame = base.copy()
+        typed = text[:(i // 3) % (len(text) + 1)]
+        cv2.putText(frame, typed, (10, 460), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 0, 0), 1, cv2.LINE_AA)
+        if (i // 15) % 2 == 0:
+            cx = 10 + cv2.getTextSize(typed, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0][0]
+            cv2.line(frame, (cx, 448), (cx, 464), (0, 0, 0), 1)
+        clip.append(frame)
+    return clip
+
+def panning_clip(count, width=640, height=480):
+    '''Camara que se desplaza sobre una escena con textura: cambia toda la imagen en cada frame'''
+    rng = np.random.default_rng(1)
+    scene = cv2.resize(rng.integers(0, 255, (height // 4, width // 2, 3), dtype=np.uint8), (width * 2, height),
+                       interpolation=cv2.INTER_CUBIC)
+    return [np.ascontiguousarray(scene[:, (i * 4) % width:(i * 4) % width + width]) for i in range(count)]
+
+def load_clip(path, count):
+    '''Lee hasta count frames de un fichero de video, a 640x480'''
+    cap = cv2.VideoCapture(path)
+    clip = []
+    while len(clip) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        clip.append(cv2.resize(frame, (640, 480), interpolation=cv2.INTER_AREA))
+    cap.release()
+    return clip
+
+def encode(image):
+    '''Comprime como video.compress'''
+    return cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, QUALITY])[1].tobytes()
+
+def decode(content):
+    '''Descomprime como video.decode'''
+    return cv2.imdecode(np.frombuffer(content, np.uint8), 1)
+
+def run_full(clip):
+    '''Envia siempre el frame completo. Devuelve (bytes/frame, ms emisor, ms receptor, PSNR)'''
+    sizes, send_time, recv_time, psnr = 0, 0.0, 0.0, 0.0
+    for frame in clip:
+        start = time.perf_counter()
+        encimg = encode(frame)
+        send_time += time.perf_counter() - start
+        start = time.perf_counter()
+        decimg = decode(encimg)
+        recv_time += time.perf_counter() - start
+        sizes += len(encimg)
+        psnr += cv2.PSNR(frame, decimg)
+    n = len(clip)
+    return sizes / n, send_time * 1000 / n, recv_time * 1000 / n, psnr / n
+
+def run_tiles(clip, config):
+    '''Envia por tiles. Devuelve (bytes/frame, ms emisor, ms receptor, PSNR, fraccion de frames clave)'''
+    encoder = TileEncoder(config.TILE_SIZE, config.TILE_THRESHOLD, config.TILE_REFRESH, config.TILE_MAX_FRACTION)
+    decoder = TileDecoder()
+    sizes, send_time, recv_time, psnr, keys = 0, 0.0, 0.0, 0.0, 0
+    for num, frame in enumerate(clip):
+        start = time.perf_counter()
+        #El refresco se mide en tiempo del clip, no en tiempo de ejecucion
+        image, flags, directory = encoder.prepare(frame, num, num / FPS)
+        encimg = encode(image) if image is not None else b""
+        send_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        header = [num, 0, "640x480", FPS, flags]
+        if flags & VIDEO_FLAG_DELTA:
+            header.append(parse_tile_directory(directory)[0])
+        else:
+            keys += 1
+        decimg = decoder.reconstruct(header, decode(encimg) if len(encimg) > 0 else None)
+        recv_time += time.perf_counter() - start
+        sizes += len(directory) + len(encimg)
+        psnr += cv2.PSNR(frame, decimg)
+    n = len(clip)
+    return sizes / n, send_time * 1000 / n, recv_time * 1000 / n, psnr / n, keys / n
+
+if __name__ == '__main__':
+    config = ConfigParser()
+    frames = 300
+    if len(sys.argv) > 1:
+        clips = [(os.path.basename(path), load_clip(path, frames)) for path in sys.argv[1:]]
+    else:
+        clips = [("cara", talking_head_clip(frames)), ("pantalla", screen_clip(frames)),
+                 ("movimiento", panning_clip(frames))]
+
+    print("Tiles de %dpx, umbral %.1f, frame clave cada %.1f s o si cambia mas del %d%%, calidad %d" %
+          (config.TILE_SIZE, config.TILE_THRESHOLD, config.TILE_REFRESH, config.TILE_MAX_FRACTION * 100, QUALITY))
+    print("%-12s %-8s %10s %8s %10s %10s %8s %7s" %
+          ("clip", "modo", "bytes/fr", "kbit/s", "emisor ms", "recept ms", "PSNR", "clave"))
+    for name, clip in clips:
+        if len(clip) == 0:
+            print("%-12s no se ha podido leer" % name)
+            continue
+        size, send_ms, recv_ms, psnr = run_full(clip)
+        print("%-12s %-8s %10.0f %8.0f %10.2f %10.2f %8.2f %7s" %
+              (name, "completo", size, size * 8 * FPS / 1000, send_ms, recv_ms, psnr, "100%"))
+        tsize, tsend_ms, trecv_ms, tpsnr, keys = run_tiles(clip, config)
+        print("%-12s %-8s %10.0f %8.0f %10.2f %10.2f %8.2f %6.0f%%" %
+              (name, "tiles", tsize, tsize * 8 * FPS / 1000, tsend_ms, trecv_ms, tpsnr, keys * 100))
+        print("%-12s ahorro: %.0f%% de ancho de banda, %.0f%% de CPU en el emisor, %.0f%% en el receptor" %
+              ("", 100 * (1 - tsize / size), 100 * (1 - tsend_ms / send_ms), 100 * (1 - trecv_ms / recv_ms)))
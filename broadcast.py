@@ -0,0 +1,725 @@
+'''
+    broadcast.py
+    Modulo de las emisiones multicast (extension BROADCAST): un emisor envia su video una sola vez a un
+    grupo multicast de la LAN y cualquier numero de espectadores se une al grupo para verlo.
+    @author Alejandro Bravo, Miguel Gonzalez
+    @version 1.0
+    @date 18-10-2026
+
+    DESCRIPCION GENERAL DEL MODULO
+    El emisor envia cada datagrama una sola vez a BROADCAST_GROUP:BROADCAST_PORT, con TTL BROADCAST_TTL,
+    y es la red la que lo copia a cada espectador: el coste del emisor no depende de cuantos haya. Los
+    datagramas son los de una llamada normal, comprimidos con las extensiones del emisor salvo las que
+    solo tienen sentido con un receptor (NACK, RATE) o necesitan un frame anterior que un espectador
+    recien llegado no tiene (TILES).
+
+    Cada espectador abre una conexion de control con el emisor, que no tiene que aceptarla:
+        BROADCAST_JOIN nick
+            Del espectador al emisor. Si no esta emitiendo responde CALL_DENIED.
+        BROADCAST_ACCEPTED nick grupo puerto intervalo protocolos
+            Respuesta del emisor: grupo multicast y puerto del video, segundos entre reportes de
+            perdidas y extensiones del video, separadas por '#'. El espectador se une al grupo
+            (IP_ADD_MEMBERSHIP) con un socket en ese puerto, ya que su socket de video esta en el suyo.
+        BROADCAST_REPORT intervalo
+            Del emisor a todos los espectadores cuando el intervalo de reportes llega a la mitad o al doble.
+        BROADCAST_LOSS nick perdidas segundos
+            Reporte de perdidas del espectador: frames perdidos en los ultimos segundos.
+        CALL_END nick
+            Cualquiera de los dos deja la emision. Si es el emisor, termina para todos.
+
+    REPORTES DE PERDIDAS
+    Como en RTCP, el intervalo de los reportes crece con los espectadores para que al emisor le lleguen
+    unos BROADCAST_REPORT_RATE por segundo en total (como mucho el doble, mientras no cambia el intervalo
+    anunciado), y nunca baja de REPORT_REFRESH. Cada espectador acumula sus perdidas y reporta tras un
+    intervalo aleatorio entre la mitad y vez y media del indicado, para que no lleguen todos a la vez.
+    El emisor guarda las perdidas por segundo del ultimo reporte de cada espectador y ajusta calidad,
+    fps y resolucion con su percentil BROADCAST_LOSS_PERCENTILE, sin contar a los que llevan tres
+    intervalos sin reportar: un espectador con mala conexion no baja el video de todos, pero una parte
+    de ellos si.
+'''
+
+import math
+import time
+import random
+import select
+import socket
+import threading
+import ipaddress
+from control import MessageParser, SocketLink
+from video import VideoBuffer, PROTOCOLS, drain_socket
+
+BROADCAST_EXCLUDED = ("TILES", "NACK", "RATE", "GROUP", "SIMULCAST") #Extensiones que no se usan en las emisiones
+
+ROLE_SENDER = 1 #Estamos emitiendo
+ROLE_VIEWER = 2 #Estamos viendo una emision
+
+def open_multicast_socket(group, port, interface=""):
+    '''
+    Nombre: open_multicast_socket
+    Descripcion: Abre un socket UDP en el puerto de una emision y lo une a su grupo multicast (IP_ADD_MEMBERSHIP).
+                 Se puede abrir en varios procesos del mismo equipo a la vez (SO_REUSEADDR).
+    Argumentos: group: IP del grupo multicast.
+                port: Puerto UDP de la emision.
+                interface: IP de la interfaz por la que unirse, o "" para la de por defecto.
+    Retorno:
+        El socket, o None en caso de error.
+    '''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("", port))
+        membership = socket.inet_aton(group) + socket.inet_aton(interface or "0.0.0.0")
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+    except OSError as e:
+        print("Error uniendose al grupo multicast " + group + ":" + str(port) + ": " + str(e))
+        sock.close()
+        return None
+    return sock
+
+class BroadcastPeer():
+    '''Otro extremo de una emision: Un espectador para el emisor, o el emisor para un espectador'''
+
+    nick = None #Nick del otro extremo.
+    link = None #Conexion de control con el (SocketLink o ControlSession).
+    loss_per_second = 0 #Frames perdidos por segundo segun su ultimo reporte. Solo la usa el emisor.
+    time_report = -1 #Instante en que llego su ultimo reporte, o -1 si aun no ha reportado.
+    lost_total = 0 #Frames perdidos segun todos sus reportes.
+
+    def __init__(self, nick, link):
+        '''
+        Nombre: __init__
+        Descripcion: Crea el otro extremo de una emision.
+        Argumentos: nick: Su nick.
+                    link: Conexion de control con el.
+        '''
+        self.nick = nick
+        self.link = link
+
+class Broadcast():
+    '''Emision multicast: Espectadores y QoS del emisor, o recepcion y reportes de un espectador'''
+
+    config = None #Objeto de configuracion.
+    discovery = None #Objeto de descubrimiento.
+    control = None #Modulo de control, para el nick y los timeouts.
+    video_buffer = None #VideoBuffer con el que se envia nuestro video.
+    gui = None #Interfaz para avisar de que la emision ha terminado.
+    lock = None #Cerrojo del rol y los espectadores.
+
+    role = None #ROLE_SENDER, ROLE_VIEWER o None si no hay emision.
+    address = None #Grupo multicast y puerto (entero) del video de la emision.
+    interval = 0 #Segundos entre reportes de perdidas.
+
+    #Emisor
+    viewers = {} #Espectadores por nick. Se sustituye entero al cambiar: el hilo de reproduccion lo lee sin cerrojo.
+    announced = 0 #Intervalo de reportes anunciado a los espectadores con BROADCAST_REPORT.
+    time_start = 0 #Instante en que empezo la emision.
+    time_last_qos = -1 #Timestamp con la ultima vez que se ajusto el video con los reportes.
+    reports_received = 0 #Reportes de perdidas recibidos en esta emision.
+
+    #Espectador
+    peer = None #BroadcastPeer del emisor.
+    sender = None #Nick del emisor de la ultima emision vista.
+    socket = None #Socket unido al grupo multicast. Lo cierra reset, en el hilo de reproduccion.
+    buffer = None #VideoBuffer con el que se recibe la emision.
+    pending_lost = 0 #Frames perdidos desde el ultimo reporte enviado.
+    time_last_report = 0 #Timestamp con la ultima vez que se envio un reporte.
+    time_next_report = 0 #Instante a partir del cual se envia el siguiente reporte.
+    reports_sent = 0 #Reportes de perdidas enviados en esta emision.
+
+    #QoS del video entrante del espectador (listas para pasarlas por referencia a pop_frame). No se envia nada con el.
+    quality = None
+    fps = None
+    resolution = None
+    lost_total = None
+
+    def __init__(self, config, discovery, control, video_buffer):
+        '''
+        Nombre: __init__
+        Descripcion: Crea la emision, sin emitir ni ver nada.
+        Argumentos: config: Objeto de configuracion.
+                    discovery: Objeto de descubrimiento.
+                    control: Modulo de control.
+                    video_buffer: VideoBuffer con el que se envia nuestro video.
+        '''
+        self.config = config
+        self.discovery = discovery
+        self.control = control
+        self.video_buffer = video_buffer
+        self.lock = threading.Lock()
+        self.viewers = {}
+        self.quality = [75]
+        self.fps = [30]
+        self.resolution = ["640x480"]
+        self.lost_total = [0]
+
+    def set_gui(self, gui):
+        '''
+        Nombre: set_gui
+        Descripcion: Ajusta la interfaz con la que se avisa del final de la emision.
+        Argumentos: gui: Objeto interfaz grafica.
+        '''
+        self.gui = gui
+
+    def busy(self):
+        '''
+        Nombre: busy
+        Descripcion: Indica si estamos emitiendo o viendo una emision (o empezando a verla).
+        '''
+        return self.role is not None
+
+    def sending(self):
+        '''
+        Nombre: sending
+        Descripcion: Indica si estamos emitiendo.
+        '''
+        return self.role == ROLE_SENDER
+
+    def watching(self):
+        '''
+        Nombre: watching
+        Descripcion: Indica si estamos viendo una emision ya establecida.
+        '''
+        return self.role == ROLE_VIEWER and self.peer is not None
+
+    def leftover(self):
+        '''
+        Nombre: leftover
+        Descripcion: Indica si quedan el socket o el buffer de una emision vista que ya ha terminado. Si termino antes
+                     de que el hilo de reproduccion empezara a reproducirla, nadie los ha liberado aun.
+        '''
+        with self.lock:
+            return self.role is None and (self.socket is not None or self.buffer is not None)
+
+    def protocols(self):
+        '''
+        Nombre: protocols
+        Descripcion: Extensiones con las que se envia el video de la emision.
+        '''
+        return [p for p in PROTOCOLS if p not in BROADCAST_EXCLUDED]
+
+    # EMISOR
+
+    def start(self, socket_video_send):
+        '''
+        Nombre: start
+        Descripcion: Empieza a emitir: a partir de ahora el video se envia al grupo multicast.
+        Argumentos: socket_video_send: Socket UDP con el que se envia el video. Se le ajustan el TTL y la interfaz multicast.
+        Retorno:
+            0 si todo es correcto, -1 en caso de error.
+        '''
+        group = self.config.BROADCAST_GROUP
+        try:
+            if not ipaddress.IPv4Address(group).is_multicast:
+                raise ValueError
+        except ValueError:
+            print("Error empezando la emision: BROADCAST_GROUP no es un grupo multicast IPv4: " + str(group))
+            return -1
+        with self.lock:
+            if self.role is not None or self.control.get_connected_username() is not None:
+                print("Error empezando la emision: ya hay una llamada o una emision en curso.")
+                return -1
+            try:
+                socket_video_send.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, int(self.config.BROADCAST_TTL))
+                if self.config.BROADCAST_INTERFACE:
+                    socket_video_send.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF,
+                                                 socket.inet_aton(self.config.BROADCAST_INTERFACE))
+            except OSError as e:
+                print("Error empezando la emision: " + str(e))
+                return -1
+            self.role = ROLE_SENDER
+            self.address = (group, int(self.config.BROADCAST_PORT))
+            self.viewers = {}
+            self.announced = self.report_interval(0)
+            self.time_start = time.time()
+            self.time_last_qos = -1
+            self.reports_received = 0
+        self.video_buffer.set_peer_protocols(self.protocols())
+        print("Emitiendo en " + self.address[0] + ":" + str(self.address[1]))
+        return 0
+
+    def report_interval(self, count):
+        '''
+        Nombre: report_interval
+        Descripcion: Segundos entre reportes de cada espectador para que el emisor reciba BROADCAST_REPORT_RATE por segundo.
+        Argumentos: count: Numero de espectadores.
+        '''
+        interval = self.config.REPORT_REFRESH
+        if self.config.BROADCAST_REPORT_RATE > 0:
+            interval = max(interval, count / self.config.BROADCAST_REPORT_RATE)
+        return interval
+
+    def add_viewer(self, link, nick, read=True):
+        '''
+        Nombre: add_viewer
+        Descripcion: Atiende un BROADCAST_JOIN: anade al espectador y le indica donde esta el video. Lo llama el modulo de control.
+        Argumentos: link: Conexion de control con el espectador (SocketLink o ControlSession).
+                    nick: Nick del espectador.
+                    read: True para leer la conexion en un hilo propio. Si es False la lee quien llama,
+                          pasando los mensajes a process_message y el cierre a peer_closed.
+        Retorno:
+            BroadcastPeer del espectador, o None si no estamos emitiendo.
+        '''
+        viewer = BroadcastPeer(nick, link)
+        with self.lock:
+            if self.role != ROLE_SENDER:
+                return None
+            old = self.viewers.get(nick)
+            viewers = dict(self.viewers)
+            viewers[nick] = viewer
+            self.viewers = viewers
+            interval = self.report_interval(len(viewers))
+        if old is not None:
+            #Se vuelve a unir sin haber salido: su conexion anterior ya no sirve
+            old.link.close()
+        self.send(viewer, "BROADCAST_ACCEPTED " + self.control.get_username() + " " + self.address[0] + " " +
+                  str(self.address[1]) + " " + str(interval) + " " + "#".join(self.protocols()))
+        self.announce_interval()
+        if read:
+            threading.Thread(target=self.link_loop, args=(viewer,), daemon=True).start()
+        print(nick + " se une a la emision. Espectadores: " + str(len(self.viewers)))
+        return viewer
+
+    def announce_interval(self):
+        '''
+        Nombre: announce_interval
+        Descripcion: Si el intervalo de reportes que toca con los espectadores actuales es la mitad o el doble del
+                     anunciado, se lo indica a todos (BROADCAST_REPORT). Asi no se avisa a todos con cada uno que entra.
+        '''
+        with self.lock:
+            interval = self.report_interval(len(self.viewers))
+            if self.role != ROLE_SENDER or self.announced / 2 < interval < self.announced * 2:
+                return
+            self.announced = interval
+            viewers = list(self.viewers.values())
+        for viewer in viewers:
+            self.send(viewer, "BROADCAST_REPORT " + str(interval))
+
+    def receive_loss_report(self, viewer, lost, elapsed):
+        '''
+        Nombre: receive_loss_report
+        Descripcion: Guarda las perdidas de un BROADCAST_LOSS de un espectador.
+        Argumentos: viewer: BroadcastPeer del espectador.
+                    lost: Frames perdidos.
+                    elapsed: Segundos que abarca el reporte.
+        '''
+        if elapsed <= 0:
+            return
+        viewer.loss_per_second = lost / elapsed
+        viewer.time_report = time.time()
+        viewer.lost_total += lost
+        self.reports_received += 1
+
+    def aggregate_loss(self, now):
+        '''
+        Nombre: aggregate_loss
+        Descripcion: Percentil BROADCAST_LOSS_PERCENTILE de las perdidas por segundo de los espectadores que
+                     han reportado en los ultimos tres intervalos.
+        Argumentos: now: Instante actual.
+        Retorno:
+            Frames perdidos por segundo, 0 si nadie ha reportado.
+        '''
+        limit = 3 * self.report_interval(len(self.viewers))
+        losses = sorted(viewer.loss_per_second for viewer in list(self.viewers.values())
+                        if viewer.time_report != -1 and now - viewer.time_report < limit)
+        if not losses:
+            return 0
+        rank = math.ceil(len(losses) * self.config.BROADCAST_LOSS_PERCENTILE / 100)
+        return losses[min(len(losses), max(1, rank)) - 1]
+
+    def update_qos(self, quality, fps, resolution, min_fps, max_fps):
+        '''
+        Nombre: update_qos
+        Descripcion: Ajusta el video de la emision cada QUALITY_REFRESH con las perdidas agregadas de los
+                     espectadores, con los mismos escalones que el QoS de pop_frame. Con FEC, como alli, primero
+                     se sube la proteccion y solo cuando llega a FEC_MAX_RATIO se baja la resolucion.
+                     Lo llama el hilo de reproduccion, que mientras se emite no reproduce nada.
+        Argumentos: min_fps, max_fps: Limites de fps del QoS.
+
+                    Datos que actualiza la funcion (envueltos en una lista, como en pop_frame):
+                    quality, fps, resolution: Calidad, FPS y resolucion del video saliente.
+        '''
+        now = time.time()
+        if now - self.time_last_qos < self.config.QUALITY_REFRESH:
+            return
+        self.time_last_qos = now
+        buffer = self.video_buffer
+        fraction = self.aggregate_loss(now) / max(1, fps[0])
+
+        if fraction < buffer.MEDIUM_LOST:
+            quality[0], fps[0] = 75, max_fps
+        elif fraction < buffer.WORST_LOST:
+            quality[0], fps[0] = 50, (max_fps + min_fps) // 2
+        else:
+            quality[0], fps[0] = 25, min_fps
+
+        if buffer.using_fec:
+            if fraction >= buffer.MEDIUM_LOST:
+                buffer.fec_ratio = min(self.config.FEC_MAX_RATIO, buffer.fec_ratio * 2)
+            elif fraction < buffer.MEDIUM_LOST / 2:
+                buffer.fec_ratio = max(self.config.FEC_MIN_RATIO, buffer.fec_ratio / 2)
+
+        if fraction < buffer.MEDIUM_LOST:
+            resolution[0] = "640x480"
+        elif buffer.using_fec and buffer.fec_ratio < self.config.FEC_MAX_RATIO:
+            pass
+        elif fraction < buffer.WORST_LOST:
+            resolution[0] = "320x240"
+        else:
+            resolution[0] = "160x120"
+
+    def summary(self):
+        '''
+        Nombre: summary
+        Descripcion: Estado de la emision, para mostrarlo en la interfaz.
+        Retorno:
+            Cadena con los espectadores, las perdidas agregadas y los reportes recibidos por segundo.
+        '''
+        now = time.time()
+        rate = self.reports_received / max(1, now - self.time_start)
+        return ("Espectadores: " + str(len(self.viewers)) + " Perdidas (p" + str(self.config.BROADCAST_LOSS_PERCENTILE) + "): " +
+                "%.1f" % self.aggregate_loss(now) + " frames/s Reportes: " + "%.1f" % rate + "/s")
+
+    # ESPECTADOR
+
+    def watch(self, nick):
+        '''
+        Nombre: watch
+        Descripcion: Se une a la emision de un usuario: le envia BROADCAST_JOIN y, si esta emitiendo, se une al grupo multicast.
+        Argumentos: nick: Nick del emisor.
+        Retorno:
+            0 si todo es correcto, -1 en caso de error o -3 si el usuario no esta emitiendo.
+        '''
+        me = self.control.get_username()
+        if nick == me:
+            print("Error viendo la emision: no puede verse la propia.")
+            return -1
+        with self.lock:
+            if self.role is not None or self.control.get_connected_username() is not None:
+                print("Error viendo la emision: ya hay una llamada o una emision en curso.")
+                return -1
+            if self.socket is not None or self.buffer is not None:
+                #El socket y el buffer de la anterior los libera el hilo de reproduccion (reset), que puede estar aun recibiendo
+                print("Error viendo la emision: aun se esta cerrando la anterior.")
+                return -1
+            self.role = ROLE_VIEWER
+
+        info = self.discovery.query_user(nick)
+        if info is None or info == -1:
+            print("Error viendo la emision: el servidor reporta que " + nick + " no existe.")
+            self.end()
+            return -1
+        if "BROADCAST" not in info[2]:
+            print("Error viendo la emision: " + nick + " no emite por multicast.")
+            self.end()
+            return -1
+        try:
+            sock = socket.create_connection((info[0], int(info[1])), self.control.socket_timeout)
+        except OSError:
+            print("No ha sido posible conectarse a " + nick + ".")
+            self.discovery.invalidate_user(nick)
+            self.end()
+            return -1
+
+        parser = MessageParser(True)
+        try:
+            sock.sendall(parser.encode("BROADCAST_JOIN " + me))
+            sock.settimeout(self.control.socket_timeout)
+            msg = parser.receive(sock)
+            sock.settimeout(None)
+        except OSError:
+            msg = ""
+        words = msg.split()
+        result = self.joined(SocketLink(sock, parser), nick, words)
+        if result != 0:
+            sock.close()
+            self.end()
+        return result
+
+    def joined(self, link, nick, words):
+        '''
+        Nombre: joined
+        Descripcion: Atiende la respuesta del emisor a BROADCAST_JOIN: se une al grupo multicast y empieza a leer su conexion.
+        Argumentos: link: Conexion de control con el emisor.
+                    nick: Nick del emisor.
+                    words: Palabras de la respuesta.
+        Retorno:
+            Lo mismo que watch.
+        '''
+        if len(words) < 6 or words[0] != "BROADCAST_ACCEPTED":
+            if words and words[0] == "CALL_DENIED":
+                print(nick + " no esta emitiendo.")
+                return -3
+            print("Respuesta a BROADCAST_JOIN malformada: " + " ".join(words))
+            return -1
+        protocols = words[5].split("#")
+        missing = [p for p in protocols if p not in PROTOCOLS]
+        if missing:
+            print("Error viendo la emision: se envia con extensiones que no soportamos: " + ", ".join(missing))
+            return -1
+        try:
+            port = int(words[3])
+            interval = float(words[4])
+        except ValueError:
+            print("Respuesta a BROADCAST_JOIN malformada: " + " ".join(words))
+            return -1
+        sock = open_multicast_socket(words[2], port, self.config.BROADCAST_INTERFACE)
+        if sock is None:
+            return -1
+
+        buffer = VideoBuffer(self.config, self.video_buffer.buffer_pool)
+        buffer.reset_reception()
+        buffer.set_control(self)
+        buffer.set_peer_protocols(protocols)
+        now = time.time()
+        peer = BroadcastPeer(nick, link)
+        with self.lock:
+            if self.role != ROLE_VIEWER:
+                #Se ha cancelado mientras esperabamos la respuesta
+                sock.close()
+                return -1
+            self.address = (words[2], port)
+            self.interval = interval
+            self.socket = sock
+            self.buffer = buffer
+            self.pending_lost = 0
+            self.reports_sent = 0
+            self.lost_total[0] = 0
+            self.time_last_report = now
+            self.time_next_report = now + interval * random.uniform(0.5, 1.5)
+            self.peer = peer
+            self.sender = nick
+        threading.Thread(target=self.link_loop, args=(peer,), daemon=True).start()
+        print("Viendo la emision de " + nick + " en " + words[2] + ":" + str(port))
+        return 0
+
+    def receive_loop(self, socket_video_rec):
+        '''
+        Nombre: receive_loop
+        Descripcion: Hilo de recepcion del espectador: pasa al buffer los datagramas del grupo multicast hasta
+                     recibir END_RECEPTION por el socket de video propio.
+        Argumentos: socket_video_rec: Socket UDP de recepcion de video.
+        '''
+        sock = self.socket
+        buffer = self.buffer
+        buffer.set_receive_buffer(sock)
+        pool = buffer.buffer_pool
+        buf = pool.acquire(VideoBuffer.RECV_SIZE)
+        view = memoryview(buf)
+        drain_socket(socket_video_rec, buf)
+        sock.setblocking(0)
+
+        while True:
+            readable, _, _ = select.select([sock, socket_video_rec], [], [])
+            if socket_video_rec in readable:
+                nbytes, _ = socket_video_rec.recvfrom_into(buf)
+                if view[:nbytes] == b'END_RECEPTION':
+                    pool.release(buf)
+                    return
+            if sock not in readable:
+                continue
+            #Se vacia el socket antes de volver a esperar: un select por rafaga, no por datagrama
+            while True:
+                try:
+                    nbytes, _ = sock.recvfrom_into(buf)
+                except BlockingIOError:
+                    break
+                if buffer.receive_datagram(view[:nbytes], buf):
+                    buf = pool.acquire(VideoBuffer.RECV_SIZE)
+                    view = memoryview(buf)
+
+    def pop_frame(self, min_fps, max_fps):
+        '''
+        Nombre: pop_frame
+        Descripcion: Saca el siguiente frame de la emision (VideoBuffer.pop_frame). Su QoS no cambia nada,
+                     pero cuenta las perdidas con las que se envian los reportes.
+        Argumentos: min_fps, max_fps: Limites de fps del QoS.
+        Retorno:
+            Lo mismo que VideoBuffer.pop_frame.
+        '''
+        return self.buffer.pop_frame(self.quality, self.fps, self.resolution, self.lost_total, min_fps, max_fps)
+
+    #Interfaz de control que usa el VideoBuffer del espectador para enviar reportes
+
+    def send_loss_report(self, lost):
+        '''
+        Nombre: send_loss_report
+        Descripcion: Acumula los frames perdidos y, si ya toca, se los reporta al emisor (BROADCAST_LOSS).
+                     El siguiente reporte se programa tras un intervalo aleatorio entre la mitad y vez y media del indicado.
+        Argumentos: lost: Frames perdidos desde la ultima llamada.
+        Retorno:
+            0 si todo es correcto, -1 en caso de error.
+        '''
+        self.pending_lost += lost
+        now = time.time()
+        if now < self.time_next_report:
+            return 0
+        msg = "BROADCAST_LOSS " + self.control.get_username() + " " + str(self.pending_lost) + " " + "%.3f" % (now - self.time_last_report)
+        self.pending_lost = 0
+        self.time_last_report = now
+        self.time_next_report = now + self.interval * random.uniform(0.5, 1.5)
+        self.reports_sent += 1
+        return self.send(self.peer, msg)
+
+    def send_rate_report(self, bitrate):
+        '''
+        Nombre: send_rate_report
+        Descripcion: RATE no se usa en las emisiones.
+        Retorno:
+            -1
+        '''
+        return -1
+
+    def send_nack(self, nums, margin):
+        '''
+        Nombre: send_nack
+        Descripcion: NACK no se usa en las emisiones.
+        Retorno:
+            -1
+        '''
+        return -1
+
+    # MENSAJES DE CONTROL
+
+    def send(self, peer, msg):
+        '''
+        Nombre: send
+        Descripcion: Envia un mensaje por la conexion de control con el otro extremo.
+        Argumentos: peer: BroadcastPeer.
+                    msg: Mensaje como cadena.
+        Retorno:
+            0 si todo es correcto, -1 en caso de error.
+        '''
+        if peer is None:
+            return -1
+        try:
+            if not peer.link.send(peer.link.parser.encode(msg)):
+                return -1
+        except OSError:
+            print("Error enviando " + msg.split()[0] + " a " + peer.nick + ".")
+            return -1
+        return 0
+
+    def link_loop(self, peer):
+        '''
+        Nombre: link_loop
+        Descripcion: Lee los mensajes de la conexion de control con el otro extremo hasta que se cierra.
+        Argumentos: peer: BroadcastPeer con conexion SocketLink.
+        '''
+        link = peer.link
+        while True:
+            try:
+                msg = link.parser.receive(link.sock)
+            except OSError:
+                msg = ""
+            if not msg or self.process_message(peer, msg):
+                break
+        self.peer_closed(peer)
+
+    def process_message(self, peer, msg):
+        '''
+        Nombre: process_message
+        Descripcion: Atiende un mensaje de control de la emision.
+        Argumentos: peer: BroadcastPeer que lo ha enviado.
+                    msg: Mensaje como cadena.
+        Retorno:
+            True si el otro extremo ha dejado la emision (CALL_END), False si no.
+        '''
+        words = msg.split()
+        if not words:
+            return False
+        if words[0] == "CALL_END":
+            return True
+        if words[0] == "BROADCAST_LOSS" and len(words) >= 4 and self.role == ROLE_SENDER:
+            try:
+                lost = int(words[2])
+                elapsed = float(words[3])
+            except ValueError:
+                print("Reporte de perdidas de emision malformado: " + msg)
+                return False
+            self.receive_loss_report(peer, lost, elapsed)
+        elif words[0] == "BROADCAST_REPORT" and len(words) >= 2 and self.role == ROLE_VIEWER:
+            try:
+                self.interval = float(words[1])
+            except ValueError:
+                print("Intervalo de reportes malformado: " + msg)
+        return False
+
+    # FINAL DE LA EMISION
+
+    def peer_closed(self, peer):
+        '''
+        Nombre: peer_closed
+        Descripcion: Se ha cerrado la conexion con el otro extremo. Si somos el emisor quitamos al espectador;
+                     si era el emisor, la emision termina.
+        Argumentos: peer: BroadcastPeer cuya conexion se ha cerrado.
+        '''
+        with self.lock:
+            sending = self.role == ROLE_SENDER
+            if sending:
+                if self.viewers.get(peer.nick) is not peer:
+                    #Ya lo habiamos quitado, o hemos dejado de emitir
+                    return
+                viewers = dict(self.viewers)
+                del viewers[peer.nick]
+                self.viewers = viewers
+            elif self.peer is not peer:
+                return
+        peer.link.close()
+        if sending:
+            print(peer.nick + " deja la emision. Espectadores: " + str(len(self.viewers)))
+            self.announce_interval()
+            return
+        self.end()
+        if self.gui is not None:
+            self.gui.infoBox("Emision finalizada.", "La emision ha terminado.")
+
+    def leave(self):
+        '''
+        Nombre: leave
+        Descripcion: Deja la emision (CALL_END). Si somos el emisor termina para todos.
+        Retorno:
+            0 si todo es correcto, -1 si no hay emision.
+        '''
+        return self.end("CALL_END " + self.control.get_username())
+
+    def end(self, farewell=None):
+        '''
+        Nombre: end
+        Descripcion: Termina la emision y cierra las conexiones de control. El socket multicast y el buffer
+                     del espectador se liberan en el hilo de reproduccion (reset).
+        Argumentos: farewell: Mensaje que se envia por cada conexion antes de cerrarla, o None.
+        Retorno:
+            0 si todo es correcto, -1 si no hay emision.
+        '''
+        #Primero se olvida a los demas: asi, cuando cierren, peer_closed no hace nada
+        with self.lock:
+            if self.role is None:
+                return -1
+            peers = list(self.viewers.values()) if self.role == ROLE_SENDER else [self.peer]
+            self.role = None
+            self.viewers = {}
+            self.peer = None
+        for peer in peers:
+            if peer is None:
+                continue
+            if farewell is not None:
+                self.send(peer, farewell)
+            peer.link.close()
+        print("Emision terminada.")
+        return 0
+
+    def reset(self):
+        '''
+        Nombre: reset
+        Descripcion: Libera el socket multicast y el buffer de la emision vista. Lo llama el hilo de reproduccion.
+        '''
+        with self.lock:
+            sock, buffer = self.socket, self.buffer
+            self.socket = None
+            self.buffer = None
+        if buffer is not None:
+            buffer.stop_workers()
+            buffer.empty_buffer()
+        if sock is not None:
+            #Al cerrarlo se deja el grupo multicast
+            sock.close()
@@ -0,0 +1,76 @@
+'''
+    bufferpool.py
+    Modulo con el pool de buffers en los que se recibe el video entrante.
+    @author Alejandro Bravo, Miguel Gonzalez
+    @version 1.0
+    @date 18-10-2026
+
+    DESCRIPCION GENERAL DEL MODULO
+    Los datagramas se reciben con recvfrom_into sobre bytearrays reservados de antemano,
+    en lugar de crear un objeto bytes de 64 KB con cada recvfrom. La cabecera se lee y el
+    frame se descomprime a traves de memoryviews sobre esos buffers, sin copias intermedias.
+
+    Cada buffer tiene un unico dueno en cada momento: el hilo de recepcion mientras recibe
+    o reensambla, la entrada del buffer de reproduccion mientras espera a mostrarse, y el
+    pool cuando se devuelve tras la reproduccion. Lo saca el hilo de recepcion y lo devuelve
+    el de reproduccion, y como ambas operaciones sobre el deque son atomicas no hace falta cerrojo.
+'''
+
+from collections import deque
+
+class BufferPool():
+    '''Pool de buffers: Reutiliza los bytearrays en los que se reciben y reensamblan los frames'''
+
+    size = 65536 #Tamano minimo de cada buffer. Cabe cualquier datagrama UDP.
+    max_buffers = 64 #Numero maximo de buffers libres que se guardan.
+    free = None #Buffers libres.
+    allocated = 0 #Buffers que se han tenido que crear por estar el pool vacio o ser pequenos.
+
+    def __init__(self, count, size):
+        '''
+        Nombre: __init__
+        Descripcion: Constructor que reserva los buffers.
+        Argumentos: count: Numero de buffers que se reservan y que se guardan como mucho.
+                    size: Tamano minimo de cada buffer.
+        '''
+        self.size = size
+        self.max_buffers = count
+        self.free = deque(bytearray(size) for _ in range(count))
+        self.allocated = 0
+
+    def acquire(self, size=0):
+        '''
+        Nombre: acquire
+        Descripcion: Saca un buffer del pool. Si esta vacio, o el buffer es demasiado pequeno, crea uno.
+        Argumentos: size: Bytes que necesita el que lo pide. Si es mayor que el tamano del pool
+                          el buffer nuevo se crea de ese tamano, y a la vuelta queda en el pool.
+        Retorno:
+            Un bytearray de al menos max(size, tamano del pool) bytes.
+        '''
+        try:
+            buf = self.free.pop()
+            if len(buf) >= size:
+                return buf
+        except IndexError:
+            pass
+        self.allocated += 1
+        return bytearray(max(size, self.size))
+
+    def release(self, buf):
+        '''
+        Nombre: release
+        Descripcion: Devuelve un buffer al pool. Nadie debe seguir leyendo de el.
+        Argumentos: buf: Buffer a devolver. Si no es un bytearray (por ejemplo, bytes de un
+                         frame que no vino del pool) se ignora.
+        '''
+        if isinstance(buf, bytearray) and len(self.free) < self.max_buffers:
+            self.free.append(buf)
+
+    def release_view(self, data):
+        '''
+        Nombre: release_view
+        Descripcion: Devuelve al pool el buffer sobre el que esta un memoryview.
+        Argumentos: data: memoryview (o bytes, que se ignoran).
+        '''
+        if isinstance(data, memoryview):
+            self.release(data.obj)
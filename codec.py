@@ -0,0 +1,229 @@
+'''
+    codec.py
+    Modulo con los codecs de imagen con los que se comprime el video: el registro de
+    codecs, sus opciones y la eleccion del codec segun lo que acepta el otro extremo.
+    @author Alejandro Bravo, Miguel Gonzalez
+    @version 1.0
+    @date 18-10-2026
+
+    DESCRIPCION GENERAL DEL MODULO
+    Cada codec tiene un token con el que se anuncia en la lista de protocolos del servidor de
+    descubrimiento y un identificador que viaja en los bits VIDEO_CODEC_MASK de los flags de la
+    cabecera binaria, de modo que el receptor sabe con que descomprimir cada frame. JPEG es el
+    codec base (identificador 0) y lo entiende cualquier cliente, por lo que no necesita token;
+    con la cabecera de texto de V0 solo se envia JPEG.
+
+    Para JPEG hay dos implementaciones que producen el mismo formato y se eligen localmente con
+    JPEG_BACKEND: la de OpenCV y la de libjpeg-turbo a traves de PyTurboJPEG, si esta instalado.
+    Ambas permiten descomprimir a 1/2, 1/4 o 1/8 de resolucion, que es mucho mas rapido que
+    descomprimir entero y reescalar despues. WebP comprime mas a igual calidad a cambio de mas CPU.
+
+    Opciones de JPEG (ver config.py):
+        JPEG_SUBSAMPLING: submuestreo de croma "444", "422" o "420".
+        JPEG_OPTIMIZE: tablas de Huffman optimizadas para cada imagen (algo menos de tamano, mas CPU).
+        JPEG_RESTART: intervalo de reinicio en MCUs (0 sin marcadores). Solo con OpenCV.
+'''
+
+import cv2
+import numpy as np
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_444, TJSAMP_422, TJSAMP_420
+except ImportError:
+    TurboJPEG = None
+
+CODEC_JPEG = 0 #Identificador de JPEG en los flags de la cabecera
+CODEC_WEBP = 1 #Identificador de WebP en los flags de la cabecera
+
+#Factores de reduccion que admite la descompresion escalada
+DECODE_SCALES = (1, 2, 4, 8)
+#Flags de cv2.imdecode para cada factor de reduccion
+CV2_REDUCED = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+class Codec():
+    '''Codec: Interfaz comun de los codecs de imagen'''
+
+    token = None #Token con el que se anuncia en la lista de protocolos. None si todos lo aceptan.
+    codec_id = CODEC_JPEG #Identificador en los flags de la cabecera.
+
+    def encode(self, frame, quality):
+        '''
+        Nombre: encode
+        Descripcion: Comprime un frame. Puede ejecutarse en varios hilos a la vez.
+        Argumentos: frame: Frame BGR a comprimir.
+                    quality: Calidad entre 0 y 100.
+        Retorno:
+            Buffer con el frame comprimido (array de numpy o bytes), o None en caso de error.
+        '''
+        return None
+
+    def decode(self, content, scale=1):
+        '''
+        Nombre: decode
+        Descripcion: Descomprime un frame. Puede ejecutarse en varios hilos a la vez.
+        Argumentos: content: Frame comprimido (bytes o memoryview).
+                    scale: Factor de reduccion de DECODE_SCALES.
+        Retorno:
+            El frame BGR descomprimido, o None en caso de error.
+        '''
+        return None
+
+class OpenCVJpegCodec(Codec):
+    '''Codec JPEG de OpenCV: El que se usaba siempre. Admite todas las opciones de JPEG'''
+
+    SAMPLING = {"444": cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444, "422": cv2.IMWRITE_JPEG_SAMPLING_FACTOR_422,
+                "420": cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420}
+
+    params = None #Parametros de cv2.imencode salvo la calidad.
+
+    def __init__(self, subsampling="420", optimize=False, restart=0):
+        '''
+        Nombre: __init__
+        Descripcion: Constructor que ajusta las opciones de compresion.
+        Argumentos: subsampling: Submuestreo de croma ("444", "422" o "420").
+                    optimize: True para optimizar las tablas de Huffman.
+                    restart: Intervalo de reinicio en MCUs, 0 para no poner marcadores.
+        '''
+        self.params = [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, self.SAMPLING.get(subsampling, cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420),
+                       cv2.IMWRITE_JPEG_OPTIMIZE, int(bool(optimize))]
+        if restart > 0:
+            self.params += [cv2.IMWRITE_JPEG_RST_INTERVAL, int(restart)]
+
+    def encode(self, frame, quality):
+        result, encimg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)] + self.params)
+        if not result:
+            return None
+        return encimg
+
+    def decode(self, content, scale=1):
+        return cv2.imdecode(np.frombuffer(content, np.uint8), CV2_REDUCED.get(scale, cv2.IMREAD_COLOR))
+
+class TurboJpegCodec(Codec):
+    '''Codec JPEG de libjpeg-turbo: Mas rapido que el de OpenCV, mismo formato en la red'''
+
+    turbo = None #Objeto TurboJPEG. Es seguro usarlo desde varios hilos.
+    subsampling = 2 #Submuestreo de croma de turbojpeg.
+
+    def __init__(self, subsampling="420", optimize=False, restart=0):
+        '''
+        Nombre: __init__
+        Descripcion: Constructor que carga libjpeg-turbo. Lanza RuntimeError si no esta disponible.
+        Argumentos: subsampling: Submuestreo de croma ("444", "422" o "420").
+                    optimize: Ignorado: PyTurboJPEG no lo expone.
+                    restart: Ignorado: PyTurboJPEG no lo expone.
+        '''
+        if TurboJPEG is None:
+            raise RuntimeError("PyTurboJPEG no esta instalado")
+        self.turbo = TurboJPEG()
+        self.subsampling = {"444": TJSAMP_444, "422": TJSAMP_422}.get(subsampling, TJSAMP_420)
+        if optimize or restart > 0:
+            print("JPEG_OPTIMIZE y JPEG_RESTART no se aplican con libjpeg-turbo.")
+
+    def encode(self, frame, quality):
+        try:
+            return self.turbo.encode(frame, quality=int(quality), pixel_format=TJPF_BGR, jpeg_subsample=self.subsampling)
+        except OSError as e:
+            print("Error al codificar imagen con libjpeg-turbo: " + str(e))
+            return None
+
+    def decode(self, content, scale=1):
+        try:
+            return self.turbo.decode(content, pixel_format=TJPF_BGR, scaling_factor=(1, scale) if scale > 1 else None)
+        except OSError as e:
+            print("Error al decodificar imagen con libjpeg-turbo: " + str(e))
+            return None
+
+class WebPCodec(Codec):
+    '''Codec WebP de OpenCV: Frames mas pequenos que JPEG a igual calidad, a cambio de mas CPU'''
+
+    token = "WEBP"
+    codec_id = CODEC_WEBP
+
+    def encode(self, frame, quality):
+        #WebP acepta calidad de 1 a 100; por encima de 100 seria sin perdidas
+        result, encimg = cv2.imencode('.webp', frame, [cv2.IMWRITE_WEBP_QUALITY, min(100, max(1, int(quality)))])
+        if not result:
+            return None
+        return encimg
+
+    def decode(self, content, scale=1):
+        #WebP no tiene descompresion escalada: se descomprime entero
+        return cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+
+#Codecs que se pueden elegir con CODEC. La clase de JPEG se sustituye por la de JPEG_BACKEND
+CODECS = {"jpeg": OpenCVJpegCodec, "webp": WebPCodec}
+#Implementaciones de JPEG que se pueden elegir con JPEG_BACKEND
+JPEG_BACKENDS = {"opencv": OpenCVJpegCodec, "turbojpeg": TurboJpegCodec}
+
+def create_jpeg_codec(config):
+    '''
+    Nombre: create_jpeg_codec
+    Descripcion: Crea el codec JPEG indicado en JPEG_BACKEND. Si libjpeg-turbo no esta disponible usa el de OpenCV.
+    Argumentos: config: Objeto de configuracion.
+    Retorno:
+        El codec JPEG.
+    '''
+    options = (config.JPEG_SUBSAMPLING, config.JPEG_OPTIMIZE, config.JPEG_RESTART)
+    backend = JPEG_BACKENDS.get(config.JPEG_BACKEND)
+    if backend is None:
+        print("JPEG_BACKEND desconocido: " + str(config.JPEG_BACKEND) + ". Se usa el JPEG de OpenCV.")
+        backend = OpenCVJpegCodec
+    try:
+        return backend(*options)
+    except (RuntimeError, OSError) as e:
+        print("No se puede usar " + str(config.JPEG_BACKEND) + " (" + str(e) + "). Se usa el JPEG de OpenCV.")
+    return OpenCVJpegCodec(*options)
+
+def create_codecs(config):
+    '''
+    Nombre: create_codecs
+    Descripcion: Crea un codec de cada tipo para descomprimir lo que llegue.
+    Argumentos: config: Objeto de configuracion.
+    Retorno:
+        Diccionario identificador de codec -> codec.
+    '''
+    codecs = {codec.codec_id: codec() for codec in CODECS.values() if codec.codec_id != CODEC_JPEG}
+    codecs[CODEC_JPEG] = create_jpeg_codec(config)
+    return codecs
+
+def codec_tokens():
+    '''
+    Nombre: codec_tokens
+    Descripcion: Tokens de los codecs que hay que anunciar en la lista de protocolos.
+    Retorno:
+        Lista de tokens.
+    '''
+    return [c.token for c in CODECS.values() if c.token is not None]
+
+def choose_codec(codecs, name, protocols, binary_header):
+    '''
+    Nombre: choose_codec
+    Descripcion: Elige el codec del video saliente: el de CODEC si el otro extremo lo acepta, y si no JPEG.
+    Argumentos: codecs: Diccionario de create_codecs.
+                name: Nombre del codec preferido (CODEC).
+                protocols: Lista de protocolos del otro cliente.
+                binary_header: True si se usa la cabecera binaria (los demas codecs necesitan sus flags).
+    Retorno:
+        El codec a usar.
+    '''
+    preferred = CODECS.get(name)
+    if preferred is None:
+        print("Codec desconocido: " + str(name) + ". Se usa JPEG.")
+    elif preferred.token is not None and binary_header and preferred.token in protocols:
+        return codecs[preferred.codec_id]
+    return codecs[CODEC_JPEG]
+
+def decode_scale(width, max_width):
+    '''
+    Nombre: decode_scale
+    Descripcion: Mayor factor de reduccion con el que el frame descomprimido sigue teniendo al menos max_width de ancho.
+    Argumentos: width: Ancho del frame.
+                max_width: Ancho que hace falta, 0 para descomprimir entero.
+    Retorno:
+        Factor de DECODE_SCALES.
+    '''
+    scale = 1
+    if max_width > 0:
+        for candidate in DECODE_SCALES:
+            if width // candidate >= max_width:
+                scale = candidate
+    return scale
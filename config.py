@@ -24,18 +24,104 @@ class ConfigParser():
     #Parametros control
     call_timeout = 15 #Timeout para responder a la llamada
     user_filename = "usuario.json" #Fichero de usuario
+    CONTROL_BACKEND = "threads" #Implementacion del control: "threads" (hilos y semaforo) o "asyncio" (bucle de eventos).
 
     #Config server descubrimiento
     server_ip = "vega.ii.uam.es" #IP del servidor de descubrimiento
     server_port = 8000 #Puerto del servidor de descubrimiento
+    DISCOVERY_CACHE_TTL = 300 #Segundos que se guardan en cache los usuarios consultados. 0 para preguntar siempre al servidor.
+    DISCOVERY_CACHE_SIZE = 256 #Usuarios que se guardan en cache como maximo.
+    DISCOVERY_CACHE_FILE = "" #Fichero en el que se guarda la cache entre ejecuciones. Vacio para no guardarla.
+    DISCOVERY_POOL_SIZE = 2 #Conexiones con el servidor de descubrimiento como maximo, para atender varias peticiones a la vez.
 
     #V1
     REPORT_REFRESH = 10.0 #Cada cuanto tiempo se envia un reporte de perdidas
     REPORT_WEIGHT = 0.7 #Peso que se le da a los reportes de perdidas frente a las perdidas de trafico entrante
 
+    #Fragmentacion
+    MAX_DATAGRAM_SIZE = 1400 #Tamano maximo de cada datagrama de video, para no provocar fragmentacion IP.
+    REASSEMBLY_SLOTS = 32 #Numero maximo de frames a medio reensamblar.
+    REASSEMBLY_TIMEOUT = 0.5 #Segundos que se espera a que lleguen todos los fragmentos de un frame.
+
+    #Retardo de reproduccion adaptativo
+    JITTER_FACTOR = 3.0 #Multiplo del jitter estimado que se reserva como margen de retardo.
+    PLAYOUT_RATE_STEP = 0.1 #Fraccion en la que se acelera o frena la reproduccion segun lo lleno que este el buffer.
+
+    #Compresion en paralelo
+    ENCODE_WORKERS = 2 #Hilos que comprimen el video saliente. Con 0 se comprime en el hilo de captura.
+    ENCODE_QUEUE = 4 #Frames que pueden estar comprimiendose o esperando a enviarse a la vez.
+    DECODE_WORKERS = 2 #Hilos que descomprimen por adelantado el video entrante. Con 0 se descomprime al reproducir.
+
+    #Interfaz
+    DISPLAY_FPS = 30 #Veces por segundo que se intenta repintar la pantalla (solo si hay frames nuevos).
+    STATUS_REFRESH = 0.5 #Cada cuanto se actualiza como mucho la barra de estado.
+    LIST_REFRESH = 0.2 #Cada cuanto se refresca como mucho la lista de usuarios mientras llega el listado.
+
+    #Codificacion delta por tiles
+    TILE_DELTA = False #Enviar solo los tiles que cambian, si el otro extremo acepta TILES.
+    TILE_SIZE = 32 #Lado de cada tile en pixeles.
+    TILE_THRESHOLD = 4.0 #Diferencia media por pixel y canal a partir de la cual un tile se reenvia.
+    TILE_REFRESH = 2.0 #Segundos maximos entre frames completos.
+    TILE_MAX_FRACTION = 0.5 #Si cambia mas de esta fraccion de tiles se envia el frame completo.
+
+    #Correccion de errores (FEC)
+    FEC = False #Enviar datagramas de paridad XOR, si el otro extremo acepta FEC y FRAG.
+    FEC_MIN_RATIO = 0.1 #Proteccion minima: paridades por fragmento (0.1 = una paridad cada 10 fragmentos).
+    FEC_MAX_RATIO = 0.5 #Proteccion maxima a la que puede subir el QoS antes de bajar la resolucion.
+
+    #Retransmision selectiva (NACK)
+    NACK = False #Pedir por el canal de control los frames perdidos que aun pueden llegar a tiempo, si el otro extremo acepta NACK.
+    NACK_HISTORY = 32 #Frames enviados que se guardan por si el otro extremo los pide.
+    NACK_INTERVAL = 0.02 #Segundos minimos entre dos NACK. Los huecos detectados entre medias se piden juntos.
+
+    #Control de tasa
+    RATE_CONTROLLER = "" #Controlador de tasa ("aimd", "fixed"). Vacio para el QoS por escalones segun perdidas.
+    RATE_REFRESH = 0.5 #Cada cuanto se recalcula la tasa objetivo.
+    RATE_START = 4000000 #Tasa objetivo en bits por segundo al empezar una llamada.
+    RATE_MIN = 150000 #Tasa objetivo minima en bits por segundo.
+    RATE_MAX = 10000000 #Tasa objetivo maxima en bits por segundo.
+    MAX_KBPS = 0 #Tope de kbit/s del video saliente. La calidad de cada frame se elige para no pasarlo. 0 sin tope.
+
+    #Codecs
+    CODEC = "jpeg" #Codec del video saliente ("jpeg", "webp"). Si el otro extremo no lo acepta se usa JPEG.
+    JPEG_BACKEND = "opencv" #Implementacion de JPEG ("opencv", "turbojpeg"). Si no esta instalada se usa OpenCV.
+    JPEG_SUBSAMPLING = "420" #Submuestreo de croma de JPEG ("444", "422", "420").
+    JPEG_OPTIMIZE = False #Optimizar las tablas de Huffman de cada JPEG.
+    JPEG_RESTART = 0 #Intervalo de reinicio de JPEG en MCUs. 0 sin marcadores de reinicio.
+    DECODE_MAX_WIDTH = 0 #Ancho que hace falta del video entrante. Si el frame es mayor se descomprime reducido. 0 siempre entero.
+
+    #Recepcion
+    RECV_POOL_SIZE = 32 #Buffers de recepcion reservados de antemano (64 KB cada uno).
+    RECV_BITRATE = 16000000 #Bits por segundo que se espera recibir como mucho. Con el se dimensiona SO_RCVBUF.
+    RECV_FPS = 30 #FPS que se espera recibir, para pasar BUFFER_THRESHOLD frames a bytes al dimensionar SO_RCVBUF.
+
+    #Llamadas de grupo
+    GROUP_MAX = 8 #Participantes como maximo en una llamada de grupo, contando al anfitrion.
+    SIMULCAST = False #Enviar el video en varias capas en las llamadas de grupo, para que cada participante reciba la que aguanta su conexion.
+    SIMULCAST_LAYERS = "640x480,320x240,160x120" #Resoluciones de las capas, separadas por comas.
+
+    #Emision multicast
+    BROADCAST_GROUP = "239.192.0.1" #Grupo multicast al que se envia la emision (ambito local de la organizacion).
+    BROADCAST_PORT = 5004 #Puerto UDP del grupo multicast.
+    BROADCAST_TTL = 1 #Saltos que puede dar el video multicast. 1 no sale de la LAN.
+    BROADCAST_INTERFACE = "" #IP de la interfaz por la que se envia y se recibe la emision. Vacio para la de por defecto.
+    BROADCAST_REPORT_RATE = 5 #Reportes de perdidas por segundo que recibe como mucho el emisor, sumando todos los espectadores.
+    BROADCAST_LOSS_PERCENTILE = 80 #Percentil de las perdidas de los espectadores con el que se ajusta el QoS del emisor.
+
     #Nombres de las variables que se pueden ajustar
     can_set = ["BUFFER_SIZE", "BUFFER_THRESHOLD", "FIXED_DELAY_THRESHOLD", "FPS_REFRESH", "QUALITY_REFRESH",
-               "RESOLUTION_REFRESH", "call_timeout", "user_filename", "server_ip", "server_port", "REPORT_REFRESH", "REPORT_WEIGHT"]
+               "RESOLUTION_REFRESH", "call_timeout", "user_filename", "CONTROL_BACKEND", "server_ip", "server_port", "DISCOVERY_CACHE_TTL", "DISCOVERY_CACHE_SIZE", "DISCOVERY_CACHE_FILE", "DISCOVERY_POOL_SIZE", "REPORT_REFRESH", "REPORT_WEIGHT",
+               "MAX_DATAGRAM_SIZE", "REASSEMBLY_SLOTS", "REASSEMBLY_TIMEOUT",
+               "JITTER_FACTOR", "PLAYOUT_RATE_STEP", "ENCODE_WORKERS", "ENCODE_QUEUE", "DECODE_WORKERS",
+               "DISPLAY_FPS", "STATUS_REFRESH", "LIST_REFRESH",
+               "TILE_DELTA", "TILE_SIZE", "TILE_THRESHOLD", "TILE_REFRESH", "TILE_MAX_FRACTION",
+               "RECV_POOL_SIZE", "RECV_BITRATE", "RECV_FPS", "FEC", "FEC_MIN_RATIO", "FEC_MAX_RATIO",
+               "NACK", "NACK_HISTORY", "NACK_INTERVAL",
+               "RATE_CONTROLLER", "RATE_REFRESH", "RATE_START", "RATE_MIN", "RATE_MAX", "MAX_KBPS",
+               "CODEC", "JPEG_BACKEND", "JPEG_SUBSAMPLING", "JPEG_OPTIMIZE", "JPEG_RESTART", "DECODE_MAX_WIDTH",
+               "GROUP_MAX", "SIMULCAST", "SIMULCAST_LAYERS",
+               "BROADCAST_GROUP", "BROADCAST_PORT", "BROADCAST_TTL", "BROADCAST_INTERFACE", "BROADCAST_REPORT_RATE",
+               "BROADCAST_LOSS_PERCENTILE"]
 
     #Cargamos el fichero
     def __init__(self):
@@ -16,12 +16,151 @@
     5. Los bucles gestionan las conexiones y comandos entrantes por si solos, de manera sincronizada.
     6. Si se desea terminar la conexion, hay que hacer call_end() y control_disconnect().
     7. Para detener los bucles se usan las funciones de stop.
+
+    FORMATO DE LOS MENSAJES (extension FRAMED)
+    Si el otro extremo anuncia FRAMED, cada mensaje termina en salto de linea y se pueden enviar
+    varios seguidos sin esperar respuesta: MessageParser los separa aunque TCP los junte en un
+    mismo recv o parta uno entre varios. Con clientes que no lo anuncian cada recv se toma como
+    un mensaje, como siempre.
 '''
 
 import socket
 import time
 import threading
 import json
+from collections import deque
+
+class MessageParser():
+    '''Parser de mensajes de control: Separa de forma incremental los mensajes de una conexion'''
+
+    MAX_MESSAGE = 4096 #Longitud maxima de un mensaje. Si se supera sin salto de linea se descarta lo recibido.
+    RECV_SIZE = 4096 #Bytes que se reciben de una vez.
+
+    framed = False #True si el otro extremo termina cada mensaje con salto de linea (FRAMED).
+    buffer = None #Bytes recibidos que aun no forman un mensaje completo.
+    chunk = None #Buffer de recepcion, reutilizado en cada recv.
+    ready = None #Mensajes completos pendientes de procesar, en orden de llegada.
+
+    def __init__(self, framed=False):
+        '''
+            Nombre: __init__
+            Descripcion: Crea el parser de una conexion.
+            Argumentos: framed: True si el otro extremo termina los mensajes con salto de linea. Si no,
+                                cada recv es un mensaje (clientes sin FRAMED).
+        '''
+        self.framed = framed
+        self.buffer = bytearray()
+        self.chunk = bytearray(self.RECV_SIZE)
+        self.ready = deque()
+
+    def feed(self, data):
+        '''
+            Nombre: feed
+            Descripcion: Anade bytes recibidos y separa los mensajes completos que contengan.
+            Argumentos: data: Bytes recibidos (bytes, bytearray o memoryview).
+        '''
+        self.buffer += data
+        if not self.framed:
+            #Sin FRAMED lo recibido es un mensaje entero; si trae saltos de linea, son varios
+            end = len(self.buffer)
+        else:
+            end = self.buffer.rfind(b"\n") + 1
+            if end == 0:
+                if len(self.buffer) > self.MAX_MESSAGE:
+                    print("Mensaje de control demasiado largo. Descartando " + str(len(self.buffer)) + " bytes.")
+                    self.buffer.clear()
+                return
+        for line in bytes(self.buffer[:end]).split(b"\n"):
+            if line.strip():
+                self.ready.append(line.decode(errors="replace"))
+        del self.buffer[:end]
+
+    def receive(self, sock):
+        '''
+            Nombre: receive
+            Descripcion: Devuelve el siguiente mensaje de la conexion, recibiendo solo si no hay ninguno pendiente.
+                         Los errores del socket (timeout incluido) se propagan.
+            Argumentos: sock: Socket de la conexion.
+            Retorno:
+                El mensaje como cadena, o "" si el otro extremo ha cerrado la conexion.
+        '''
+        while not self.ready:
+            received = sock.recv_into(self.chunk)
+            if received == 0:
+                return self.flush()
+            self.feed(memoryview(self.chunk)[:received])
+        return self.ready.popleft()
+
+    def flush(self):
+        '''
+            Nombre: flush
+            Descripcion: Se llama al cerrarse la conexion: lo recibido sin salto de linea final es un ultimo
+                         mensaje completo (un CALL_BUSY o CALL_DENIED de un cliente sin FRAMED, por ejemplo).
+            Retorno:
+                Ese ultimo mensaje, o "" si no queda nada.
+        '''
+        line = bytes(self.buffer).decode(errors="replace").strip()
+        self.buffer.clear()
+        return line
+
+    def encode(self, mensaje, final=False):
+        '''
+            Nombre: encode
+            Descripcion: Codifica un mensaje para enviarlo por la conexion.
+            Argumentos: mensaje: Mensaje como cadena.
+                        final: True si es la respuesta con la que se cierra la conexion (CALL_BUSY, CALL_DENIED).
+                               Se envia siempre con salto de linea, porque aun no se sabe si el otro extremo usa
+                               FRAMED, y los que no lo usan separan los mensajes por el salto de linea igualmente.
+            Retorno:
+                Los bytes a enviar, con salto de linea final si el otro extremo usa FRAMED.
+        '''
+        if self.framed or final:
+            mensaje += "\n"
+        return mensaje.encode()
+
+class SocketLink():
+    '''Enlace de control: Una conexion TCP bloqueante con su parser, con la interfaz de ControlSession (send y close)'''
+
+    sock = None #Socket de la conexion.
+    parser = None #Parser de los mensajes de la conexion.
+    send_lock = None #Cerrojo de envio: varios hilos pueden enviar a la vez por la misma conexion.
+
+    def __init__(self, sock, parser):
+        '''
+            Nombre: __init__
+            Descripcion: Crea el enlace de una conexion ya establecida.
+            Argumentos: sock: Socket de la conexion.
+                        parser: MessageParser de la conexion.
+        '''
+        self.sock = sock
+        self.parser = parser
+        self.send_lock = threading.Lock()
+
+    def send(self, data):
+        '''
+            Nombre: send
+            Descripcion: Envia datos por la conexion. Se puede llamar desde cualquier hilo.
+            Argumentos: data: Bytes a enviar.
+            Retorno:
+                Numero de bytes enviados, o 0 si la conexion esta cerrada.
+        '''
+        with self.send_lock:
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                return 0
+        return len(data)
+
+    def close(self):
+        '''
+            Nombre: close
+            Descripcion: Cierra la conexion, desbloqueando al hilo que la este leyendo. Se puede llamar varias veces.
+        '''
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
 
 class Control():
     '''Clase de control: Objeto que encapsula el estado y la funcionalidad del modulo de control'''
@@ -47,6 +186,9 @@ class Control():
     call_timeout = 15 #Timeout para responder a la llamada
     user_filename = "usuario.json" #Fichero de usuario
     video_buffer = None #Buffer del modulo de video
+    parser = MessageParser() #Parser de la conexion de control actual.
+    group = None #Llamada de grupo (ver group.py). Mientras hay una no se aceptan otras llamadas.
+    broadcast = None #Emision multicast (ver broadcast.py). Mientras se emite o se ve una no se aceptan llamadas.
 
     def __init__(self, discovery, call_timeout, user_filename, video_buffer):
         '''
@@ -62,6 +204,22 @@ class Control():
         self.user_filename = user_filename
         self.video_buffer = video_buffer
 
+    def set_group(self, group):
+        '''
+            Nombre: set_group
+            Descripcion: Ajusta la llamada de grupo, que atiende las invitaciones GROUP_CALLING.
+            Argumentos: group: Objeto GroupCall.
+        '''
+        self.group = group
+
+    def set_broadcast(self, broadcast):
+        '''
+            Nombre: set_broadcast
+            Descripcion: Ajusta la emision multicast, que atiende a los espectadores que piden BROADCAST_JOIN.
+            Argumentos: broadcast: Objeto Broadcast.
+        '''
+        self.broadcast = broadcast
+
     # INFORMACION
     def get_username(self):
         '''
@@ -136,13 +294,21 @@ class Control():
         if connected_to_read is not None:
             print("Error conectandose al usuario indicado. Ya esta conectado al usuario: " + connected_to_read)
             return -1
+        if self.group is not None and self.group.busy():
+            print("Error conectandose al usuario indicado. Hay una llamada de grupo en curso.")
+            return -1
+        if self.broadcast is not None and self.broadcast.busy():
+            print("Error conectandose al usuario indicado. Hay una emision en curso.")
+            return -1
 
         #Obtenemos la IP y el puerto.
         ret = self.discovery.query_user(username)
-        if ret is None:
+        if ret is None or ret == -1:
             print("Error conectandose al usuario indicado. El servidor reporta que no existe.")
             return -1
         if self.connect_to_addr(ret[0], ret[1]) == -1:
+            #Puede que la direccion de la cache ya no sea valida
+            self.discovery.invalidate_user(username)
             return -1
 
         #Ajuste de parametros
@@ -151,8 +317,8 @@ class Control():
             self.on_hold = False #Reinicia la espera de la llamada.
             self.call_held = False
             self.on_call_with = [ret[0], None] #Vamos ajustando la IP de video
-            if "V1" in ret[2]:
-                self.video_buffer.set_using_v1()
+            self.video_buffer.set_peer_protocols(ret[2])
+            self.parser = MessageParser("FRAMED" in ret[2])
         return self.call(int(self.get_video_port())) #Se efectua la llamada
 
     def connect_to_addr(self, ip, port):
@@ -187,6 +353,11 @@ class Control():
                 self.control_socket.close()
                 self.control_socket = None
                 return -1
+            except OSError as e:
+                print ("No ha sido posible conectarse al usuario: " + str(e))
+                self.control_socket.close()
+                self.control_socket = None
+                return -1
 
         return 0
 
@@ -238,22 +409,26 @@ class Control():
                 print ("Error llamando: no se esta conectado a ningun usuario.")
                 return None
             mensaje = "CALLING " + self.get_username() + " " + str(dstport)
-            self.control_socket.send(mensaje.encode())
+            self.control_socket.send(self.parser.encode(mensaje))
 
         with self.global_lock:
             #Por si cambia la conexion, guardamos el socket actual. Esto es para no bloquear el lock durante receive que puede tardar.
             control_socket_read = self.control_socket
+            parser = self.parser
 
         try:
             #try except por si nos han cerrado el socket, y para el timeout.
+            #Lo que llegue detras de la respuesta se queda en el parser para el hilo de comandos.
             control_socket_read.settimeout(self.call_timeout)
-            result = control_socket_read.recv(1024)
+            result = parser.receive(control_socket_read)
             control_socket_read.settimeout(None)
         except socket.timeout:
             print("Error iniciando llamada: el otro lado no ha respondido. Cerrando conexion...")
             self.connection_barrier.release() #Para que pueda hacerse la desconexion
             self.control_disconnect()
             return -1
+        except OSError:
+            result = ""
 
         self.connection_barrier.release() #Subimos el semaforo de conexion, ya solo leera el otro hilo
 
@@ -264,7 +439,7 @@ class Control():
             return -1
 
         #Obtenemos las palabras de la respuesta
-        words = result.decode().split()
+        words = result.split()
         if len(words) == 0:
             #No hay respuesta suficiente
             print ("Error llamando usuario. El destinatario no respondio.")
@@ -323,7 +498,7 @@ class Control():
                     print ("La llamada ya está en espera por parte de este extremo.")
                     return -1
                 mensaje = "CALL_HOLD " + self.get_username()
-                self.control_socket.send(mensaje.encode())
+                self.control_socket.send(self.parser.encode(mensaje))
                 print("Llamada puesta en espera.")
                 self.on_hold = True
             else:
@@ -332,7 +507,7 @@ class Control():
                     print("La llamada ya está reanudada desde este extremo.")
                     return -1
                 mensaje = "CALL_RESUME " + self.get_username()
-                self.control_socket.send(mensaje.encode())
+                self.control_socket.send(self.parser.encode(mensaje))
                 print("Espera retirada de la llamada.")
                 self.on_hold = False
         return 0
@@ -358,7 +533,7 @@ class Control():
                 return -1
 
             mensaje = "CALL_END " + self.get_username()
-            self.control_socket.send(mensaje.encode())
+            self.control_socket.send(self.parser.encode(mensaje))
 
             self.on_call_with[1] = None
         return 0
@@ -384,10 +559,61 @@ class Control():
                 return -1
 
             mensaje = "LOSS_REPORT " + str(lost) + " " + str(time.time())
-            self.control_socket.send(mensaje.encode())
+            self.control_socket.send(self.parser.encode(mensaje))
             print("Enviado reporte: " + mensaje)
         return 0
 
+    def send_rate_report(self, bitrate):
+        '''
+        Nombre: send_rate_report
+        Descripcion: Envia al otro extremo la tasa objetivo que estimamos para su video.
+        Argumentos: bitrate: Tasa en bits por segundo.
+        Retorno:
+            0 si todo es correcto, -1 en caso de error.
+        '''
+
+        with self.global_lock:
+            #Zona protegida porque opera con el estado y los sockets.
+
+            #Si no hay conexiones, error.
+            if self.control_socket is None or self.connected_to is None:
+                print("Error enviando tasa: no esta conectado con ningun usuario.")
+                return -1
+
+            if self.on_call_with[0] is None or self.on_call_with[1] is None:
+                print("Error enviando tasa: no esta en llamada.")
+                return -1
+
+            mensaje = "RATE_REPORT " + str(int(bitrate))
+            self.control_socket.send(self.parser.encode(mensaje))
+        return 0
+
+    def send_nack(self, nums, margin):
+        '''
+        Nombre: send_nack
+        Descripcion: Pide al otro extremo que reenvie los frames indicados (NACK).
+        Argumentos: nums: Lista de numeros de orden de los frames perdidos.
+                    margin: Segundos que puede tardar un frame desde su envio sin llegar tarde.
+        Retorno:
+            0 si todo es correcto, -1 en caso de error.
+        '''
+
+        with self.global_lock:
+            #Zona protegida porque opera con el estado y los sockets.
+
+            #Si no hay conexiones, error.
+            if self.control_socket is None or self.connected_to is None:
+                print("Error enviando NACK: no esta conectado con ningun usuario.")
+                return -1
+
+            if self.on_call_with[0] is None or self.on_call_with[1] is None:
+                print("Error enviando NACK: no esta en llamada.")
+                return -1
+
+            mensaje = "NACK " + str(round(margin, 4)) + " " + ",".join(str(num) for num in nums)
+            self.control_socket.send(self.parser.encode(mensaje))
+        return 0
+
     def call_status(self):
         '''
             Nombre: call_status
@@ -435,7 +661,7 @@ class Control():
 
             if(self.control_socket != None):
                 try:
-                    msg = self.control_socket.recv(1024) #Recibimos mensaje
+                    msg = self.parser.receive(self.control_socket) #Recibimos mensaje (o tomamos uno ya recibido)
                 except OSError:
                     self.connection_barrier.release()
                     self.control_disconnect()
@@ -451,8 +677,6 @@ class Control():
                         incoming_end_read = self.incoming_end
                     continue
 
-                msg = msg.decode()
-
                 print("Hilo de procesado de mensajes recibe: " + msg)
             else:
                 self.connection_barrier.release()
@@ -460,31 +684,7 @@ class Control():
                     incoming_end_read = self.incoming_end
                 continue
 
-            words = msg.split()
-            will_end = False
-
-            if(len(words) < 1):
-                #El mensaje esta vacio
-                self.connection_barrier.release()
-                with self.global_lock:
-                    incoming_end_read = self.incoming_end
-                continue
-
-            if(words[0] == "CALL_HOLD" and len(words) >= 2):
-                print("El usuario " + words[1] + " pone la llamada en espera.")
-                #Poner en espera
-                with self.global_lock:
-                    self.call_held = True
-            elif(words[0] == "CALL_RESUME" and len(words) >= 2):
-                print("El usuario " + words[1] + " retira su espera.")
-                #Quitar espera
-                with self.global_lock:
-                    self.call_held = False
-            elif(words[0] == "LOSS_REPORT" and len(words) >= 3):
-                print("Reporte de perdidas recibido: " + words[1] + " perdidas, timestamp: " + words[2])
-                self.video_buffer.set_loss_report(int(words[1]), float(words[2]))
-            elif(words[0] == "CALL_END"):
-                will_end = True
+            will_end = self.process_message(msg)
 
             self.connection_barrier.release()
 
@@ -501,6 +701,46 @@ class Control():
 
         print("Hilo de procesado de mensajes saliendo...")
 
+    def process_message(self, msg):
+        '''
+            Nombre: process_message
+            Descripcion: Atiende un comando recibido por la conexion de control de la llamada actual.
+            Argumentos:
+                msg: Mensaje recibido, como cadena.
+            Retorno:
+                True si el otro extremo ha terminado la llamada y hay que cerrar la conexion, False si no.
+        '''
+        words = msg.split()
+        if(len(words) < 1):
+            #El mensaje esta vacio
+            return False
+
+        if(words[0] == "CALL_HOLD" and len(words) >= 2):
+            print("El usuario " + words[1] + " pone la llamada en espera.")
+            #Poner en espera
+            with self.global_lock:
+                self.call_held = True
+        elif(words[0] == "CALL_RESUME" and len(words) >= 2):
+            print("El usuario " + words[1] + " retira su espera.")
+            #Quitar espera
+            with self.global_lock:
+                self.call_held = False
+        elif(words[0] == "CALL_END"):
+            return True
+        try:
+            if(words[0] == "LOSS_REPORT" and len(words) >= 3):
+                print("Reporte de perdidas recibido: " + words[1] + " perdidas, timestamp: " + words[2])
+                self.video_buffer.set_loss_report(int(words[1]), float(words[2]))
+            elif(words[0] == "RATE_REPORT" and len(words) >= 2):
+                self.video_buffer.set_rate_report(int(words[1]))
+            elif(words[0] == "NACK" and len(words) >= 3):
+                #Reenviamos los frames pedidos que aun puedan llegar a tiempo
+                self.video_buffer.resend_frames([int(num) for num in words[2].split(",")], float(words[1]))
+        except ValueError:
+            #Numeros mal formados: se ignora el mensaje sin cortar la llamada
+            print("Mensaje de control malformado: " + msg)
+        return False
+
     def control_incoming_stop(self):
         '''
             Nombre: control_incoming_stop
@@ -555,8 +795,10 @@ class Control():
 
             #Vemos a ver si esta intentando llamar.
             connection.settimeout(self.socket_timeout) #Ponemos un timeout por si no responden
+            #Aun no sabemos si el llamante usa FRAMED: el CALLING se lee como un recv, que vale en ambos casos
+            parser = MessageParser()
             try:
-                msg = connection.recv(1024)
+                msg = parser.receive(connection)
             except socket.timeout:
                 print ("Conexion rechazada ante la falta de comandos.")
                 connection.close()
@@ -571,15 +813,26 @@ class Control():
                     listen_end_read = self.listen_end
                 continue
 
-            msg = msg.decode()
             words = msg.split()
 
             print("Conexion entrante pide: " + msg)
+            #Los espectadores de una emision se unen sin preguntar al usuario. Todos anuncian FRAMED.
+            if len(words) >= 2 and words[0] == "BROADCAST_JOIN" and self.broadcast is not None:
+                parser.framed = True
+                if self.broadcast.add_viewer(SocketLink(connection, parser), words[1]) is None:
+                    print("No estamos emitiendo. Informando a " + words[1] + "...")
+                    connection.send(parser.encode("CALL_DENIED " + self.get_username(), final=True))
+                    connection.close()
+                with self.global_lock:
+                    listen_end_read = self.listen_end
+                continue
+
             #Si no esta intentando llamar cerramos
-            if(len(words) < 3 or words[0] != "CALLING"):
+            group_call = len(words) >= 3 and words[0] == "GROUP_CALLING" and self.group is not None
+            if(len(words) < 3 or (words[0] != "CALLING" and not group_call)):
                 print("Llamada denegada por peticion malformada: " + msg)
                 end_call = "CALL_DENIED " + self.get_username()
-                connection.send(end_call.encode())
+                connection.send(parser.encode(end_call, final=True))
                 connection.close()
                 with self.global_lock:
                     listen_end_read = self.listen_end
@@ -589,19 +842,23 @@ class Control():
             with self.global_lock:
                 connected_to_read = self.connected_to
                 control_socket_read = self.control_socket
-            if(connected_to_read != None or control_socket_read != None):
+            if(connected_to_read != None or control_socket_read != None or (self.group is not None and self.group.busy())
+               or (self.broadcast is not None and self.broadcast.busy())):
                 print("Ya hay una conexion activa. Respondiendo a " + words[1] + " como llamada ocupada.")
-                connection.send(b'CALL_BUSY')
+                connection.send(parser.encode("CALL_BUSY", final=True))
                 connection.close()
                 with self.global_lock:
                     listen_end_read = self.listen_end
                 continue
             #Comprobar si el usuario rechaza la conexion
-            accepted = gui.yesNoBox("Llamada entrante.", words[1] + " esta llamando. Desea coger la llamada?")
+            if group_call:
+                accepted = gui.yesNoBox("Llamada de grupo entrante.", words[1] + " le invita a una llamada de grupo. Desea unirse?")
+            else:
+                accepted = gui.yesNoBox("Llamada entrante.", words[1] + " esta llamando. Desea coger la llamada?")
             if not accepted:
                 print("Llamada rechazada. Informando a " + words[1] + " y cortando su conexion...")
                 call_denied = "CALL_DENIED " + self.get_username()
-                connection.send(call_denied.encode())
+                connection.send(parser.encode(call_denied, final=True))
                 connection.close()
                 with self.global_lock:
                     listen_end_read = self.listen_end
@@ -609,11 +866,29 @@ class Control():
 
             #Obtenemos que version esta usando la otra parte:
             ret = self.discovery.query_user(words[1])
+            if group_call:
+                #La llamada de grupo lleva su propia conexion de control con el anfitrion
+                joined = None
+                if ret is not None and ret != -1:
+                    parser.framed = "FRAMED" in ret[2]
+                    joined = self.group.join(SocketLink(connection, parser), words[1], addr[0], words[2], ret[2])
+                if joined is None:
+                    print("Invitacion de grupo rechazada. Informando a " + words[1] + "...")
+                    connection.send(parser.encode("CALL_DENIED " + self.get_username(), final=True))
+                    connection.close()
+                with self.global_lock:
+                    listen_end_read = self.listen_end
+                continue
+            if ret is None or ret == -1:
+                print("Llamada rechazada: el servidor no devuelve los datos de " + words[1] + ". Informando y cortando su conexion...")
+                connection.send(parser.encode("CALL_DENIED " + self.get_username(), final=True))
+                connection.close()
+                with self.global_lock:
+                    listen_end_read = self.listen_end
+                continue
             if "V1" in ret[2]:
-                uses_v1 = True
                 print("Llamante usa V1")
             else:
-                uses_v1 = False
                 print("Llamante no usa V1")
 
             #Si no, esta pasa a ser la conexion actual
@@ -621,14 +896,15 @@ class Control():
                 print("Llamada aceptada. Cambiando conexion de control actual...")
                 self.control_socket = connection
                 self.connected_to = words[1]
-                if uses_v1:
-                    self.video_buffer.set_using_v1()
+                self.video_buffer.set_peer_protocols(ret[2])
+                parser.framed = "FRAMED" in ret[2]
+                self.parser = parser
                 self.on_call_with = [addr[0], words[2]]
                 self.on_hold = False
                 self.call_held = False
                 self.connection_barrier.release() #Levantamos la barrera de conexion
                 start_call = "CALL_ACCEPTED " + self.get_username() + " " + self.get_video_port()
-                sent = connection.send(start_call.encode())
+                sent = connection.send(parser.encode(start_call))
                 listen_end_read = self.listen_end
             if not sent: #Esto ocurre si antes de que aceptemos nos han cerrado.
                 self.control_disconnect()
@@ -0,0 +1,543 @@
+'''
+    control_async.py
+    Modulo de control implementado con asyncio: escucha de conexiones, lectura de cada conexion
+    y maquina de estados de la llamada en un unico bucle de eventos.
+    @author Alejandro Bravo, Miguel Gonzalez
+    @version 1.0
+    @date 18-10-2026
+
+    DESCRIPCION GENERAL DEL MODULO
+    AsyncControl tiene la misma interfaz que control.Control, de modo que el cliente puede usar
+    uno u otro (CONTROL_BACKEND en config.py). En lugar de dos hilos bloqueados coordinados con
+    un semaforo, todas las conexiones de control se atienden con corrutinas en un bucle de
+    eventos. Cada conexion es una ControlSession con su propia tarea de lectura y su estado:
+
+        HANDSHAKE -> RINGING -> ACTIVE    (llamada entrante: espera CALLING, pregunta al usuario)
+        CALLING -> ACTIVE                 (llamada saliente: espera CALL_ACCEPTED)
+        cualquiera -> CLOSED
+
+    Solo una sesion puede estar en RINGING, CALLING o ACTIVE a la vez; las demas llamadas reciben
+    CALL_BUSY sin esperar a que se resuelva la actual, y una conexion que no envia nada no bloquea
+    al resto. Las operaciones bloqueantes (descubrimiento, cuadros de dialogo) se ejecutan en el
+    pool de hilos del bucle. Las invitaciones a llamadas de grupo (GROUP_CALLING, ver group.py) pasan
+    por los mismos estados; si se aceptan, la sesion queda como conexion con el anfitrion. Los espectadores
+    de una emision (BROADCAST_JOIN, ver broadcast.py) no pasan por RINGING: se anaden sin preguntar, y
+    cada uno es una sesion mas, asi que el emisor atiende a todos sin un hilo por espectador.
+
+    Fachada sincrona:
+    1. control_listen_loop(port, gui) ejecuta el bucle de eventos en el hilo que la llama, hasta control_listen_stop().
+    2. control_incoming_loop(gui) solo espera a control_incoming_stop(): los comandos los atiende el bucle de eventos.
+    3. connect_to, control_disconnect, set_on_hold, end_call, call_status y los envios de reportes se
+       pueden llamar desde cualquier hilo, como en Control. La sesion actual se guarda en control_socket
+       y su parser en parser, por lo que los envios de Control funcionan sin cambios.
+'''
+
+import asyncio
+import threading
+from control import Control, MessageParser
+
+SESSION_HANDSHAKE = 0 #Conexion entrante que aun no ha enviado CALLING
+SESSION_RINGING = 1 #Llamada entrante esperando a que el usuario la coja
+SESSION_CALLING = 2 #Llamada saliente esperando la respuesta del otro extremo
+SESSION_ACTIVE = 3 #Llamada en curso
+SESSION_CLOSED = 4 #Conexion cerrada
+
+class ControlSession():
+    '''Sesion de control: Una conexion TCP con otro cliente y el estado de su llamada'''
+
+    loop = None #Bucle de eventos al que pertenece la conexion.
+    reader = None #StreamReader de la conexion.
+    writer = None #StreamWriter de la conexion. Solo se usa desde el bucle de eventos.
+    state = SESSION_HANDSHAKE #Estado de la llamada (SESSION_*).
+    addr = None #IP y puerto del otro extremo.
+    parser = None #Parser de los mensajes de la conexion.
+
+    def __init__(self, loop, reader, writer, state):
+        '''
+        Nombre: __init__
+        Descripcion: Crea la sesion de una conexion ya establecida.
+        Argumentos: loop: Bucle de eventos.
+                    reader, writer: Streams de la conexion.
+                    state: Estado inicial (SESSION_HANDSHAKE para las entrantes, SESSION_CALLING para las salientes).
+        '''
+        self.loop = loop
+        self.reader = reader
+        self.writer = writer
+        self.state = state
+        self.addr = writer.get_extra_info("peername")
+        self.parser = MessageParser()
+
+    def send(self, data):
+        '''
+        Nombre: send
+        Descripcion: Envia datos por la conexion. Se puede llamar desde cualquier hilo: la escritura
+                     se encola en el bucle de eventos y no espera a que se complete.
+        Argumentos: data: Bytes a enviar.
+        Retorno:
+            Numero de bytes encolados, o 0 si la conexion esta cerrada.
+        '''
+        if self.state == SESSION_CLOSED or self.loop.is_closed():
+            return 0
+        self.loop.call_soon_threadsafe(self.writer.write, data)
+        return len(data)
+
+    def close(self):
+        '''
+        Nombre: close
+        Descripcion: Cierra la conexion. Se puede llamar desde cualquier hilo y varias veces.
+        '''
+        if self.state == SESSION_CLOSED:
+            return
+        self.state = SESSION_CLOSED
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.writer.close)
+
+class AsyncControl(Control):
+    '''Control con asyncio: Misma interfaz que Control con un bucle de eventos en lugar de hilos y semaforos'''
+
+    loop = None #Bucle de eventos del control.
+    stop_event = None #Evento que detiene el bucle de eventos.
+    incoming_done = None #Evento que libera control_incoming_loop.
+    gui = None #Interfaz para los cuadros de dialogo.
+    ringing = None #Sesion entrante que espera a que el usuario coja la llamada.
+    sessions = None #Sesiones abiertas, para cerrarlas al parar.
+    tasks = None #Tareas de las sesiones, para cancelarlas al parar.
+    backlog = 64 #Conexiones pendientes de aceptar que admite el socket de escucha.
+
+    def __init__(self, discovery, call_timeout, user_filename, video_buffer):
+        '''
+            Nombre: __init__
+            Descripcion: Inicializa los parametros deseados y crea el bucle de eventos (sin arrancarlo).
+            Argumentos: los mismos que Control.
+        '''
+        super().__init__(discovery, call_timeout, user_filename, video_buffer)
+        self.global_lock = threading.Lock()
+        self.on_call_with = [None, None]
+        self.loop = asyncio.new_event_loop()
+        self.stop_event = asyncio.Event()
+        self.incoming_done = threading.Event()
+        self.sessions = set()
+        self.tasks = set()
+
+    # FACHADA SINCRONA
+
+    def connect_to(self, username):
+        '''
+            Nombre: connect_to
+            Descripcion: Inicializa la conexion de control con un usuario y lo llama. Bloquea hasta que responde.
+            Argumentos: username: Nombre de usuario.
+            Retorno:
+                Lo mismo que Control.connect_to.
+        '''
+        if not self.loop.is_running():
+            print("Error conectandose al usuario indicado. El bucle de control no esta en marcha.")
+            return -1
+        return asyncio.run_coroutine_threadsafe(self.dial(username), self.loop).result()
+
+    def control_disconnect(self):
+        '''
+            Nombre: control_disconnect
+            Descripcion: Finaliza la conexion de control actual. Se puede llamar desde cualquier hilo.
+            Argumentos:
+            Retorno:
+                0 si todo ha ido correctamente, -1 en caso de error.
+        '''
+        with self.global_lock:
+            session = self.control_socket
+            #Reinicio de variables
+            self.on_call_with = [None, None]
+            self.control_socket = None
+            self.connected_to = None
+            self.on_hold = False
+        if session is None:
+            return -1
+        session.close()
+        return 0
+
+    def control_incoming_loop(self, gui):
+        '''
+            Nombre: control_incoming_loop
+            Descripcion: Por compatibilidad con Control: los comandos los atiende el bucle de eventos,
+                         asi que solo espera a control_incoming_stop.
+            Argumentos:
+                gui: Interfaz para mostrar informacion
+        '''
+        self.gui = gui
+        self.incoming_done.wait()
+        print("Hilo de procesado de mensajes saliendo...")
+
+    def control_incoming_stop(self):
+        '''
+            Nombre: control_incoming_stop
+            Descripcion: Libera control_incoming_loop.
+        '''
+        self.incoming_done.set()
+
+    def control_listen_loop(self, port, gui):
+        '''
+            Nombre: control_listen_loop
+            Descripcion: Ejecuta el bucle de eventos del control, escuchando en el puerto pasado, hasta control_listen_stop.
+            Argumentos:
+                    port: puerto de escucha como cadena. Por ejemplo "1234"
+                    gui: Objeto interfaz grafica para preguntar al usuario si coge las llamadas.
+            Retorno:
+                Imprime salida por pantalla. -1 en caso de error, 0 en caso correcto.
+        '''
+        self.gui = gui
+        self.tcp_port = port
+        asyncio.set_event_loop(self.loop)
+        try:
+            ret = self.loop.run_until_complete(self.serve(int(port)))
+        finally:
+            self.loop.close()
+        print("Hilo de escucha de peticiones saliendo...")
+        return ret
+
+    def control_listen_stop(self):
+        '''
+            Nombre: control_listen_stop
+            Descripcion: Detiene el bucle de eventos. No hace falta conectarse a uno mismo para desbloquear accept.
+        '''
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+
+    # BUCLE DE EVENTOS
+
+    async def serve(self, port):
+        '''
+            Nombre: serve
+            Descripcion: Escucha conexiones de control hasta que se activa stop_event, y despues cierra todas las sesiones.
+            Argumentos: port: Puerto de escucha.
+            Retorno:
+                -1 en caso de error, 0 en caso correcto.
+        '''
+        try:
+            server = await asyncio.start_server(self.handle_connection, '', port, backlog=self.backlog)
+        except OSError as e:
+            print("Error abriendo socket para escuchar conexiones de control: " + str(e))
+            return -1
+        print("Bucle de control operativo en puerto: " + str(port))
+
+        await self.stop_event.wait()
+        server.close()
+        self.control_disconnect()
+        for session in list(self.sessions):
+            session.close()
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await server.wait_closed()
+        return 0
+
+    def track(self, session):
+        '''
+            Nombre: track
+            Descripcion: Registra una sesion y la tarea actual para cerrarlas al parar.
+            Argumentos: session: Sesion de control.
+        '''
+        self.sessions.add(session)
+        self.tasks.add(asyncio.current_task())
+
+    def untrack(self, session):
+        '''
+            Nombre: untrack
+            Descripcion: Olvida una sesion que ha terminado y cierra su conexion.
+            Argumentos: session: Sesion de control.
+        '''
+        session.close()
+        self.sessions.discard(session)
+        self.tasks.discard(asyncio.current_task())
+
+    def is_busy(self):
+        '''
+            Nombre: is_busy
+            Descripcion: Indica si hay una llamada en curso, sonando o saliendo. Hay que llamarla con global_lock.
+            Retorno:
+                True si no se puede empezar otra llamada.
+        '''
+        return (self.connected_to is not None or self.control_socket is not None or self.ringing is not None
+                or (self.group is not None and self.group.busy()) or (self.broadcast is not None and self.broadcast.busy()))
+
+    async def receive(self, session, timeout=None):
+        '''
+            Nombre: receive
+            Descripcion: Devuelve el siguiente mensaje de una sesion, recibiendo solo si no hay ninguno pendiente.
+            Argumentos: session: Sesion de control.
+                        timeout: Segundos de espera como mucho en cada lectura, None sin limite.
+            Retorno:
+                El mensaje como cadena, "" si la conexion se ha cerrado, o None si se agota el tiempo.
+        '''
+        parser = session.parser
+        try:
+            while not parser.ready:
+                data = await asyncio.wait_for(session.reader.read(parser.RECV_SIZE), timeout)
+                if not data:
+                    return parser.flush()
+                parser.feed(data)
+        except asyncio.TimeoutError:
+            return None
+        except OSError:
+            return ""
+        return parser.ready.popleft()
+
+    async def handle_connection(self, reader, writer):
+        '''
+            Nombre: handle_connection
+            Descripcion: Atiende una conexion entrante: espera el CALLING, pregunta al usuario y, si coge la
+                         llamada, pasa a ser la sesion actual y atiende sus comandos hasta que se cierra.
+            Argumentos: reader, writer: Streams de la conexion.
+        '''
+        session = ControlSession(self.loop, reader, writer, SESSION_HANDSHAKE)
+        self.track(session)
+        try:
+            await self.answer(session)
+        finally:
+            self.untrack(session)
+
+    async def answer(self, session):
+        '''
+            Nombre: answer
+            Descripcion: Maquina de estados de una llamada entrante (HANDSHAKE -> RINGING -> ACTIVE).
+            Argumentos: session: Sesion de la conexion entrante.
+        '''
+        print("Aceptada conexion desde " + session.addr[0] + ":" + str(session.addr[1]))
+        msg = await self.receive(session, self.socket_timeout)
+        if msg is None:
+            print("Conexion rechazada ante la falta de comandos.")
+            return
+        if not msg: #En caso de que nos cierren la conexion.
+            return
+
+        words = msg.split()
+        print("Conexion entrante pide: " + msg)
+        #Los espectadores de una emision se unen sin preguntar al usuario
+        if len(words) >= 2 and words[0] == "BROADCAST_JOIN" and self.broadcast is not None:
+            await self.broadcast_loop(session, words)
+            return
+        #Si no esta intentando llamar cerramos
+        group_call = len(words) >= 3 and words[0] == "GROUP_CALLING" and self.group is not None
+        if len(words) < 3 or (words[0] != "CALLING" and not group_call):
+            print("Llamada denegada por peticion malformada: " + msg)
+            session.send(session.parser.encode("CALL_DENIED " + self.get_username(), final=True))
+            return
+
+        #Si ya estamos en llamada, o sonando otra, estamos ocupados.
+        with self.global_lock:
+            busy = self.is_busy()
+            if not busy:
+                self.ringing = session
+        if busy:
+            print("Ya hay una conexion activa. Respondiendo a " + words[1] + " como llamada ocupada.")
+            session.send(session.parser.encode("CALL_BUSY", final=True))
+            return
+
+        session.state = SESSION_RINGING
+        try:
+            #Los cuadros de dialogo y el descubrimiento bloquean: se ejecutan fuera del bucle de eventos
+            if group_call:
+                accepted = await self.loop.run_in_executor(None, self.gui.yesNoBox, "Llamada de grupo entrante.",
+                                                           words[1] + " le invita a una llamada de grupo. Desea unirse?")
+            else:
+                accepted = await self.loop.run_in_executor(None, self.gui.yesNoBox, "Llamada entrante.",
+                                                           words[1] + " esta llamando. Desea coger la llamada?")
+            ret = await self.loop.run_in_executor(None, self.discovery.query_user, words[1]) if accepted else None
+        finally:
+            with self.global_lock:
+                self.ringing = None
+
+        if not accepted or ret is None or ret == -1:
+            if accepted:
+                print("Llamada rechazada: el servidor no devuelve los datos de " + words[1] + ".")
+            print("Llamada rechazada. Informando a " + words[1] + " y cortando su conexion...")
+            session.send(session.parser.encode("CALL_DENIED " + self.get_username(), final=True))
+            return
+        if group_call:
+            await self.group_loop(session, words, ret)
+            return
+
+        with self.global_lock:
+            if session.state == SESSION_CLOSED:
+                #Nos han colgado o hemos parado mientras sonaba
+                return
+            print("Llamada aceptada. Cambiando conexion de control actual...")
+            self.control_socket = session
+            self.connected_to = words[1]
+            self.video_buffer.set_peer_protocols(ret[2])
+            session.parser.framed = "FRAMED" in ret[2]
+            self.parser = session.parser
+            self.on_call_with = [session.addr[0], words[2]]
+            self.on_hold = False
+            self.call_held = False
+            session.state = SESSION_ACTIVE
+        session.send(session.parser.encode("CALL_ACCEPTED " + self.get_username() + " " + str(self.get_video_port())))
+        await self.session_loop(session)
+
+    async def group_loop(self, session, words, ret):
+        '''
+            Nombre: group_loop
+            Descripcion: Se une a la llamada de grupo a la que invita la sesion y atiende sus mensajes hasta que se cierra.
+            Argumentos: session: Sesion con el anfitrion.
+                        words: Palabras de la invitacion GROUP_CALLING.
+                        ret: Datos del anfitrion segun el descubrimiento.
+        '''
+        if session.state == SESSION_CLOSED:
+            return
+        session.state = SESSION_ACTIVE
+        session.parser.framed = "FRAMED" in ret[2]
+        host = self.group.join(session, words[1], session.addr[0], words[2], ret[2], read=False)
+        if host is None:
+            print("Invitacion de grupo rechazada. Informando a " + words[1] + "...")
+            session.send(session.parser.encode("CALL_DENIED " + self.get_username(), final=True))
+            return
+        while True:
+            msg = await self.receive(session)
+            if not msg or self.group.process_message(host, msg):
+                break
+        #Al terminar la llamada se avisa con un cuadro de dialogo, que bloquea
+        await self.loop.run_in_executor(None, self.group.member_closed, host)
+
+    async def broadcast_loop(self, session, words):
+        '''
+            Nombre: broadcast_loop
+            Descripcion: Anade a la emision al espectador de la sesion y atiende sus reportes hasta que se cierra.
+            Argumentos: session: Sesion con el espectador.
+                        words: Palabras de la peticion BROADCAST_JOIN.
+        '''
+        #Todos los clientes con BROADCAST anuncian FRAMED
+        session.parser.framed = True
+        viewer = self.broadcast.add_viewer(session, words[1], read=False)
+        if viewer is None:
+            print("No estamos emitiendo. Informando a " + words[1] + "...")
+            session.send(session.parser.encode("CALL_DENIED " + self.get_username(), final=True))
+            return
+        session.state = SESSION_ACTIVE
+        while True:
+            msg = await self.receive(session)
+            if not msg or self.broadcast.process_message(viewer, msg):
+                break
+        self.broadcast.peer_closed(viewer)
+
+    async def dial(self, username):
+        '''
+            Nombre: dial
+            Descripcion: Maquina de estados de una llamada saliente (CALLING -> ACTIVE).
+            Argumentos: username: Nombre de usuario.
+            Retorno:
+                Lo mismo que Control.connect_to.
+        '''
+        with self.global_lock:
+            connected_to_read = self.connected_to
+            busy = self.is_busy()
+        if busy:
+            print("Error conectandose al usuario indicado. Ya esta conectado al usuario: " + str(connected_to_read))
+            return -1
+
+        #Obtenemos la IP y el puerto.
+        ret = await self.loop.run_in_executor(None, self.discovery.query_user, username)
+        if ret is None or ret == -1:
+            print("Error conectandose al usuario indicado. El servidor reporta que no existe.")
+            return -1
+
+        print("Conectandose al usuario con ip " + ret[0] + " y puerto " + ret[1])
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(ret[0], int(ret[1])), self.socket_timeout)
+        except asyncio.TimeoutError:
+            print("No ha sido posible conectarse al usuario. El usuario no ha aceptado la conexion en el tiempo establecido.")
+            self.discovery.invalidate_user(username)
+            return -1
+        except OSError as e:
+            print("No ha sido posible conectarse al usuario: " + str(e))
+            self.discovery.invalidate_user(username)
+            return -1
+
+        session = ControlSession(self.loop, reader, writer, SESSION_CALLING)
+        session.parser.framed = "FRAMED" in ret[2]
+        with self.global_lock:
+            busy = self.is_busy()
+            if not busy:
+                self.control_socket = session
+                self.connected_to = username
+                self.on_hold = False #Reinicia la espera de la llamada.
+                self.call_held = False
+                self.on_call_with = [ret[0], None] #Vamos ajustando la IP de video
+                self.video_buffer.set_peer_protocols(ret[2])
+                self.parser = session.parser
+        if busy:
+            #Ha entrado una llamada mientras conectabamos
+            print("Error conectandose al usuario indicado. Ha entrado otra llamada.")
+            session.close()
+            return -1
+
+        session.send(session.parser.encode("CALLING " + self.get_username() + " " + str(self.get_video_port())))
+        result = await self.receive(session, self.call_timeout)
+        if result is None:
+            print("Error iniciando llamada: el otro lado no ha respondido. Cerrando conexion...")
+            self.control_disconnect()
+            return -1
+        if not result:
+            print("Error iniciando llamada: el otro extremo ha cerrado la conexion.")
+            self.control_disconnect()
+            return -1
+
+        #Obtenemos las palabras de la respuesta. Lo que llegue detras se queda en el parser para session_loop.
+        words = result.split()
+        if words[0] == "CALL_ACCEPTED":
+            if len(words) < 3:
+                print("Error en la respuesta del destinatario. No ha devuelto nick o puerto destino.")
+                self.control_disconnect()
+                return -1
+            print("Llamada aceptada por destinatario. Desea puerto: " + words[2])
+            with self.global_lock:
+                if session.state == SESSION_CLOSED:
+                    return -1
+                self.on_call_with[1] = words[2] #Ajustamos el puerto de llamada.
+                session.state = SESSION_ACTIVE
+            self.loop.create_task(self.outgoing_loop(session))
+            return int(words[2])
+        elif words[0] == "CALL_DENIED":
+            print("Destinatario rechaza llamada. Desconectando...")
+            self.control_disconnect()
+            return -3
+        elif words[0] == "CALL_BUSY":
+            print("Destinatario esta en llamada. Desconectando...")
+            self.control_disconnect()
+            return -2
+        #Respuesta desconocida
+        print("Error desconocido llamando.")
+        self.control_disconnect()
+        return None
+
+    async def outgoing_loop(self, session):
+        '''
+            Nombre: outgoing_loop
+            Descripcion: Tarea que atiende los comandos de una llamada saliente aceptada.
+            Argumentos: session: Sesion de la llamada.
+        '''
+        self.track(session)
+        try:
+            await self.session_loop(session)
+        finally:
+            self.untrack(session)
+
+    async def session_loop(self, session):
+        '''
+            Nombre: session_loop
+            Descripcion: Atiende los comandos de la llamada en curso hasta que se cierra la conexion o llega CALL_END.
+            Argumentos: session: Sesion de la llamada.
+        '''
+        while True:
+            msg = await self.receive(session)
+            if not msg:
+                break
+            print("Bucle de control recibe: " + msg)
+            if self.process_message(msg):
+                self.control_disconnect()
+                if self.gui is not None:
+                    self.loop.run_in_executor(None, self.gui.infoBox, "Llamada finalizada.", "El otro usuario ha terminado la llamada.")
+                return
+
+        with self.global_lock:
+            current = self.control_socket is session
+        if current:
+            print("Cerrando conexion de control actual ante el cierre por la parte contraria.")
+            self.control_disconnect()
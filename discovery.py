@@ -4,44 +4,604 @@
     @author Miguel Gonzalez, Alejandro Bravo.
     @version 1.0
     @date 22-04-2020
+
+    CACHE DE USUARIOS
+    Las respuestas a QUERY se guardan en una cache con caducidad (TTL) y expulsion del menos usado
+    (LRU), de modo que llamar o recibir una llamada de un usuario reciente no espera al servidor.
+    LIST_USERS no trae los protocolos: solo renueva las entradas cuya direccion coincide y borra
+    las que han cambiado. El control borra la entrada de un usuario si no consigue conectarse a el.
+    Si se indica un fichero, la cache se guarda al salir y se carga al arrancar.
+
+    CONEXIONES CON EL SERVIDOR
+    Cada peticion usa una conexion en exclusiva hasta recibir su respuesta, por lo que varios hilos
+    (la interfaz listando usuarios, el control consultando al que llama) ya no mezclan respuestas.
+    Las respuestas del servidor no llevan delimitador ni identificador (la de QUERY acaba en la lista
+    de protocolos, de longitud libre), asi que no se pueden encadenar varias peticiones en la misma
+    conexion: para atender varias a la vez se abren hasta pool_size conexiones, con una peticion en
+    vuelo cada una. Si una conexion falla se reconecta con espera exponencial y se repite la peticion.
+
+    LISTADO DE USUARIOS
+    La respuesta a LIST_USERS puede ocupar muchos recv. UsersListParser la procesa segun llega: cada
+    usuario se separa en cuanto llega su '#' y se pasa a quien lo haya pedido, sin volver a recorrer lo
+    ya recibido. UserDirectory guarda los usuarios listados indexados por nick (lista ordenada para
+    buscar por prefijo y trigramas para buscar por subcadena), para que la interfaz busque mientras se
+    escribe y muestre los resultados a medida que llega el listado.
 '''
 
 import socket
+import time
+import json
+import re
+import bisect
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+
+class DiscoveryCache():
+    '''Cache de usuarios: Direcciones y protocolos de los usuarios consultados, con TTL y LRU'''
+
+    ttl = 300 #Segundos que es valida una entrada.
+    max_entries = 256 #Entradas como maximo. Al pasarse se expulsa la menos usada.
+    filename = None #Fichero en el que se guarda la cache. None para no guardarla.
+    entries = None #Diccionario ordenado nick -> [ip, puerto, protocolos, instante]. El ultimo es el mas usado.
+    lock = None #Cerrojo de la cache: se consulta desde varios hilos.
+    hits = 0 #Consultas respondidas por la cache.
+    misses = 0 #Consultas que han tenido que ir al servidor.
+
+    def __init__(self, ttl, max_entries, filename=None):
+        '''
+            Nombre: __init__
+            Descripcion: Crea la cache y, si hay fichero, carga las entradas que no hayan caducado.
+            Argumentos: ttl: Segundos que es valida una entrada.
+                        max_entries: Entradas como maximo.
+                        filename: Fichero en el que se guarda la cache, o None.
+        '''
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.filename = filename
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        if filename:
+            self.load()
+
+    def get(self, nickname):
+        '''
+            Nombre: get
+            Descripcion: Busca un usuario en la cache.
+            Argumentos: nickname: Nombre del usuario.
+            Retorno:
+                Lista [ip, puerto, protocolos] como la de query_user, o None si no esta o ha caducado.
+        '''
+        with self.lock:
+            entry = self.entries.get(nickname)
+            if entry is not None and time.time() - entry[3] > self.ttl:
+                del self.entries[nickname]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(nickname)
+            self.hits += 1
+            return [entry[0], entry[1], list(entry[2])]
+
+    def put(self, nickname, ip, port, protocols):
+        '''
+            Nombre: put
+            Descripcion: Guarda o renueva un usuario, expulsando el menos usado si no cabe.
+            Argumentos: nickname: Nombre del usuario.
+                        ip, port, protocols: Datos como los devuelve query_user.
+        '''
+        with self.lock:
+            self.entries[nickname] = [ip, port, list(protocols), time.time()]
+            self.entries.move_to_end(nickname)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def refresh_address(self, nickname, ip, port):
+        '''
+            Nombre: refresh_address
+            Descripcion: Actualiza un usuario con una direccion del listado: si coincide con la guardada renueva
+                         la entrada, y si no la borra (sin protocolos no se puede guardar la nueva).
+            Argumentos: nickname: Nombre del usuario.
+                        ip, port: Direccion del listado.
+        '''
+        with self.lock:
+            entry = self.entries.get(nickname)
+            if entry is None:
+                return
+            if entry[0] == ip and entry[1] == port:
+                entry[3] = time.time()
+            else:
+                del self.entries[nickname]
+
+    def invalidate(self, nickname):
+        '''
+            Nombre: invalidate
+            Descripcion: Borra un usuario de la cache.
+            Argumentos: nickname: Nombre del usuario.
+        '''
+        with self.lock:
+            self.entries.pop(nickname, None)
+
+    def load(self):
+        '''
+            Nombre: load
+            Descripcion: Carga del fichero las entradas que no hayan caducado.
+        '''
+        try:
+            with open(self.filename, "r") as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return
+        except (json.JSONDecodeError, OSError):
+            print("Error leyendo la cache de descubrimiento. Se empieza vacia.")
+            return
+        now = time.time()
+        with self.lock:
+            #El fichero esta ordenado del menos al mas usado
+            try:
+                for nickname, entry in data:
+                    if now - entry[3] <= self.ttl:
+                        self.entries[nickname] = [entry[0], entry[1], list(entry[2]), entry[3]]
+            except (TypeError, ValueError, IndexError):
+                print("Cache de descubrimiento con formato incorrecto. Se ignora el resto.")
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        print("Cache de descubrimiento cargada con " + str(len(self.entries)) + " usuarios.")
+
+    def save(self):
+        '''
+            Nombre: save
+            Descripcion: Guarda la cache en el fichero, si lo hay.
+        '''
+        if not self.filename:
+            return
+        with self.lock:
+            data = list(self.entries.items())
+        try:
+            with open(self.filename, "w") as file:
+                json.dump(data, file)
+        except OSError:
+            print("Error guardando la cache de descubrimiento.")
+
+class DiscoveryConnection():
+    '''Conexion con el servidor de descubrimiento: Un socket que se reconecta solo si falla'''
+
+    RETRIES = 3 #Intentos de cada peticion antes de darla por fallida.
+    BACKOFF_MIN = 0.1 #Espera tras el primer fallo, en segundos.
+    BACKOFF_MAX = 2.0 #Espera maxima entre reconexiones, en segundos.
+    REQUEST_TIMEOUT = 5 #Segundos que se espera una respuesta antes de reconectar.
+    RECV_SIZE = 65536 #Bytes que se piden en cada recv: el listado de usuarios llega en pocos.
+
+    server_socket = None #Socket del servidor. None si no esta conectada.
+    server_ip = None #IP del servidor.
+    server_port = None #Puerto del servidor.
+    connect_timeout = 3 #Timeout para conectarse.
+    backoff = BACKOFF_MIN #Espera antes del siguiente intento de reconexion.
+    chunk = None #Buffer en el que se recibe, reutilizado en cada recv.
+
+    def __init__(self, server_ip, server_port, connect_timeout):
+        '''
+            Nombre: __init__
+            Descripcion: Prepara la conexion, sin conectarse todavia.
+            Argumentos: server_ip, server_port: Direccion del servidor.
+                        connect_timeout: Timeout para conectarse.
+        '''
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.connect_timeout = connect_timeout
+        self.chunk = bytearray(self.RECV_SIZE)
+
+    def connect(self):
+        '''
+            Nombre: connect
+            Descripcion: Se conecta al servidor si no lo estaba ya.
+            Retorno:
+                True si esta conectada, False en caso de error.
+        '''
+        if self.server_socket is not None:
+            return True
+        try:
+            self.server_socket = socket.create_connection((self.server_ip, self.server_port), self.connect_timeout)
+            self.server_socket.settimeout(self.REQUEST_TIMEOUT)
+        except OSError as e:
+            print("Error conectandose al servidor de descubrimiento: " + str(e))
+            self.server_socket = None
+            return False
+        return True
+
+    def close(self):
+        '''
+            Nombre: close
+            Descripcion: Cierra el socket, si estaba abierto.
+        '''
+        if self.server_socket is not None:
+            self.server_socket.close()
+            self.server_socket = None
+
+    def request(self, mensaje, parser=None):
+        '''
+            Nombre: request
+            Descripcion: Envia una peticion y recibe su respuesta. Si la conexion falla, reconecta con espera
+                         exponencial y repite la peticion hasta RETRIES veces (todas las peticiones se pueden repetir).
+            Argumentos: mensaje: Peticion como cadena.
+                        parser: Objeto con reset() y feed(bytes), que dice si la respuesta esta completa, al
+                                que se pasan los bytes segun llegan (ver UsersListParser).
+                                None si la respuesta llega en un solo recv.
+            Retorno:
+                La respuesta en bytes (o el parser, si se ha pasado), o None si no se ha podido obtener.
+        '''
+        for attempt in range(self.RETRIES):
+            if attempt > 0:
+                time.sleep(self.backoff)
+                self.backoff = min(self.backoff * 2, self.BACKOFF_MAX)
+            if not self.connect():
+                continue
+            try:
+                self.server_socket.sendall(mensaje.encode())
+                if parser is not None:
+                    #Si se repite la peticion la respuesta empieza de nuevo
+                    parser.reset()
+                while True:
+                    size = self.server_socket.recv_into(self.chunk)
+                    if size == 0:
+                        raise ConnectionError("el servidor ha cerrado la conexion")
+                    if parser is None:
+                        result = bytes(self.chunk[:size])
+                        break
+                    if parser.feed(memoryview(self.chunk)[:size]):
+                        result = parser
+                        break
+            except OSError as e:
+                print("Error con el servidor de descubrimiento (" + str(e) + "). Reconectando...")
+                self.close()
+                continue
+            self.backoff = self.BACKOFF_MIN
+            return result
+        return None
+
+    def quit(self):
+        '''
+            Nombre: quit
+            Descripcion: Se despide del servidor y cierra la conexion.
+            Retorno:
+                0 si todo ha ido correctamente, -1 si no estaba conectada.
+        '''
+        if self.server_socket is None:
+            return -1
+        try:
+            self.server_socket.sendall(b'QUIT')
+            result = self.server_socket.recv(1024)
+            if result.decode() != "BYE":
+                print ("Advertencia: El servidor no ha respondido al server_quit. Cerrando conexion...")
+        except OSError:
+            print ("Advertencia: El servidor no ha respondido al server_quit. Cerrando conexion...")
+        self.close()
+        return 0
+
+class UsersListParser():
+    '''Parser de LIST_USERS: Separa los usuarios segun llegan los bytes de la respuesta'''
+
+    #Cabecera de la respuesta correcta: las tres palabras y el espacio que las sigue
+    HEADER = re.compile(rb"\s*(\S+)\s+(\S+)\s+(\S+)\s")
+    #Respuesta completa sin usuarios (puede no llevar nada tras el 0)
+    EMPTY = re.compile(rb"\s*OK\s+USERS_LIST\s+0\s*")
+    #Primeras dos palabras de cualquier respuesta
+    WORDS = re.compile(rb"\s*(\S+)\s+(\S+)")
+
+    buffer = None #Bytes recibidos hasta ahora.
+    start = 0 #Posicion en buffer del primer usuario sin separar.
+    scan = 0 #Posicion en buffer desde la que buscar el siguiente '#'.
+    words = None #Dos primeras palabras de la respuesta, o None si aun no han llegado.
+    total = None #Usuarios que anuncia la cabecera, o None si aun no ha llegado.
+    users = None #Usuarios separados hasta ahora. Cada uno es [nick ip port ts].
+    done = False #Indica si la respuesta esta completa.
+    on_user = None #Funcion a la que se pasa cada usuario en cuanto se separa, o None.
+
+    def __init__(self, on_user=None):
+        '''
+            Nombre: __init__
+            Descripcion: Crea el parser.
+            Argumentos: on_user: Funcion a la que se pasa cada usuario en cuanto llega, o None.
+        '''
+        self.on_user = on_user
+        self.reset()
+
+    def reset(self):
+        '''
+            Nombre: reset
+            Descripcion: Olvida lo recibido para empezar con una respuesta nueva.
+        '''
+        self.buffer = bytearray()
+        self.start = 0
+        self.scan = 0
+        self.words = None
+        self.total = None
+        self.users = []
+        self.done = False
+
+    def feed(self, data):
+        '''
+            Nombre: feed
+            Descripcion: Anade bytes recibidos y separa los usuarios que ya esten completos.
+            Argumentos: data: Bytes recibidos.
+            Retorno:
+                True si la respuesta esta completa (o es una respuesta de error), False si falta por llegar.
+        '''
+        self.buffer += data
+        if self.total is None:
+            self.parse_header()
+        if self.total is not None:
+            self.parse_users()
+        return self.done
+
+    def parse_header(self):
+        '''
+            Nombre: parse_header
+            Descripcion: Lee la cabecera "OK USERS_LIST n" si ya ha llegado.
+        '''
+        match = self.WORDS.match(self.buffer)
+        if match is None:
+            return
+        self.words = [match.group(1).decode(errors="ignore"), match.group(2).decode(errors="ignore")]
+        if self.words[0] != "OK":
+            #Respuesta de error: llega entera
+            self.done = True
+            return
+        match = self.HEADER.match(self.buffer)
+        if match is None:
+            if self.EMPTY.fullmatch(self.buffer):
+                self.total = 0
+                self.done = True
+            return
+        try:
+            self.total = int(match.group(3))
+        except ValueError:
+            print("Advertencia en LIST: El servidor ha devuelto un numero de usuarios incorrecto.")
+            self.total = 0
+        self.start = self.scan = match.end()
+        self.done = self.total <= 0
+
+    def parse_users(self):
+        '''
+            Nombre: parse_users
+            Descripcion: Separa los usuarios cuyo '#' final ya ha llegado.
+        '''
+        while not self.done:
+            end = self.buffer.find(b"#", self.scan)
+            if end < 0:
+                self.scan = len(self.buffer)
+                return
+            self.scan = end + 1
+            usuario = bytes(self.buffer[self.start:end]).decode(errors="ignore").split()
+            #¿Por que no vale con el primer '#'? Pues porque algun gracioso se ha puesto de
+            #username: "mua#ja#ja#ja", y el server no lo prohibe. El '#' que cierra un usuario
+            #es el primero tras sus cuatro campos: los anteriores son parte del nick.
+            if len(usuario) < 4:
+                continue
+            self.start = self.scan
+            self.users.append(usuario)
+            if self.on_user is not None:
+                self.on_user(usuario)
+            self.done = len(self.users) >= self.total
+
+class UserDirectory():
+    '''Directorio de usuarios: Los usuarios listados, indexados para buscar por nick'''
+
+    MAX_RESULTS = 200 #Resultados que devuelve una busqueda como maximo.
+    GRAM = 3 #Longitud de los trozos del indice de subcadenas.
+
+    users = None #Diccionario nick -> [nick ip port ts].
+    keys = None #Lista ordenada de (nick en minusculas, nick) para buscar por prefijo.
+    grams = None #Diccionario trigrama -> conjunto de nicks que lo contienen.
+    seen = None #Nicks vistos en el listado en curso, o None si no hay ninguno en curso.
+    lock = None #Cerrojo del directorio: lo rellena un hilo y lo consulta la interfaz.
+
+    def __init__(self):
+        '''
+            Nombre: __init__
+            Descripcion: Crea el directorio vacio.
+        '''
+        self.users = {}
+        self.keys = []
+        self.grams = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.users)
+
+    def trigrams(self, text):
+        '''
+            Nombre: trigrams
+            Descripcion: Trozos de GRAM caracteres de un texto en minusculas.
+            Argumentos: text: Texto en minusculas.
+            Retorno:
+                Conjunto de trozos.
+        '''
+        return {text[i:i + self.GRAM] for i in range(len(text) - self.GRAM + 1)}
+
+    def begin_update(self):
+        '''
+            Nombre: begin_update
+            Descripcion: Empieza un listado nuevo. Los usuarios que no aparezcan en el se borran en end_update.
+        '''
+        with self.lock:
+            self.seen = set()
+
+    def end_update(self, complete=True):
+        '''
+            Nombre: end_update
+            Descripcion: Termina el listado en curso borrando los usuarios que ya no estan.
+            Argumentos: complete: False si el listado ha fallado: entonces no se borra nada.
+        '''
+        with self.lock:
+            seen = self.seen
+            self.seen = None
+            if not complete or seen is None:
+                return
+            for nickname in [n for n in self.users if n not in seen]:
+                self.remove(nickname)
+
+    def add(self, usuario):
+        '''
+            Nombre: add
+            Descripcion: Anade o actualiza un usuario del listado.
+            Argumentos: usuario: Lista [nick ip port ts] como las de list_users.
+        '''
+        nickname = usuario[0]
+        with self.lock:
+            if self.seen is not None:
+                self.seen.add(nickname)
+            if nickname not in self.users:
+                lowered = nickname.lower()
+                bisect.insort(self.keys, (lowered, nickname))
+                for gram in self.trigrams(lowered):
+                    self.grams.setdefault(gram, set()).add(nickname)
+            self.users[nickname] = usuario
+
+    def remove(self, nickname):
+        '''
+            Nombre: remove
+            Descripcion: Borra un usuario. Hay que llamarla con el cerrojo cogido.
+            Argumentos: nickname: Nombre del usuario.
+        '''
+        del self.users[nickname]
+        lowered = nickname.lower()
+        i = bisect.bisect_left(self.keys, (lowered, nickname))
+        del self.keys[i]
+        for gram in self.trigrams(lowered):
+            nicks = self.grams[gram]
+            nicks.discard(nickname)
+            if not nicks:
+                del self.grams[gram]
+
+    def get(self, nickname):
+        '''
+            Nombre: get
+            Descripcion: Datos de un usuario del listado.
+            Argumentos: nickname: Nombre del usuario.
+            Retorno:
+                Lista [nick ip port ts], o None si no esta.
+        '''
+        with self.lock:
+            return self.users.get(nickname)
+
+    def search(self, text, limit=MAX_RESULTS):
+        '''
+            Nombre: search
+            Descripcion: Busca usuarios cuyo nick contenga el texto, sin distinguir mayusculas.
+            Argumentos: text: Texto a buscar. Vacio para todos.
+                        limit: Resultados como maximo.
+            Retorno:
+                Lista de nicks: primero los que empiezan por el texto y luego los que lo contienen, en orden alfabetico.
+        '''
+        text = text.strip().lower()
+        with self.lock:
+            #Prefijo: los nicks que empiezan por el texto son consecutivos en la lista ordenada
+            result = []
+            i = bisect.bisect_left(self.keys, (text,))
+            while i < len(self.keys) and len(result) < limit and self.keys[i][0].startswith(text):
+                result.append(self.keys[i][1])
+                i += 1
+            if len(result) >= limit or not text:
+                return result
+
+            #Subcadena: candidatos con todos los trigramas del texto, o todos si es mas corto
+            if len(text) >= self.GRAM:
+                sets = sorted((self.grams.get(gram, set()) for gram in self.trigrams(text)), key=len)
+                candidates = set.intersection(*sets)
+            else:
+                candidates = self.users.keys()
+            prefixed = set(result)
+            others = sorted((n.lower(), n) for n in candidates if n not in prefixed and text in n.lower())
+            result += [n for _, n in others[:limit - len(result)]]
+            return result
 
 class Discovery():
     '''Clase de descubrimiento: mantiene el estado y las funcionalidades del modulo de descubrimiento'''
 
     socket_timeout = 3 #Timeout para la conexion
-    server_socket = None #Socket del servidor.
     server_ip = "vega.ii.uam.es" #Parametro con la IP
     server_port = 8000 #Parametro con el puerto
+    cache = None #Cache de usuarios consultados. None si esta desactivada.
+
+    #Conexiones
+    pool_size = 1 #Conexiones con el servidor como maximo.
+    connections = None #Todas las conexiones abiertas, la principal la primera.
+    idle = None #Cola de conexiones libres.
+    pool_lock = None #Cerrojo para crear conexiones nuevas.
+    executor = None #Hilos con los que se lanzan varias consultas a la vez (query_many).
 
-    def __init__(self, server_ip, server_port):
+    def __init__(self, server_ip, server_port, cache_ttl=0, cache_size=256, cache_file=None, pool_size=1):
         '''
             Nombre: __init__
             Descripcion: Inicializa la conexion con el servidor
             Argumentos: server_ip : Valor de la IP de discovery.
                         server_port: Valor del puerto de discovery.
+                        cache_ttl: Segundos que se guardan los usuarios consultados. 0 para no usar cache.
+                        cache_size: Usuarios que se guardan como maximo.
+                        cache_file: Fichero en el que se guarda la cache entre ejecuciones, o None.
+                        pool_size: Conexiones con el servidor como maximo para atender varias peticiones a la vez.
             Retorno:
                 Lanza una excepcion generica si algo va mal.
         '''
         self.server_ip = server_ip
         self.server_port = server_port
+        if cache_ttl > 0:
+            self.cache = DiscoveryCache(cache_ttl, cache_size, cache_file)
 
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        if self.server_socket == None:
-            raise Exception("Error abriendo socket de descubrimiento.")
+        self.pool_size = max(1, pool_size)
+        self.pool_lock = threading.Lock()
+        self.idle = queue.LifoQueue() #La ultima conexion usada es la que mas probablemente sigue viva
 
         print("Conectandose al servidor de descubrimiento...")
-        try:
-            self.server_socket.settimeout(self.socket_timeout)
-            self.server_socket.connect((self.server_ip,self.server_port))
-            self.server_socket.settimeout(None)
-        except:
-            #Timeout
-            self.server_socket.close()
-            self.server_socket = None
+        connection = DiscoveryConnection(self.server_ip, self.server_port, self.socket_timeout)
+        if not connection.connect():
             raise Exception("La conexion al server de descubrimiento ha dado timeout.")
+        self.connections = [connection]
+        self.idle.put(connection)
+
+    def acquire(self):
+        '''
+            Nombre: acquire
+            Descripcion: Toma una conexion libre. Si no hay ninguna abre otra, hasta pool_size, y si no espera a que se libere una.
+            Retorno:
+                La conexion, que hay que devolver con release.
+        '''
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.pool_lock:
+            if len(self.connections) < self.pool_size:
+                #La conexion nueva se conecta al hacer su primera peticion, fuera del cerrojo
+                connection = DiscoveryConnection(self.server_ip, self.server_port, self.socket_timeout)
+                self.connections.append(connection)
+                return connection
+        return self.idle.get()
+
+    def release(self, connection):
+        '''
+            Nombre: release
+            Descripcion: Devuelve una conexion a las libres.
+            Argumentos: connection: Conexion obtenida con acquire.
+        '''
+        self.idle.put(connection)
+
+    def request(self, mensaje, parser=None):
+        '''
+            Nombre: request
+            Descripcion: Envia una peticion por una conexion libre y devuelve su respuesta. Se puede llamar desde varios hilos.
+            Argumentos: mensaje, parser: Ver DiscoveryConnection.request.
+            Retorno:
+                La respuesta en bytes (o el parser), o None en caso de error.
+        '''
+        connection = self.acquire()
+        try:
+            return connection.request(mensaje, parser)
+        finally:
+            self.release(connection)
 
     def server_quit(self):
         '''
@@ -51,16 +611,21 @@ class Discovery():
             Retorno:
                 0 si todo ha ido correctamente, -1 en caso de error.
         '''
-        if self.server_socket == None:
+        if self.cache is not None:
+            print("Cache de descubrimiento: " + str(self.cache.hits) + " aciertos, " + str(self.cache.misses) + " fallos.")
+            self.cache.save()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        with self.pool_lock:
+            connections = self.connections
+            self.connections = []
+        if not connections:
             print ("Se ha intentado enviar un comando al servidor sin estar conectado a el.")
             return -1
-        self.server_socket.send(b'QUIT')
-        result = self.server_socket.recv(1024)
-        if result.decode() != "BYE":
-            print ("Advertencia: El servidor no ha respondido al server_quit. Cerrando conexion...")
-        self.server_socket.close()
+        for connection in connections:
+            connection.quit()
         print("Desconectado del servidor de descubrimiento.")
-        self.server_socket = None
         return 0
 
     def register_user(self, nickname, password, ip, port, protocols):
@@ -75,13 +640,12 @@ class Discovery():
             Retorno:
                 Timestamp de registro, -1 en caso de clave incorrecta o None en caso de error.
         '''
-        if self.server_socket == None:
-            print ("Se ha intentado enviar un comando al servidor sin estar conectado a el.")
-            return None
         cadena_protocolos = "#".join(protocols) #Creamos la cadena como especifica el protocolo
         mensaje = "REGISTER " + nickname + " " + ip + " " + port + " " + password + " " + cadena_protocolos
-        self.server_socket.send(mensaje.encode())
-        result = self.server_socket.recv(1024)
+        result = self.request(mensaje)
+        if result is None:
+            print ("Error registrando usuario. No se puede contactar con el servidor.")
+            return None
 
         #Obtenemos las palabras de la respuesta
         words = result.decode().split()
@@ -109,17 +673,21 @@ class Discovery():
     def query_user(self,nickname):
         '''
             Nombre: query_user
-            Descripcion: Busca la informacion del usuario dado en el sistema.
+            Descripcion: Busca la informacion del usuario dado en el sistema. Si esta en la cache no pregunta al servidor.
             Argumentos: nickname: Nombre del usuario.
             Retorno:
                 Lista con IP, puerto y lista de protocolos soportados por el cliente, todo como cadenas. None en caso de error.
         '''
-        if self.server_socket == None:
-            print ("Se ha intentado enviar un comando al servidor sin estar conectado a el.")
-            return None
+        if self.cache is not None:
+            cached = self.cache.get(nickname)
+            if cached is not None:
+                print("Usuario " + nickname + " encontrado en cache con IP: " + cached[0] + ", puerto: " + cached[1])
+                return cached
         mensaje = "QUERY " + nickname
-        self.server_socket.send(mensaje.encode())
-        result = self.server_socket.recv(1024)
+        result = self.request(mensaje)
+        if result is None:
+            print ("Error buscando usuario. No se puede contactar con el servidor.")
+            return None
         words = result.decode().split()
         if len(words) < 2:
             #No hay respuesta suficiente
@@ -134,65 +702,57 @@ class Discovery():
             #Hay datos en la respuesta
             print("Usuario " + words[2] + " encontrado correctamente con IP: " + words[3] + ", puerto: " + words[4] + " y protocolos: " + words[5])
             lista_protocolos = words[5].split("#")
+            if self.cache is not None:
+                self.cache.put(nickname, words[3], words[4], lista_protocolos)
             return [words[3],words[4],lista_protocolos]
         elif words[0] == "NOK" and words[1] == "USER_UNKNOWN":
             #Respuesta incorrecta
             print("Error buscando usuario: No existe usuario con ese nombre.")
+            self.invalidate_user(nickname)
             return None
         #Respuesta desconocida.
         print("Error desconocido buscando usuario.")
         return None
 
-    def list_users(self):
+    def list_users(self, on_user=None):
         '''
             Nombre: list_users
             Descripcion: Muestra un listado de todos los usuarios en el sistema.
-            Argumentos:
+            Argumentos: on_user: Funcion a la que se pasa cada usuario en cuanto llega, o None. Si hay que
+                                 repetir la peticion puede recibir otra vez los mismos usuarios.
             Retorno:
                 Lista con los datos de cada usuario. Cada dato es [nick ip port ts]. None en caso de error.
         '''
-        if self.server_socket == None:
-            print ("Se ha intentado enviar un comando al servidor sin estar conectado a el.")
-            return None
         mensaje = "LIST_USERS"
-        self.server_socket.send(mensaje.encode())
-
-        #Recibir la cantidad adecuada de usuarios
-        continue_receiving = True
-        result = bytes()
-        while continue_receiving:
-            result += self.server_socket.recv(1024)
-            result_str = result.decode()
-            words = result_str.split() #Queremos la tercera palabra que trae cuantos users hay
-
-            #¿Por que este codigo tan raro, en lugar de result_str.count(#)? Pues porque algun
-            #gracioso se ha puesto de username: "mua#ja#ja#ja", y el server no lo prohibe.
-            #Por tanto contamos como maximo un # por palabra...
-            if int(words[2]) <= len([1 for e in words[3:] if '#' in e]):
-                continue_receiving = False
-                
-        if len(words) < 2:
+        #Los usuarios se separan segun llegan
+        parser = UsersListParser(on_user)
+        result = self.request(mensaje, parser)
+        if result is None:
+            print ("Error listando usuarios. No se puede contactar con el servidor.")
+            return None
+        words = parser.words
+
+        if words is None:
             #No hay respuesta suficiente
             print ("Error listando usuarios. El servidor no respondio.")
             return None
         elif words[0] == "OK" and words[1] == "USERS_LIST":
             #Respuesta correcta
-            if len(words) < 3:
+            lista_usuarios = parser.users
+            if not lista_usuarios:
                 #No hay datos en la respuesta
                 print("Advertencia en LIST: El servidor no ha devuelto ningun usuario.")
                 return []
-            #Obtenemos lista de usuarios.
-            lista_usuarios = " ".join(words[3:]).split("#") #A partir de la palabra 3 estan los usuarios
-            lista_usuarios = lista_usuarios[:-1] #Eliminamos el espacio en blanco final.
 
             #Los imprimimos
-            i = 1
             print(str(len(lista_usuarios)) + " usuarios encontrados: ")
-            for usuario in lista_usuarios:
-                print(str(i) + ": " + usuario)
-                i += 1
+            print("\n".join(str(i) + ": " + " ".join(usuario) for i, usuario in enumerate(lista_usuarios, 1)))
 
-            return list(map(lambda x : x.split() , lista_usuarios))
+            if self.cache is not None:
+                #Renovamos los usuarios en cache que siguen en la misma direccion
+                for usuario in lista_usuarios:
+                    self.cache.refresh_address(usuario[0], usuario[1], usuario[2])
+            return lista_usuarios
 
         elif words[0] == "NOK" and words[1] == "USER_UNKNOWN":
             #Respuesta incorrecta
@@ -201,3 +761,25 @@ class Discovery():
         #Respuesta desconocida.
         print("Error desconocido listando usuarios.")
         return None
+
+    def invalidate_user(self, nickname):
+        '''
+            Nombre: invalidate_user
+            Descripcion: Olvida los datos en cache de un usuario, por ejemplo si no se ha podido conectar con el.
+            Argumentos: nickname: Nombre del usuario.
+        '''
+        if self.cache is not None:
+            self.cache.invalidate(nickname)
+
+    def query_many(self, nicknames):
+        '''
+            Nombre: query_many
+            Descripcion: Busca varios usuarios a la vez, repartiendo las consultas entre las conexiones del pool.
+            Argumentos: nicknames: Lista de nombres de usuario.
+            Retorno:
+                Diccionario nombre -> resultado de query_user.
+        '''
+        with self.pool_lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="discovery")
+        return dict(zip(nicknames, self.executor.map(self.query_user, nicknames)))
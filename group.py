@@ -0,0 +1,916 @@
+'''
+    group.py
+    Modulo de las llamadas de grupo (extension GROUP): invitacion de los participantes, reparto del
+    video saliente comprimido una sola vez y recepcion de un flujo por cada participante remoto.
+    @author Alejandro Bravo, Miguel Gonzalez
+    @version 1.0
+    @date 18-10-2026
+
+    DESCRIPCION GENERAL DEL MODULO
+    Una llamada de grupo tiene un anfitrion, el que la inicia, y hasta GROUP_MAX - 1 invitados.
+    El control es en estrella: el anfitrion tiene una conexion de control con cada invitado y es el
+    unico que los conoce a todos desde el principio. El video es en malla: cada participante envia
+    su video directamente a todos los demas. No se pueden anadir participantes una vez empezada.
+
+    Mensajes de control, ademas de CALL_ACCEPTED, CALL_DENIED, CALL_BUSY y CALL_END:
+        GROUP_CALLING nick puerto
+            Invitacion del anfitrion. Se responde como a CALLING.
+        GROUP_MEMBERS nick ip puerto protocolos [nick ip puerto protocolos ...]
+            Del anfitrion a cada invitado cada vez que cambian los participantes. Incluye a todos,
+            anfitrion y destinatario incluidos. Los protocolos de cada uno van separados por '#'.
+        GROUP_LOSS origen destino perdidas timestamp
+            Reporte de perdidas de origen sobre el video de destino (como LOSS_REPORT). Los invitados
+            lo envian al anfitrion, que lo reenvia a destino si no es el.
+        GROUP_LAYER origen destino resolucion
+            Capa del video de destino que quiere recibir origen (extension SIMULCAST). Va por el
+            anfitrion como GROUP_LOSS.
+    Si un invitado cuelga, el anfitrion lo quita y avisa a los demas. Si cuelga el anfitrion, la
+    llamada termina para todos.
+
+    VIDEO
+    Cada frame se captura, reescala y comprime una vez (send_frame_async sin destino) y send_datagrams
+    envia los mismos buffers a cada participante por el mismo socket, anteponiendo a cada datagrama el
+    prefijo de grupo (ver packet.py) con el flujo propio y un numero de secuencia por destinatario.
+    Un participante mas solo cuesta sus llamadas a sendmsg.
+
+    Cada participante remoto tiene su propio VideoBuffer como flujo de recepcion (anillo, jitter,
+    reensamblador, QoS y descompresion), todos sobre el mismo pool de buffers. receive_loop reparte
+    los datagramas entre ellos segun el flujo del prefijo y cuenta las perdidas de cada camino con su
+    numero de secuencia. Los frames se descomprimen reducidos al ancho de su celda en la rejilla
+    (GridCompositor), asi que la recepcion cuesta lo que cuesten las descompresiones.
+
+    Se usan las extensiones que aceptan todos los participantes, salvo NACK y RATE: un reenvio o una
+    tasa pedida por uno afectaria al video de todos. El video saliente se envia con la calidad, los fps
+    y la resolucion del QoS del participante que peor lo recibe.
+
+    SIMULCAST
+    Con SIMULCAST cada frame capturado se envia en varias capas (SIMULCAST_LAYERS, por ejemplo
+    640x480, 320x240 y 160x120) que se comprimen en paralelo en el pool de compresion. Cada capa
+    lleva su propia calidad, la del participante suscrito a ella que peor la recibe, y se envia solo
+    a sus suscriptores: un participante con mala conexion ya no baja la resolucion de los demas.
+    Cada receptor elige la capa de cada emisor con el QoS de su flujo (la resolucion que el QoS
+    bajaria o subiria) y se la pide con GROUP_LAYER. El reparto de capas se fija al mandar a
+    comprimir cada frame y todas las capas llevan el mismo numero de orden, asi que el cambio se
+    hace entre un frame y el siguiente, sin huecos en el buffer del receptor. TILES no se usa con
+    SIMULCAST: los frames delta de una capa no servirian al cambiar a otra.
+'''
+
+import math
+import time
+import zlib
+import socket
+import threading
+import cv2
+import numpy as np
+from control import MessageParser, SocketLink
+from video import VideoBuffer, PROTOCOLS, parse_resolution, resize_to, drain_socket
+from packet import pack_group_prefix, parse_group_prefix, SEQUENCE_MODULE, GROUP_HEADER
+
+GROUP_EXCLUDED = ("NACK", "RATE") #Extensiones que no se usan en las llamadas de grupo
+
+GRID_RESOLUTION = "640x480" #Tamano de la rejilla, el de la pantalla de video del cliente
+
+ROLE_HOST = 1 #Hemos iniciado la llamada de grupo
+ROLE_GUEST = 2 #Nos han invitado a la llamada de grupo
+
+def stream_id(nickname):
+    '''
+    Nombre: stream_id
+    Descripcion: Identificador del flujo de video de un participante en el prefijo de grupo.
+    Argumentos: nickname: Nick del participante.
+    Retorno:
+        Entero de 32 bits.
+    '''
+    return zlib.crc32(nickname.encode())
+
+class GroupMember():
+    '''Participante remoto de una llamada de grupo: Su direccion, su conexion de control y su flujo de recepcion'''
+
+    nick = None #Nick del participante.
+    address = None #IP y puerto (entero) de video.
+    protocols = None #Protocolos que anuncia.
+    stream = 0 #Identificador de su flujo de video.
+    link = None #Conexion de control con el, o None si no hay (entre invitados).
+    group = None #Llamada de grupo a la que pertenece.
+    buffer = None #VideoBuffer con el que se recibe su video.
+
+    send_seq = 0 #Numero de secuencia del siguiente datagrama que se le envia. Solo lo usa el hilo de envio.
+    recv_seq = -1 #Ultimo numero de secuencia recibido de el. Solo lo usa el hilo de recepcion.
+    datagrams_received = 0 #Datagramas recibidos de el.
+    datagrams_lost = 0 #Datagramas suyos perdidos por el camino.
+    reported_lost = 0 #Frames nuestros que ha perdido, segun sus reportes.
+    layer = 0 #Capa de nuestro video que recibe con SIMULCAST (indice en GroupCall.layers).
+    wanted = None #Resolucion que le hemos pedido de su video con GROUP_LAYER, o None si aun no.
+
+    #QoS de nuestro video hacia el, como en la llamada normal (listas para pasarlas por referencia a pop_frame).
+    #Empiezan con los valores del video saliente al reproducir su primer frame.
+    quality = None
+    fps = None
+    resolution = None
+    lost_total = None
+
+    frame = None #Ultimo frame suyo descomprimido, o None si aun no ha llegado ninguno.
+
+    def __init__(self, group, nick, ip, port, protocols, link=None):
+        '''
+        Nombre: __init__
+        Descripcion: Crea el participante y su flujo de recepcion.
+        Argumentos: group: Llamada de grupo.
+                    nick, ip, port, protocols: Datos del participante, como los devuelve el descubrimiento.
+                    link: Conexion de control con el, o None.
+        '''
+        self.group = group
+        self.nick = nick
+        self.address = (ip, int(port))
+        self.protocols = list(protocols)
+        self.stream = stream_id(nick)
+        self.link = link
+        self.buffer = VideoBuffer(group.config, group.video_buffer.buffer_pool)
+        self.buffer.reset_reception()
+        self.buffer.set_control(self)
+        self.lost_total = [0]
+
+    def count_datagram(self, seq):
+        '''
+        Nombre: count_datagram
+        Descripcion: Cuenta un datagrama recibido de el y los que se han perdido antes segun su numero de secuencia.
+        Argumentos: seq: Numero de secuencia del prefijo de grupo.
+        '''
+        self.datagrams_received += 1
+        if self.recv_seq != -1:
+            gap = (seq - self.recv_seq - 1) % SEQUENCE_MODULE
+            if gap >= SEQUENCE_MODULE // 2:
+                #Llega tarde: ya se habia contado como perdido
+                self.datagrams_lost = max(0, self.datagrams_lost - 1)
+                return
+            self.datagrams_lost += gap
+        self.recv_seq = seq
+
+    def loss_percent(self):
+        '''
+        Nombre: loss_percent
+        Descripcion: Porcentaje de sus datagramas perdidos por el camino.
+        '''
+        total = self.datagrams_received + self.datagrams_lost
+        return 100 * self.datagrams_lost / total if total else 0
+
+    #Interfaz de control que usa su VideoBuffer para enviar reportes sobre su video
+
+    def send_loss_report(self, lost):
+        '''
+        Nombre: send_loss_report
+        Descripcion: Le informa de los frames suyos perdidos (GROUP_LOSS).
+        Argumentos: lost: Frames perdidos desde el reporte anterior.
+        Retorno:
+            0 si todo es correcto, -1 en caso de error.
+        '''
+        return self.group.send_loss_report(self, lost)
+
+    def send_rate_report(self, bitrate):
+        '''
+        Nombre: send_rate_report
+        Descripcion: RATE no se usa en las llamadas de grupo.
+        Retorno:
+            -1
+        '''
+        return -1
+
+    def send_nack(self, nums, margin):
+        '''
+        Nombre: send_nack
+        Descripcion: NACK no se usa en las llamadas de grupo.
+        Retorno:
+            -1
+        '''
+        return -1
+
+class GridCompositor():
+    '''Compositor en rejilla: Junta en una imagen el ultimo frame de cada participante'''
+
+    width = 640 #Ancho de la imagen compuesta.
+    height = 480 #Alto de la imagen compuesta.
+    canvas = None #Imagen en la que se pinta.
+    output = None #Copia de la imagen que se entrega, para que la interfaz no la lea mientras se pinta.
+    cells = [] #Rectangulos (x, y, ancho, alto) de cada celda.
+    drawn = [] #Frame pintado en cada celda, para no repintar las que no cambian.
+
+    def __init__(self, width, height):
+        '''
+        Nombre: __init__
+        Descripcion: Crea el compositor.
+        Argumentos: width, height: Tamano de la imagen compuesta.
+        '''
+        self.width = width
+        self.height = height
+        self.layout(0)
+
+    def cell_size(self, count):
+        '''
+        Nombre: cell_size
+        Descripcion: Tamano de cada celda de la rejilla para count participantes.
+        Retorno:
+            Tupla (ancho, alto).
+        '''
+        cols = max(1, math.ceil(math.sqrt(count)))
+        rows = max(1, math.ceil(count / cols))
+        return self.width // cols, self.height // rows
+
+    def layout(self, count):
+        '''
+        Nombre: layout
+        Descripcion: Reparte la imagen en una rejilla de count celdas, por filas, y la pinta de negro.
+        Argumentos: count: Numero de participantes.
+        '''
+        cols = max(1, math.ceil(math.sqrt(count)))
+        width, height = self.cell_size(count)
+        self.cells = [((i % cols) * width, (i // cols) * height, width, height) for i in range(count)]
+        self.drawn = [None] * count
+        self.canvas = np.zeros((self.height, self.width, 3), np.uint8)
+        self.output = self.canvas.copy()
+
+    def compose(self, members):
+        '''
+        Nombre: compose
+        Descripcion: Pinta el ultimo frame de cada participante en su celda, con su nick.
+        Argumentos: members: Lista de GroupMember, en el orden de las celdas.
+        Retorno:
+            Imagen compuesta.
+        '''
+        if len(members) != len(self.cells):
+            self.layout(len(members))
+        changed = False
+        for i, member in enumerate(members):
+            frame = member.frame
+            if frame is None or frame is self.drawn[i]:
+                continue
+            x, y, width, height = self.cells[i]
+            interpolation = cv2.INTER_AREA if frame.shape[1] > width else cv2.INTER_LINEAR
+            self.canvas[y:y + height, x:x + width] = cv2.resize(frame, (width, height), interpolation=interpolation)
+            cv2.putText(self.canvas, member.nick, (x + 6, y + height - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                        (255, 255, 255), 1, cv2.LINE_AA)
+            self.drawn[i] = frame
+            changed = True
+        if changed:
+            self.output = self.canvas.copy()
+        return self.output
+
+class GroupCall():
+    '''Llamada de grupo: Participantes, conexiones de control y reparto del video de una llamada de varios'''
+
+    config = None #Objeto de configuracion.
+    discovery = None #Objeto de descubrimiento.
+    control = None #Modulo de control, para el nick, el puerto de video y los timeouts.
+    video_buffer = None #VideoBuffer con el que se envia nuestro video.
+    gui = None #Interfaz para avisar de que la llamada ha terminado.
+
+    role = None #ROLE_HOST, ROLE_GUEST o None si no hay llamada de grupo.
+    host = None #Nick del anfitrion.
+    stream = 0 #Identificador de nuestro flujo de video.
+    own = None #Nuestra entrada en GROUP_MEMBERS [ip, puerto, protocolos]. Solo la usa el anfitrion.
+    members = {} #Participantes remotos por nick. Se sustituye entero al cambiar: los hilos de video lo leen sin cerrojo.
+    streams = {} #Participantes remotos por flujo de video.
+    retired = [] #Participantes que han salido, cuyos pools de descompresion para el hilo de reproduccion.
+    lock = None #Cerrojo de los participantes y el rol.
+    compositor = None #Rejilla con el video de los participantes.
+    layers = [] #Resoluciones de las capas de simulcast, de mayor a menor.
+    simulcast = False #Indica si nuestro video se envia en capas.
+
+    def __init__(self, config, discovery, control, video_buffer):
+        '''
+        Nombre: __init__
+        Descripcion: Crea la llamada de grupo, sin participantes.
+        Argumentos: config: Objeto de configuracion.
+                    discovery: Objeto de descubrimiento.
+                    control: Modulo de control.
+                    video_buffer: VideoBuffer con el que se envia nuestro video.
+        '''
+        self.config = config
+        self.discovery = discovery
+        self.control = control
+        self.video_buffer = video_buffer
+        self.members = {}
+        self.streams = {}
+        self.retired = []
+        self.lock = threading.Lock()
+        width, height = parse_resolution(GRID_RESOLUTION)
+        self.compositor = GridCompositor(width, height)
+        try:
+            layers = [layer.strip() for layer in config.SIMULCAST_LAYERS.split(",") if layer.strip()]
+            self.layers = sorted(layers, key=lambda layer: math.prod(parse_resolution(layer)), reverse=True)
+        except ValueError:
+            print("SIMULCAST_LAYERS mal configurado: " + str(config.SIMULCAST_LAYERS) + ". Se envia una sola capa.")
+            self.layers = []
+
+    def set_gui(self, gui):
+        '''
+        Nombre: set_gui
+        Descripcion: Ajusta la interfaz con la que se avisa del final de la llamada.
+        Argumentos: gui: Objeto interfaz grafica.
+        '''
+        self.gui = gui
+
+    def busy(self):
+        '''
+        Nombre: busy
+        Descripcion: Indica si hay una llamada de grupo en curso o empezando.
+        '''
+        return self.role is not None
+
+    def active(self):
+        '''
+        Nombre: active
+        Descripcion: Indica si hay una llamada de grupo con algun participante remoto.
+        '''
+        return self.role is not None and len(self.members) > 0
+
+    def nicknames(self):
+        '''
+        Nombre: nicknames
+        Descripcion: Nicks de los participantes remotos.
+        '''
+        return list(self.members)
+
+    # INICIO DE LA LLAMADA
+
+    def start(self, nicknames):
+        '''
+        Nombre: start
+        Descripcion: Inicia una llamada de grupo como anfitrion: invita a la vez a todos los usuarios y
+                     empieza la llamada con los que acepten. Bloquea hasta que responden todos.
+        Argumentos: nicknames: Nicks de los usuarios a invitar. Se invita como mucho a GROUP_MAX - 1.
+        Retorno:
+            Numero de usuarios que han aceptado, 0 si no ha aceptado ninguno o -1 en caso de error.
+        '''
+        me = self.control.get_username()
+        nicknames = [nick for nick in dict.fromkeys(nicknames) if nick and nick != me][:self.config.GROUP_MAX - 1]
+        if not nicknames:
+            print("Error iniciando llamada de grupo: no hay a quien llamar.")
+            return -1
+        with self.lock:
+            if self.role is not None or self.control.get_connected_username() is not None:
+                print("Error iniciando llamada de grupo: ya hay una llamada en curso.")
+                return -1
+            self.role = ROLE_HOST
+            self.host = me
+            self.stream = stream_id(me)
+
+        own = self.discovery.query_user(me)
+        if own is None or own == -1:
+            print("Error iniciando llamada de grupo: el servidor no devuelve nuestros datos.")
+            self.end()
+            return -1
+        self.own = [own[0], str(self.control.get_video_port()), "#".join(PROTOCOLS)]
+
+        #Invitamos a todos a la vez: cada uno tarda lo que tarde en coger la llamada
+        found = self.discovery.query_many(nicknames)
+        accepted = []
+        threads = [threading.Thread(target=lambda nick=nick: accepted.append(self.invite(nick, found.get(nick))))
+                   for nick in nicknames]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        accepted = [member for member in accepted if member is not None]
+
+        with self.lock:
+            cancelled = self.role != ROLE_HOST
+            if not cancelled and accepted:
+                self.set_members([member for nick in nicknames for member in accepted if member.nick == nick])
+        if cancelled or not accepted:
+            for member in accepted:
+                member.link.close()
+            if not cancelled:
+                print("Llamada de grupo cancelada: no ha aceptado nadie.")
+                self.end()
+            return 0 if not cancelled else -1
+
+        self.configure()
+        for member in accepted:
+            threading.Thread(target=self.link_loop, args=(member,), daemon=True).start()
+        self.broadcast_members()
+        print("Llamada de grupo iniciada con: " + ", ".join(self.nicknames()))
+        return len(accepted)
+
+    def invite(self, nick, info):
+        '''
+        Nombre: invite
+        Descripcion: Invita a un usuario a la llamada de grupo y espera su respuesta.
+        Argumentos: nick: Nick del usuario.
+                    info: Sus datos segun el descubrimiento.
+        Retorno:
+            GroupMember con la conexion abierta si acepta, o None.
+        '''
+        if info is None or info == -1:
+            print("Error invitando a " + nick + ": el servidor reporta que no existe.")
+            return None
+        if "GROUP" not in info[2]:
+            print("Error invitando a " + nick + ": no acepta llamadas de grupo.")
+            return None
+        try:
+            sock = socket.create_connection((info[0], int(info[1])), self.control.socket_timeout)
+        except OSError:
+            print("No ha sido posible conectarse a " + nick + ".")
+            self.discovery.invalidate_user(nick)
+            return None
+
+        parser = MessageParser("FRAMED" in info[2])
+        try:
+            sock.sendall(parser.encode("GROUP_CALLING " + self.control.get_username() + " " + str(self.control.get_video_port())))
+            sock.settimeout(self.control.call_timeout)
+            msg = parser.receive(sock)
+            sock.settimeout(None)
+        except OSError:
+            msg = ""
+        words = msg.split()
+        if len(words) >= 3 and words[0] == "CALL_ACCEPTED":
+            print(nick + " acepta la llamada de grupo. Desea puerto: " + words[2])
+            return GroupMember(self, nick, info[0], words[2], info[2], SocketLink(sock, parser))
+        if words and words[0] == "CALL_BUSY":
+            print(nick + " esta en llamada.")
+        else:
+            print(nick + " rechaza la llamada de grupo.")
+        sock.close()
+        return None
+
+    def join(self, link, host_nick, ip, port, protocols, read=True):
+        '''
+        Nombre: join
+        Descripcion: Acepta la invitacion de un anfitrion. Lo llama el modulo de control cuando el usuario coge la llamada.
+        Argumentos: link: Conexion de control con el anfitrion (SocketLink o ControlSession).
+                    host_nick: Nick del anfitrion.
+                    ip, port, protocols: IP y puerto de video del anfitrion y sus protocolos.
+                    read: True para leer la conexion en un hilo propio. Si es False la lee quien llama,
+                          pasando los mensajes a process_message y el cierre a member_closed.
+        Retorno:
+            GroupMember del anfitrion, o None si ya hay una llamada de grupo.
+        '''
+        try:
+            host = GroupMember(self, host_nick, ip, port, protocols, link)
+        except ValueError:
+            print("Invitacion de grupo malformada: puerto de video " + str(port))
+            return None
+        with self.lock:
+            if self.role is not None:
+                return None
+            self.role = ROLE_GUEST
+            self.host = host_nick
+            self.stream = stream_id(self.control.get_username())
+            self.set_members([host])
+        self.configure()
+        link.send(link.parser.encode("CALL_ACCEPTED " + self.control.get_username() + " " + str(self.control.get_video_port())))
+        if read:
+            threading.Thread(target=self.link_loop, args=(host,), daemon=True).start()
+        return host
+
+    def set_members(self, members):
+        '''
+        Nombre: set_members
+        Descripcion: Sustituye la lista de participantes remotos. Los que ya no estan se retiran y el
+                     video de los que quedan se descomprime al ancho de su celda. Hay que llamarla con lock.
+        Argumentos: members: Lista de GroupMember.
+        '''
+        current = {member.nick: member for member in members}
+        self.retired.extend(member for nick, member in self.members.items() if nick not in current)
+        self.members = current
+        self.streams = {member.stream: member for member in members}
+        width = self.compositor.cell_size(len(members))[0]
+        if self.config.DECODE_MAX_WIDTH > 0:
+            width = min(width, self.config.DECODE_MAX_WIDTH)
+        for member in members:
+            member.buffer.decode_max_width = width
+
+    def configure(self):
+        '''
+        Nombre: configure
+        Descripcion: Ajusta los flujos de envio y recepcion a las extensiones que aceptan todos los participantes.
+        '''
+        members = list(self.members.values())
+        self.simulcast = bool(self.config.SIMULCAST) and len(self.layers) > 1
+        excluded = GROUP_EXCLUDED + ("TILES",) if self.simulcast else GROUP_EXCLUDED
+        common = [p for p in PROTOCOLS if p not in excluded and all(p in member.protocols for member in members)]
+        self.video_buffer.set_peer_protocols(common)
+        #Cada datagrama lleva el prefijo de grupo, asi que los fragmentos se acortan para que quepa
+        self.video_buffer.prefix_size = GROUP_HEADER.size
+        for member in members:
+            member.buffer.set_peer_protocols(common)
+
+    # MENSAJES DE CONTROL
+
+    def send(self, member, msg):
+        '''
+        Nombre: send
+        Descripcion: Envia un mensaje por la conexion de control de un participante.
+        Argumentos: member: GroupMember con conexion de control.
+                    msg: Mensaje como cadena.
+        Retorno:
+            0 si todo es correcto, -1 en caso de error.
+        '''
+        if member is None or member.link is None:
+            return -1
+        try:
+            if not member.link.send(member.link.parser.encode(msg)):
+                return -1
+        except OSError:
+            print("Error enviando " + msg.split()[0] + " a " + member.nick + ".")
+            return -1
+        return 0
+
+    def broadcast_members(self):
+        '''
+        Nombre: broadcast_members
+        Descripcion: El anfitrion envia a cada invitado la lista de participantes (GROUP_MEMBERS).
+        '''
+        members = list(self.members.values())
+        entries = [self.control.get_username() + " " + " ".join(self.own)]
+        entries += [member.nick + " " + member.address[0] + " " + str(member.address[1]) + " " + "#".join(member.protocols)
+                    for member in members]
+        msg = "GROUP_MEMBERS " + " ".join(entries)
+        for member in members:
+            self.send(member, msg)
+
+    def send_loss_report(self, member, lost):
+        '''
+        Nombre: send_loss_report
+        Descripcion: Informa a un participante de los frames suyos perdidos, a traves del anfitrion si no lo somos.
+        Argumentos: member: GroupMember cuyo video se ha perdido.
+                    lost: Frames perdidos desde el reporte anterior.
+        Retorno:
+            0 si todo es correcto, -1 en caso de error.
+        '''
+        msg = "GROUP_LOSS " + self.control.get_username() + " " + member.nick + " " + str(lost) + " " + str(time.time())
+        return self.relay(member, msg)
+
+    def request_layer(self, member):
+        '''
+        Nombre: request_layer
+        Descripcion: Si su QoS ha cambiado de resolucion, pide a un participante la capa de su video que
+                     corresponde (GROUP_LAYER). Solo si el participante envia en capas (SIMULCAST).
+        Argumentos: member: GroupMember cuyo video recibimos.
+        Retorno:
+            0 si no hace falta pedir nada o se ha pedido, -1 en caso de error.
+        '''
+        if "SIMULCAST" not in member.protocols or member.resolution is None or member.wanted == member.resolution[0]:
+            return 0
+        member.wanted = member.resolution[0]
+        return self.relay(member, "GROUP_LAYER " + self.control.get_username() + " " + member.nick + " " + member.wanted)
+
+    def relay(self, member, msg):
+        '''
+        Nombre: relay
+        Descripcion: Envia un mensaje a un participante: directamente si somos el anfitrion y, si no, a
+                     traves del anfitrion, que es con quien tenemos conexion de control.
+        Argumentos: member: GroupMember destinatario.
+                    msg: Mensaje como cadena.
+        Retorno:
+            0 si todo es correcto, -1 en caso de error.
+        '''
+        if self.role == ROLE_HOST:
+            return self.send(member, msg)
+        return self.send(self.members.get(self.host), msg)
+
+    def link_loop(self, member):
+        '''
+        Nombre: link_loop
+        Descripcion: Lee los mensajes de la conexion de control de un participante hasta que se cierra.
+        Argumentos: member: GroupMember con conexion SocketLink.
+        '''
+        link = member.link
+        while True:
+            try:
+                msg = link.parser.receive(link.sock)
+            except OSError:
+                msg = ""
+            if not msg or self.process_message(member, msg):
+                break
+        self.member_closed(member)
+
+    def process_message(self, member, msg):
+        '''
+        Nombre: process_message
+        Descripcion: Atiende un mensaje de control de la llamada de grupo.
+        Argumentos: member: GroupMember que lo ha enviado.
+                    msg: Mensaje como cadena.
+        Retorno:
+            True si el participante ha colgado (CALL_END), False si no.
+        '''
+        words = msg.split()
+        if not words:
+            return False
+        if words[0] == "CALL_END":
+            print(member.nick + " sale de la llamada de grupo.")
+            return True
+        if words[0] == "GROUP_MEMBERS" and self.role == ROLE_GUEST:
+            self.update_members(words[1:])
+        elif words[0] == "GROUP_LOSS" and len(words) >= 5:
+            try:
+                lost = int(words[3])
+                timestamp = float(words[4])
+            except ValueError:
+                print("Reporte de perdidas de grupo malformado: " + msg)
+                return False
+            self.receive_loss_report(words[1], words[2], lost, timestamp, msg)
+        elif words[0] == "GROUP_LAYER" and len(words) >= 4:
+            self.receive_layer_request(words[1], words[2], words[3], msg)
+        return False
+
+    def update_members(self, words):
+        '''
+        Nombre: update_members
+        Descripcion: Un invitado actualiza los participantes segun GROUP_MEMBERS. Los que ya estaban se conservan.
+        Argumentos: words: Palabras del mensaje tras GROUP_MEMBERS, de cuatro en cuatro.
+        '''
+        me = self.control.get_username()
+        with self.lock:
+            if self.role != ROLE_GUEST:
+                return
+            members = []
+            for i in range(0, len(words) - 3, 4):
+                nick, ip, port, protocols = words[i:i + 4]
+                if nick == me:
+                    continue
+                member = self.members.get(nick)
+                if member is None:
+                    try:
+                        member = GroupMember(self, nick, ip, port, protocols.split("#"))
+                    except ValueError:
+                        print("Participante de grupo malformado: " + nick)
+                        continue
+                members.append(member)
+            if self.host not in [member.nick for member in members]:
+                #El anfitrion siempre esta: sin el no podriamos enviar reportes ni colgar
+                members.insert(0, self.members[self.host])
+            self.set_members(members)
+        self.configure()
+        print("Participantes de la llamada de grupo: " + ", ".join(self.nicknames()))
+
+    def receive_loss_report(self, origin, target, lost, timestamp, msg):
+        '''
+        Nombre: receive_loss_report
+        Descripcion: Aplica un GROUP_LOSS sobre nuestro video o, si somos el anfitrion, lo reenvia a su destino.
+        Argumentos: origin, target: Nicks de quien pierde el video y de quien lo envia.
+                    lost, timestamp: Datos del reporte.
+                    msg: Mensaje original, para reenviarlo.
+        '''
+        if target == self.control.get_username():
+            member = self.members.get(origin)
+            if member is not None:
+                member.buffer.set_loss_report(lost, timestamp)
+                member.reported_lost += lost
+        elif self.role == ROLE_HOST:
+            self.send(self.members.get(target), msg)
+
+    def receive_layer_request(self, origin, target, resolution, msg):
+        '''
+        Nombre: receive_layer_request
+        Descripcion: Aplica un GROUP_LAYER sobre nuestro video o, si somos el anfitrion, lo reenvia a su destino.
+                     La capa nueva se usa desde el siguiente frame que se mande a comprimir.
+        Argumentos: origin, target: Nicks de quien pide la capa y de quien envia el video.
+                    resolution: Resolucion pedida.
+                    msg: Mensaje original, para reenviarlo.
+        '''
+        if target != self.control.get_username():
+            if self.role == ROLE_HOST:
+                self.send(self.members.get(target), msg)
+            return
+        member = self.members.get(origin)
+        layer = self.layer_index(resolution)
+        if member is not None and layer != -1:
+            member.layer = layer
+
+    def layer_index(self, resolution):
+        '''
+        Nombre: layer_index
+        Descripcion: Capa de mayor resolucion que no pasa de la pedida.
+        Argumentos: resolution: Resolucion pedida, por ejemplo "320x240".
+        Retorno:
+            Indice en layers (la ultima si todas son mayores), o -1 si la resolucion esta malformada.
+        '''
+        try:
+            pixels = math.prod(parse_resolution(resolution))
+        except ValueError:
+            print("Capa de simulcast malformada: " + resolution)
+            return -1
+        for index, layer in enumerate(self.layers):
+            if math.prod(parse_resolution(layer)) <= pixels:
+                return index
+        return len(self.layers) - 1
+
+    # FINAL DE LA LLAMADA
+
+    def member_closed(self, member):
+        '''
+        Nombre: member_closed
+        Descripcion: Se ha cerrado la conexion de control de un participante. Si somos el anfitrion lo
+                     quitamos y avisamos a los demas; si era el anfitrion, la llamada termina.
+        Argumentos: member: GroupMember cuya conexion se ha cerrado.
+        '''
+        with self.lock:
+            if self.members.get(member.nick) is not member:
+                #Ya lo habiamos quitado, o hemos colgado nosotros
+                return
+            remaining = [other for other in self.members.values() if other is not member]
+            if self.role == ROLE_HOST and remaining:
+                self.set_members(remaining)
+        member.link.close()
+        if self.role == ROLE_HOST and remaining:
+            self.configure()
+            self.broadcast_members()
+            return
+        self.end()
+        if self.gui is not None:
+            self.gui.infoBox("Llamada finalizada.", "La llamada de grupo ha terminado.")
+
+    def leave(self):
+        '''
+        Nombre: leave
+        Descripcion: Cuelga la llamada de grupo (CALL_END). Si somos el anfitrion termina para todos.
+        Retorno:
+            0 si todo es correcto, -1 si no hay llamada de grupo.
+        '''
+        return self.end("CALL_END " + self.control.get_username())
+
+    def end(self, farewell=None):
+        '''
+        Nombre: end
+        Descripcion: Termina la llamada de grupo y cierra las conexiones de control. Los flujos de
+                     recepcion se liberan en el hilo de reproduccion (pop_frames o reset).
+        Argumentos: farewell: Mensaje que se envia por cada conexion antes de cerrarla, o None.
+        Retorno:
+            0 si todo es correcto, -1 si no hay llamada de grupo.
+        '''
+        #Primero se olvidan los participantes: asi, cuando los otros cierren, member_closed no hace nada
+        with self.lock:
+            if self.role is None:
+                return -1
+            members = list(self.members.values())
+            self.role = None
+            self.host = None
+            self.retired.extend(members)
+            self.members = {}
+            self.streams = {}
+        for member in members:
+            if member.link is not None:
+                if farewell is not None:
+                    self.send(member, farewell)
+                member.link.close()
+        print("Llamada de grupo terminada.")
+        return 0
+
+    def collect_retired(self):
+        '''
+        Nombre: collect_retired
+        Descripcion: Detiene los pools de descompresion de los participantes que han salido y devuelve sus buffers al pool.
+        '''
+        with self.lock:
+            retired = self.retired
+            self.retired = []
+        for member in retired:
+            member.buffer.stop_workers()
+            member.buffer.empty_buffer()
+
+    def reset(self):
+        '''
+        Nombre: reset
+        Descripcion: Libera los flujos de recepcion de la llamada terminada. Lo llama el hilo de reproduccion.
+        '''
+        self.collect_retired()
+        self.compositor.layout(0)
+
+    # VIDEO
+
+    def send_frame(self, socket_video, frame, numOrden, quality, resolution, fps):
+        '''
+        Nombre: send_frame
+        Descripcion: Envia un frame capturado a los participantes: comprimido una vez a la resolucion del QoS
+                     o, con SIMULCAST, en las capas a las que haya alguien suscrito.
+        Argumentos: socket_video: Socket UDP con el que se envia.
+                    frame: Frame capturado.
+                    numOrden: Numero del frame.
+                    quality, resolution, fps: Parametros del video saliente sin SIMULCAST.
+        Retorno:
+            0 si el frame se ha encolado (o enviado), -1 en caso de error.
+        '''
+        if not self.simulcast:
+            frame = resize_to(frame, resolution, cv2.INTER_AREA)
+            return self.video_buffer.send_frame_async(socket_video, None, frame, numOrden, quality, resolution, fps)
+        return self.video_buffer.send_layers_async(socket_video, frame, numOrden, self.layer_plan(quality), fps)
+
+    def layer_plan(self, quality):
+        '''
+        Nombre: layer_plan
+        Descripcion: Reparto de los participantes entre las capas de simulcast para el siguiente frame.
+        Argumentos: quality: Calidad para los participantes cuyo QoS aun no ha elegido ninguna.
+        Retorno:
+            Lista de tuplas (resolucion, calidad, participantes) de las capas con algun suscriptor, de mayor a
+            menor resolucion. La calidad de cada capa es la menor que piden sus suscriptores.
+        '''
+        members = list(self.members.values())
+        plan = []
+        for index, resolution in enumerate(self.layers):
+            subscribers = [member for member in members if member.layer == index]
+            if subscribers:
+                layer_quality = min(quality if member.quality is None else member.quality[0] for member in subscribers)
+                plan.append((resolution, layer_quality, subscribers))
+        return plan
+
+    def send_datagrams(self, sender, socket_video, datagrams, members=None):
+        '''
+        Nombre: send_datagrams
+        Descripcion: Envia los datagramas de un frame, comprimido una sola vez, a los participantes, cada uno
+                     con su prefijo de grupo. Lo llama el hilo de envio (VideoBuffer.deliver).
+        Argumentos: sender: VideoBuffer que envia.
+                    socket_video: Socket UDP con el que se envia.
+                    datagrams: Datagramas del frame (ver VideoBuffer.encode_frame).
+                    members: Participantes a los que se envia (los suscritos a una capa), o None para todos.
+        Retorno:
+            0 si todo es correcto, -1 si ha fallado el envio a alguno.
+        '''
+        if datagrams is None:
+            return -1
+        if members is None:
+            members = list(self.members.values())
+        result = 0
+        for member in members:
+            seq = member.send_seq
+            prefixed = [[pack_group_prefix(self.stream, seq + i)] + datagram for i, datagram in enumerate(datagrams)]
+            member.send_seq = (seq + len(datagrams)) % SEQUENCE_MODULE
+            if sender.send_datagrams(socket_video, member.address, prefixed) == -1:
+                result = -1
+        return result
+
+    def receive_loop(self, socket_video_rec):
+        '''
+        Nombre: receive_loop
+        Descripcion: Hilo de recepcion de la llamada de grupo: reparte los datagramas entre los flujos de
+                     cada participante segun su prefijo, hasta recibir END_RECEPTION.
+        Argumentos: socket_video_rec: Socket UDP de recepcion de video.
+        '''
+        self.video_buffer.set_receive_buffer(socket_video_rec)
+        pool = self.video_buffer.buffer_pool
+        buf = pool.acquire(VideoBuffer.RECV_SIZE)
+        view = memoryview(buf)
+        drain_socket(socket_video_rec, buf)
+
+        while True:
+            nbytes, _ = socket_video_rec.recvfrom_into(buf)
+            data = view[:nbytes]
+
+            if(data == b'END_RECEPTION'):
+                pool.release(buf)
+                return
+
+            prefix = parse_group_prefix(data)
+            if prefix is None:
+                continue
+            stream, seq, data = prefix
+            member = self.streams.get(stream)
+            if member is None:
+                continue
+            member.count_datagram(seq)
+            if member.buffer.receive_datagram(data, buf):
+                buf = pool.acquire(VideoBuffer.RECV_SIZE)
+                view = memoryview(buf)
+
+    def pop_frames(self, quality, fps, resolution, min_fps, max_fps):
+        '''
+        Nombre: pop_frames
+        Descripcion: Saca el siguiente frame de cada participante (VideoBuffer.pop_frame, con su QoS) y los
+                     junta en la rejilla. Ajusta el video saliente al participante que peor lo recibe.
+        Argumentos: quality, fps, resolution: Parametros del video saliente, envueltos en una lista.
+                    min_fps, max_fps: Limites de fps del QoS.
+        Retorno:
+            Tupla (imagen compuesta, fps del participante que mas envia).
+        '''
+        self.collect_retired()
+        members = list(self.members.values())
+        fps_in = 0
+        for member in members:
+            if member.quality is None:
+                member.quality, member.fps, member.resolution = [quality[0]], [fps[0]], [resolution[0]]
+            num, header, frame = member.buffer.pop_frame(member.quality, member.fps, member.resolution,
+                                                          member.lost_total, min_fps, max_fps)
+            if num == -1:
+                continue
+            member.frame = frame
+            fps_in = max(fps_in, header[3])
+            self.request_layer(member)
+
+        if members:
+            quality[0] = min(member.quality[0] for member in members)
+            fps[0] = min(member.fps[0] for member in members)
+            if self.simulcast:
+                #Cada capa tiene su resolucion: se muestra la mayor que se esta enviando
+                resolution[0] = self.layers[min(member.layer for member in members)]
+            else:
+                resolution[0] = min((member.resolution[0] for member in members), key=lambda r: math.prod(parse_resolution(r)))
+        return self.compositor.compose(members), fps_in
+
+    def loss_summary(self):
+        '''
+        Nombre: loss_summary
+        Descripcion: Perdidas de cada participante, para mostrarlas en la interfaz.
+        Retorno:
+            Cadena "nick: %recibido perdido / frames nuestros perdidos, ...".
+        '''
+        return ", ".join(member.nick + ": " + "%.1f%%" % member.loss_percent() + "/" + str(member.reported_lost)
+                         for member in list(self.members.values()))
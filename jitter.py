@@ -0,0 +1,235 @@
+'''
+    jitter.py
+    Modulo con el buffer de reproduccion (jitter buffer) del video entrante y
+    el estimador de jitter con el que se adapta el retardo de reproduccion.
+    @author Alejandro Bravo, Miguel Gonzalez
+    @version 1.0
+    @date 18-10-2026
+
+    DESCRIPCION GENERAL DEL MODULO
+    El buffer es un anillo de capacidad fija indexado por numero_de_orden % capacidad.
+    Esta pensado para un unico productor (hilo que recibe de la red) y un unico
+    consumidor (hilo que reproduce), y no usa cerrojos:
+
+    1. Solo el productor escribe en las casillas vacias, en inserted y en resync.
+    2. Solo el consumidor vacia casillas y avanza head y removed.
+    3. El productor solo inserta numeros de orden dentro de la ventana [head, head + capacidad),
+       por lo que nunca escribe en la casilla que el consumidor esta leyendo.
+
+    Con el GIL cada una de estas asignaciones es atomica, asi que basta con respetar
+    quien escribe cada variable.
+'''
+
+class RingBuffer():
+    '''Buffer en anillo: Almacena los frames entrantes por numero de orden con insercion y extraccion O(1)'''
+
+    capacity = 256 #Numero de casillas del anillo.
+    slots = None #Casillas. Cada una es None o una tupla (numero de orden, header, frame comprimido).
+    head = -1 #Numero de orden del siguiente frame a reproducir. -1 hasta el primer frame. (Consumidor)
+    tail = -1 #Mayor numero de orden insertado mas uno. (Productor)
+    inserted = 0 #Frames insertados. (Productor)
+    removed = 0 #Frames extraidos o descartados. (Consumidor)
+    resync = -1 #Numero de orden que no cupo en la ventana y obliga a adelantarla. (Productor)
+
+    def __init__(self, capacity):
+        '''
+        Nombre: __init__
+        Descripcion: Constructor que reserva las casillas del anillo.
+        Argumentos: capacity: Numero de frames que caben en el buffer.
+        '''
+        self.capacity = capacity
+        self.clear()
+
+    def __len__(self):
+        '''
+        Nombre: __len__
+        Descripcion: Numero de frames almacenados.
+        '''
+        return self.inserted - self.removed
+
+    def clear(self):
+        '''
+        Nombre: clear
+        Descripcion: Vacia el buffer. Solo debe llamarse con el productor detenido.
+        '''
+        self.slots = [None] * self.capacity
+        self.head = -1
+        self.tail = -1
+        self.inserted = 0
+        self.removed = 0
+        self.resync = -1
+
+    # PRODUCTOR
+
+    def push(self, num, header, encimg):
+        '''
+        Nombre: push
+        Descripcion: Inserta un frame en su casilla. Lo llama solo el hilo de recepcion.
+        Argumentos: num: Numero de orden del frame.
+                    header: Cabecera del frame.
+                    encimg: Frame comprimido.
+        Retorno:
+            True si se ha insertado, False si es anterior a lo ya reproducido, esta repetido
+            o no cabe en la ventana del buffer.
+        '''
+        head = self.head
+        if head == -1:
+            #Primer frame: fija el inicio de la ventana. El consumidor aun no lee.
+            self.head = head = num
+
+        if num < head:
+            return False
+        if num >= head + self.capacity:
+            #El emisor va muy por delante: pedimos al consumidor que adelante la ventana
+            self.resync = num
+            return False
+
+        index = num % self.capacity
+        if self.slots[index] is not None:
+            return False
+
+        self.slots[index] = (num, header, encimg)
+        self.inserted += 1
+        if num >= self.tail:
+            self.tail = num + 1
+        return True
+
+    # CONSUMIDOR
+
+    def has_gap(self):
+        '''
+        Nombre: has_gap
+        Descripcion: Indica si falta el frame que toca reproducir pero ya han llegado posteriores.
+        Retorno:
+            True si hay un hueco en la cabeza del buffer.
+        '''
+        head = self.head
+        return head != -1 and self.slots[head % self.capacity] is None and self.tail > head
+
+    def contains(self, num):
+        '''
+        Nombre: contains
+        Descripcion: Indica si un frame esta en el buffer.
+        Argumentos: num: Numero de orden del frame.
+        Retorno:
+            True si el frame esta guardado y aun no se ha extraido.
+        '''
+        entry = self.slots[num % self.capacity]
+        return entry is not None and entry[0] == num
+
+    def peek(self):
+        '''
+        Nombre: peek
+        Descripcion: Devuelve el siguiente frame en orden sin extraerlo, saltando los huecos.
+        Retorno:
+            Tupla (numero de orden, header, frame comprimido) o None si el buffer esta vacio.
+        '''
+        self.apply_resync()
+        if len(self) == 0:
+            return None
+
+        head = self.head
+        tail = self.tail
+        while head < tail:
+            index = head % self.capacity
+            entry = self.slots[index]
+            if entry is not None:
+                if entry[0] == head:
+                    self.head = head
+                    return entry
+                #Frame que el productor escribio con una ventana ya adelantada: se descarta
+                self.slots[index] = None
+                self.removed += 1
+            head += 1
+        self.head = head
+        return None
+
+    def upcoming(self, count):
+        '''
+        Nombre: upcoming
+        Descripcion: Devuelve, sin extraerlos, los proximos frames en orden.
+        Argumentos: count: Numero maximo de frames a devolver.
+        Retorno:
+            Lista de tuplas (numero de orden, header, frame comprimido).
+        '''
+        entries = []
+        head = self.head
+        if head == -1:
+            return entries
+        tail = self.tail
+        while head < tail and len(entries) < count:
+            entry = self.slots[head % self.capacity]
+            if entry is not None and entry[0] == head:
+                entries.append(entry)
+            head += 1
+        return entries
+
+    def pop(self):
+        '''
+        Nombre: pop
+        Descripcion: Extrae el siguiente frame en orden, saltando los huecos.
+        Retorno:
+            Tupla (numero de orden, header, frame comprimido) o None si el buffer esta vacio.
+        '''
+        entry = self.peek()
+        if entry is None:
+            return None
+        self.slots[entry[0] % self.capacity] = None
+        self.removed += 1
+        self.head = entry[0] + 1
+        return entry
+
+    def apply_resync(self):
+        '''
+        Nombre: apply_resync
+        Descripcion: Si el productor encontro un frame fuera de la ventana, la adelanta
+                     descartando los frames que se quedan atras.
+        '''
+        resync = self.resync
+        if resync < self.head + self.capacity:
+            return
+
+        new_head = resync - self.capacity + 1
+        for num in range(self.head, min(new_head, self.head + self.capacity)):
+            index = num % self.capacity
+            if self.slots[index] is not None:
+                self.slots[index] = None
+                self.removed += 1
+        self.head = new_head
+
+class JitterEstimator():
+    '''Estimador de jitter: Calcula el jitter entre llegadas como en RFC 3550 (seccion 6.4.1) y el retardo de transito medio'''
+
+    GAIN = 1/16 #Ganancia del filtro, la misma que usa RFC 3550.
+
+    jitter = 0.0 #Jitter estimado en segundos.
+    transit = None #Tiempo de transito medio (llegada - envio) en segundos. Incluye el desfase entre relojes.
+    last_transit = None #Tiempo de transito del ultimo frame.
+
+    def reset(self):
+        '''
+        Nombre: reset
+        Descripcion: Reinicia el estimador para una nueva llamada.
+        '''
+        self.jitter = 0.0
+        self.transit = None
+        self.last_transit = None
+
+    def update(self, send_time, arrival_time):
+        '''
+        Nombre: update
+        Descripcion: Actualiza las estimaciones con un frame recibido.
+        Argumentos: send_time: Timestamp de envio de la cabecera del frame.
+                    arrival_time: Instante en que ha llegado.
+        '''
+        transit = arrival_time - send_time
+        if self.last_transit is None:
+            self.transit = transit
+            self.last_transit = transit
+            return
+
+        #J(i) = J(i-1) + (|D(i-1,i)| - J(i-1))/16
+        d = abs(transit - self.last_transit)
+        self.last_transit = transit
+        self.jitter += (d - self.jitter) * self.GAIN
+        self.transit += (transit - self.transit) * self.GAIN
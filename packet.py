@@ -0,0 +1,607 @@
+'''
+    packet.py
+    Modulo encargado del formato de los datagramas de video en la red.
+    Incluye la cabecera binaria de video, la fragmentacion de frames en varios
+    datagramas y su reensamblado.
+    @author Alejandro Bravo, Miguel Gonzalez
+    @version 1.0
+    @date 18-10-2026
+
+    FORMATO DE UN FRAGMENTO
+    Cada fragmento empieza por una cabecera binaria de tamano fijo (orden de red):
+        magic (1 byte) | frame_id (4 bytes) | indice (2 bytes) | total (2 bytes)
+    seguida de un trozo del mensaje original (cabecera de video + frame comprimido).
+    El byte magic no es un digito ASCII, por lo que nunca se confunde con un
+    datagrama V0, cuya cabecera empieza por el numero de orden.
+
+    FORMATO DE LA CABECERA BINARIA DE VIDEO (extension BINHDR)
+    Sustituye a la cabecera de texto "num#ts#res#fps#" de V0. Es de tamano fijo (orden de red):
+        magic (1 byte) | version (1 byte) | flags (2 bytes) | numero de orden (4 bytes) |
+        timestamp en microsegundos (8 bytes) | ancho (2 bytes) | alto (2 bytes) | fps (2 bytes)
+    Tras ella va directamente el frame comprimido.
+
+    FORMATO DE UN FRAME DELTA (extension TILES, solo con cabecera binaria)
+    Si la cabecera lleva el flag VIDEO_FLAG_DELTA, tras ella va un directorio de tiles:
+        frame clave (4 bytes) | tamano de tile (2 bytes) | columnas (2 bytes) | filas (2 bytes) |
+        numero de tiles (2 bytes) | indices de los tiles (2 bytes cada uno)
+    seguido de un JPEG con los tiles cambiados apilados en vertical (tamano de tile de ancho).
+    Si no ha cambiado ningun tile no hay JPEG.
+
+    FORMATO DE UN DATAGRAMA DE PARIDAD (extension FEC)
+    Protege un grupo de fragmentos consecutivos del mismo frame. Cabecera (orden de red):
+        magic (1 byte) | frame_id (4 bytes) | total (2 bytes) | primer indice del grupo (2 bytes) |
+        tamano del grupo (2 bytes) | xor de los tamanos de los trozos (2 bytes)
+    seguida del XOR byte a byte de los trozos del grupo (rellenando con ceros el mas corto).
+    Con la paridad y todos los trozos del grupo menos uno se reconstruye el que falta.
+
+    CODEC DEL FRAME (solo con cabecera binaria)
+    Los bits VIDEO_CODEC_MASK de los flags llevan el identificador del codec con el que se ha
+    comprimido el frame (ver codec.py). 0 es JPEG, por lo que los frames de clientes anteriores
+    se siguen descomprimiendo igual.
+
+    PREFIJO DE GRUPO (extension GROUP)
+    En las llamadas de grupo cada datagrama (fragmento, paridad o mensaje entero) va precedido de
+    un prefijo de tamano fijo (orden de red):
+        magic (1 byte) | flujo (4 bytes) | numero de secuencia (4 bytes)
+    El flujo identifica al emisor (ver group.py) y el numero de secuencia cuenta los datagramas
+    enviados a cada destinatario por separado, de modo que cada receptor mide sus propias perdidas
+    aunque el frame comprimido sea el mismo para todos.
+
+    En ambos formatos la cabecera se devuelve como la lista [num, ts, resolucion, fps, flags],
+    con el numero de orden y los fps como enteros, el timestamp en segundos como float y la
+    resolucion como cadena "anchoxalto".
+'''
+
+import struct
+import time
+from collections import deque
+import numpy as np
+
+FRAGMENT_MAGIC = 0xFA #Primer byte de todo fragmento
+FRAGMENT_HEADER = struct.Struct("!BIHH") #magic, frame_id, indice, total
+FRAME_ID_MODULE = 2**32 #Los identificadores de frame dan la vuelta al llegar aqui
+
+PARITY_MAGIC = 0xFC #Primer byte de todo datagrama de paridad (extension FEC)
+PARITY_HEADER = struct.Struct("!BIHHHH") #magic, frame_id, total, primer indice del grupo, tamano del grupo, xor de tamanos
+
+GROUP_MAGIC = 0xFD #Primer byte del prefijo de grupo (extension GROUP)
+GROUP_HEADER = struct.Struct("!BII") #magic, flujo, numero de secuencia
+SEQUENCE_MODULE = 2**32 #Los numeros de secuencia del prefijo de grupo dan la vuelta al llegar aqui
+
+VIDEO_MAGIC = 0xFB #Primer byte de la cabecera binaria de video
+VIDEO_HEADER_VERSION = 1 #Version actual de la cabecera binaria
+VIDEO_HEADER = struct.Struct("!BBHIQHHH") #magic, version, flags, num, ts, ancho, alto, fps
+ENCODED_HASHTAG = 35 #Codigo de la almohadilla en la cabecera de texto
+TEXT_HEADER_MAX = 128 #Bytes en los que se busca la cabecera de texto
+
+VIDEO_FLAG_DELTA = 0x0001 #El frame solo trae los tiles que han cambiado respecto a su frame clave (extension TILES)
+VIDEO_FLAG_KEY = 0x0002 #Frame completo que sirve de referencia a los frames delta siguientes (extension TILES)
+VIDEO_CODEC_MASK = 0x00F0 #Bits de los flags con el identificador del codec del frame
+VIDEO_CODEC_SHIFT = 4 #Desplazamiento de los bits del codec en los flags
+TILE_HEADER = struct.Struct("!IHHHH") #frame clave, tamano de tile, columnas, filas, numero de tiles
+TILE_INDEX = np.dtype(">u2") #Cada indice de tile ocupa 2 bytes en orden de red
+
+def pack_video_header(num, timestamp, width, height, fps, flags=0):
+    '''
+    Nombre: pack_video_header
+    Descripcion: Construye la cabecera binaria de un frame.
+    Argumentos: num: Numero de orden del frame.
+                timestamp: Instante de envio en segundos (como time.time()).
+                width: Ancho del frame.
+                height: Alto del frame.
+                fps: FPS a los que se envia.
+                flags: Campo de flags.
+    Retorno:
+        La cabecera como bytes.
+    '''
+    return VIDEO_HEADER.pack(VIDEO_MAGIC, VIDEO_HEADER_VERSION, flags, num % 2**32,
+                             int(timestamp * 1000000), width, height, min(max(int(fps), 0), 0xFFFF))
+
+def pack_text_header(num, timestamp, resolution, fps):
+    '''
+    Nombre: pack_text_header
+    Descripcion: Construye la cabecera de texto de V0.
+    Argumentos: num: Numero de orden del frame.
+                timestamp: Instante de envio en segundos.
+                resolution: Resolucion como cadena "anchoxalto".
+                fps: FPS a los que se envia.
+    Retorno:
+        La cabecera como bytes.
+    '''
+    return (str(num) + "#" + str(timestamp) + "#" + resolution + "#" + str(fps) + "#").encode()
+
+def parse_header(data):
+    '''
+    Nombre: parse_header
+    Descripcion: Lee la cabecera de un mensaje de video, sea binaria o de texto.
+    Argumentos: data: Mensaje completo (bytes, bytearray o memoryview).
+    Retorno:
+        Tupla (cabecera, desplazamiento) donde cabecera es la lista [num, ts, resolucion, fps, flags]
+        y desplazamiento es la posicion en la que empieza el frame comprimido.
+        None si la cabecera es invalida.
+    '''
+    if len(data) == 0:
+        return None
+
+    if data[0] == VIDEO_MAGIC:
+        if len(data) < VIDEO_HEADER.size:
+            return None
+        _, version, flags, num, ts, width, height, fps = VIDEO_HEADER.unpack_from(data)
+        if version != VIDEO_HEADER_VERSION:
+            print("Error en el datagrama: version de cabecera desconocida " + str(version))
+            return None
+        return [num, ts / 1000000, str(width) + "x" + str(height), fps, flags], VIDEO_HEADER.size
+
+    #Cabecera de texto: buscamos la cuarta almohadilla en los primeros bytes
+    head = bytes(data[:TEXT_HEADER_MAX])
+    i = -1
+    for _ in range(4):
+        i = head.find(ENCODED_HASHTAG, i + 1)
+        if i == -1:
+            return None
+    try:
+        fields = head[:i].decode().split("#")
+        return [int(fields[0]), float(fields[1]), fields[2], int(fields[3]), 0], i + 1
+    except (UnicodeDecodeError, ValueError, IndexError):
+        return None
+
+def pack_tile_directory(key_num, tile_size, cols, rows, indices):
+    '''
+    Nombre: pack_tile_directory
+    Descripcion: Construye el directorio de tiles de un frame delta.
+    Argumentos: key_num: Numero de orden del frame clave sobre el que se aplican los tiles.
+                tile_size: Lado de cada tile en pixeles.
+                cols: Columnas de la rejilla de tiles.
+                rows: Filas de la rejilla de tiles.
+                indices: Array de numpy con el indice (fila * columnas + columna) de cada tile enviado.
+    Retorno:
+        El directorio como bytes.
+    '''
+    return TILE_HEADER.pack(key_num % 2**32, tile_size, cols, rows, len(indices)) + indices.astype(TILE_INDEX).tobytes()
+
+def parse_tile_directory(data):
+    '''
+    Nombre: parse_tile_directory
+    Descripcion: Lee el directorio de tiles de un frame delta.
+    Argumentos: data: Contenido del frame tras la cabecera de video.
+    Retorno:
+        Tupla (directorio, desplazamiento) donde directorio es la tupla
+        (frame clave, tamano de tile, columnas, filas, array de indices) y desplazamiento es la
+        posicion en la que empieza el JPEG de los tiles. None si el directorio es invalido.
+    '''
+    if len(data) < TILE_HEADER.size:
+        return None
+    key_num, tile_size, cols, rows, count = TILE_HEADER.unpack_from(data)
+    end = TILE_HEADER.size + count * TILE_INDEX.itemsize
+    if tile_size == 0 or len(data) < end:
+        return None
+    indices = np.frombuffer(data, TILE_INDEX, count, TILE_HEADER.size).astype(np.intp)
+    if count > 0 and indices.max() >= cols * rows:
+        return None
+    return (key_num, tile_size, cols, rows, indices), end
+
+def fragment_message(parts, frame_id, max_datagram_size, fec=False):
+    '''
+    Nombre: fragment_message
+    Descripcion: Divide un mensaje en fragmentos que caben en un datagrama de max_datagram_size bytes.
+                 No copia el mensaje: cada fragmento es una lista de trozos (memoryview) de las partes.
+    Argumentos: parts: Lista con las partes del mensaje (cabecera de video, directorio, frame comprimido...),
+                       cualquier objeto con protocolo buffer (bytes, memoryview, array de numpy contiguo).
+                frame_id: Identificador del frame al que pertenecen los fragmentos.
+                max_datagram_size: Tamano maximo de cada datagrama, cabecera de fragmento incluida.
+                fec: Si se van a enviar paridades de los fragmentos. La paridad lleva un trozo del mismo tamano
+                     que los fragmentos y una cabecera mayor, asi que los trozos se acortan para que tambien quepa.
+    Retorno:
+        Lista con los datagramas a enviar, en orden. Cada datagrama es una lista de buffers
+        (la cabecera de fragmento y los trozos) que se envian juntos con socket.sendmsg.
+        None si el mensaje necesita mas fragmentos de los que caben en la cabecera.
+    '''
+    views = [v for v in map(byte_view, parts) if len(v) > 0]
+    total = sum(len(v) for v in views)
+    chunk_size = max_datagram_size - (PARITY_HEADER.size if fec else FRAGMENT_HEADER.size)
+    count = max(1, -(-total // chunk_size)) #Division por exceso
+    if count > 0xFFFF:
+        print("Error fragmentando: el frame necesita demasiados fragmentos.")
+        return None
+
+    datagrams = []
+    part = 0
+    offset = 0
+    for index in range(count):
+        datagram = [FRAGMENT_HEADER.pack(FRAGMENT_MAGIC, frame_id % FRAME_ID_MODULE, index, count)]
+        remaining = chunk_size
+        #Un fragmento puede empezar en una parte y acabar en la siguiente
+        while remaining > 0 and part < len(views):
+            view = views[part]
+            size = min(remaining, len(view) - offset)
+            datagram.append(view[offset:offset + size])
+            offset += size
+            remaining -= size
+            if offset == len(view):
+                part += 1
+                offset = 0
+        datagrams.append(datagram)
+    return datagrams
+
+def byte_view(data):
+    '''
+    Nombre: byte_view
+    Descripcion: Vista de bytes sin copia de cualquier objeto con protocolo buffer.
+    Argumentos: data: bytes, bytearray, memoryview o array de numpy contiguo.
+    Retorno:
+        memoryview de una dimension con formato de bytes.
+    '''
+    view = memoryview(data)
+    if view.ndim != 1 or view.format != "B":
+        view = view.cast("B")
+    return view
+
+def parity_datagrams(datagrams, frame_id, group_size):
+    '''
+    Nombre: parity_datagrams
+    Descripcion: Calcula los datagramas de paridad XOR de los fragmentos de un frame, uno por cada
+                 grupo de group_size fragmentos consecutivos.
+    Argumentos: datagrams: Fragmentos del frame, como los devuelve fragment_message.
+                frame_id: Identificador del frame.
+                group_size: Fragmentos que protege cada paridad.
+    Retorno:
+        Lista de tuplas (posicion, datagrama de paridad): la paridad se envia tras el fragmento
+        de esa posicion, es decir, al acabar su grupo.
+    '''
+    count = len(datagrams)
+    chunk = sum(len(buf) for buf in datagrams[0][1:])
+    parities = []
+    for first in range(0, count, group_size):
+        group = min(group_size, count - first)
+        data = np.zeros(chunk, np.uint8)
+        size_xor = 0
+        for datagram in datagrams[first:first + group]:
+            offset = 0
+            for buf in datagram[1:]:
+                piece = np.frombuffer(buf, np.uint8)
+                data[offset:offset + len(piece)] ^= piece
+                offset += len(piece)
+            size_xor ^= offset
+        header = PARITY_HEADER.pack(PARITY_MAGIC, frame_id % FRAME_ID_MODULE, count, first, group, size_xor)
+        parities.append((first + group - 1, [header, memoryview(data)]))
+    return parities
+
+def pack_group_prefix(stream, seq):
+    '''
+    Nombre: pack_group_prefix
+    Descripcion: Construye el prefijo de grupo de un datagrama.
+    Argumentos: stream: Identificador del flujo del emisor.
+                seq: Numero de secuencia del datagrama para su destinatario.
+    Retorno:
+        El prefijo como bytes.
+    '''
+    return GROUP_HEADER.pack(GROUP_MAGIC, stream % SEQUENCE_MODULE, seq % SEQUENCE_MODULE)
+
+def parse_group_prefix(datagram):
+    '''
+    Nombre: parse_group_prefix
+    Descripcion: Lee el prefijo de grupo de un datagrama.
+    Argumentos: datagram: Datagrama recibido, como memoryview.
+    Retorno:
+        Tupla (flujo, numero de secuencia, resto del datagrama como memoryview), o None si no lleva prefijo de grupo.
+    '''
+    if len(datagram) < GROUP_HEADER.size or datagram[0] != GROUP_MAGIC:
+        return None
+    _, stream, seq = GROUP_HEADER.unpack_from(datagram)
+    return stream, seq, datagram[GROUP_HEADER.size:]
+
+def is_fragment(datagram):
+    '''
+    Nombre: is_fragment
+    Descripcion: Indica si un datagrama es un fragmento.
+    Argumentos: datagram: Datagrama recibido.
+    Retorno:
+        True si empieza por la cabecera de fragmento o de paridad (que tambien pasan por el
+        reensamblador), False en otro caso.
+    '''
+    return len(datagram) >= FRAGMENT_HEADER.size and (datagram[0] == FRAGMENT_MAGIC or datagram[0] == PARITY_MAGIC)
+
+class PartialFrame():
+    '''Frame a medio reensamblar: Estado de un frame fragmentado del que faltan trozos'''
+
+    count = 0 #Numero total de fragmentos.
+    received = 0 #Fragmentos recibidos (o recuperados).
+    mask = None #bytearray con un 1 por cada fragmento recibido.
+    buffer = None #Buffer del frame. Se reserva al conocer el tamano de trozo.
+    chunk = 0 #Tamano de todos los trozos menos el ultimo.
+    last_size = 0 #Tamano del ultimo trozo.
+    pending_last = None #Ultimo trozo, si llego antes de conocer el tamano de trozo.
+    parities = None #Diccionario primer indice del grupo -> (tamano del grupo, xor de tamanos, paridad).
+    recovered = False #Indica si algun trozo se ha recuperado con FEC.
+    first_time = 0 #Instante en que llego el primer datagrama del frame.
+
+    def __init__(self, count, now):
+        '''
+        Nombre: __init__
+        Descripcion: Constructor de un frame vacio.
+        Argumentos: count: Numero total de fragmentos.
+                    now: Instante actual.
+        '''
+        self.count = count
+        self.mask = bytearray(count)
+        self.parities = {}
+        self.first_time = now
+
+    def size(self):
+        '''
+        Nombre: size
+        Descripcion: Tamano del mensaje completo.
+        '''
+        return (self.count - 1) * self.chunk + self.last_size
+
+    def piece(self, index):
+        '''
+        Nombre: piece
+        Descripcion: Trozo ya colocado en el buffer.
+        Argumentos: index: Indice del fragmento.
+        Retorno:
+            memoryview del trozo.
+        '''
+        size = self.chunk if index < self.count - 1 else self.last_size
+        return memoryview(self.buffer)[index * self.chunk:index * self.chunk + size]
+
+class Reassembler():
+    '''Reensamblador: Tabla acotada de frames a medio recibir que reconstruye los mensajes fragmentados'''
+
+    max_slots = 32 #Numero maximo de frames incompletos que se guardan a la vez.
+    timeout = 0.5 #Segundos que se espera como mucho a que se complete un frame.
+    pool = None #Pool del que se sacan los buffers de los frames (ver bufferpool.py). Si es None se crean.
+    table = None #Diccionario frame_id -> PartialFrame.
+    completed = None #Ultimos frame_id completados, para ignorar los datagramas que lleguen despues.
+    evicted = 0 #Numero de frames incompletos descartados.
+    recovered = 0 #Numero de frames que se han completado gracias a la paridad (FEC). Solo lo escribe el hilo de recepcion.
+
+    def __init__(self, max_slots, timeout, pool=None):
+        '''
+        Nombre: __init__
+        Descripcion: Constructor que ajusta los limites de la tabla.
+        Argumentos: max_slots: Numero maximo de frames incompletos en la tabla.
+                    timeout: Segundos tras los que un frame incompleto se descarta.
+                    pool: BufferPool del que sacar los buffers de los frames, o None.
+        '''
+        self.max_slots = max_slots
+        self.timeout = timeout
+        self.pool = pool
+        self.table = {}
+        self.completed = deque(maxlen=2 * max_slots)
+        self.evicted = 0
+        self.recovered = 0
+
+    def add(self, datagram):
+        '''
+        Nombre: add
+        Descripcion: Incorpora un fragmento o un datagrama de paridad a la tabla. El contenido se copia,
+                     por lo que el datagrama se puede reutilizar al volver.
+        Argumentos: datagram: Fragmento o paridad recibido (bytes, bytearray o memoryview).
+        Retorno:
+            El mensaje completo si con este datagrama se completa el frame: un memoryview sobre
+            el buffer del frame o, si el frame cabe en un fragmento, sobre el propio datagrama.
+            None si el frame sigue incompleto o el datagrama es invalido.
+        '''
+        if datagram[0] == PARITY_MAGIC:
+            return self.add_parity(datagram)
+
+        _, frame_id, index, count = FRAGMENT_HEADER.unpack_from(datagram)
+        if count == 0 or index >= count:
+            return None
+
+        #Caso rapido: el frame cabe en un solo fragmento
+        if count == 1:
+            if frame_id in self.completed:
+                return None
+            self.completed.append(frame_id)
+            return memoryview(datagram)[FRAGMENT_HEADER.size:]
+
+        entry = self.get_entry(frame_id, count)
+        if entry is None or entry.mask[index]:
+            return None #Ya completado o repetido
+        if not self.store(entry, frame_id, index, memoryview(datagram)[FRAGMENT_HEADER.size:]):
+            return None
+
+        #Si en su grupo solo falta un trozo y ya esta la paridad, lo recuperamos
+        for first, parity in entry.parities.items():
+            if first <= index < first + parity[0]:
+                self.recover(entry, frame_id, first)
+                break
+        return self.finish(entry, frame_id)
+
+    def add_parity(self, datagram):
+        '''
+        Nombre: add_parity
+        Descripcion: Incorpora un datagrama de paridad e intenta recuperar el trozo que falte en su grupo.
+        Argumentos: datagram: Datagrama de paridad.
+        Retorno:
+            Lo mismo que add.
+        '''
+        if len(datagram) < PARITY_HEADER.size:
+            return None
+        _, frame_id, count, first, group, size_xor = PARITY_HEADER.unpack_from(datagram)
+        if count == 0 or group == 0 or first + group > count:
+            return None
+        payload = memoryview(datagram)[PARITY_HEADER.size:]
+
+        if count == 1:
+            #La paridad de un grupo de un solo fragmento es una copia de ese fragmento
+            if frame_id in self.completed:
+                return None
+            self.completed.append(frame_id)
+            self.recovered += 1
+            return memoryview(bytes(payload))
+
+        entry = self.get_entry(frame_id, count)
+        if entry is None or first in entry.parities:
+            return None
+        entry.parities[first] = (group, size_xor, bytes(payload))
+        self.recover(entry, frame_id, first)
+        return self.finish(entry, frame_id)
+
+    def get_entry(self, frame_id, count):
+        '''
+        Nombre: get_entry
+        Descripcion: Busca la entrada de un frame, creandola si no existe.
+        Argumentos: frame_id: Identificador del frame.
+                    count: Numero total de fragmentos.
+        Retorno:
+            El PartialFrame, o None si el frame ya se completo.
+        '''
+        entry = self.table.get(frame_id)
+        if entry is not None and entry.count == count:
+            return entry
+        if entry is None and frame_id in self.completed:
+            return None
+
+        now = time.time()
+        if entry is not None:
+            self.release(self.table.pop(frame_id))
+        self.evict(now)
+        entry = PartialFrame(count, now)
+        self.table[frame_id] = entry
+        return entry
+
+    def store(self, entry, frame_id, index, payload):
+        '''
+        Nombre: store
+        Descripcion: Copia un trozo en su posicion del buffer del frame.
+        Argumentos: entry: PartialFrame del frame.
+                    frame_id: Identificador del frame.
+                    index: Indice del fragmento.
+                    payload: Contenido del fragmento.
+        Retorno:
+            True si se ha guardado, False si el trozo es invalido.
+        '''
+        size = len(payload)
+        if index < entry.count - 1:
+            #Todos los trozos menos el ultimo miden lo mismo: con el primero reservamos el buffer
+            if entry.buffer is None:
+                if entry.pending_last is not None and len(entry.pending_last) > size:
+                    print("Error reensamblando: fragmento de tamano inesperado.")
+                    self.release(self.table.pop(frame_id))
+                    return False
+                entry.chunk = size
+                entry.buffer = self.pool.acquire(entry.count * size) if self.pool is not None else bytearray(entry.count * size)
+                if entry.pending_last is not None:
+                    self.place(entry, entry.count - 1, entry.pending_last)
+                    entry.pending_last = None
+            elif size != entry.chunk:
+                print("Error reensamblando: fragmento de tamano inesperado.")
+                return False
+            self.place(entry, index, payload)
+        else:
+            if entry.buffer is not None and size > entry.chunk:
+                print("Error reensamblando: fragmento de tamano inesperado.")
+                return False
+            entry.last_size = size
+            if entry.buffer is None:
+                #Aun no sabemos donde va: lo guardamos hasta que llegue otro trozo
+                entry.pending_last = bytes(payload)
+            else:
+                self.place(entry, index, payload)
+
+        entry.mask[index] = 1
+        entry.received += 1
+        return True
+
+    def recover(self, entry, frame_id, first):
+        '''
+        Nombre: recover
+        Descripcion: Si en un grupo protegido por paridad falta exactamente un trozo, lo reconstruye
+                     haciendo XOR de la paridad con los demas trozos del grupo.
+        Argumentos: entry: PartialFrame del frame.
+                    frame_id: Identificador del frame.
+                    first: Primer indice del grupo.
+        '''
+        group, size_xor, parity = entry.parities[first]
+        missing = [i for i in range(first, first + group) if not entry.mask[i]]
+        if len(missing) != 1:
+            return
+        index = missing[0]
+
+        data = np.frombuffer(parity, np.uint8).copy()
+        for i in range(first, first + group):
+            if i == index:
+                continue
+            if i == entry.count - 1 and entry.buffer is None:
+                piece = entry.pending_last
+            else:
+                piece = entry.piece(i)
+            if len(piece) > len(data):
+                #Paridad mas corta que los trozos que protege: no es valida (o no es de este frame)
+                del entry.parities[first]
+                return
+            size_xor ^= len(piece)
+            data[:len(piece)] ^= np.frombuffer(piece, np.uint8)
+
+        if size_xor > len(data):
+            return
+        if self.store(entry, frame_id, index, memoryview(data)[:size_xor]):
+            entry.recovered = True
+
+    def finish(self, entry, frame_id):
+        '''
+        Nombre: finish
+        Descripcion: Si el frame esta completo, lo saca de la tabla.
+        Argumentos: entry: PartialFrame del frame.
+                    frame_id: Identificador del frame.
+        Retorno:
+            El mensaje completo como memoryview, o None si aun faltan trozos.
+        '''
+        if entry.received < entry.count or self.table.get(frame_id) is not entry:
+            return None
+        del self.table[frame_id]
+        self.completed.append(frame_id)
+        if entry.recovered:
+            self.recovered += 1
+        return memoryview(entry.buffer)[:entry.size()]
+
+    def place(self, entry, index, payload):
+        '''
+        Nombre: place
+        Descripcion: Copia un trozo en su posicion del buffer del frame.
+        Argumentos: entry: PartialFrame del frame.
+                    index: Indice del fragmento.
+                    payload: Contenido del fragmento.
+        '''
+        offset = index * entry.chunk
+        entry.buffer[offset:offset + len(payload)] = payload
+
+    def release(self, entry):
+        '''
+        Nombre: release
+        Descripcion: Devuelve al pool el buffer de un frame incompleto que se descarta.
+        Argumentos: entry: PartialFrame del frame.
+        '''
+        if entry.buffer is not None and self.pool is not None:
+            self.pool.release(entry.buffer)
+
+    def evict(self, now):
+        '''
+        Nombre: evict
+        Descripcion: Descarta los frames incompletos caducados y, si la tabla sigue llena,
+                     el mas antiguo, para dejar sitio a uno nuevo.
+        Argumentos: now: Instante actual.
+        '''
+        stale = [k for k, v in self.table.items() if now - v.first_time > self.timeout]
+        for frame_id in stale:
+            self.release(self.table.pop(frame_id))
+        self.evicted += len(stale)
+
+        if len(self.table) >= self.max_slots:
+            oldest = min(self.table, key=lambda k: self.table[k].first_time)
+            self.release(self.table.pop(oldest))
+            self.evicted += 1
+
+    def clear(self):
+        '''
+        Nombre: clear
+        Descripcion: Vacia la tabla de reensamblado.
+        '''
+        for entry in self.table.values():
+            self.release(entry)
+        self.table = {}
+        self.completed.clear()
+        self.recovered = 0
@@ -0,0 +1,197 @@
+'''
+    pipeline.py
+    Modulo con las etapas de codificacion en paralelo del video saliente y de
+    descompresion en paralelo del video entrante.
+    @author Alejandro Bravo, Miguel Gonzalez
+    @version 1.0
+    @date 18-10-2026
+
+    DESCRIPCION GENERAL DEL MODULO
+    Los frames capturados se comprimen en un pool de hilos (cv2.imencode libera el GIL,
+    por lo que los hilos trabajan realmente en paralelo). Los resultados se guardan en
+    una cola acotada en el mismo orden en que se enviaron a comprimir, y un unico hilo
+    de envio los va sacando en ese orden. Asi la captura del frame N+1 se solapa con la
+    compresion del frame N sin alterar los numeros de orden ni el orden de envio.
+
+    En recepcion, el hilo que lee del socket solo reensambla e inserta los frames
+    comprimidos en el buffer en anillo, que hace de etapa de reordenacion. El hilo de
+    reproduccion manda a descomprimir a un pool los siguientes frames del buffer, de
+    forma que cuando le toca mostrar uno normalmente ya esta descomprimido.
+'''
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+class EncodePipeline():
+    '''Pipeline de codificacion: Comprime en paralelo y entrega los resultados en orden'''
+
+    executor = None #Pool de hilos de compresion.
+    pending = None #Cola de tuplas (futuro, contexto) en el orden de llegada.
+    max_pending = 4 #Numero maximo de frames en vuelo. Si se alcanza, submit espera.
+    on_ready = None #Funcion on_ready(resultado, contexto) que se llama en orden desde el hilo de envio.
+    cond = None #Condicion que protege la cola.
+    stopped = False #Indica al hilo de envio que debe parar.
+    sender = None #Hilo de envio.
+
+    def __init__(self, workers, max_pending, on_ready):
+        '''
+        Nombre: __init__
+        Descripcion: Crea el pool de compresion y arranca el hilo de envio.
+        Argumentos: workers: Numero de hilos de compresion.
+                    max_pending: Numero maximo de frames comprimiendose o esperando a ser enviados.
+                    on_ready: Funcion on_ready(resultado, contexto) a la que se entregan los resultados en orden.
+        '''
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="encode")
+        self.pending = deque()
+        self.max_pending = max(1, max_pending)
+        self.on_ready = on_ready
+        self.cond = threading.Condition()
+        self.stopped = False
+        self.sender = threading.Thread(target=self.sender_loop, daemon=True)
+        self.sender.start()
+
+    def submit(self, function, args, context):
+        '''
+        Nombre: submit
+        Descripcion: Manda a comprimir un frame. Si la cola esta llena espera a que se vacie un hueco.
+        Argumentos: function: Funcion que se ejecuta en el pool.
+                    args: Tupla de argumentos de la funcion.
+                    context: Dato que se entrega junto al resultado (por ejemplo, el destino).
+        Retorno:
+            True si se ha encolado, False si el pipeline esta parado.
+        '''
+        with self.cond:
+            while len(self.pending) >= self.max_pending and not self.stopped:
+                self.cond.wait()
+            if self.stopped:
+                return False
+            self.pending.append((self.executor.submit(function, *args), context))
+            self.cond.notify_all()
+        return True
+
+    def sender_loop(self):
+        '''
+        Nombre: sender_loop
+        Descripcion: Bucle del hilo de envio. Espera al resultado mas antiguo y lo entrega.
+        '''
+        while True:
+            with self.cond:
+                while not self.pending and not self.stopped:
+                    self.cond.wait()
+                if not self.pending:
+                    return
+                future, context = self.pending[0]
+
+            try:
+                result = future.result()
+            except Exception as e:
+                print("Error comprimiendo frame: " + str(e))
+                result = None
+
+            with self.cond:
+                self.pending.popleft()
+                self.cond.notify_all()
+
+            self.on_ready(result, context)
+
+    def stop(self):
+        '''
+        Nombre: stop
+        Descripcion: Detiene el pipeline tras entregar los frames pendientes.
+        '''
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        self.sender.join()
+        self.executor.shutdown(wait=True)
+
+class DecodePool():
+    '''Pool de descompresion: Descomprime por adelantado los proximos frames a reproducir'''
+
+    executor = None #Pool de hilos de descompresion.
+    decode = None #Funcion decode(header, frame comprimido) -> frame.
+    futures = None #Diccionario numero de orden -> futuro de su descompresion.
+    cancelled = 0 #Descompresiones adelantadas que se cancelaron antes de empezar.
+
+    def __init__(self, workers, decode):
+        '''
+        Nombre: __init__
+        Descripcion: Crea el pool de descompresion. Solo debe usarlo el hilo de reproduccion.
+        Argumentos: workers: Numero de hilos de descompresion.
+                    decode: Funcion que descomprime un frame a partir de su header y el frame comprimido.
+        '''
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decode")
+        self.decode = decode
+        self.futures = {}
+        self.cancelled = 0
+
+    def prefetch(self, entries):
+        '''
+        Nombre: prefetch
+        Descripcion: Manda a descomprimir los frames indicados si no lo estaban ya.
+        Argumentos: entries: Lista de tuplas (numero de orden, header, frame comprimido).
+        '''
+        for num, header, encimg in entries:
+            if num not in self.futures:
+                self.futures[num] = self.executor.submit(self.decode, header, encimg)
+
+    def take(self, num, header, encimg):
+        '''
+        Nombre: take
+        Descripcion: Obtiene el frame descomprimido de un numero de orden. Descarta las descompresiones
+                     adelantadas de frames anteriores, que ya no se van a mostrar.
+        Argumentos: num: Numero de orden del frame.
+                    header: Header del frame, por si no se habia mandado a descomprimir.
+                    encimg: Frame comprimido, por si no se habia mandado a descomprimir.
+        Retorno:
+            El frame descomprimido, o None en caso de error.
+        '''
+        for old in [k for k in self.futures if k < num]:
+            if self.futures.pop(old).cancel():
+                self.cancelled += 1
+
+        future = self.futures.pop(num, None)
+        if future is None:
+            return self.decode(header, encimg)
+        try:
+            return future.result()
+        except Exception as e:
+            print("Error descomprimiendo frame: " + str(e))
+            return None
+
+    def discard(self, num):
+        '''
+        Nombre: discard
+        Descripcion: Olvida la descompresion adelantada de un frame que no se va a mostrar. Si ya
+                     habia empezado, espera a que termine, para que su buffer se pueda reutilizar.
+        Argumentos: num: Numero de orden del frame.
+        '''
+        future = self.futures.pop(num, None)
+        if future is None:
+            return
+        if future.cancel():
+            self.cancelled += 1
+            return
+        try:
+            future.result()
+        except Exception:
+            pass
+
+    def clear(self):
+        '''
+        Nombre: clear
+        Descripcion: Cancela las descompresiones pendientes.
+        '''
+        for future in self.futures.values():
+            future.cancel()
+        self.futures = {}
+        self.cancelled = 0
+
+    def stop(self):
+        '''
+        Nombre: stop
+        Descripcion: Detiene el pool.
+        '''
+        self.clear()
+        self.executor.shutdown(wait=True)
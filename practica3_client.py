@@ -16,9 +16,12 @@ import threading
 import socket
 import json
 import time
-from discovery import Discovery
+from discovery import Discovery, UserDirectory
 from control import Control
-from video import VideoBuffer
+from control_async import AsyncControl
+from video import VideoBuffer, PROTOCOLS, resize_to
+from group import GroupCall
+from broadcast import Broadcast
 from config import ConfigParser
 import requests #Para hacer la peticion de ip externa
 
@@ -27,6 +30,8 @@ class VideoClient(object):
     #PARAMETROS DE CONTROL DEL CLIENTE DE VIDEO
 
     discovery = None #Objeto que gestiona la conexion al server de descubrimiento
+    directory = None #Usuarios listados, indexados para buscar desde la ventana de llamar
+    time_last_list = 0 #Ultima vez que se refresco la lista de usuarios mientras llegaba el listado
     connection_loop = None #Hilo que despacha las conexiones entrantes
     command_loop = None #Hilo que atiende a los comandos de llamada entrantes
     frame_send_loop = None #Hilo que envia los frames al ritmo correcto
@@ -51,10 +56,24 @@ class VideoClient(object):
     rec_frame = np.array([]) #Ultimo frame recibido, se actualiza a ritmo de fps_recv
     cap_frame_lock = threading.Lock() #Lock para captura de video
     rec_frame_lock = threading.Lock() #Lock para recepcion de video
-    update_screen_lock = threading.Lock() #Para evitar que receptor y emisor actualicen la pantalla a la vez.
+    cap_frame_version = 0 #Se incrementa cada vez que hay un frame capturado nuevo
+    rec_frame_version = 0 #Se incrementa cada vez que hay un frame recibido nuevo
+    drawn_versions = (-1, -1) #Versiones de los frames que hay pintados en pantalla
+    screen_rgba = None #Buffer preasignado en el que se compone la pantalla (640x480 RGBA)
+    mini_bgr = None #Buffer preasignado para el frame propio en miniatura
+    mini_rgba = None #Buffer preasignado para la miniatura convertida a RGBA
+    screen_image = None #Imagen PIL que comparte memoria con screen_rgba
+    screen_photo = None #PhotoImage de Tk que se actualiza en el sitio en cada repintado
+    screen_attached = False #Indica si screen_photo ya esta asociado al widget de video
+    status_fields = None #Textos pendientes de la barra de estado, uno por campo
+    status_shown = None #Textos que se muestran actualmente en la barra de estado
+    time_last_status = 0 #Ultima vez que se actualizo la barra de estado
     program_quit = False #Indica si han solicitado cerrar el programa.
     config = None #Objeto con parametros de configuracion
     control = None #Objeto del modulo de control
+    group = None #Llamada de grupo
+    broadcast = None #Emision multicast, que emitimos o que vemos
+    receive_loop = None #Hilo que recibe el video de la llamada, o None si no recibimos (emitiendo)
 
     def __init__(self, window_size):
         '''
@@ -69,6 +88,9 @@ class VideoClient(object):
         #Creamos el objeto de buffer de video
         self.buffer_video = VideoBuffer(self.config)
 
+        #Directorio de usuarios en el que se busca al llamar
+        self.directory = UserDirectory()
+
         # Creamos una variable que contenga el GUI principal
         self.app = gui("Redes2 - P2P", window_size)
         self.app.setGuiPadding(10, 10)
@@ -88,8 +110,9 @@ class VideoClient(object):
         self.fps_send = [self.fps_send_max]
 
         # Añadir los botones
-        self.app.addButtons(["Conectar", "Espera", "Colgar", "Salir"], self.buttonsCallback)
+        self.app.addButtons(["Conectar", "Emitir", "Espera", "Colgar", "Salir"], self.buttonsCallback)
         self.app.enableButton("Conectar")
+        self.app.enableButton("Emitir")
         self.app.disableButton("Espera")
         self.app.disableButton("Colgar")
 
@@ -102,6 +125,16 @@ class VideoClient(object):
         self.app.setStatusbarWidth(60,field=2)
         #Bara de herramientas
         self.app.addToolbar(["FILE","CAMERA"], self.toolbarCallback, findIcon=True)
+        self.status_fields = ["", "", ""]
+        self.status_shown = ["", "", ""]
+
+        #Buffers de composicion de la pantalla. La imagen PIL comparte memoria con screen_rgba
+        #(RGBA no necesita conversion en PIL), y el PhotoImage se reutiliza con paste.
+        self.screen_rgba = np.zeros((480, 640, 4), np.uint8)
+        self.mini_bgr = np.zeros((120, 160, 3), np.uint8)
+        self.mini_rgba = np.zeros((120, 160, 4), np.uint8)
+        self.screen_image = Image.frombuffer("RGBA", (640, 480), self.screen_rgba, "raw", "RGBA", 0, 1)
+        self.screen_photo = ImageTk.PhotoImage(self.screen_image)
         self.app.setToolbarIcon("CAMERA","md-camera-photo")
         self.app.setStopFunction(self.stop)
         self.app.setStartFunction(self.on_startup)
@@ -147,11 +180,13 @@ class VideoClient(object):
         self.app.addEntry("calleeNickInput",1,1)
         self.app.addListBox("nicksList",["Cargando..."],2,1)
 
-        #Handler
+        #Handlers: al escribir se filtra la lista, al pinchar en ella se rellena el nick
         self.app.setListBoxChangeFunction("nicksList", self.list_handler)
+        self.app.setEntryChangeFunction("calleeNickInput", self.search_handler)
 
         self.app.setPadding([20,20])
         self.app.addButton("Llamar", self.init_call,3,1)
+        self.app.addButton("Ver emision", self.watch_broadcast,4,1)
         self.app.setPadding([0,0])
         self.app.stopSubWindow()
 
@@ -176,6 +211,7 @@ class VideoClient(object):
             self.frame_send_loop.join()
         if self.frame_recv_loop:
             self.frame_recv_loop.join()
+        self.buffer_video.stop_workers()
         if self.connection_loop:
             self.control.control_listen_stop()
             self.connection_loop.join()
@@ -216,15 +252,25 @@ class VideoClient(object):
         '''
         #Conexion a Discovery
         try:
-            self.discovery = Discovery(self.config.server_ip, self.config.server_port)
+            self.discovery = Discovery(self.config.server_ip, self.config.server_port, self.config.DISCOVERY_CACHE_TTL,
+                                       self.config.DISCOVERY_CACHE_SIZE, self.config.DISCOVERY_CACHE_FILE or None,
+                                       self.config.DISCOVERY_POOL_SIZE)
         except Exception as e:
             print(e)
             self.app.errorBox("Error", "No se ha podido establecer la conexion al servidor de descubrimiento.")
             self.app.stop()
             return
 
-        self.control = Control(self.discovery, self.config.call_timeout, self.config.user_filename, self.buffer_video)
+        control_class = AsyncControl if self.config.CONTROL_BACKEND == "asyncio" else Control
+        self.control = control_class(self.discovery, self.config.call_timeout, self.config.user_filename, self.buffer_video)
         self.buffer_video.set_control(self.control)
+        self.group = GroupCall(self.config, self.discovery, self.control, self.buffer_video)
+        self.group.set_gui(self.app)
+        self.control.set_group(self.group)
+        self.buffer_video.set_group(self.group)
+        self.broadcast = Broadcast(self.config, self.discovery, self.control, self.buffer_video)
+        self.broadcast.set_gui(self.app)
+        self.control.set_broadcast(self.broadcast)
 
         #Obtenemos IP externa
         try:
@@ -287,7 +333,7 @@ class VideoClient(object):
 
         #Realizamos el registro en el discovery
         print("Tratando de registrar a " + register_nick + " con clave " + password + " puerto:" + control_port + " ip:" + ip + " puerto de video: " + video_port)
-        ret = self.discovery.register_user(register_nick, password, ip, control_port, ["V0", "V1"])
+        ret = self.discovery.register_user(register_nick, password, ip, control_port, PROTOCOLS)
         if not ret:
             #Error
             self.app.errorBox("Error", "No se ha podido realizar el registro correctamente. Error del servidor de descubrimiento.",parent="Login")
@@ -326,6 +372,9 @@ class VideoClient(object):
         with open(self.config.user_filename, "w+") as file:
             json.dump(user_data,file, indent=4)
 
+        #Bucle de repintado en el hilo de la GUI
+        self.app.after(0, self.renderLoop)
+
         #Mostrar ventana principal
         self.app.hideSubWindow("Login")
 
@@ -363,30 +412,50 @@ class VideoClient(object):
                     self.app.stop()
                     return
 
-            #Reescalado para mostrar en la GUI
-            frame = cv2.resize(frame, (640,480))
-
             # Código que envia el frame a la red en caso de que se este en llamada
             status = self.control.call_status()
-            if(status[0] != None and status[0] != "HOLD1" and status[0] != "HOLD2"):
+            if self.buffer_video.skip_frame(self.fps_send[0]):
+                #Ni con la calidad ni con la resolucion minimas se cumple el tope de tasa: no se envia este frame
+                pass
+            elif self.group.active():
+                #En grupo el frame se comprime una vez (o una por capa con SIMULCAST) y se reparte entre los participantes
+                errorSend = self.group.send_frame(self.socket_video_send, frame, self.num, self.quality_send[0], self.resolution_send[0], self.fps_send[0])
+                if(errorSend == -1):
+                    print("Error sending message")
+                self.num += 1
+            elif self.broadcast.sending():
+                #La emision se envia una sola vez al grupo multicast, haya los espectadores que haya
+                frame_send = resize_to(frame, self.resolution_send[0], cv2.INTER_AREA)
+                errorSend = self.buffer_video.send_frame_async(self.socket_video_send, self.broadcast.address, frame_send, self.num, self.quality_send[0], self.resolution_send[0], self.fps_send[0])
+                if(errorSend == -1):
+                    print("Error sending message")
+                self.num += 1
+            elif(status[0] != None and status[0] != "HOLD1" and status[0] != "HOLD2"):
+                #Reducimos una sola vez a la resolucion que ha elegido el QoS, y eso es lo que se comprime
+                frame_send = resize_to(frame, self.resolution_send[0], cv2.INTER_AREA)
                 #Enviamos el frame
-                errorSend = self.buffer_video.send_frame(self.socket_video_send, (status[0],int(status[1])), frame, self.num, self.quality_send[0],self.resolution_send[0], self.fps_send[0])
+                errorSend = self.buffer_video.send_frame_async(self.socket_video_send, (status[0],int(status[1])), frame_send, self.num, self.quality_send[0],self.resolution_send[0], self.fps_send[0])
                 if(errorSend == -1):
                     print("Error sending message")
                 self.num += 1
 
-            #Almacenamos finalmente el frame
+            #Reescalado barato para mostrar en la GUI, independiente del frame que se envia
+            frame = resize_to(frame, "640x480", cv2.INTER_NEAREST)
+
+            #Almacenamos finalmente el frame. Lo pintara el bucle de repintado.
             with self.cap_frame_lock:
                 self.cap_frame = frame
+                self.cap_frame_version += 1
 
             #Actualizacion de informacion
             string_field1 = "Video propio: " + str(self.fps_send[0]) + " FPS"
-            string_field1 += " Compresion: " + str(self.quality_send[0]) + "%"
+            if(self.buffer_video.frame_budget(self.fps_send[0]) > 0):
+                #Con presupuesto de bytes, la calidad la elige el modelo de tamano frame a frame
+                string_field1 += " Compresion: " + str(self.buffer_video.quality_selector.quality) + "%"
+            else:
+                string_field1 += " Compresion: " + str(self.quality_send[0]) + "%"
             string_field1 += " Resolucion: " + self.resolution_send[0]
-            self.app.setStatusbar( string_field1 ,field=1)
-
-            #Repintar la pantalla
-            self.updateScreen()
+            self.setStatus( string_field1 ,field=1)
 
             #Pausa el tiempo que quede para mandar a ritmo FPS_send
             remaining = 1/self.fps_send[0] - (time.time() - send_start_time)
@@ -417,11 +486,79 @@ class VideoClient(object):
 
             # Código que recoge el frame a imprimir por pantalla
             status = self.control.call_status()
-            if(status[0] != None and status[0] != "HOLD1" and status[0] != "HOLD2"):
+            if self.group.active():
+                #LLAMADA DE GRUPO
+                if(self.boolResetFrame == 1):
+                    self.app.disableButton("Conectar")
+                    self.app.disableButton("Emitir")
+                    self.app.disableButton("Espera")
+                    self.app.enableButton("Colgar")
+                    self.boolResetFrame = 0
+                    self.startTime = time.time()
+                    #Hilo de RECOGIDA: Reparte los datagramas entrantes entre los flujos de cada participante.
+                    self.receive_loop = threading.Thread(target=self.group.receive_loop, args = (self.socket_video_rec,))
+                    self.receive_loop.start()
+                    print("Hilo de recepción de video de grupo iniciado.")
+
+                self.setStatus("En llamada de grupo con: " + ", ".join(self.group.nicknames()) ,field=0)
+
+                #Sacamos un frame de cada participante y los juntamos en la rejilla
+                frame_rec, fps_in = self.group.pop_frames(self.quality_send, self.fps_send, self.resolution_send, self.fps_send_min, self.fps_send_max)
+                string = "Duracion: " + str(time.strftime('%H:%M:%S',time.gmtime(time.time() - self.startTime)))
+                string += " Perdidos (recibido/enviado): " + self.group.loss_summary()
+                self.setStatus(string ,field=2)
+                if fps_in > 0:
+                    self.fps_recv = int(fps_in)
+
+            elif self.broadcast.sending():
+                #EMITIENDO: no se recibe video. El QoS se ajusta con los reportes de los espectadores
+                if(self.boolResetFrame == 1):
+                    self.app.disableButton("Conectar")
+                    self.app.disableButton("Emitir")
+                    self.app.disableButton("Espera")
+                    self.app.enableButton("Colgar")
+                    self.boolResetFrame = 0
+                    self.startTime = time.time()
+                    self.receive_loop = None
+
+                self.setStatus("Emitiendo en " + self.broadcast.address[0] + ":" + str(self.broadcast.address[1]) ,field=0)
+                self.broadcast.update_qos(self.quality_send, self.fps_send, self.resolution_send, self.fps_send_min, self.fps_send_max)
+                string = "Duracion: " + str(time.strftime('%H:%M:%S',time.gmtime(time.time() - self.startTime)))
+                string += " " + self.broadcast.summary()
+                self.setStatus(string ,field=2)
+
+            elif self.broadcast.watching():
+                #VIENDO UNA EMISION
+                if(self.boolResetFrame == 1):
+                    self.app.disableButton("Conectar")
+                    self.app.disableButton("Emitir")
+                    self.app.disableButton("Espera")
+                    self.app.enableButton("Colgar")
+                    self.boolResetFrame = 0
+                    self.startTime = time.time()
+                    #Hilo de RECOGIDA: Recibe los datagramas del grupo multicast de la emision.
+                    self.receive_loop = threading.Thread(target=self.broadcast.receive_loop, args = (self.socket_video_rec,))
+                    self.receive_loop.start()
+                    print("Hilo de recepción de la emision iniciado.")
+
+                self.setStatus("Viendo la emision de " + self.broadcast.sender ,field=0)
+                _, header, frame_rec = self.broadcast.pop_frame(self.fps_send_min, self.fps_send_max)
+                string = "Duracion: " + str(time.strftime('%H:%M:%S',time.gmtime(time.time() - self.startTime)))
+                if(len(header) >= 4):
+                    string += " FPS: " + str(header[3])
+                    string += " Resolucion: " + str(header[2])
+                    string += " Perdidos: " + str(self.broadcast.lost_total[0])
+                    self.fps_recv = int(header[3])
+                else:
+                    frame_rec = cv2.imread("imgs/loading_video.png")
+                self.setStatus(string ,field=2)
+
+            elif(status[0] != None and status[0] != "HOLD1" and status[0] != "HOLD2"):
 
                 #Si es el primer tick en el que se ha entrado aqui, preparar lo necesario
                 if(self.boolResetFrame == 1):
                     self.app.disableButton("Conectar")
+                    self.app.disableButton("Emitir")
                     self.app.enableButton("Espera")
                     self.app.enableButton("Colgar")
                     self.boolResetFrame = 0
@@ -436,7 +573,7 @@ class VideoClient(object):
                     ver = "V1"
                 else:
                     ver = "V0"
-                self.app.setStatusbar("En llamada con: " + self.control.get_connected_username() + " usando " + ver ,field=0)
+                self.setStatus("En llamada con: " + self.control.get_connected_username() + " usando " + ver ,field=0)
 
                 #Popeamos el elemento a mostrar
                 _, header, frame_rec = self.buffer_video.pop_frame(self.quality_send, self.fps_send, self.resolution_send ,self.packets_lost_total,self.fps_send_min,self.fps_send_max)
@@ -447,44 +584,45 @@ class VideoClient(object):
                     string += " FPS: " + str(header[3])
                     string += " Resolucion: " + str(header[2])
                     string += " Perdidos: " + str(self.packets_lost_total[0])
-                    self.app.setStatusbar(string ,field=2)
+                    self.setStatus(string ,field=2)
                     self.fps_recv = int(header[3])
                 else:
                     #Aun no hay frames suficientes en el buffer: icono de carga
-                    self.app.setStatusbar("Duracion: " + str(time.strftime('%H:%M:%S',time.gmtime(time.time() - self.startTime))) ,field=2)
+                    self.setStatus("Duracion: " + str(time.strftime('%H:%M:%S',time.gmtime(time.time() - self.startTime))) ,field=2)
                     frame_rec = cv2.imread("imgs/loading_video.png")
 
             elif status[0] == "HOLD1":
                 #EN ESPERA POR NUESTRA PARTE
                 frame_rec = cv2.imread("imgs/call_held.png")
-                self.app.setStatusbar("Llamada en espera por " + self.control.get_username() ,field=0)
-                self.app.setStatusbar("Duracion: " + time.strftime('%H:%M:%S',time.gmtime(time.time() - self.startTime) ) ,field=2)
+                self.setStatus("Llamada en espera por " + self.control.get_username() ,field=0)
+                self.setStatus("Duracion: " + time.strftime('%H:%M:%S',time.gmtime(time.time() - self.startTime) ) ,field=2)
 
             elif status[0] == "HOLD2":
                 #EN ESPERA POR LA PARTE OPUESTA
                 frame_rec = cv2.imread("imgs/call_held.png")
-                self.app.setStatusbar("Llamada en espera por " + connecting_to ,field=0)
-                self.app.setStatusbar("Duracion: " + time.strftime('%H:%M:%S',time.gmtime(time.time() - self.startTime)) ,field=2)
+                self.setStatus("Llamada en espera por " + connecting_to ,field=0)
+                self.setStatus("Duracion: " + time.strftime('%H:%M:%S',time.gmtime(time.time() - self.startTime)) ,field=2)
 
             elif connecting_to != None:
                 #LLAMANDO
                 frame_rec = cv2.imread("imgs/calling.jpg")
-                self.app.setStatusbar("Llamando a " + connecting_to,field=0)
+                self.setStatus("Llamando a " + connecting_to,field=0)
                 self.app.disableButton("Conectar")
                 self.app.disableButton("Espera")
                 self.app.disableButton("Colgar")
 
             else:
                 #NO EN LLAMADA
-                self.app.setStatusbar("Cliente listo para llamar.",field=0)
-                self.app.setStatusbar("" ,field=2)
+                self.setStatus("Cliente listo para llamar.",field=0)
+                self.setStatus("" ,field=2)
 
                 #Si es el primer tick que se entra aqui tras una llamada, finalizamos todos los recursos asociados a la misma.
                 if(self.boolResetFrame != 1):
 
-                    #Parar hilo de RECOGIDA
-                    self.socket_video_send.sendto(b'END_RECEPTION',('localhost',int(self.control.get_video_port())))
-                    self.receive_loop.join()
+                    #Parar hilo de RECOGIDA, si lo hay (emitiendo no se recibe)
+                    if self.receive_loop is not None:
+                        self.socket_video_send.sendto(b'END_RECEPTION',('localhost',int(self.control.get_video_port())))
+                        self.receive_loop.join()
 
                     #Reinicio de parametros
                     self.boolResetFrame = 1
@@ -494,28 +632,33 @@ class VideoClient(object):
                     self.packets_lost_total[0] = 0
                     self.rec_frame = np.array([])
                     
-                    #Vaciado del buffer
+                    #Vaciado del buffer, y de los de cada participante si era una llamada de grupo
                     self.buffer_video.empty_buffer()
+                    self.group.reset()
+                    self.broadcast.reset()
 
                     #Reactivar botones
                     self.app.enableButton("Conectar")
+                    self.app.enableButton("Emitir")
                     self.app.disableButton("Espera")
                     self.app.disableButton("Colgar")
                     print("Hilo de recepción de video recogido.")
+                elif self.broadcast.leftover():
+                    #Emision que termino antes de empezar a reproducirla: no hay hilo de recepcion que parar
+                    self.broadcast.reset()
 
             #Una vez obtenido el frame entrante, lo reescalamos para que entre en la gui.
+            #Llega a la resolucion que eligio el QoS del emisor, asi que puede tocar ampliarlo.
             if frame_rec.size != 0:
-                frame_rec = cv2.resize(frame_rec, (640,480))
+                frame_rec = resize_to(frame_rec, "640x480", cv2.INTER_LINEAR)
 
-            #Lo almacenamos
+            #Lo almacenamos. Lo pintara el bucle de repintado.
             with self.rec_frame_lock:
                 self.rec_frame = frame_rec
+                self.rec_frame_version += 1
 
-            #Actualizamos la pantalla
-            self.updateScreen()
-
-            #Pausa el tiempo que quede para mandar a ritmo FPS_recv
-            remaining = 1/self.fps_recv - (time.time() - receive_start_time)
+            #Pausa el tiempo que quede para mandar a ritmo FPS_recv, corregido por la velocidad de reproduccion del buffer
+            remaining = 1/(self.fps_recv * self.buffer_video.playout_rate) - (time.time() - receive_start_time)
             if(remaining > 0):
                 time.sleep(remaining)
 
@@ -526,35 +669,92 @@ class VideoClient(object):
             self.fps_recv = 30
             self.rec_frame = np.array([])
             self.buffer_video.empty_buffer()
-            self.socket_video_send.sendto(b'END_RECEPTION',('localhost',int(self.control.get_video_port())))
-            self.receive_loop.join()
+            if self.receive_loop is not None:
+                self.socket_video_send.sendto(b'END_RECEPTION',('localhost',int(self.control.get_video_port())))
+                self.receive_loop.join()
+            self.group.reset()
+            self.broadcast.reset()
             print("Hilo de recepción de video recogido.")
         print("Hilo de procesado de video entrante recogido.")
 
+    def renderLoop(self):
+        '''
+        Nombre: renderLoop
+        Descripcion: Bucle de repintado. Se ejecuta en el hilo de la GUI, programado con after
+        al ritmo de DISPLAY_FPS, y es el unico que toca la imagen y la barra de estado.
+        '''
+        if self.program_quit:
+            return
+        render_start_time = time.time()
+
+        self.updateScreen()
+        self.updateStatus()
+
+        remaining = 1/self.config.DISPLAY_FPS - (time.time() - render_start_time)
+        self.app.after(max(1, int(remaining * 1000)), self.renderLoop)
+
     def updateScreen(self):
         '''
         Nombre: updateScreen
         Descripcion: Con los frames que haya capturado cada hilo (emisor/receptor), los
-        pinta en la pantalla.
+        pinta en la pantalla. Solo repinta si alguno ha cambiado desde la ultima vez.
+        Debe llamarse desde el hilo de la GUI.
         '''
         with self.rec_frame_lock:
             frame_rec = self.rec_frame
+            rec_version = self.rec_frame_version
         with self.cap_frame_lock:
             frame = self.cap_frame
+            cap_version = self.cap_frame_version
 
-        #Mostrar frame capturado
+        if (rec_version, cap_version) == self.drawn_versions:
+            return
+        self.drawn_versions = (rec_version, cap_version)
+
+        #Frame principal: el recibido si lo hay, si no el propio
+        main = frame_rec if frame_rec.size != 0 else frame
+        if main.size == 0:
+            return
+        main = resize_to(main, "640x480", cv2.INTER_LINEAR)
+        cv2.cvtColor(main, cv2.COLOR_BGR2RGBA, dst=self.screen_rgba)
+
+        #Mostrar frame capturado en miniatura, sin tocar los frames compartidos
         if frame_rec.size != 0 and frame.size != 0:
-            #Frame pequeno
-            frame_mini = cv2.resize(frame, (160,120))
-            frame_compuesto = frame_rec
-            frame_compuesto[0:frame_mini.shape[0], 0:frame_mini.shape[1]] = frame_mini
-            frame = frame_compuesto
-
-        if frame.size != 0:
-            cv2_im = cv2.cvtColor(frame,cv2.COLOR_BGR2RGB)
-            img_tk = ImageTk.PhotoImage(Image.fromarray(cv2_im))
-            with self.update_screen_lock:
-                self.app.setImageData("video", img_tk, fmt = 'PhotoImage')
+            cv2.resize(frame, (160,120), dst=self.mini_bgr, interpolation=cv2.INTER_NEAREST)
+            cv2.cvtColor(self.mini_bgr, cv2.COLOR_BGR2RGBA, dst=self.mini_rgba)
+            self.screen_rgba[0:120, 0:160] = self.mini_rgba
+
+        self.screen_photo.paste(self.screen_image)
+        if not self.screen_attached:
+            #Primer repintado: asociamos el PhotoImage al widget
+            self.app.setImageData("video", self.screen_photo, fmt = 'PhotoImage')
+            self.screen_attached = True
+
+    def setStatus(self, text, field):
+        '''
+        Nombre: setStatus
+        Descripcion: Guarda el texto de un campo de la barra de estado. Lo muestra el bucle de repintado.
+        Argumentos: text: Texto del campo.
+                    field: Numero de campo.
+        '''
+        self.status_fields[field] = text
+
+    def updateStatus(self):
+        '''
+        Nombre: updateStatus
+        Descripcion: Actualiza la barra de estado como mucho cada STATUS_REFRESH segundos, y solo
+        los campos que hayan cambiado. Debe llamarse desde el hilo de la GUI.
+        '''
+        now = time.time()
+        if now - self.time_last_status < self.config.STATUS_REFRESH:
+            return
+        self.time_last_status = now
+
+        for field in range(len(self.status_fields)):
+            text = self.status_fields[field]
+            if text != self.status_shown[field]:
+                self.app.setStatusbar(text, field=field)
+                self.status_shown[field] = text
 
     # Establece la resolución de la imagen capturada
     def setImageResolution(self, resolution):
@@ -610,7 +810,7 @@ class VideoClient(object):
         if button == "Salir":
 
             #Si esta en llamada se cuelga.
-            if self.control.call_status()[0] != None:
+            if self.control.call_status()[0] != None or self.group.busy() or self.broadcast.busy():
                 self.buttonsCallback("Colgar")
             # Salimos de la aplicación
             self.app.stop()
@@ -622,7 +822,26 @@ class VideoClient(object):
             #Mostramos la ventana para llamar.
             self.app.showSubWindow("Iniciar llamada")
 
+        elif button == "Emitir":
+            if self.control.call_status()[0] != None or self.group.busy() or self.broadcast.busy():
+                self.app.warningBox("Advertencia.", "Ya hay una llamada o una emision en curso.")
+                return
+            if self.broadcast.start(self.socket_video_send) == -1:
+                self.app.errorBox("Error", "No se ha podido empezar la emision. Revise BROADCAST_GROUP en la configuracion.")
+                return
+            self.app.infoBox("Emision iniciada.", "Emitiendo en " + self.config.BROADCAST_GROUP + ":" + str(self.config.BROADCAST_PORT) +
+                             ". Los espectadores pueden unirse con Conectar y Ver emision.")
+
         elif button == "Colgar":
+            if self.group.busy():
+                self.group.leave()
+                self.app.infoBox("Desconexion", "Ha salido de la llamada de grupo.")
+                return
+            if self.broadcast.busy():
+                sending = self.broadcast.sending()
+                self.broadcast.leave()
+                self.app.infoBox("Desconexion", "Ha terminado la emision." if sending else "Ha dejado de ver la emision.")
+                return
             ret = self.control.end_call()
             if ret == -1:
                 self.app.warningBox("Advertencia.", "No está en llamada con ningún usuario.")
@@ -631,6 +850,12 @@ class VideoClient(object):
                 self.app.infoBox("Desconexion", "Ha sido desconectado del destinatario.")
 
         elif button == "Espera":
+            if self.group.busy():
+                self.app.warningBox("Advertencia.", "Las llamadas de grupo no se pueden poner en espera.")
+                return
+            if self.broadcast.busy():
+                self.app.warningBox("Advertencia.", "Las emisiones no se pueden poner en espera.")
+                return
             status = self.control.call_status()
             if status[0] == "HOLD1":
                 #Ya estamos en espera. Desactivar.
@@ -653,10 +878,16 @@ class VideoClient(object):
         '''
         Nombre: init_call
         Descripcion: Inicia una llamada con el usuario que se haya indicado en la ventana correspondiente.
+        Si se indican varios separados por comas, inicia una llamada de grupo con ellos.
         La llamada se iniciara asincronamente para no bloquear el GUI.
         '''
         nick = self.app.getEntry("calleeNickInput")
         self.app.hideSubWindow("Iniciar llamada")
+        nicks = [n.strip() for n in nick.split(",") if n.strip()]
+        if len(nicks) > 1:
+            self.app.disableButton("Conectar")
+            self.app.threadCallback(self.group.start,self.group_callback,nicks)
+            return
         if nick == self.control.get_username():
             self.app.warningBox("Advertencia", "No puedes llamarte a ti mismo.")
             return
@@ -694,6 +925,58 @@ class VideoClient(object):
             self.app.enableButton("Espera")
             self.app.enableButton("Colgar")
 
+    def group_callback(self,ret):
+        '''
+        Nombre: group_callback
+        Descripcion: Se ejecuta cuando la llamada de grupo que se estaba iniciando asincronamente devuelve un resultado.
+        Arugmentos: ret - numero de usuarios que han aceptado, 0 si ninguno, -1 en caso de error.
+        '''
+        if ret > 0:
+            self.app.thread(self.app.infoBox,"Conectado", "Llamada de grupo iniciada con " + str(ret) + " participantes.")
+            return
+        if ret == 0:
+            self.app.thread(self.app.infoBox,"Llamada rechazada", "Ninguno de los usuarios indicados ha aceptado la llamada.")
+        else:
+            self.app.thread(self.app.errorBox,"Error durante la llamada", "No ha podido iniciarse la llamada de grupo.")
+        self.app.enableButton("Conectar")
+
+    def watch_broadcast(self):
+        '''
+        Nombre: watch_broadcast
+        Descripcion: Se une a la emision multicast del usuario indicado en la ventana de llamar.
+        La conexion se hace asincronamente para no bloquear el GUI.
+        '''
+        nick = self.app.getEntry("calleeNickInput").strip()
+        self.app.hideSubWindow("Iniciar llamada")
+        if nick == None or nick == "":
+            self.app.warningBox("Advertencia", "No has introducido usuario.")
+            return
+        if "," in nick:
+            self.app.warningBox("Advertencia", "Solo se puede ver la emision de un usuario.")
+            return
+        if self.control.call_status()[0] != None or self.group.busy() or self.broadcast.busy():
+            self.app.warningBox("Advertencia", "Ya hay una llamada o una emision en curso.")
+            return
+        self.app.disableButton("Conectar")
+        self.app.disableButton("Emitir")
+        self.app.threadCallback(self.broadcast.watch,self.broadcast_callback,nick)
+
+    def broadcast_callback(self,ret):
+        '''
+        Nombre: broadcast_callback
+        Descripcion: Se ejecuta cuando la union a una emision que se estaba haciendo asincronamente devuelve un resultado.
+        Arugmentos: ret - resultado de Broadcast.watch.
+        '''
+        if ret == 0:
+            self.app.thread(self.app.infoBox,"Conectado", "Viendo la emision de " + self.broadcast.sender + ".")
+            return
+        if ret == -3:
+            self.app.thread(self.app.infoBox,"Emision no disponible", "El usuario indicado no esta emitiendo.")
+        else:
+            self.app.thread(self.app.errorBox,"Error durante la conexion", "No ha podido verse la emision del usuario indicado.")
+        self.app.enableButton("Conectar")
+        self.app.enableButton("Emitir")
+
     def list_handler(self):
         '''
         Nombre: list_handler
@@ -703,20 +986,57 @@ class VideoClient(object):
         inputs = self.app.getListBox("nicksList")
         if len(inputs) > 0:
             nick = inputs[0]
-            self.app.setEntry("calleeNickInput", nick)
+            #Si ya hay nicks separados por comas (llamada de grupo), se sustituye el ultimo
+            text = self.app.getEntry("calleeNickInput")
+            if "," in text:
+                nick = text[:text.rindex(",") + 1] + " " + nick
+            self.app.setEntry("calleeNickInput", nick, callFunction=False)
+
+    def search_handler(self, entry):
+        '''
+        Nombre: search_handler
+        Descripcion: Se ejecuta cada vez que cambia el nick a llamar: filtra la lista de usuarios.
+        Argumentos: entry - nombre del campo que ha cambiado
+        '''
+        self.show_nicks()
+
+    def show_nicks(self):
+        '''
+        Nombre: show_nicks
+        Descripcion: Muestra en la lista los usuarios cuyo nick contiene lo escrito en el campo de llamar.
+        '''
+        nicks = self.directory.search(self.app.getEntry("calleeNickInput").split(",")[-1].strip())
+        if len(nicks) == 0 and len(self.directory) == 0:
+            nicks = ["Cargando..."]
+        self.app.updateListBox("nicksList", nicks, select=False)
+
+    def add_listed_user(self, usuario):
+        '''
+        Nombre: add_listed_user
+        Descripcion: Recibe cada usuario del listado segun llega. Lo anade al directorio y refresca la lista
+                     como mucho cada LIST_REFRESH segundos, para que se vea el listado mientras llega.
+        Argumentos: usuario - lista [nick ip port ts]
+        '''
+        self.directory.add(usuario)
+        now = time.time()
+        if now - self.time_last_list >= self.config.LIST_REFRESH:
+            self.time_last_list = now
+            self.app.queueFunction(self.show_nicks)
 
     def populate_list(self):
         '''
         Nombre: populate_list
         Descripcion: Funcion pensada para rellenar la lista de usuarios de forma asincrona.
         '''
-        #Poblamos la lista de usuarios con los nombres
-        users = self.discovery.list_users()
+        #Poblamos el directorio de usuarios segun llegan. Los que ya no esten se borran al final.
+        self.directory.begin_update()
+        self.time_last_list = time.time()
+        users = self.discovery.list_users(self.add_listed_user)
+        self.directory.end_update(users is not None)
         if users == None:
             print("Error obteniendo listado de usuarios.")
-            return
 
-        self.app.updateListBox("nicksList", [e[0] for e in users if len(e) > 0], select=False)
+        self.app.queueFunction(self.show_nicks)
 
 #PROGRAMA PRINCIPAL
 
@@ -0,0 +1,539 @@
+'''
+    ratecontrol.py
+    Modulo de control de tasa del video: estima si el camino se esta saturando a partir de
+    la evolucion del retardo de los frames entrantes y calcula la tasa objetivo del emisor.
+    @author Alejandro Bravo, Miguel Gonzalez
+    @version 1.0
+    @date 18-10-2026
+
+    DESCRIPCION GENERAL DEL MODULO
+    El QoS por escalones solo reacciona cuando ya se pierden frames. Cuando un enlace se satura,
+    antes de perder paquetes se llena la cola del router, y eso se ve en que el retardo en un
+    sentido (llegada - timestamp de envio) crece de frame a frame. El estimador, como el filtro de
+    tendencia de GCC (Google Congestion Control), acumula la variacion de retardo entre frames
+    consecutivos, la suaviza y calcula su pendiente por minimos cuadrados. Si la pendiente supera
+    un umbral adaptativo durante un tiempo hay sobreuso, si baja de -umbral la cola se esta vaciando
+    (infrauso), y si no el estado es normal. El desfase entre relojes no afecta porque solo se usan
+    diferencias.
+
+    Los controladores reciben el estado del estimador y la fraccion de perdidas y devuelven la tasa
+    objetivo en bits por segundo. Todos heredan de RateController y se eligen por nombre con
+    RATE_CONTROLLER (ver CONTROLLERS). AimdController aumenta la tasa multiplicativamente mientras
+    el estado es normal y la reduce a BETA veces la tasa recibida en cuanto hay sobreuso.
+
+    La tasa objetivo se traduce a calidad, fps y resolucion con bitrate_to_settings. Ademas, si se
+    comprime con presupuesto de bytes por frame, QualitySelector elige la calidad JPEG de cada frame
+    con un modelo en linea del tamano segun la calidad para la escena actual: ln(bits por pixel) es
+    aproximadamente lineal en la calidad, y tras cada compresion se corrigen el termino independiente
+    (cambia con la escena) y la pendiente (cuando hay dos medidas a calidades distintas). Si ni con
+    la calidad minima cabe el frame, el emisor baja la resolucion, y si aun asi se acumula exceso,
+    salta frames hasta devolverlo.
+
+    El estimador lo actualiza solo el hilo de recepcion y los controladores los usa solo el de
+    reproduccion. Lo que el controlador lee del estimador son asignaciones simples o contadores
+    que solo crecen, asi que no hace falta cerrojo. QualitySelector si lo usa, porque los frames
+    se comprimen en varios hilos a la vez.
+'''
+
+import math
+import threading
+from collections import deque
+
+#Estados del estimador
+STATE_NORMAL = 0
+STATE_OVERUSE = 1
+STATE_UNDERUSE = -1
+
+#Bits por pixel aproximados de un JPEG de camara para cada calidad del QoS
+BITS_PER_PIXEL = {75: 1.0, 50: 0.65, 25: 0.4}
+#Resoluciones del QoS, de mayor a menor
+RESOLUTIONS = ["640x480", "320x240", "160x120"]
+
+class DelayGradientEstimator():
+    '''Estimador por gradiente de retardo: Detecta si la cola del camino crece a partir de la tendencia del retardo en un sentido'''
+
+    WINDOW = 20 #Frames con los que se calcula la pendiente.
+    SMOOTHING = 0.9 #Coeficiente del suavizado exponencial del retardo acumulado.
+    TREND_GAIN = 4.0 #Ganancia con la que se escala la pendiente antes de compararla con el umbral.
+    MAX_DELTAS = 60 #Numero maximo de muestras por el que se multiplica la pendiente.
+    K_UP = 0.0087 #Velocidad con la que sube el umbral cuando la tendencia lo supera.
+    K_DOWN = 0.039 #Velocidad con la que baja el umbral cuando la tendencia queda por debajo.
+    MIN_THRESHOLD = 6.0 #Umbral minimo en milisegundos.
+    MAX_THRESHOLD = 600.0 #Umbral maximo en milisegundos.
+    OVERUSE_TIME = 0.01 #Segundos que la tendencia debe superar el umbral para declarar sobreuso.
+    RATE_WINDOW = 1.0 #Segundos con los que se mide la tasa entrante.
+
+    state = STATE_NORMAL #Estado actual del camino.
+    overuse_events = 0 #Veces que se ha detectado sobreuso. Solo crece, para que el controlador no se pierda ninguna.
+    bitrate = 0 #Bits por segundo recibidos en el ultimo RATE_WINDOW.
+    threshold = 12.5 #Umbral adaptativo en milisegundos.
+    trend = 0.0 #Pendiente del retardo suavizado (ms de retardo por ms).
+    samples = None #Ultimos WINDOW pares (llegada en ms, retardo acumulado suavizado en ms).
+    accumulated = 0.0 #Variacion de retardo acumulada en ms.
+    smoothed = 0.0 #Variacion de retardo acumulada y suavizada en ms.
+    num_deltas = 0 #Muestras recibidas, hasta MAX_DELTAS.
+    first_arrival = None #Llegada del primer frame.
+    last_send = None #Timestamp de envio del ultimo frame usado.
+    last_arrival = None #Llegada del ultimo frame usado.
+    overuse_time = -1 #Segundos que la tendencia lleva por encima del umbral. -1 si esta por debajo.
+    overuse_count = 0 #Muestras seguidas por encima del umbral.
+    last_threshold_update = None #Instante en que se actualizo el umbral por ultima vez.
+    received = None #Pares (llegada, bytes) de los frames del ultimo RATE_WINDOW.
+    received_bytes = 0 #Bytes de los frames en received.
+
+    def __init__(self):
+        '''
+        Nombre: __init__
+        Descripcion: Constructor que deja el estimador listo para una llamada.
+        '''
+        self.reset()
+
+    def reset(self):
+        '''
+        Nombre: reset
+        Descripcion: Reinicia el estimador para una nueva llamada.
+        '''
+        self.state = STATE_NORMAL
+        self.overuse_events = 0
+        self.bitrate = 0
+        self.threshold = 12.5
+        self.trend = 0.0
+        self.samples = deque(maxlen=self.WINDOW)
+        self.accumulated = 0.0
+        self.smoothed = 0.0
+        self.num_deltas = 0
+        self.first_arrival = None
+        self.last_send = None
+        self.last_arrival = None
+        self.overuse_time = -1
+        self.overuse_count = 0
+        self.last_threshold_update = None
+        self.received = deque()
+        self.received_bytes = 0
+
+    def update(self, send_time, arrival_time, size):
+        '''
+        Nombre: update
+        Descripcion: Actualiza la tendencia, el estado y la tasa recibida con un frame.
+        Argumentos: send_time: Timestamp de envio de la cabecera del frame.
+                    arrival_time: Instante en que ha llegado el frame completo.
+                    size: Bytes del frame.
+        '''
+        #Tasa recibida en la ultima ventana
+        self.received.append((arrival_time, size))
+        self.received_bytes += size
+        while arrival_time - self.received[0][0] > self.RATE_WINDOW:
+            self.received_bytes -= self.received.popleft()[1]
+        self.bitrate = int(self.received_bytes * 8 / self.RATE_WINDOW)
+
+        if self.last_send is None:
+            self.first_arrival = arrival_time
+            self.last_send = send_time
+            self.last_arrival = arrival_time
+            return
+
+        send_delta = send_time - self.last_send
+        if send_delta <= 0:
+            #Frame desordenado: no aporta a la tendencia
+            return
+        arrival_delta = arrival_time - self.last_arrival
+        self.last_send = send_time
+        self.last_arrival = arrival_time
+
+        #Variacion de retardo en un sentido entre este frame y el anterior
+        self.num_deltas = min(self.num_deltas + 1, self.MAX_DELTAS)
+        self.accumulated += (arrival_delta - send_delta) * 1000
+        self.smoothed = self.SMOOTHING * self.smoothed + (1 - self.SMOOTHING) * self.accumulated
+        self.samples.append(((arrival_time - self.first_arrival) * 1000, self.smoothed))
+
+        previous_trend = self.trend
+        if len(self.samples) == self.WINDOW:
+            slope = linear_slope(self.samples)
+            if slope is not None:
+                self.trend = slope
+        self.detect(self.trend * self.num_deltas * self.TREND_GAIN, previous_trend, send_delta, arrival_time)
+
+    def detect(self, modified_trend, previous_trend, send_delta, now):
+        '''
+        Nombre: detect
+        Descripcion: Compara la tendencia escalada con el umbral y actualiza el estado y el umbral.
+        Argumentos: modified_trend: Pendiente multiplicada por el numero de muestras y TREND_GAIN.
+                    previous_trend: Pendiente antes de este frame.
+                    send_delta: Segundos entre el envio de este frame y el anterior.
+                    now: Instante de llegada del frame.
+        '''
+        if modified_trend > self.threshold:
+            if self.overuse_time == -1:
+                #Suponemos que empezo a mitad de camino entre los dos frames
+                self.overuse_time = send_delta / 2
+            else:
+                self.overuse_time += send_delta
+            self.overuse_count += 1
+            if self.overuse_time > self.OVERUSE_TIME and self.overuse_count > 1 and self.trend >= previous_trend:
+                self.overuse_time = 0
+                self.overuse_count = 0
+                self.state = STATE_OVERUSE
+                self.overuse_events += 1
+        elif modified_trend < -self.threshold:
+            self.overuse_time = -1
+            self.overuse_count = 0
+            self.state = STATE_UNDERUSE
+        else:
+            self.overuse_time = -1
+            self.overuse_count = 0
+            self.state = STATE_NORMAL
+        self.update_threshold(modified_trend, now)
+
+    def update_threshold(self, modified_trend, now):
+        '''
+        Nombre: update_threshold
+        Descripcion: Acerca el umbral a la tendencia: sube deprisa si la supera (por ejemplo, compitiendo
+                     con trafico TCP, que mantiene la cola llena) y baja despacio si queda por debajo.
+        Argumentos: modified_trend: Pendiente escalada.
+                    now: Instante actual.
+        '''
+        if self.last_threshold_update is None:
+            self.last_threshold_update = now
+        magnitude = abs(modified_trend)
+        if magnitude > self.threshold + 15:
+            #Picos puntuales: no se adapta a ellos
+            self.last_threshold_update = now
+            return
+        k = self.K_DOWN if magnitude < self.threshold else self.K_UP
+        elapsed_ms = min((now - self.last_threshold_update) * 1000, 100)
+        self.threshold += k * (magnitude - self.threshold) * elapsed_ms
+        self.threshold = min(self.MAX_THRESHOLD, max(self.MIN_THRESHOLD, self.threshold))
+        self.last_threshold_update = now
+
+class RateController():
+    '''Controlador de tasa: Interfaz comun de los controladores. Por si solo mantiene una tasa fija'''
+
+    min_bitrate = 150000 #Tasa minima en bits por segundo.
+    max_bitrate = 10000000 #Tasa maxima en bits por segundo.
+    start_bitrate = 4000000 #Tasa con la que empieza cada llamada.
+    bitrate = 4000000 #Tasa objetivo actual.
+
+    def __init__(self, start_bitrate, min_bitrate, max_bitrate):
+        '''
+        Nombre: __init__
+        Descripcion: Constructor que ajusta los limites de la tasa.
+        Argumentos: start_bitrate: Tasa inicial en bits por segundo.
+                    min_bitrate: Tasa minima.
+                    max_bitrate: Tasa maxima.
+        '''
+        self.start_bitrate = start_bitrate
+        self.min_bitrate = min_bitrate
+        self.max_bitrate = max_bitrate
+        self.reset()
+
+    def reset(self):
+        '''
+        Nombre: reset
+        Descripcion: Vuelve a la tasa inicial para una nueva llamada.
+        '''
+        self.bitrate = self.clamp(self.start_bitrate)
+
+    def clamp(self, bitrate):
+        '''
+        Nombre: clamp
+        Descripcion: Limita una tasa a [min_bitrate, max_bitrate].
+        Argumentos: bitrate: Tasa en bits por segundo.
+        Retorno:
+            La tasa limitada, como entero.
+        '''
+        return int(min(self.max_bitrate, max(self.min_bitrate, bitrate)))
+
+    def update(self, now, estimator, loss_fraction):
+        '''
+        Nombre: update
+        Descripcion: Calcula la nueva tasa objetivo. Los controladores redefinen este metodo.
+        Argumentos: now: Instante actual.
+                    estimator: DelayGradientEstimator del video entrante.
+                    loss_fraction: Fraccion de frames perdidos desde la ultima llamada.
+        Retorno:
+            Tasa objetivo en bits por segundo.
+        '''
+        return self.bitrate
+
+class AimdController(RateController):
+    '''Controlador AIMD: Sube la tasa multiplicativamente sin sobreuso y la recorta en cuanto lo hay, como GCC'''
+
+    BETA = 0.85 #Fraccion de la tasa recibida a la que se baja al detectar sobreuso.
+    INCREASE = 0.08 #Fraccion por segundo que sube la tasa mientras el estado es normal.
+    HEADROOM = 1.5 #La tasa no sube si ya supera este multiplo de la tasa recibida.
+    LOSS_HIGH = 0.1 #Fraccion de perdidas a partir de la cual se recorta la tasa.
+    LOSS_LOW = 0.02 #Fraccion de perdidas por debajo de la cual se permite subir.
+
+    overuse_checked = 0 #Sobreusos del estimador ya atendidos.
+    last_update = None #Instante de la ultima actualizacion.
+    holding = False #Tras recortar se mantiene la tasa hasta que el estimador vuelve a normal.
+
+    def reset(self):
+        '''
+        Nombre: reset
+        Descripcion: Vuelve a la tasa inicial para una nueva llamada.
+        '''
+        RateController.reset(self)
+        self.overuse_checked = 0
+        self.last_update = None
+        self.holding = False
+
+    def update(self, now, estimator, loss_fraction):
+        '''
+        Nombre: update
+        Descripcion: Calcula la nueva tasa objetivo con el estado del estimador y las perdidas.
+        Argumentos: now: Instante actual.
+                    estimator: DelayGradientEstimator del video entrante.
+                    loss_fraction: Fraccion de frames perdidos desde la ultima llamada.
+        Retorno:
+            Tasa objetivo en bits por segundo.
+        '''
+        elapsed = 0 if self.last_update is None else min(1.0, now - self.last_update)
+        self.last_update = now
+        incoming = estimator.bitrate
+
+        #Parte por retardo: los sobreusos detectados desde la ultima vez cuentan aunque ya hayan pasado
+        overuse_events = estimator.overuse_events
+        if overuse_events != self.overuse_checked or estimator.state == STATE_OVERUSE:
+            self.overuse_checked = overuse_events
+            base = incoming if incoming > 0 else self.bitrate
+            self.bitrate = min(self.bitrate, self.BETA * base)
+            self.holding = True
+        elif estimator.state == STATE_UNDERUSE:
+            #La cola se esta vaciando: esperamos a que se vacie antes de subir
+            self.holding = True
+        elif self.holding:
+            self.holding = False
+        elif loss_fraction < self.LOSS_LOW and (incoming == 0 or self.bitrate < self.HEADROOM * incoming):
+            #No se sube muy por encima de lo que de verdad llega (el emisor puede no estar usando toda la
+            #tasa, por ejemplo con una escena estatica), pero tampoco se baja por ello
+            self.bitrate *= (1 + self.INCREASE) ** elapsed
+
+        #Parte por perdidas: perdidas altas recortan aunque el retardo no haya avisado
+        if loss_fraction > self.LOSS_HIGH:
+            self.bitrate *= 1 - 0.5 * loss_fraction
+
+        self.bitrate = self.clamp(self.bitrate)
+        return self.bitrate
+
+class QualitySelector():
+    '''Selector de calidad: Elige la calidad JPEG que cumple un presupuesto de bytes por frame con un modelo en linea del tamano'''
+
+    MIN_QUALITY = 10 #Calidad minima que se puede elegir.
+    MAX_QUALITY = 90 #Calidad maxima que se puede elegir.
+    INTERCEPT_GAIN = 0.5 #Peso de cada compresion en el termino independiente del modelo. Alto para seguir los cambios de escena.
+    SLOPE_GAIN = 0.2 #Peso de cada medida de la pendiente del modelo.
+    MIN_SLOPE = 0.005 #Limites de la pendiente (aumento de ln(bits por pixel) por punto de calidad).
+    MAX_SLOPE = 0.06
+    MISS_FACTOR = 1.5 #Si un frame supera el presupuesto en este factor, el modelo ha fallado y se recomprime.
+    SEARCH_STEPS = 2 #Recompresiones maximas por frame.
+    DEBT_FRAMES = 8 #Frames en los que se devuelve el exceso sobre el presupuesto acumulado.
+
+    slope = 0.018 #Pendiente del modelo.
+    intercept = 0.0 #Termino independiente del modelo.
+    last = None #Ultima medida (calidad, ln(bits por pixel)), para estimar la pendiente.
+    debt = 0.0 #Bytes enviados por encima del presupuesto que aun hay que compensar. Negativo si los frames saltados han dejado margen.
+    quality = 50 #Ultima calidad elegida.
+    reencodes = 0 #Recompresiones hechas.
+    frames = 0 #Frames comprimidos con presupuesto.
+    skipped = 0 #Frames saltados para devolver el exceso sobre el presupuesto.
+    lock = None #Cerrojo: los frames se comprimen en varios hilos a la vez.
+
+    def __init__(self):
+        '''
+        Nombre: __init__
+        Descripcion: Constructor que deja el modelo en sus valores iniciales.
+        '''
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        '''
+        Nombre: reset
+        Descripcion: Vuelve al modelo inicial, sacado de BITS_PER_PIXEL.
+        '''
+        with self.lock:
+            self.slope = math.log(BITS_PER_PIXEL[75] / BITS_PER_PIXEL[25]) / 50
+            self.intercept = math.log(BITS_PER_PIXEL[50]) - 50 * self.slope
+            self.last = None
+            self.debt = 0.0
+            self.quality = 50
+            self.reencodes = 0
+            self.frames = 0
+            self.skipped = 0
+
+    def predict(self, quality, pixels):
+        '''
+        Nombre: predict
+        Descripcion: Tamano que el modelo espera para una calidad.
+        Argumentos: quality: Calidad JPEG.
+                    pixels: Pixeles de la imagen.
+        Retorno:
+            Bytes estimados.
+        '''
+        return math.exp(self.intercept + self.slope * quality) * pixels / 8
+
+    def choose(self, budget, pixels):
+        '''
+        Nombre: choose
+        Descripcion: Elige la mayor calidad que, segun el modelo, cabe en el presupuesto.
+        Argumentos: budget: Bytes por frame permitidos.
+                    pixels: Pixeles de la imagen.
+        Retorno:
+            Calidad entre MIN_QUALITY y MAX_QUALITY.
+        '''
+        with self.lock:
+            #El exceso acumulado se descuenta poco a poco, sin bajar de la mitad del presupuesto
+            budget = max(budget / 2, budget - max(0.0, self.debt) / self.DEBT_FRAMES)
+            quality = (math.log(budget * 8 / pixels) - self.intercept) / self.slope
+            self.quality = int(min(self.MAX_QUALITY, max(self.MIN_QUALITY, quality)))
+            return self.quality
+
+    def observe(self, quality, pixels, size):
+        '''
+        Nombre: observe
+        Descripcion: Corrige el modelo con el tamano real de una compresion.
+        Argumentos: quality: Calidad usada.
+                    pixels: Pixeles de la imagen.
+                    size: Bytes obtenidos.
+        '''
+        if size <= 0:
+            return
+        measured = math.log(size * 8 / pixels)
+        with self.lock:
+            last = self.last
+            if last is not None and abs(quality - last[0]) >= 5:
+                slope = (measured - last[1]) / (quality - last[0])
+                slope = min(self.MAX_SLOPE, max(self.MIN_SLOPE, slope))
+                self.slope += (slope - self.slope) * self.SLOPE_GAIN
+            self.intercept += (measured - self.slope * quality - self.intercept) * self.INTERCEPT_GAIN
+            self.last = (quality, measured)
+
+    def retry_quality(self, quality, size, budget):
+        '''
+        Nombre: retry_quality
+        Descripcion: Calidad con la que recomprimir un frame que se ha pasado del presupuesto. Se calcula
+                     con la pendiente del modelo a partir del tamano real de este mismo frame.
+        Argumentos: quality: Calidad usada.
+                    size: Bytes obtenidos.
+                    budget: Bytes por frame permitidos.
+        Retorno:
+            Calidad menor que la usada, y no menor que MIN_QUALITY.
+        '''
+        quality = min(quality - 1, quality - math.log(size / budget) / self.slope)
+        return int(max(self.MIN_QUALITY, quality))
+
+    def charge(self, size, budget, reencodes):
+        '''
+        Nombre: charge
+        Descripcion: Apunta el tamano del frame que finalmente se envia frente a su presupuesto.
+        Argumentos: size: Bytes enviados.
+                    budget: Bytes por frame permitidos.
+                    reencodes: Recompresiones que ha necesitado el frame.
+        '''
+        with self.lock:
+            self.debt = max(0.0, self.debt + size - budget)
+            self.frames += 1
+            self.reencodes += reencodes
+
+    def fits(self, budget, pixels):
+        '''
+        Nombre: fits
+        Descripcion: Indica si, segun el modelo, una imagen cabe en el presupuesto con la calidad minima.
+        Argumentos: budget: Bytes por frame permitidos.
+                    pixels: Pixeles de la imagen.
+        Retorno:
+            True si cabe.
+        '''
+        with self.lock:
+            return self.predict(self.MIN_QUALITY, pixels) <= budget
+
+    def skip(self, budget):
+        '''
+        Nombre: skip
+        Descripcion: Decide si se salta el siguiente frame: se salta si, con el exceso acumulado, ni siquiera
+                     el frame mas pequeno posible (calidad minima y menor resolucion) cabria en su presupuesto.
+                     El frame saltado deja su presupuesto como margen para el siguiente, asi que cuando ni lo
+                     minimo cabe se envia uno de cada varios frames y la media se queda dentro del tope.
+        Argumentos: budget: Bytes por frame permitidos.
+        Retorno:
+            True si hay que saltar el frame.
+        '''
+        width, height = RESOLUTIONS[-1].split('x')
+        with self.lock:
+            smallest = self.predict(self.MIN_QUALITY, int(width) * int(height))
+            if self.debt + smallest <= budget:
+                return False
+            self.debt -= budget
+            self.skipped += 1
+            return True
+
+    def missed(self, size, budget):
+        '''
+        Nombre: missed
+        Descripcion: Indica si una compresion se ha pasado tanto del presupuesto que merece recomprimir.
+        Argumentos: size: Bytes obtenidos.
+                    budget: Bytes por frame permitidos.
+        Retorno:
+            True si hay que recomprimir.
+        '''
+        return size > budget * self.MISS_FACTOR
+
+#Controladores que se pueden elegir con RATE_CONTROLLER
+CONTROLLERS = {"fixed": RateController, "aimd": AimdController}
+
+def create_controller(config):
+    '''
+    Nombre: create_controller
+    Descripcion: Crea el controlador de tasa indicado en la configuracion.
+    Argumentos: config: Objeto de configuracion.
+    Retorno:
+        El controlador, o None si RATE_CONTROLLER esta vacio (QoS por escalones) o no existe.
+    '''
+    name = config.RATE_CONTROLLER
+    if not name:
+        return None
+    if name not in CONTROLLERS:
+        print("Controlador de tasa desconocido: " + str(name) + ". Se usa el QoS por escalones.")
+        return None
+    return CONTROLLERS[name](config.RATE_START, config.RATE_MIN, config.RATE_MAX)
+
+def bitrate_to_settings(bitrate, min_fps, max_fps):
+    '''
+    Nombre: bitrate_to_settings
+    Descripcion: Elige la calidad, fps y resolucion que caben en una tasa. Se prefiere mantener la
+                 resolucion y bajar antes la calidad; los fps se ajustan entre min_fps y max_fps.
+    Argumentos: bitrate: Tasa objetivo en bits por segundo.
+                min_fps: FPS minimos.
+                max_fps: FPS maximos.
+    Retorno:
+        Tupla (calidad, fps, resolucion).
+    '''
+    for resolution in RESOLUTIONS:
+        width, height = resolution.split('x')
+        pixels = int(width) * int(height)
+        for quality in (75, 50, 25):
+            fps = bitrate / (pixels * BITS_PER_PIXEL[quality])
+            if fps >= min_fps:
+                return quality, int(min(max_fps, fps)), resolution
+    return 25, min_fps, RESOLUTIONS[-1]
+
+def linear_slope(samples):
+    '''
+    Nombre: linear_slope
+    Descripcion: Pendiente de la recta de minimos cuadrados de unos puntos.
+    Argumentos: samples: Iterable de pares (x, y).
+    Retorno:
+        La pendiente, o None si todos los x son iguales.
+    '''
+    n = len(samples)
+    mean_x = sum(x for x, _ in samples) / n
+    mean_y = sum(y for _, y in samples) / n
+    numerator = 0.0
+    denominator = 0.0
+    for x, y in samples:
+        numerator += (x - mean_x) * (y - mean_y)
+        denominator += (x - mean_x) ** 2
+    if denominator == 0:
+        return None
+    return numerator / denominator
@@ -0,0 +1,139 @@
+'''
+   test_control.py
+   Pruebas de la conexion de control entre dos clientes en local, con los dos backends (Control y AsyncControl).
+   El descubrimiento, la interfaz y el modulo de video se sustituyen por objetos minimos.
+   Uso: python -m pytest tests
+   @author Alejandro Bravo, Miguel Gonzalez
+   @version 1.0
+   @date 18-10-2026
+'''
+
+import os
+import sys
+import json
+import time
+import socket
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from control import Control
+from control_async import AsyncControl
+
+class FakeDiscovery():
+    '''Descubrimiento en memoria'''
+    def __init__(self):
+        self.users = {}
+    def query_user(self, nickname):
+        return self.users.get(nickname)
+    def invalidate_user(self, nickname):
+        pass
+
+class FakeGui():
+    '''Interfaz que coge o rechaza todas las llamadas'''
+    def __init__(self, accept):
+        self.accept = accept
+    def yesNoBox(self, title, message):
+        return self.accept
+    def infoBox(self, title, message):
+        pass
+
+class NullVideo():
+    '''Modulo de video que ignora todo'''
+    def set_peer_protocols(self, protocols):
+        pass
+
+def free_port():
+    '''Puerto TCP libre en local'''
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class TestCallReplies(unittest.TestCase):
+    '''Un llamante con FRAMED distingue ocupado y rechazado de una conexion cerrada'''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.discovery = FakeDiscovery()
+        self.clients = []
+
+    def tearDown(self):
+        for ctl, threads in self.clients:
+            ctl.end_call()
+            ctl.control_disconnect()
+            ctl.control_listen_stop()
+            threads[0].join()
+            ctl.control_incoming_stop()
+            threads[1].join()
+
+    def start_client(self, backend, name, accept):
+        '''Crea un cliente con FRAMED y sus hilos de control, como VideoClient.register'''
+        port, video_port = free_port(), free_port()
+        user_filename = os.path.join(self.directory, name + ".json")
+        with open(user_filename, "w") as file:
+            json.dump({"username": name, "udp_port": str(video_port)}, file)
+        self.discovery.users[name] = ["127.0.0.1", str(port), ["V0", "V1", "FRAMED"]]
+        ctl = backend(self.discovery, 15, user_filename, NullVideo())
+        if backend is Control:
+            #La barrera y el cerrojo de Control son atributos de clase: cada cliente del proceso necesita los suyos
+            ctl.connection_barrier = threading.Semaphore(0)
+            ctl.global_lock = threading.Lock()
+        gui = FakeGui(accept)
+        threads = [threading.Thread(target=ctl.control_listen_loop, args=(str(port), gui)),
+                   threading.Thread(target=ctl.control_incoming_loop, args=(gui,))]
+        for thread in threads:
+            thread.start()
+        self.clients.append((ctl, threads))
+        time.sleep(0.2)
+        return ctl
+
+    def check_replies(self, caller_backend, callee_backend):
+        '''Llama a quien rechaza, a quien ya esta en llamada y a quien coge, en ese orden'''
+        for name, accept in (("callee", True), ("busy", True), ("denier", False)):
+            self.start_client(callee_backend, name, accept)
+        caller = self.start_client(caller_backend, "caller", True)
+        other = self.start_client(caller_backend, "other", True)
+
+        self.assertEqual(caller.connect_to("denier"), -3)
+        self.assertGreater(other.connect_to("busy"), 0)
+        self.assertEqual(caller.connect_to("busy"), -2)
+        self.assertGreater(caller.connect_to("callee"), 0)
+
+    def check_discovery_errors(self, backend):
+        '''Si el descubrimiento no da los datos de un usuario (no existe o falla, -1) se rechaza sin romper el control'''
+        callee = self.start_client(backend, "callee", True)
+        caller = self.start_client(backend, "caller", True)
+        self.discovery.users["down"] = -1
+        self.assertEqual(caller.connect_to("down"), -1)
+        self.assertEqual(caller.connect_to("nobody"), -1)
+
+        #Llamadas entrantes de quien el descubrimiento no conoce
+        port = int(self.discovery.users["callee"][1])
+        for nick in ("down", "nobody"):
+            with socket.create_connection(("127.0.0.1", port), timeout=5) as sock:
+                sock.sendall(b"CALLING " + nick.encode() + b" 1234\n")
+                self.assertTrue(sock.recv(1024).startswith(b"CALL_DENIED"))
+        self.assertIsNone(callee.get_connected_username())
+        self.assertGreater(caller.connect_to("callee"), 0)
+
+    def test_threads(self):
+        self.check_replies(Control, Control)
+
+    def test_asyncio(self):
+        self.check_replies(AsyncControl, AsyncControl)
+
+    def test_mixed(self):
+        self.check_replies(Control, AsyncControl)
+
+    def test_mixed_reverse(self):
+        self.check_replies(AsyncControl, Control)
+
+    def test_discovery_errors_threads(self):
+        self.check_discovery_errors(Control)
+
+    def test_discovery_errors_asyncio(self):
+        self.check_discovery_errors(AsyncControl)
+
+if __name__ == '__main__':
+    unittest.main()
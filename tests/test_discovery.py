@@ -0,0 +1,111 @@
+'''
+   test_discovery.py
+   Pruebas del parser de LIST_USERS y del directorio de usuarios.
+   Uso: python -m pytest tests
+   @author Alejandro Bravo, Miguel Gonzalez
+   @version 1.0
+   @date 18-10-2026
+'''
+
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from discovery import UsersListParser, UserDirectory
+
+USERS = [
+    ["alice", "10.0.0.1", "8000", "1587000000.1"],
+    ["Alberto", "10.0.0.2", "8001", "1587000000.2"],
+    ["mua#ja#ja#ja", "10.0.0.3", "8002", "1587000000.3"],
+    ["bob", "10.0.0.4", "8003", "1587000000.4"],
+    ["malicia", "10.0.0.5", "8004", "1587000000.5"],
+    ["Zalicante", "10.0.0.6", "8005", "1587000000.6"],
+]
+REPLY = ("OK USERS_LIST " + str(len(USERS)) + " " + "".join(" ".join(u) + "#" for u in USERS)).encode()
+
+def feed_chunks(parser, sizes):
+    '''Pasa REPLY al parser en trozos de los tamanos dados.'''
+    pos = 0
+    for size in sizes:
+        parser.feed(REPLY[pos:pos + size])
+        pos += size
+
+class TestUsersListParser(unittest.TestCase):
+
+    def check(self, sizes):
+        seen = []
+        parser = UsersListParser(seen.append)
+        feed_chunks(parser, sizes)
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.words, ["OK", "USERS_LIST"])
+        self.assertEqual(parser.users, USERS)
+        self.assertEqual(seen, USERS)
+
+    def test_one_byte_chunks(self):
+        '''La respuesta troceada byte a byte se separa igual, con nicks que contienen '#' '''
+        self.check([1] * len(REPLY))
+
+    def test_random_chunks(self):
+        '''La respuesta en trozos de tamano aleatorio se separa igual'''
+        rng = random.Random(22)
+        for _ in range(50):
+            sizes = []
+            while sum(sizes) < len(REPLY):
+                sizes.append(rng.randint(1, 40))
+            self.check(sizes)
+
+    def test_single_chunk_and_errors(self):
+        '''La respuesta entera de golpe, la vacia y la de error terminan el parser'''
+        self.check([len(REPLY)])
+        parser = UsersListParser()
+        for byte in b"OK USERS_LIST 0":
+            parser.feed(bytes([byte]))
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.users, [])
+        parser = UsersListParser()
+        self.assertTrue(parser.feed(b"NOK USER_UNKNOWN"))
+        self.assertEqual(parser.words, ["NOK", "USER_UNKNOWN"])
+
+class TestUserDirectory(unittest.TestCase):
+
+    def fill(self):
+        directory = UserDirectory()
+        parser = UsersListParser(directory.add)
+        directory.begin_update()
+        rng = random.Random(4)
+        pos = 0
+        while not parser.done:
+            size = rng.randint(1, 7)
+            parser.feed(REPLY[pos:pos + size])
+            pos += size
+        directory.end_update()
+        return directory
+
+    def test_search(self):
+        '''Primero los nicks que empiezan por el texto y luego los que lo contienen, sin distinguir mayusculas'''
+        directory = self.fill()
+        self.assertEqual(len(directory), len(USERS))
+        self.assertEqual(directory.get("bob"), USERS[3])
+        self.assertEqual(directory.search("AL"), ["Alberto", "alice", "malicia", "Zalicante"])
+        self.assertEqual(directory.search("lic"), ["alice", "malicia", "Zalicante"])
+        self.assertEqual(directory.search("alic"), ["alice", "malicia", "Zalicante"])
+        self.assertEqual(directory.search("ja#"), ["mua#ja#ja#ja"])
+        self.assertEqual(directory.search("xyz"), [])
+        self.assertEqual(directory.search(""), sorted((u[0] for u in USERS), key=str.lower))
+        self.assertEqual(directory.search("al", limit=2), ["Alberto", "alice"])
+
+    def test_update_removes_missing(self):
+        '''Un listado nuevo borra los usuarios que ya no aparecen, tambien de las busquedas'''
+        directory = self.fill()
+        directory.begin_update()
+        for usuario in USERS[:2]:
+            directory.add(usuario)
+        directory.end_update()
+        self.assertEqual(len(directory), 2)
+        self.assertIsNone(directory.get("malicia"))
+        self.assertEqual(directory.search("lic"), ["alice"])
+
+if __name__ == '__main__':
+    unittest.main()
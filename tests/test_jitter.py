@@ -0,0 +1,96 @@
+'''
+   test_jitter.py
+   Pruebas del buffer en anillo de reproduccion y del estimador de jitter.
+   Uso: python -m pytest tests
+   @author Alejandro Bravo, Miguel Gonzalez
+   @version 1.0
+   @date 18-10-2026
+'''
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from jitter import RingBuffer, JitterEstimator
+
+class TestRingBuffer(unittest.TestCase):
+
+    def test_wraparound(self):
+        '''Insercion y extraccion en orden dando varias vueltas al anillo, con frames desordenados dentro de la ventana'''
+        ring = RingBuffer(8)
+        popped = []
+        for base in range(0, 40, 4):
+            for num in (base, base + 3, base + 1, base + 2):
+                self.assertTrue(ring.push(num, "h" + str(num), b"f" + str(num).encode()))
+            self.assertEqual(len(ring), 4)
+            while len(ring) > 0:
+                popped.append(ring.pop())
+        self.assertEqual([entry[0] for entry in popped], list(range(40)))
+        self.assertEqual(popped[37], (37, "h37", b"f37"))
+        self.assertIsNone(ring.pop())
+
+    def test_gap(self):
+        '''Un hueco en la cabeza se detecta y se salta al extraer'''
+        ring = RingBuffer(8)
+        ring.push(10, None, b"")
+        ring.push(12, None, b"")
+        self.assertFalse(ring.has_gap())
+        self.assertEqual(ring.pop()[0], 10)
+        self.assertTrue(ring.has_gap())
+        self.assertFalse(ring.contains(11))
+        self.assertTrue(ring.contains(12))
+        self.assertEqual(ring.pop()[0], 12)
+        self.assertFalse(ring.has_gap())
+
+    def test_stale_and_repeated(self):
+        '''Se rechazan los frames ya reproducidos (aunque su casilla este libre) y los repetidos'''
+        ring = RingBuffer(8)
+        for num in range(5):
+            ring.push(num, None, b"")
+        for _ in range(5):
+            ring.pop()
+        self.assertFalse(ring.push(3, None, b""))
+        self.assertFalse(ring.push(4, None, b""))
+        self.assertTrue(ring.push(6, None, b""))
+        self.assertFalse(ring.push(6, None, b""))
+        #La casilla de 14 es la de 6, y 14 aun no cabe en la ventana
+        self.assertFalse(ring.push(14, None, b""))
+        self.assertEqual(len(ring), 1)
+
+    def test_resync(self):
+        '''Un frame muy por delante de la ventana la adelanta, descartando lo que se queda atras'''
+        ring = RingBuffer(8)
+        ring.push(0, None, b"")
+        ring.push(1, None, b"")
+        self.assertFalse(ring.push(20, None, b""))
+        self.assertIsNone(ring.pop())
+        self.assertEqual(ring.head, 13)
+        self.assertEqual(len(ring), 0)
+        self.assertTrue(ring.push(20, None, b""))
+        self.assertFalse(ring.push(5, None, b""))
+        self.assertEqual(ring.pop()[0], 20)
+
+class TestJitterEstimator(unittest.TestCase):
+
+    def test_update(self):
+        '''Sin variacion el jitter es 0; con variacion constante D tiende a D con ganancia 1/16 (RFC 3550)'''
+        estimator = JitterEstimator()
+        estimator.reset()
+        for i in range(10):
+            estimator.update(i * 0.033, i * 0.033 + 0.5)
+        self.assertAlmostEqual(estimator.jitter, 0.0)
+        self.assertAlmostEqual(estimator.transit, 0.5)
+
+        estimator.reset()
+        estimator.update(0.0, 0.1)
+        self.assertEqual(estimator.jitter, 0.0)
+        estimator.update(1.0, 1.11)
+        self.assertAlmostEqual(estimator.jitter, 0.01 / 16)
+        for i in range(2, 200):
+            estimator.update(float(i), i + (0.11 if i % 2 else 0.1))
+        self.assertAlmostEqual(estimator.jitter, 0.01, places=4)
+        self.assertAlmostEqual(estimator.transit, 0.105, places=2)
+
+if __name__ == '__main__':
+    unittest.main()
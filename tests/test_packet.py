@@ -0,0 +1,112 @@
+'''
+   test_packet.py
+   Pruebas de la fragmentacion y de las paridades FEC del video.
+   Uso: python -m pytest tests
+   @author Alejandro Bravo, Miguel Gonzalez
+   @version 1.0
+   @date 18-10-2026
+'''
+
+import os
+import sys
+import socket
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from config import ConfigParser
+from video import VideoBuffer, PROTOCOLS
+from group import GroupCall, GroupMember
+from packet import fragment_message, parity_datagrams, Reassembler, PARITY_HEADER, PARITY_MAGIC
+
+MAX_DATAGRAM_SIZE = 1200 #Tamano maximo de datagrama de las pruebas
+
+def datagram_bytes(datagram):
+    '''Une los buffers de un datagrama tal y como los envia sendmsg'''
+    return b"".join(bytes(buf) for buf in datagram)
+
+class TestFragmentation(unittest.TestCase):
+
+    def test_fec_datagrams_fit(self):
+        '''Fragmentos y paridades caben en MAX_DATAGRAM_SIZE, y la paridad recupera un fragmento perdido'''
+        message = np.random.default_rng(0).integers(0, 256, 20000, dtype=np.uint8).tobytes()
+        datagrams = fragment_message([message], 7, MAX_DATAGRAM_SIZE, fec=True)
+        parities = parity_datagrams(datagrams, 7, 4)
+        for datagram in datagrams + [parity for _, parity in parities]:
+            self.assertLessEqual(len(datagram_bytes(datagram)), MAX_DATAGRAM_SIZE)
+
+        reassembler = Reassembler(4, 1.0)
+        result = None
+        for index, datagram in enumerate(datagrams):
+            if index != 1:
+                result = reassembler.add(datagram_bytes(datagram)) or result
+        for _, parity in parities:
+            result = reassembler.add(datagram_bytes(parity)) or result
+        self.assertEqual(bytes(result), message)
+
+    def test_short_parity_ignored(self):
+        '''Una paridad mas corta que los fragmentos de su grupo se descarta sin romper el reensamblado'''
+        message = bytes(range(256)) * 2
+        datagrams = [datagram_bytes(d) for d in fragment_message([message], 3, 109)]
+        self.assertGreater(len(datagrams), 2)
+        short = PARITY_HEADER.pack(PARITY_MAGIC, 3, len(datagrams), 0, 2, 100) + bytes(10)
+        for parity_first in (True, False):
+            reassembler = Reassembler(4, 1.0)
+            if parity_first:
+                self.assertIsNone(reassembler.add(short))
+            self.assertIsNone(reassembler.add(datagrams[0]))
+            if not parity_first:
+                self.assertIsNone(reassembler.add(short))
+            result = None
+            for datagram in datagrams[1:]:
+                result = reassembler.add(datagram) or result
+            self.assertEqual(bytes(result), message)
+            self.assertEqual(reassembler.recovered, 0)
+
+    def test_encoded_frame_fits(self):
+        '''Todo datagrama de un frame comprimido con FRAG y FEC cabe en MAX_DATAGRAM_SIZE'''
+        config = ConfigParser()
+        config.MAX_DATAGRAM_SIZE = MAX_DATAGRAM_SIZE
+        config.FEC = True
+        config.FEC_MIN_RATIO = 0.5
+        buffer = VideoBuffer(config)
+        buffer.set_peer_protocols(PROTOCOLS)
+        frame = np.random.default_rng(1).integers(0, 256, (480, 640, 3), dtype=np.uint8)
+        datagrams = buffer.encode_frame(frame, 0, 0, 75, "640x480", 30)
+        self.assertGreater(len(datagrams), 2)
+        for datagram in datagrams:
+            self.assertLessEqual(len(datagram_bytes(datagram)), MAX_DATAGRAM_SIZE)
+
+    def test_group_datagrams_fit(self):
+        '''En las llamadas de grupo los datagramas caben en MAX_DATAGRAM_SIZE con el prefijo de grupo incluido'''
+        config = ConfigParser()
+        config.MAX_DATAGRAM_SIZE = MAX_DATAGRAM_SIZE
+        config.ENCODE_WORKERS = 0
+        config.SIMULCAST = False
+        config.FEC = True
+        config.FEC_MIN_RATIO = 0.5
+        sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sink.bind(("127.0.0.1", 0))
+        sink.settimeout(0.5)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        buffer = VideoBuffer(config)
+        group = GroupCall(config, None, None, buffer)
+        buffer.set_group(group)
+        group.set_members([GroupMember(group, "p", "127.0.0.1", sink.getsockname()[1], PROTOCOLS)])
+        group.configure()
+
+        frame = np.random.default_rng(2).integers(0, 256, (240, 320, 3), dtype=np.uint8)
+        self.assertEqual(buffer.send_frame(sock, None, frame, 0, 75, "320x240", 30), 0)
+        sizes = []
+        try:
+            while True:
+                sizes.append(len(sink.recv(65536)))
+        except socket.timeout:
+            pass
+        sink.close()
+        sock.close()
+        self.assertGreater(len(sizes), 2)
+        self.assertLessEqual(max(sizes), MAX_DATAGRAM_SIZE)
+
+if __name__ == '__main__':
+    unittest.main()
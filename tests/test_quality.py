@@ -0,0 +1,51 @@
+'''
+   test_quality.py
+   Pruebas del tope de tasa (MAX_KBPS): el video saliente no lo pasa de media aunque ni con la calidad
+   minima quepa el frame.
+   Uso: python -m pytest tests
+   @author Alejandro Bravo, Miguel Gonzalez
+   @version 1.0
+   @date 18-10-2026
+'''
+
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from config import ConfigParser
+from video import VideoBuffer
+
+FPS = 30 #Frames por segundo de las pruebas
+
+def noisy_clip(count):
+    '''Clip de 640x480 de ruido: a 30 fps ocupa unos 8 Mbit/s incluso con la calidad minima'''
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (480, 640, 3), dtype=np.uint8) for _ in range(count)]
+
+class TestMaxKbps(unittest.TestCase):
+
+    clip = noisy_clip(90)
+
+    def sent_kbps(self, kbps):
+        '''Kbit/s que se envian con el tope, como enviaVideo y VideoBuffer.encode_frame'''
+        config = ConfigParser()
+        config.MAX_KBPS = kbps
+        buffer = VideoBuffer(config)
+        budget = buffer.frame_budget(FPS)
+        sent = 0
+        for frame in self.clip:
+            if buffer.skip_frame(FPS):
+                continue
+            image, _ = buffer.fit_resolution(frame, budget, "640x480")
+            sent += len(buffer.compress_to_budget(image, budget))
+        return sent * 8 * FPS / len(self.clip) / 1000
+
+    def test_average_under_cap(self):
+        '''La media se queda por debajo del tope, baje la resolucion o haga falta saltar frames'''
+        for kbps in (150, 1000, 5000):
+            self.assertLessEqual(self.sent_kbps(kbps), kbps)
+
+if __name__ == '__main__':
+    unittest.main()
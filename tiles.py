@@ -0,0 +1,240 @@
+'''
+    tiles.py
+    Modulo con la codificacion delta por tiles del video saliente (extension TILES)
+    y la reconstruccion de los frames delta en el receptor.
+    @author Alejandro Bravo, Miguel Gonzalez
+    @version 1.0
+    @date 18-10-2026
+
+    DESCRIPCION GENERAL DEL MODULO
+    El frame se divide en una rejilla de tiles cuadrados de TILE_SIZE pixeles. Cada cierto
+    tiempo se envia un frame clave completo, que pasa a ser la referencia. Los frames
+    siguientes se comparan con esa referencia (diferencia absoluta media de cada tile,
+    calculada de una vez con numpy) y solo se envian los tiles que han cambiado, apilados
+    en un unico JPEG. El receptor los pega sobre su copia del frame clave.
+
+    Como todos los frames delta se refieren al frame clave y no al frame anterior, perder
+    o descartar un frame delta no afecta a los siguientes: solo hace falta tener el frame clave.
+    Si cambian demasiados tiles, la resolucion cambia o pasa TILE_REFRESH desde el ultimo,
+    se envia un nuevo frame clave.
+
+    Los lados de la rejilla se redondean hacia arriba, rellenando el frame por la derecha y por
+    abajo con sus bordes, de modo que vale cualquier resolucion.
+'''
+
+import cv2
+import numpy as np
+from packet import VIDEO_FLAG_DELTA, VIDEO_FLAG_KEY, pack_tile_directory
+
+class TileEncoder():
+    '''Codificador por tiles: Decide que frames son clave y extrae los tiles que cambian en los demas'''
+
+    tile_size = 32 #Lado de cada tile. Conviene que sea multiplo de 16 para que coincida con los bloques del JPEG.
+    threshold = 4.0 #Diferencia media por pixel y canal a partir de la cual un tile se considera cambiado.
+    refresh = 2.0 #Segundos maximos entre frames clave.
+    max_fraction = 0.5 #Si cambia mas de esta fraccion de tiles se envia un frame clave.
+    reference = None #Frame clave actual, rellenado a multiplo del tamano de tile.
+    key_num = -1 #Numero de orden del frame clave actual.
+    time_last_key = -1 #Instante en que se envio el frame clave actual.
+
+    def __init__(self, tile_size, threshold, refresh, max_fraction):
+        '''
+        Nombre: __init__
+        Descripcion: Constructor que ajusta los parametros de la codificacion.
+        Argumentos: tile_size: Lado de cada tile en pixeles.
+                    threshold: Diferencia media por pixel y canal para considerar que un tile ha cambiado.
+                    refresh: Segundos maximos entre frames clave.
+                    max_fraction: Fraccion de tiles cambiados a partir de la cual se envia un frame clave.
+        '''
+        self.tile_size = tile_size
+        self.threshold = threshold
+        self.refresh = refresh
+        self.max_fraction = max_fraction
+        self.reset()
+
+    def reset(self):
+        '''
+        Nombre: reset
+        Descripcion: Olvida el frame clave, de modo que el siguiente frame se envia completo.
+        '''
+        self.reference = None
+        self.key_num = -1
+        self.time_last_key = -1
+
+    def prepare(self, frame, num, now):
+        '''
+        Nombre: prepare
+        Descripcion: Decide como se envia un frame. Debe llamarse en orden, desde un unico hilo.
+        Argumentos: frame: Frame a enviar.
+                    num: Numero de orden del frame.
+                    now: Instante actual.
+        Retorno:
+            Tupla (imagen a comprimir, flags de la cabecera, directorio de tiles en bytes).
+            En un frame clave la imagen es el propio frame y el directorio esta vacio.
+            En un frame delta la imagen son los tiles apilados, o None si no ha cambiado ninguno.
+        '''
+        padded = pad_to_tiles(frame, self.tile_size)
+        if self.reference is None or self.reference.shape != padded.shape or now - self.time_last_key > self.refresh:
+            return self.key_frame(frame, padded, num, now)
+
+        rows = padded.shape[0] // self.tile_size
+        cols = padded.shape[1] // self.tile_size
+        changed = changed_tiles(padded, self.reference, self.tile_size, self.threshold)
+        if len(changed) > self.max_fraction * rows * cols:
+            return self.key_frame(frame, padded, num, now)
+
+        mosaic = gather_tiles(padded, changed, self.tile_size) if len(changed) > 0 else None
+        return mosaic, VIDEO_FLAG_DELTA, pack_tile_directory(self.key_num, self.tile_size, cols, rows, changed)
+
+    def key_frame(self, frame, padded, num, now):
+        '''
+        Nombre: key_frame
+        Descripcion: Toma un frame como nuevo frame clave.
+        Argumentos: frame: Frame original.
+                    padded: Frame rellenado a multiplo del tamano de tile.
+                    num: Numero de orden del frame.
+                    now: Instante actual.
+        Retorno:
+            Tupla (frame, VIDEO_FLAG_KEY, directorio vacio).
+        '''
+        self.reference = padded
+        self.key_num = num
+        self.time_last_key = now
+        return frame, VIDEO_FLAG_KEY, b""
+
+class TileDecoder():
+    '''Decodificador por tiles: Guarda el ultimo frame clave y pega sobre el los tiles de los frames delta'''
+
+    key_num = -1 #Numero de orden del frame clave actual.
+    key = None #Frame clave descomprimido.
+    padded = None #Frame clave rellenado al tamano de tile de los frames delta. Se calcula con el primero.
+    missing_key = 0 #Frames delta que no se han podido reconstruir por no tener su frame clave.
+
+    def reset(self):
+        '''
+        Nombre: reset
+        Descripcion: Olvida el frame clave para una nueva llamada.
+        '''
+        self.key_num = -1
+        self.key = None
+        self.padded = None
+        self.missing_key = 0
+
+    def reconstruct(self, header, image):
+        '''
+        Nombre: reconstruct
+        Descripcion: Obtiene el frame a mostrar a partir de lo descomprimido. Los frames clave se
+                     guardan como referencia y los frames delta se reconstruyen sobre ella.
+                     Solo debe llamarlo el hilo de reproduccion.
+        Argumentos: header: Cabecera del frame ([num, ts, resolucion, fps, flags] y, en los
+                            frames delta, el directorio de tiles).
+                    image: Frame o tiles descomprimidos (None si el frame delta no trae tiles).
+        Retorno:
+            El frame completo, o None si no se puede reconstruir.
+        '''
+        flags = header[4]
+        if flags & VIDEO_FLAG_KEY:
+            self.key_num = header[0]
+            self.key = image
+            self.padded = None
+            return image
+        if not flags & VIDEO_FLAG_DELTA:
+            return image
+
+        key_num, tile_size, cols, rows, indices = header[5]
+        if key_num != self.key_num or self.key is None:
+            self.missing_key += 1
+            return None
+
+        height, width = self.key.shape[:2]
+        if self.padded is None or self.padded.shape[0] != rows * tile_size or self.padded.shape[1] != cols * tile_size:
+            padded = pad_to_tiles(self.key, tile_size)
+            if padded.shape[0] != rows * tile_size or padded.shape[1] != cols * tile_size:
+                print("Error reconstruyendo frame: la rejilla de tiles no coincide con el frame clave.")
+                return None
+            self.padded = padded
+
+        if len(indices) == 0:
+            return self.key
+        if image is None or image.shape[:2] != (len(indices) * tile_size, tile_size):
+            print("Error reconstruyendo frame: los tiles no coinciden con el directorio.")
+            return None
+
+        frame = self.padded.copy()
+        scatter_tiles(frame, indices, image, tile_size)
+        if frame.shape[0] != height or frame.shape[1] != width:
+            frame = np.ascontiguousarray(frame[:height, :width])
+        return frame
+
+def pad_to_tiles(frame, tile_size):
+    '''
+    Nombre: pad_to_tiles
+    Descripcion: Rellena un frame por la derecha y por abajo hasta un multiplo del tamano de tile.
+    Argumentos: frame: Frame a rellenar.
+                tile_size: Lado de cada tile.
+    Retorno:
+        El frame rellenado (el mismo objeto si ya era multiplo).
+    '''
+    height, width = frame.shape[:2]
+    bottom = -height % tile_size
+    right = -width % tile_size
+    if bottom == 0 and right == 0:
+        return frame
+    return cv2.copyMakeBorder(frame, 0, bottom, 0, right, cv2.BORDER_REPLICATE)
+
+def changed_tiles(frame, reference, tile_size, threshold):
+    '''
+    Nombre: changed_tiles
+    Descripcion: Compara dos frames del mismo tamano (multiplo del tamano de tile) tile a tile.
+    Argumentos: frame: Frame actual.
+                reference: Frame de referencia.
+                tile_size: Lado de cada tile.
+                threshold: Diferencia media por pixel y canal para considerar que un tile ha cambiado.
+    Retorno:
+        Array con los indices (fila * columnas + columna) de los tiles cambiados.
+    '''
+    height, width, channels = frame.shape
+    rows = height // tile_size
+    cols = width // tile_size
+    diff = cv2.absdiff(frame, reference)
+    sums = diff.reshape(rows, tile_size, cols, tile_size * channels).sum(axis=(1, 3), dtype=np.uint32)
+    return np.flatnonzero(sums > threshold * tile_size * tile_size * channels)
+
+def tile_view(frame, tile_size):
+    '''
+    Nombre: tile_view
+    Descripcion: Vista de un frame como rejilla de tiles, sin copiarlo.
+    Argumentos: frame: Frame contiguo de alto y ancho multiplos del tamano de tile.
+                tile_size: Lado de cada tile.
+    Retorno:
+        Array de forma (filas, columnas, tile_size, tile_size, canales) que comparte memoria con el frame.
+    '''
+    height, width, channels = frame.shape
+    return frame.reshape(height // tile_size, tile_size, width // tile_size, tile_size, channels).swapaxes(1, 2)
+
+def gather_tiles(frame, indices, tile_size):
+    '''
+    Nombre: gather_tiles
+    Descripcion: Copia los tiles indicados apilados en vertical.
+    Argumentos: frame: Frame de alto y ancho multiplos del tamano de tile.
+                indices: Indices de los tiles.
+                tile_size: Lado de cada tile.
+    Retorno:
+        Imagen de (numero de tiles * tile_size) x tile_size.
+    '''
+    cols = frame.shape[1] // tile_size
+    tiles = tile_view(np.ascontiguousarray(frame), tile_size)[indices // cols, indices % cols]
+    return tiles.reshape(len(indices) * tile_size, tile_size, frame.shape[2])
+
+def scatter_tiles(frame, indices, mosaic, tile_size):
+    '''
+    Nombre: scatter_tiles
+    Descripcion: Pega en su sitio los tiles apilados por gather_tiles.
+    Argumentos: frame: Frame contiguo de alto y ancho multiplos del tamano de tile, que se modifica.
+                indices: Indices de los tiles.
+                mosaic: Tiles apilados en vertical.
+                tile_size: Lado de cada tile.
+    '''
+    cols = frame.shape[1] // tile_size
+    tiles = mosaic.reshape(len(indices), tile_size, tile_size, frame.shape[2])
+    tile_view(frame, tile_size)[indices // cols, indices % cols] = tiles
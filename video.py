@@ -7,19 +7,33 @@
 '''
 
 import threading
-import heapq
 import time
+import socket
+import math
+from collections import deque
 import cv2
 import numpy as np
+from jitter import RingBuffer, JitterEstimator
+from pipeline import EncodePipeline, DecodePool
+from packet import fragment_message, parity_datagrams, byte_view, is_fragment, Reassembler, pack_video_header, pack_text_header, parse_header
+from packet import VIDEO_FLAG_DELTA, VIDEO_FLAG_KEY, VIDEO_CODEC_MASK, VIDEO_CODEC_SHIFT, parse_tile_directory
+from tiles import TileEncoder, TileDecoder
+from bufferpool import BufferPool
+from ratecontrol import DelayGradientEstimator, QualitySelector, create_controller, bitrate_to_settings, RESOLUTIONS
+from codec import OpenCVJpegCodec, CODEC_JPEG, create_codecs, codec_tokens, choose_codec, decode_scale
+
+DEFAULT_CODEC = OpenCVJpegCodec() #Codec de compress y decode si no se indica otro
+
+#Protocolos que soporta el cliente, tal y como se registran en el servidor de descubrimiento
+PROTOCOLS = ["V0", "V1", "FRAG", "BINHDR", "TILES", "FEC", "NACK", "RATE", "FRAMED", "GROUP", "SIMULCAST", "BROADCAST"] + codec_tokens()
 
 class VideoBuffer():
     '''Buffer de video: Encapsula el estado y funcionalidades del buffer de video'''
 
     #Variables globales de estado del modulo
-    buffer_lock = threading.Lock() #Cerrojo para el buffer en los 2 hilos (recepcion de la red y extraccion para reproducir)
-    buffer_heap = [] #Buffer de video (lista de paquetes)
+    buffer_ring = None #Buffer de video (anillo indexado por numero de orden, sin cerrojos entre recepcion y reproduccion)
     buffer_num = 0 #Ultimo paquete que se extrajo del buffer. Esto evita que llegue uno posterior a uno ya emitido.
-    timemax = -1 #Retardo fijo. No se reproduciran paquetes pasado este retardo fijo desde su emision.
+    timemax = -1 #Retardo maximo. No se reproduciran paquetes pasado este retardo desde su emision. Se adapta al jitter.
     packets_lost = [0, 0, 0, 0] #4 contadores de paquetes uno para cada ajuste (calidad,FPS,resolucion,reportes salientes) posible.
     time_last_check_qual = -1 #Timestamp con la ultima vez que se intento actualizar la calidad
     time_last_check_fps = -1 #Timestamp con la ultima vez que se intentaron actualizar los FPS
@@ -40,21 +54,111 @@ class VideoBuffer():
     using_v1 = False #Indica si se esta usando la version 1, para enviar reportes de perdidas.
     control = None #Modulo de control
 
+    #Variables de fragmentacion
+    using_frag = False #Indica si el otro extremo acepta frames fragmentados en varios datagramas.
+    frame_id = 0 #Identificador del siguiente frame fragmentado que se envia.
+    reassembler = None #Tabla de reensamblado de los frames fragmentados entrantes.
+    prefix_size = 0 #Bytes que se anaden delante de cada datagrama al enviarlo (prefijo de grupo), y que no puede ocupar el fragmento.
+
+    #Correccion de errores (FEC)
+    using_fec = False #Indica si se envian datagramas de paridad (FEC activo y el otro extremo acepta FEC y FRAG).
+    fec_ratio = 0.1 #Datagramas de paridad por cada fragmento enviado. Lo ajusta el QoS entre FEC_MIN_RATIO y FEC_MAX_RATIO.
+    recovered_checked = 0 #Frames recuperados con paridad hasta el ultimo ajuste del QoS.
+
+    #Retransmision selectiva (NACK)
+    using_nack = False #Indica si el otro extremo acepta NACK: se guardan los frames enviados y, con NACK activo, se piden los perdidos.
+    NACK_BATCH = 64 #Numero maximo de frames que se piden en un NACK, para que quepa en un mensaje de control.
+    sent_history = None #Diccionario numero de orden -> (instante de envio, socket, destino, datagramas) de los ultimos frames enviados.
+    history_lock = threading.Lock() #Cerrojo del historial: lo escriben los hilos de envio y lo lee el de control.
+    frames_resent = 0 #Frames reenviados a peticion del otro extremo.
+    resend_late = 0 #Frames pedidos que no se reenvian por no estar ya en el historial o no poder llegar a tiempo.
+    nack_detected = None #Huecos detectados por el hilo de recepcion, pendientes de pedir por el de reproduccion.
+    nack_requested = None #Frames pedidos que aun no han llegado. Lo escribe el hilo de reproduccion.
+    time_last_nack = -1 #Timestamp con la ultima vez que se enviaron NACK
+    nacks_sent = 0 #Frames pedidos en esta llamada.
+    nack_recovered = 0 #Frames pedidos que han llegado a tiempo de entrar en el buffer. Solo lo escribe el hilo de recepcion.
+
+    #Control de tasa
+    delay_estimator = None #Estimador de sobreuso por gradiente de retardo del video entrante. Solo lo actualiza el hilo de recepcion.
+    rate_controller = None #Controlador de tasa (RATE_CONTROLLER), o None para el QoS por escalones. Solo lo usa el hilo de reproduccion.
+    target_bitrate = 0 #Tasa objetivo del video saliente en bits por segundo.
+    quality_selector = None #Modelo del tamano segun la calidad con el que se cumple el presupuesto de bytes por frame.
+    time_last_check_rate = -1 #Timestamp con la ultima vez que se recalculo la tasa objetivo
+    using_rate = False #Indica si el otro extremo acepta RATE: se le envia la tasa que debe usar y se aplica la que envie.
+    peer_bitrate = 0 #Tasa objetivo para el video saliente segun el ultimo RATE_REPORT del otro extremo.
+    time_peer_rate = -1 #Instante en que llego el ultimo RATE_REPORT.
+
+    #Recepcion sin copias
+    buffer_pool = None #Pool de buffers en los que se reciben y reensamblan los frames entrantes.
+    RECV_SIZE = 65536 #Tamano de cada buffer de recepcion: cabe cualquier datagrama UDP.
+
+    #Compresion en paralelo
+    encoder = None #Pipeline de compresion del video saliente. Se crea con el primer frame.
+    decoder = None #Pool que descomprime por adelantado el video entrante. Solo lo usa el hilo de reproduccion.
+
+    #Variables de cabecera binaria
+    using_binhdr = False #Indica si el otro extremo acepta la cabecera binaria de video.
+
+    #Codificacion delta por tiles
+    using_tiles = False #Indica si se envian frames delta por tiles (TILE_DELTA activo y el otro extremo acepta TILES y BINHDR).
+    tile_encoder = None #Codificador por tiles del video saliente. Solo lo usa el hilo de captura.
+    tile_decoder = None #Reconstructor de los frames delta entrantes. Solo lo usa el hilo de reproduccion.
+
+    #Codecs negociados
+    codecs = None #Diccionario identificador -> codec con el que se descomprime cada frame entrante.
+    codec = None #Codec del video saliente, elegido segun CODEC y los protocolos del otro extremo.
+
+    #Decodificacion diferida: el buffer guarda los frames comprimidos y solo se descomprime el que se reproduce
+    last_decoded = (-1, None) #Numero y frame descomprimido del ultimo frame reproducido.
+    decode_max_width = 0 #Ancho que hace falta al descomprimir (DECODE_MAX_WIDTH, o el de la celda en las llamadas de grupo).
+    frames_decoded = 0 #Frames descomprimidos en esta llamada.
+    decodes_saved = 0 #Frames que no ha hecho falta descomprimir (descartados o repetidos) en esta llamada.
+    late_arrivals = 0 #Frames que llegan tarde o repetidos y no entran en el buffer. Solo lo escribe el hilo de recepcion.
+
+    #Retardo de reproduccion adaptativo
+    jitter_estimator = None #Estimador de jitter de los frames entrantes. Solo lo actualiza el hilo de recepcion.
+    target_depth = 1 #Frames que se quiere tener en el buffer segun el jitter actual.
+    playout_rate = 1.0 #Factor de velocidad de reproduccion: >1 para vaciar el buffer, <1 para dejar que se llene.
+    DEADLINE_DECAY = 1/64 #Fraccion con la que el retardo maximo se acerca al objetivo cuando este baja.
+
+    #Llamadas de grupo
+    group = None #Llamada de grupo (ver group.py) entre cuyos miembros se reparten los frames enviados sin destino.
+
     config = None #Objeto de configuracion
 
-    def __init__(self, config):
+    def __init__(self, config, buffer_pool=None):
         '''
         Nombre: __init__
         Descripcion: Constructor que ajusta el objeto de configuracion
+        Argumentos: config: Objeto de configuracion.
+                    buffer_pool: Pool de buffers de recepcion compartido, o None para crear uno propio.
         '''
         self.config = config
+        self.buffer_pool = buffer_pool if buffer_pool is not None else BufferPool(config.RECV_POOL_SIZE, self.RECV_SIZE)
+        self.reassembler = Reassembler(config.REASSEMBLY_SLOTS, config.REASSEMBLY_TIMEOUT, self.buffer_pool)
+        self.buffer_ring = RingBuffer(config.BUFFER_SIZE)
+        self.jitter_estimator = JitterEstimator()
+        self.tile_encoder = TileEncoder(config.TILE_SIZE, config.TILE_THRESHOLD, config.TILE_REFRESH, config.TILE_MAX_FRACTION)
+        self.tile_decoder = TileDecoder()
+        self.delay_estimator = DelayGradientEstimator()
+        self.rate_controller = create_controller(config)
+        self.quality_selector = QualitySelector()
+        self.codecs = create_codecs(config)
+        self.codec = self.codecs[CODEC_JPEG]
+        self.sent_history = {}
+        self.nack_detected = deque()
+        self.nack_requested = set()
+        self.decode_max_width = config.DECODE_MAX_WIDTH
 
     def send_frame(self, socket_video, status, frame, numOrden, quality ,resolution, fps):
         '''
         Nombre: send_frame
-        Descripcion: Envia un frame comprimido a la ip/puerto indicados.
+        Descripcion: Envia un frame comprimido a la ip/puerto indicados. Si el otro extremo
+                     acepta fragmentacion, el frame se divide en datagramas de MAX_DATAGRAM_SIZE bytes.
+                     Comprime y envia en el hilo que llama (ver send_frame_async).
         Argumentos: socket_video: Socket UDP con el que se envia el frame.
-                    status: Contiene el ip y el puerto al que se envia el frame.
+                    status: Contiene el ip y el puerto al que se envia el frame, o None para enviarlo
+                            a todos los miembros de la llamada de grupo (se comprime una sola vez).
                     frame: Frame a enviar.
                     numOrden: Número del frame que se envía.
                     quality: Calidad a la que se comprime.
@@ -64,33 +168,402 @@ class VideoBuffer():
             En caso de que no haya errores devuelve 0
             En caso de error devuelve -1.
         '''
-        encimg = compress(frame, quality)
-        header = str(numOrden) + "#" + str(time.time()) + "#" + resolution + "#" + str(fps) + "#"
-        header = header.encode()
-        message = header + encimg
-        lengthTot = len(message)
+        tiles = self.prepare_tiles(frame, numOrden)
+        datagrams = self.encode_frame(frame, numOrden, self.next_frame_id(), quality, resolution, fps, tiles)
+        self.remember_frame(numOrden, socket_video, status, datagrams)
+        return self.deliver(socket_video, status, datagrams)
 
-        try:
-            lengthSend = socket_video.sendto(message, status)
-        except OSError:
-            lengthSend = -1
-            print("UDP Error: El frame no entra en el datagrama.")
+    def send_frame_async(self, socket_video, status, frame, numOrden, quality ,resolution, fps):
+        '''
+        Nombre: send_frame_async
+        Descripcion: Igual que send_frame, pero la compresion se hace en el pool de ENCODE_WORKERS hilos
+                     y el envio en el hilo del pipeline, respetando el orden de llamada.
+                     Si ENCODE_WORKERS es 0 equivale a send_frame.
+        Argumentos: Los mismos que send_frame.
+        Retorno:
+            0 si el frame se ha encolado (o enviado), -1 en caso de error.
+        '''
+        if self.config.ENCODE_WORKERS <= 0:
+            return self.send_frame(socket_video, status, frame, numOrden, quality, resolution, fps)
+
+        if self.encoder is None:
+            self.encoder = EncodePipeline(self.config.ENCODE_WORKERS, self.config.ENCODE_QUEUE, self.on_frame_encoded)
+
+        #La comparacion de tiles depende del frame anterior, asi que se hace aqui, en orden
+        tiles = self.prepare_tiles(frame, numOrden)
+        args = (frame, numOrden, self.next_frame_id(), quality, resolution, fps, tiles)
+        if not self.encoder.submit(self.encode_frame, args, (socket_video, status, numOrden)):
+            return -1
+        return 0
+
+    def send_layers_async(self, socket_video, frame, numOrden, layers, fps):
+        '''
+        Nombre: send_layers_async
+        Descripcion: Envia un frame en varias capas (simulcast, en las llamadas de grupo). Cada capa se reduce
+                     desde la anterior y se comprime en el pool de ENCODE_WORKERS hilos, en paralelo con las
+                     demas, y se envia solo a sus destinatarios. Todas llevan el mismo numero de orden, asi que
+                     un receptor puede cambiar de capa entre un frame y el siguiente.
+        Argumentos: socket_video: Socket UDP con el que se envia el frame.
+                    frame: Frame capturado.
+                    numOrden: Numero del frame.
+                    layers: Lista de tuplas (resolucion, calidad, destinatarios), de mayor a menor resolucion.
+                            Los destinatarios son una lista de miembros de la llamada de grupo.
+                    fps: Frames por segundo a los que se envia.
+        Retorno:
+            0 si todas las capas se han encolado (o enviado), -1 en caso de error.
+        '''
+        result = 0
+        image = frame
+        for resolution, quality, members in layers:
+            image = resize_to(image, resolution, cv2.INTER_AREA)
+            args = (image, numOrden, self.next_frame_id(), quality, resolution, fps)
+            if self.config.ENCODE_WORKERS <= 0:
+                if self.deliver(socket_video, members, self.encode_frame(*args)) == -1:
+                    result = -1
+                continue
+            if self.encoder is None:
+                self.encoder = EncodePipeline(self.config.ENCODE_WORKERS, self.config.ENCODE_QUEUE, self.on_frame_encoded)
+            if not self.encoder.submit(self.encode_frame, args, (socket_video, members, numOrden)):
+                result = -1
+        return result
+
+    def on_frame_encoded(self, datagrams, context):
+        '''
+        Nombre: on_frame_encoded
+        Descripcion: Recibe en orden los frames comprimidos por el pipeline y los envia.
+        Argumentos: datagrams: Datagramas del frame, o None si fallo la compresion.
+                    context: Tupla (socket, destino, numero de orden) indicada al encolar el frame.
+        '''
+        socket_video, status, numOrden = context
+        self.remember_frame(numOrden, socket_video, status, datagrams)
+        if self.deliver(socket_video, status, datagrams) == -1:
+            print("Error sending message")
+
+    def deliver(self, socket_video, status, datagrams):
+        '''
+        Nombre: deliver
+        Descripcion: Envia los datagramas de un frame a su destino o, si no tiene, a los miembros de la llamada de grupo.
+        Argumentos: Los mismos que send_datagrams. En las llamadas de grupo status es None (todos los miembros)
+                    o la lista de miembros a los que se envia (una capa de simulcast).
+        Retorno:
+            0 si todo es correcto, -1 en caso de error.
+        '''
+        if (status is None or isinstance(status, list)) and self.group is not None:
+            return self.group.send_datagrams(self, socket_video, datagrams, status)
+        return self.send_datagrams(socket_video, status, datagrams)
+
+    def remember_frame(self, numOrden, socket_video, status, datagrams):
+        '''
+        Nombre: remember_frame
+        Descripcion: Si el otro extremo acepta NACK, guarda los datagramas de un frame enviado para poder
+                     reenviarlo si lo pide. Se guardan como mucho NACK_HISTORY frames, descartando los mas antiguos.
+        Argumentos: numOrden: Numero del frame.
+                    socket_video: Socket UDP con el que se envia el frame.
+                    status: Contiene el ip y el puerto al que se envia el frame.
+                    datagrams: Datagramas del frame (ver encode_frame), o None si fallo la compresion.
+        '''
+        if not self.using_nack or datagrams is None:
+            return
+        with self.history_lock:
+            self.sent_history[numOrden] = (time.time(), socket_video, status, datagrams)
+            while len(self.sent_history) > self.config.NACK_HISTORY:
+                #Los diccionarios mantienen el orden de insercion: el primero es el mas antiguo
+                del self.sent_history[next(iter(self.sent_history))]
+
+    def resend_frames(self, nums, margin):
+        '''
+        Nombre: resend_frames
+        Descripcion: Atiende un NACK: reenvia los frames pedidos que siguen en el historial y que aun
+                     pueden llegar antes de que el otro extremo deje de esperarlos. Lo llama el hilo de control.
+        Argumentos: nums: Numeros de orden de los frames pedidos.
+                    margin: Segundos que puede tardar un frame desde su envio hasta llegar al otro extremo
+                            para reproducirse (su retardo maximo menos el tiempo de transito medio).
+        Retorno:
+            Numero de frames reenviados.
+        '''
+        now = time.time()
+        with self.history_lock:
+            sent = [self.sent_history.get(num) for num in nums]
+
+        resent = 0
+        for entry in sent:
+            #Si desde el envio original ha pasado mas del margen, el reenvio llegaria tarde
+            if entry is None or now - entry[0] >= margin:
+                self.resend_late += 1
+                continue
+            _, socket_video, status, datagrams = entry
+            if self.send_datagrams(socket_video, status, datagrams) == -1:
+                print("Error reenviando frame.")
+                continue
+            resent += 1
+        self.frames_resent += resent
+        return resent
+
+    def stop_workers(self):
+        '''
+        Nombre: stop_workers
+        Descripcion: Detiene los pools de compresion y descompresion, si se llegaron a crear.
+        '''
+        if self.encoder is not None:
+            self.encoder.stop()
+            self.encoder = None
+        if self.decoder is not None:
+            self.decoder.stop()
+            self.decoder = None
+
+    def next_frame_id(self):
+        '''
+        Nombre: next_frame_id
+        Descripcion: Reserva el identificador de fragmentacion del siguiente frame.
+        Retorno:
+            Identificador del frame.
+        '''
+        frame_id = self.frame_id
+        self.frame_id += 1
+        return frame_id
+
+    def prepare_tiles(self, frame, numOrden):
+        '''
+        Nombre: prepare_tiles
+        Descripcion: Si se usa la extension TILES, decide si el frame se envia como clave o como delta.
+        Argumentos: frame: Frame a enviar.
+                    numOrden: Numero del frame.
+        Retorno:
+            None si no se usa TILES. Si no, la tupla (imagen a comprimir, flags, directorio de tiles) de TileEncoder.prepare.
+        '''
+        if not self.using_tiles:
+            return None
+        return self.tile_encoder.prepare(frame, numOrden, time.time())
 
-        if(lengthSend != lengthTot):
+    def encode_frame(self, frame, numOrden, frame_id, quality, resolution, fps, tiles=None):
+        '''
+        Nombre: encode_frame
+        Descripcion: Comprime un frame y construye los datagramas que hay que enviar.
+                     Puede ejecutarse en varios hilos a la vez.
+        Argumentos: frame_id: Identificador de fragmentacion del frame.
+                    tiles: Resultado de prepare_tiles, o None para enviar el frame completo.
+                    El resto, los mismos que send_frame.
+        Retorno:
+            Lista de datagramas, o None en caso de error. Cada datagrama es una lista de buffers
+            (cabeceras y trozos del buffer de numpy del JPEG, sin copiar) que se envian con sendmsg.
+        '''
+        image, flags, directory = (frame, 0, b"") if tiles is None else tiles
+        codec = self.codec
+        budget = self.frame_budget(fps)
+        if image is None:
+            #Frame delta sin tiles cambiados: basta con la cabecera y el directorio
+            encimg = b""
+        else:
+            if budget > 0:
+                #Con tope o controlador de tasa la calidad se elige para cumplir el presupuesto del frame
+                if tiles is None:
+                    image, resolution = self.fit_resolution(image, budget, resolution)
+                    frame = image
+                encimg = self.compress_to_budget(image, budget, codec)
+            else:
+                encimg = compress(image, quality, codec)
+            if encimg is None:
+                return None
+        if self.using_binhdr:
+            height, width = frame.shape[:2]
+            header = pack_video_header(numOrden, time.time(), width, height, fps, flags | (codec.codec_id << VIDEO_CODEC_SHIFT))
+        else:
+            header = pack_text_header(numOrden, time.time(), resolution, fps)
+        #El mensaje no se concatena: la cabecera y el JPEG viajan como buffers separados hasta el kernel
+        parts = [header, directory, encimg]
+
+        if self.using_frag:
+            datagrams = fragment_message(parts, frame_id, self.config.MAX_DATAGRAM_SIZE - self.prefix_size, self.using_fec)
+            if datagrams is not None and self.using_fec:
+                #Una paridad tras cada grupo de 1/fec_ratio fragmentos
+                group = max(1, int(round(1 / self.fec_ratio)))
+                for position, parity in reversed(parity_datagrams(datagrams, frame_id, group)):
+                    datagrams.insert(position + 1, parity)
+            return datagrams
+        return [[byte_view(part) for part in parts if len(part) > 0]]
+
+    def frame_budget(self, fps):
+        '''
+        Nombre: frame_budget
+        Descripcion: Calcula los bytes por frame que se pueden enviar: la tasa objetivo del controlador de
+                     tasa, limitada por MAX_KBPS, repartida entre los frames de un segundo.
+        Argumentos: fps: Numero de frames que se envian por segundo.
+        Retorno:
+            Bytes por frame, o 0 si no hay ni tope ni controlador (se usa la calidad del QoS).
+        '''
+        bitrate = self.target_bitrate if self.rate_controller is not None else 0
+        cap = self.config.MAX_KBPS * 1000
+        if cap > 0:
+            bitrate = min(bitrate, cap) if bitrate > 0 else cap
+        if bitrate <= 0:
+            return 0
+        return bitrate / 8 / max(1, fps)
+
+    def skip_frame(self, fps):
+        '''
+        Nombre: skip_frame
+        Descripcion: Indica si hay que saltarse el frame capturado para no pasar del presupuesto de bytes:
+                     ocurre cuando ni con la calidad ni con la resolucion minimas se cumple. Se llama antes de
+                     numerar el frame, asi que el receptor no lo ve como perdido.
+        Argumentos: fps: Numero de frames que se envian por segundo.
+        Retorno:
+            True si no hay que enviar el frame.
+        '''
+        budget = self.frame_budget(fps)
+        return budget > 0 and self.quality_selector.skip(budget)
+
+    def fit_resolution(self, frame, budget, resolution):
+        '''
+        Nombre: fit_resolution
+        Descripcion: Si segun el modelo del tamano el frame no cabe en el presupuesto ni con la calidad minima,
+                     lo reduce a la mayor resolucion del QoS que si cabe (o a la menor de todas).
+        Argumentos: frame: Frame que se va a comprimir.
+                    budget: Bytes por frame permitidos.
+                    resolution: Resolucion del frame, como cadena.
+        Retorno:
+            Tupla (frame, resolucion) con lo que hay que comprimir.
+        '''
+        selector = self.quality_selector
+        pixels = frame.shape[0] * frame.shape[1]
+        if selector.fits(budget, pixels):
+            return frame, resolution
+        for candidate in RESOLUTIONS:
+            width, height = parse_resolution(candidate)
+            if width * height < pixels and (selector.fits(budget, width * height) or candidate == RESOLUTIONS[-1]):
+                return resize_to(frame, candidate, cv2.INTER_AREA), candidate
+        return frame, resolution
+
+    def compress_to_budget(self, frame, budget, codec=None):
+        '''
+        Nombre: compress_to_budget
+        Descripcion: Comprime un frame con la calidad que, segun el modelo del tamano, cumple el presupuesto.
+                     Si el modelo falla por mucho (cambio de escena), recomprime como mucho SEARCH_STEPS
+                     veces con una calidad corregida con el tamano real. Puede ejecutarse en varios hilos a la vez.
+        Argumentos: frame: Frame que se va a comprimir.
+                    budget: Bytes por frame permitidos.
+                    codec: Codec con el que se comprime, None para el del video saliente.
+        Retorno:
+            El frame comprimido (ver compress), o None en caso de error.
+        '''
+        selector = self.quality_selector
+        codec = self.codec if codec is None else codec
+        pixels = frame.shape[0] * frame.shape[1]
+        quality = selector.choose(budget, pixels)
+        encimg = compress(frame, quality, codec)
+        if encimg is None:
+            return None
+        selector.observe(quality, pixels, len(encimg))
+
+        reencodes = 0
+        while selector.missed(len(encimg), budget) and quality > selector.MIN_QUALITY and reencodes < selector.SEARCH_STEPS:
+            quality = selector.retry_quality(quality, len(encimg), budget)
+            retry = compress(frame, quality, codec)
+            if retry is None:
+                break
+            selector.observe(quality, pixels, len(retry))
+            encimg = retry
+            reencodes += 1
+
+        selector.charge(len(encimg), budget, reencodes)
+        return encimg
+
+    def send_datagrams(self, socket_video, status, datagrams):
+        '''
+        Nombre: send_datagrams
+        Descripcion: Envia los datagramas de un frame. Cada datagrama se envia con una sola llamada a
+                     sendmsg, que junta sus buffers en el kernel. Donde no hay sendmsg (Windows) se concatenan.
+        Argumentos: socket_video: Socket UDP con el que se envia el frame.
+                    status: Contiene el ip y el puerto al que se envia el frame.
+                    datagrams: Lista de datagramas, cada uno una lista de buffers (ver encode_frame).
+        Retorno:
+            0 si todo es correcto, -1 en caso de error.
+        '''
+        if datagrams is None:
             return -1
+
+        scatter = hasattr(socket_video, "sendmsg")
+        for datagram in datagrams:
+            length = sum(len(buf) for buf in datagram)
+            try:
+                if scatter:
+                    lengthSend = socket_video.sendmsg(datagram, (), 0, status)
+                else:
+                    lengthSend = socket_video.sendto(b"".join(datagram), status)
+            except OSError:
+                lengthSend = -1
+                print("UDP Error: El frame no entra en el datagrama.")
+
+            if(lengthSend != length):
+                return -1
         return 0
 
 
     def receive_frame(self, socket_video_rec):
         '''
         Nombre: receive_frame
-        Descripcion: Funcion que va recibiendo frames, descomprimiendolos e incluyendolos en un
-                    heap.
+        Descripcion: Funcion que va recibiendo frames e incluyendolos, aun comprimidos, en el
+                    buffer en anillo, del que es el unico productor. Los frames fragmentados se
+                    reensamblan antes. La descompresion se hace en pop_frame, solo para el frame
+                    que se va a reproducir. Los datagramas se reciben en buffers del pool, y cada
+                    frame guardado en el anillo conserva el suyo hasta que pop_frame lo devuelve.
         Argumentos: socket_video_rec: Socket UDP con el que se recibe el frame.
         Retorno:
             None
         '''
-        #Inicializar las variables de control del modulo de video.
+        self.reset_reception()
+        self.set_receive_buffer(socket_video_rec)
+        pool = self.buffer_pool
+        buf = pool.acquire(self.RECV_SIZE)
+        view = memoryview(buf)
+
+        #Vaciar el socket. Podrian quedar restos de llamadas previas, 
+        #cuyos numeros de secuencia lian al contador de paquetes perdidos.
+        drain_socket(socket_video_rec, buf)
+
+        while True:
+            nbytes, _ = socket_video_rec.recvfrom_into(buf)
+            data = view[:nbytes]
+
+            if(data == b'END_RECEPTION'):
+                pool.release(buf)
+                return
+
+            if self.receive_datagram(data, buf):
+                #El frame se queda con el buffer de recepcion: recibimos en otro
+                buf = pool.acquire(self.RECV_SIZE)
+                view = memoryview(buf)
+
+    def receive_datagram(self, data, buf):
+        '''
+        Nombre: receive_datagram
+        Descripcion: Procesa un datagrama de video recibido: lo reensambla si es un fragmento y guarda
+                     en el anillo los frames completos. Solo lo llama el hilo de recepcion.
+        Argumentos: data: Datagrama, como memoryview sobre buf.
+                    buf: Buffer del pool en el que se ha recibido.
+        Retorno:
+            True si el anillo se queda con buf (hay que recibir en otro), False si se puede reutilizar.
+        '''
+        #Si es un fragmento, esperamos a tener el frame completo. El reensamblador copia
+        #cada trozo a su sitio en el buffer del frame, asi que buf se puede reutilizar.
+        #Los datagramas de paridad (FEC) tambien van al reensamblador, que recupera con ellos
+        #los fragmentos perdidos antes de que el frame cuente como perdido.
+        if is_fragment(data):
+            data = self.reassembler.add(data)
+            if data is None:
+                return False
+
+        if not self.store_frame(data):
+            #No ha entrado en el buffer: si se reensamblo, su buffer vuelve al pool
+            if data.obj is not buf:
+                self.buffer_pool.release(data.obj)
+            return False
+        return data.obj is buf
+
+    def reset_reception(self):
+        '''
+        Nombre: reset_reception
+        Descripcion: Inicializa las variables de control del modulo de video al empezar a recibir.
+        '''
         self.buffer_num = -1
         self.timemax = -1
         self.packets_lost = [0, 0, 0, 0]
@@ -99,56 +572,112 @@ class VideoBuffer():
         self.time_last_check_res = time.time()
         self.time_last_sent_report = time.time()
         self.last_timestamp = 0
+        self.reassembler.clear()
+        self.recovered_checked = 0
+        self.nack_detected.clear()
+        self.nack_requested = set()
+        self.time_last_nack = time.time()
+        self.nacks_sent = 0
+        self.nack_recovered = 0
+        self.last_decoded = (-1, None)
+        self.frames_decoded = 0
+        self.decodes_saved = 0
+        self.late_arrivals = 0
+        self.jitter_estimator.reset()
+        self.delay_estimator.reset()
+        if self.rate_controller is not None:
+            self.rate_controller.reset()
+            self.target_bitrate = self.rate_controller.bitrate
+        self.time_last_check_rate = time.time()
+        self.target_depth = self.config.BUFFER_THRESHOLD
+        self.playout_rate = 1.0
 
-        #Vaciar el socket. Podrian quedar restos de llamadas previas, 
-        #cuyos numeros de secuencia lian al contador de paquetes perdidos.
-        socket_video_rec.setblocking(0)
-        try:
-            while socket_video_rec.recvfrom(65535):
-                pass
-        except OSError:
-            #No queda nada que vaciar
-            pass
-        socket_video_rec.setblocking(1)
+    def store_frame(self, data):
+        '''
+        Nombre: store_frame
+        Descripcion: Lee la cabecera de un frame completo y lo inserta, aun comprimido, en el buffer en anillo.
+                     Solo lo llama el hilo de recepcion.
+        Argumentos: data: Mensaje con la cabecera y el frame comprimido, como memoryview.
+        Retorno:
+            True si el frame se ha guardado en el anillo (y con el, la memoria de data), False si no.
+        '''
+        if len(self.buffer_ring) >= self.config.BUFFER_SIZE:
+            return False
 
-        while True:
-            data, _ = socket_video_rec.recvfrom(65535)
+        parsed = split_frame(data)
+        if parsed is None:
+            return False
+        header,encimg = parsed
+        timestamp = header[1]
 
-            if(data == b'END_RECEPTION'):
-                return
+        #Frame delta: el directorio de tiles pasa a la cabecera y en el buffer queda solo el JPEG de los tiles
+        if header[4] & VIDEO_FLAG_DELTA:
+            parsed = parse_tile_directory(encimg)
+            if parsed is None:
+                print("Error en el datagrama: directorio de tiles invalido.")
+                return False
+            header.append(parsed[0])
+            encimg = encimg[parsed[1]:]
+        incoming_fps = header[3]
+
+        #Un frame reenviado tras un NACK llega con el retraso del reenvio: no cuenta para el jitter
+        num = header[0]
+        retransmitted = num in self.nack_requested
+
+        #Actualizamos el jitter y, con el, el retardo maximo de reproduccion, y la tendencia del retardo
+        if not retransmitted:
+            arrival = time.time()
+            self.jitter_estimator.update(timestamp, arrival)
+            self.update_playout_deadline(incoming_fps)
+            self.delay_estimator.update(timestamp, arrival, len(data))
 
-            with self.buffer_lock:
-                video_length = len(self.buffer_heap)
-
-            if(data != None and video_length < self.config.BUFFER_SIZE):
-                header,decimg = decompress(data)
-                timestamp = float(header[1])
-                incoming_fps = int(header[3])
-
-                #Calculo del retardo fijo maximo
-                if(self.timemax == -1):
-                    #Retardo de red
-                    network_delay_estimate = time.time() - timestamp
-                    #Retardo que tendra lugar a causa de la espera inicial del buffer
-                    buffer_threshold_delay_estimate = self.config.BUFFER_THRESHOLD/incoming_fps
-                    #Tiempo maximo de retardo que permitiremos
-                    self.timemax = network_delay_estimate + buffer_threshold_delay_estimate + self.config.FIXED_DELAY_THRESHOLD
-
-                #Eliminamos los elementos anteriores al ultimo extraido
-                with self.buffer_lock:
-                    if((self.buffer_num < int(header[0]))):
-                        heapq.heappush(self.buffer_heap, (int(header[0]), header, decimg))
-                    #Levantamos el buffer cuando haya un poco de cantidad
-                    if(len(self.buffer_heap) > self.config.BUFFER_THRESHOLD):
-                        self.buffer_block = False
+        #Insertamos en su casilla. Los anteriores al ultimo extraido y los repetidos se descartan
+        tail = self.buffer_ring.tail
+        stored = self.buffer_ring.push(num, header, encimg)
+        if not stored:
+            self.late_arrivals += 1
+        elif retransmitted:
+            self.nack_recovered += 1
+        elif self.using_nack and self.config.NACK and tail != -1 and num > tail:
+            #Se han saltado numeros de orden: se pediran desde el hilo de reproduccion
+            self.nack_detected.extend(range(max(tail, num - self.NACK_BATCH), num))
+        #Levantamos el buffer cuando haya un poco de cantidad
+        if(len(self.buffer_ring) > self.config.BUFFER_THRESHOLD):
+            self.buffer_block = False
+        return stored
+
+    def set_receive_buffer(self, socket_video_rec):
+        '''
+        Nombre: set_receive_buffer
+        Descripcion: Ajusta el buffer del socket (SO_RCVBUF) para que quepan BUFFER_THRESHOLD frames
+                     al ritmo de RECV_BITRATE bits por segundo y RECV_FPS frames por segundo. Asi el
+                     sistema no tira datagramas si el hilo de recepcion tarda en volver a leer.
+        Argumentos: socket_video_rec: Socket UDP con el que se recibe el video.
+        '''
+        size = int(self.config.RECV_BITRATE / 8 * self.config.BUFFER_THRESHOLD / max(1, self.config.RECV_FPS))
+        size = max(size, self.RECV_SIZE)
+        try:
+            if socket_video_rec.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= size:
+                return #Ya es suficiente: no lo reducimos
+            socket_video_rec.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+            #Linux devuelve el doble de lo pedido (incluye su contabilidad interna)
+            granted = socket_video_rec.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        except OSError as e:
+            print("Error ajustando el buffer de recepcion: " + str(e))
+            return
+        if granted < size:
+            print("Advertencia: el sistema limita el buffer de recepcion de video a " + str(granted) +
+                  " bytes (se pidieron " + str(size) + "). Se puede subir con net.core.rmem_max.")
 
     def pop_frame(self, quality, fps, resolution, packets_lost_total, min_fps=20, max_fps=40):
         '''
         Nombre: pop_frame
         Descripcion: Extrae un elemento del buffer. Cada elemento es una tripla que
-                    contiene el numero de frame, el header y el frame. Ajusta
+                    contiene el numero de frame, el header y el frame comprimido, que
+                    se descomprime aqui (o en el pool de DECODE_WORKERS hilos, que va
+                    descomprimiendo por adelantado los siguientes). Es el unico consumidor del anillo, por lo que ni
+                    el QoS ni el envio de reportes bloquean al hilo de recepcion. Ajusta
                     la calidad del video dependiendo de los frames perdidos.
-                    heap.
         Argumentos: min_fps : Valor minimo de fps que el QoS puede ajustar.
                     max_fps : Valor maximo de fps que el QoS puede ajustar.
 
@@ -160,120 +689,329 @@ class VideoBuffer():
         Retorno:
             - Si hay elementos: se devuelven 3 elementos. El primero es el numero
             de frame, el segundo elemento es el header y el último el propio frame descomprimido.
-            - Si el buffer esta bloqueado se devuelven 3 elementos: -1, una lista vacia
-            y un numpy array vacio.
+            - Si el buffer esta bloqueado o el frame no se puede descomprimir se devuelven
+            3 elementos: -1, una lista vacia y un numpy array vacio.
         '''
         #El buffer debe estar desbloqueado, es decir, deben haber llegado suficientes elementos para poder ir extrayendo.
         if(not self.buffer_block):
-            with self.buffer_lock:
-
-                #Almacenamos el instante actual
-                time_epoch = time.time()
-
-                #Guardamos los fps a los que se envio el frame que vamos a leer
-                #buffer[0] -> paquete actual
-                #campo 1 -> Header
-                #campo 3 del header -> FPS
-                fps_entrante = int(self.buffer_heap[0][1][3])
-                if fps_entrante <= 0:
-                    fps_entrante = 1
-
-                #Si el paquete que toca sacar esta muy retrasado, lo descartamos y sacamos otro
-                #buffer[0] -> paquete que toca sacar
-                #campo 1 -> Header
-                #campo 1 del header -> timestamp
-                #Si solo queda un paquete no lo hacemos dado que no hay mas remedio que usar ese
-                while len(self.buffer_heap) > 1 and (time_epoch - float(self.buffer_heap[0][1][1]) > self.timemax):
-                    heapq.heappop(self.buffer_heap) #Extraccion del paquete descartado
-
-                #Añadimos el numero de paquetes perdidos
-                if(self.buffer_num != -1 ):
-                    #Paquetes perdidos desde el ultimo que se saco (self.buffer_num)
-                    packets_lost_now = self.buffer_heap[0][0] - self.buffer_num -1
-                    if(packets_lost_now < 0):
-                        packets_lost_now = 0
-                    #Se agregan a los 3 contadores (uno para cada parametro de calidad)
-                    self.packets_lost[0] += packets_lost_now
-                    self.packets_lost[1] += packets_lost_now
-                    self.packets_lost[2] += packets_lost_now
-                    self.packets_lost[3] += packets_lost_now
-                    #Se agregan al conteo total
-                    packets_lost_total[0] += packets_lost_now
-
-                #V1: Calculamos fraccion de perdidas segun reporte
-                report_fraction = self.last_loss_per_second / fps[0]
-                weigth = self.config.REPORT_WEIGHT
-
-                #Ajustamos la calidad de compresión cada QUALITY_REFRESH
-                if(time_epoch - self.time_last_check_qual > self.config.QUALITY_REFRESH):
-
-                    quality_fraction = self.packets_lost[0]/(self.config.QUALITY_REFRESH * fps_entrante)
-                    if(report_fraction != 0):
-                        quality_fraction = quality_fraction * (1-weigth) + report_fraction * weigth
-
-                    if(quality_fraction < self.MEDIUM_LOST):
-                        quality[0] = 75
-                    elif(quality_fraction < self.WORST_LOST):
-                        quality[0] = 50
-                    else:
-                        quality[0] = 25
-
-                    self.packets_lost[0] = 0
-                    self.time_last_check_qual = time_epoch
-
-                #Ajustamos los fps cada FPS_REFRESH
-                if(time_epoch - self.time_last_check_fps > self.config.FPS_REFRESH):
-
-                    fps_fraction = self.packets_lost[1]/(self.config.FPS_REFRESH * fps_entrante)
-                    if(report_fraction != 0):
-                        fps_fraction = fps_fraction * (1-weigth) + report_fraction * weigth
-
-                    if(fps_fraction < self.MEDIUM_LOST):
-                        fps[0] = max_fps
-                    elif(fps_fraction < self.WORST_LOST):
-                        fps[0] = (max_fps + min_fps) // 2
-                    else:
-                        fps[0] = min_fps
-
-                    self.packets_lost[1] = 0
-                    self.time_last_check_fps = time_epoch
-
-                #Ajustamos la resolucion cada RESOLUTION_REFRESH
-                if(time_epoch - self.time_last_check_res > self.config.RESOLUTION_REFRESH):
-
-                    resolution_fraction = self.packets_lost[2]/(self.config.RESOLUTION_REFRESH * fps_entrante)
-                    if(report_fraction != 0):
-                        resolution_fraction = resolution_fraction * (1-weigth) + report_fraction * weigth
-
-                    if(resolution_fraction < self.MEDIUM_LOST):
-                        resolution[0] = "640x480"
-                    elif(resolution_fraction < self.WORST_LOST):
-                        resolution[0] = "320x240"
-                    else:
-                        resolution[0] = "160x120"
-
-                    self.packets_lost[2] = 0
-                    self.time_last_check_res = time_epoch
-
-                #Mandar reportes de perdidas a los que usen V1
-                if(self.using_v1):
-                    if(time_epoch - self.time_last_sent_report > self.config.REPORT_REFRESH):
-                        self.control.send_loss_report(self.packets_lost[3])
-                        self.packets_lost[3] = 0
-                        self.time_last_sent_report = time_epoch
-
-                #Actualizamos el buffer num al numero del header del primer elemento
-                self.buffer_num = self.buffer_heap[0][0]
-
-                #Evitamos vaciado completo en caso de que no se este recibiendo a suficiente ritmo
-                if len(self.buffer_heap) == 1:
-                    return self.buffer_heap[0]
-
-                return heapq.heappop(self.buffer_heap)
+            #Almacenamos el instante actual
+            time_epoch = time.time()
+
+            #Paquete que toca sacar
+            first = self.buffer_ring.peek()
+            if first is None:
+                return -1, list(), np.array([])
+
+            #Guardamos los fps a los que se envio el frame que vamos a leer
+            #campo 1 -> Header
+            #campo 3 del header -> FPS
+            fps_entrante = first[1][3]
+            if fps_entrante <= 0:
+                fps_entrante = 1
+
+            #Ajustamos la velocidad de reproduccion segun lo lleno que este el buffer
+            depth = len(self.buffer_ring)
+            if depth > 2 * self.target_depth:
+                self.playout_rate = 1 + self.config.PLAYOUT_RATE_STEP
+            elif depth < self.target_depth:
+                self.playout_rate = 1 - self.config.PLAYOUT_RATE_STEP
+            else:
+                self.playout_rate = 1.0
+
+            #Si el paquete que toca sacar esta muy retrasado, lo descartamos y sacamos otro
+            #campo 1 -> Header
+            #campo 1 del header -> timestamp
+            #Si solo queda un paquete no lo hacemos dado que no hay mas remedio que usar ese
+            while len(self.buffer_ring) > 1 and (time_epoch - first[1][1] > self.timemax):
+                discarded = self.buffer_ring.pop() #Extraccion del paquete descartado
+                if discarded[1][4] & VIDEO_FLAG_KEY:
+                    #Los frames delta siguientes se reconstruyen sobre este, asi que hay que descomprimirlo
+                    self.decode_entry(discarded)
+                else:
+                    self.decodes_saved += 1 #Al no haberlo descomprimido al recibirlo, nos ahorramos hacerlo
+                self.release_entry(discarded)
+                first = self.buffer_ring.peek()
+                if first is None:
+                    return -1, list(), np.array([])
+
+            #Añadimos el numero de paquetes perdidos
+            if(self.buffer_num != -1 ):
+                #Paquetes perdidos desde el ultimo que se saco (self.buffer_num)
+                packets_lost_now = first[0] - self.buffer_num -1
+                if(packets_lost_now < 0):
+                    packets_lost_now = 0
+                #Se agregan a los 3 contadores (uno para cada parametro de calidad)
+                self.packets_lost[0] += packets_lost_now
+                self.packets_lost[1] += packets_lost_now
+                self.packets_lost[2] += packets_lost_now
+                self.packets_lost[3] += packets_lost_now
+                #Se agregan al conteo total
+                packets_lost_total[0] += packets_lost_now
+
+            #V1: Calculamos fraccion de perdidas segun reporte
+            report_fraction = self.last_loss_per_second / fps[0]
+            weigth = self.config.REPORT_WEIGHT
+
+            #Ajustamos la calidad de compresión cada QUALITY_REFRESH
+            if(time_epoch - self.time_last_check_qual > self.config.QUALITY_REFRESH):
+
+                quality_fraction = self.packets_lost[0]/(self.config.QUALITY_REFRESH * fps_entrante)
+                if(report_fraction != 0):
+                    quality_fraction = quality_fraction * (1-weigth) + report_fraction * weigth
+
+                if(self.rate_controller is not None):
+                    #La calidad la fija el controlador de tasa
+                    pass
+                elif(quality_fraction < self.MEDIUM_LOST):
+                    quality[0] = 75
+                elif(quality_fraction < self.WORST_LOST):
+                    quality[0] = 50
+                else:
+                    quality[0] = 25
+
+                #FEC: la proteccion se ajusta con las perdidas antes de recuperar (perdidos + recuperados)
+                if(self.using_fec):
+                    recovered = self.reassembler.recovered
+                    raw_fraction = (self.packets_lost[0] + recovered - self.recovered_checked)/(self.config.QUALITY_REFRESH * fps_entrante)
+                    self.recovered_checked = recovered
+                    if(raw_fraction >= self.MEDIUM_LOST):
+                        self.fec_ratio = min(self.config.FEC_MAX_RATIO, self.fec_ratio * 2)
+                    elif(raw_fraction < self.MEDIUM_LOST / 2):
+                        self.fec_ratio = max(self.config.FEC_MIN_RATIO, self.fec_ratio / 2)
+
+                self.packets_lost[0] = 0
+                self.time_last_check_qual = time_epoch
+
+            #Con controlador de tasa, la tasa objetivo fija a la vez calidad, fps y resolucion cada RATE_REFRESH
+            if(self.rate_controller is not None):
+                if(time_epoch - self.time_last_check_rate > self.config.RATE_REFRESH):
+                    self.update_rate(time_epoch, fps_entrante, quality, fps, resolution, min_fps, max_fps)
+
+            #Ajustamos los fps cada FPS_REFRESH
+            elif(time_epoch - self.time_last_check_fps > self.config.FPS_REFRESH):
+
+                fps_fraction = self.packets_lost[1]/(self.config.FPS_REFRESH * fps_entrante)
+                if(report_fraction != 0):
+                    fps_fraction = fps_fraction * (1-weigth) + report_fraction * weigth
+
+                if(fps_fraction < self.MEDIUM_LOST):
+                    fps[0] = max_fps
+                elif(fps_fraction < self.WORST_LOST):
+                    fps[0] = (max_fps + min_fps) // 2
+                else:
+                    fps[0] = min_fps
+
+                self.packets_lost[1] = 0
+                self.time_last_check_fps = time_epoch
+
+            #Ajustamos la resolucion cada RESOLUTION_REFRESH
+            if(self.rate_controller is None and time_epoch - self.time_last_check_res > self.config.RESOLUTION_REFRESH):
+
+                resolution_fraction = self.packets_lost[2]/(self.config.RESOLUTION_REFRESH * fps_entrante)
+                if(report_fraction != 0):
+                    resolution_fraction = resolution_fraction * (1-weigth) + report_fraction * weigth
+
+                if(resolution_fraction < self.MEDIUM_LOST):
+                    resolution[0] = "640x480"
+                elif(self.using_fec and self.fec_ratio < self.config.FEC_MAX_RATIO):
+                    #Subir la proteccion sale mas barato que bajar la resolucion: se mantiene mientras se pueda
+                    pass
+                elif(resolution_fraction < self.WORST_LOST):
+                    resolution[0] = "320x240"
+                else:
+                    resolution[0] = "160x120"
+
+                self.packets_lost[2] = 0
+                self.time_last_check_res = time_epoch
+
+            #Mandar reportes de perdidas a los que usen V1
+            if(self.using_v1):
+                if(time_epoch - self.time_last_sent_report > self.config.REPORT_REFRESH):
+                    self.control.send_loss_report(self.packets_lost[3])
+                    self.packets_lost[3] = 0
+                    self.time_last_sent_report = time_epoch
+
+            #Pedir los frames perdidos mientras aun puedan reproducirse
+            if(self.using_nack and self.config.NACK):
+                if(time_epoch - self.time_last_nack > self.config.NACK_INTERVAL):
+                    self.send_nacks(first[0])
+                    self.time_last_nack = time_epoch
+
+            #Actualizamos el buffer num al numero del header del primer elemento
+            self.buffer_num = first[0]
+
+            #Evitamos vaciado completo en caso de que no se este recibiendo a suficiente ritmo
+            keep = len(self.buffer_ring) == 1
+            if keep:
+                entry = first
+            else:
+                entry = self.buffer_ring.pop()
 
         else:
             return -1, list(), np.array([])
 
+        #Descomprimimos solo el frame que se va a mostrar. Si se repite el anterior, reutilizamos el resultado.
+        num, header, encimg = entry
+        if self.last_decoded[0] == num:
+            self.decodes_saved += 1
+            decimg = self.last_decoded[1]
+        else:
+            decimg = self.decode_entry(entry)
+        #Si ha salido del anillo, ya no se va a leer su buffer
+        if not keep:
+            self.release_entry(entry)
+        if decimg is None:
+            return -1, list(), np.array([])
+        self.last_decoded = (num, decimg)
+        return num, header, decimg
+
+    def update_rate(self, time_epoch, fps_entrante, quality, fps, resolution, min_fps, max_fps):
+        '''
+        Nombre: update_rate
+        Descripcion: Recalcula la tasa objetivo con el controlador de tasa y la traduce a calidad, fps y resolucion.
+                     La tasa que se calcula corresponde al video entrante: si el otro extremo acepta RATE se le
+                     envia, y el video saliente usa la que nos envie el. Si no, como el QoS por escalones, se
+                     supone que el camino es simetrico y se usa la propia. Solo lo llama el hilo de reproduccion.
+        Argumentos: time_epoch: Instante actual.
+                    fps_entrante: FPS del video entrante.
+                    min_fps: Valor minimo de fps que se puede ajustar.
+                    max_fps: Valor maximo de fps que se puede ajustar.
+
+                    Datos que actualiza la funcion (envueltos en una lista, como en pop_frame):
+                    quality, fps, resolution: Calidad, FPS y resolucion del video saliente.
+        '''
+        #Los contadores de fps y resolucion del QoS por escalones sirven aqui para las perdidas desde la ultima vez
+        rate_fraction = self.packets_lost[1]/((time_epoch - self.time_last_check_rate) * fps_entrante)
+        self.packets_lost[1] = 0
+        self.packets_lost[2] = 0
+        self.time_last_check_rate = time_epoch
+
+        target = self.rate_controller.update(time_epoch, self.delay_estimator, rate_fraction)
+        if(self.using_rate):
+            self.control.send_rate_report(target)
+            with self.report_lock:
+                #Si el otro extremo deja de informar, volvemos a la estimacion propia
+                if(time_epoch - self.time_peer_rate < 4 * self.config.RATE_REFRESH):
+                    target = self.peer_bitrate
+
+        self.target_bitrate = target
+        quality[0], fps[0], resolution[0] = bitrate_to_settings(target, min_fps, max_fps)
+
+    def send_nacks(self, head):
+        '''
+        Nombre: send_nacks
+        Descripcion: Pide en un unico NACK los frames de los huecos detectados que siguen faltando y que
+                     aun no se han reproducido. Solo lo llama el hilo de reproduccion.
+        Argumentos: head: Numero del frame que se va a reproducir. Los anteriores ya no se piden.
+        '''
+        #Olvidamos los pedidos que ya no se van a reproducir
+        requested = self.nack_requested
+        for num in [n for n in requested if n < head]:
+            requested.discard(num)
+
+        nums = []
+        detected = self.nack_detected
+        while detected and len(nums) < self.NACK_BATCH:
+            num = detected.popleft()
+            if num > head and num not in requested and not self.buffer_ring.contains(num):
+                nums.append(num)
+        if not nums:
+            return
+
+        #Tiempo que puede tardar un frame desde su envio sin llegar tarde, en la escala del otro extremo
+        transit = self.jitter_estimator.transit
+        margin = self.timemax - (transit if transit is not None else 0)
+        if margin <= 0:
+            return
+        requested.update(nums)
+        if self.control.send_nack(nums, margin) == 0:
+            self.nacks_sent += len(nums)
+
+    def decode_entry(self, entry):
+        '''
+        Nombre: decode_entry
+        Descripcion: Descomprime un frame extraido del buffer, en el pool de DECODE_WORKERS hilos si
+                     lo hay, y reconstruye los frames delta sobre su frame clave.
+        Argumentos: entry: Tupla (numero de orden, header, frame comprimido).
+        Retorno:
+            El frame descomprimido, o None en caso de error.
+        '''
+        num, header, encimg = entry
+        if len(encimg) == 0:
+            #Frame delta sin tiles: no hay nada que descomprimir
+            return self.tile_decoder.reconstruct(header, None)
+
+        if self.config.DECODE_WORKERS > 0:
+            if self.decoder is None:
+                self.decoder = DecodePool(self.config.DECODE_WORKERS, self.decode_content)
+            decimg = self.decoder.take(num, header, encimg)
+            #Adelantamos la descompresion de los siguientes mientras se muestra este
+            upcoming = self.buffer_ring.upcoming(self.config.DECODE_WORKERS + 1)
+            self.decoder.prefetch([e for e in upcoming if len(e[2]) > 0])
+        else:
+            decimg = self.decode_content(header, encimg)
+        if decimg is None:
+            return None
+        self.frames_decoded += 1
+        return self.tile_decoder.reconstruct(header, decimg)
+
+    def decode_content(self, header, encimg):
+        '''
+        Nombre: decode_content
+        Descripcion: Descomprime un frame con el codec que indican los flags de su header. Si DECODE_MAX_WIDTH
+                     lo permite, descomprime a menor resolucion (los frames de TILES siempre enteros, porque
+                     se combinan con su frame clave). Puede ejecutarse en varios hilos a la vez.
+        Argumentos: header: Header del frame.
+                    encimg: Frame comprimido.
+        Retorno:
+            El frame descomprimido, o None en caso de error.
+        '''
+        codec_id = (header[4] & VIDEO_CODEC_MASK) >> VIDEO_CODEC_SHIFT
+        codec = self.codecs.get(codec_id)
+        if codec is None:
+            print("Frame con codec desconocido: " + str(codec_id))
+            return None
+        scale = 1
+        if self.decode_max_width > 0 and not header[4] & (VIDEO_FLAG_DELTA | VIDEO_FLAG_KEY):
+            scale = decode_scale(parse_resolution(header[2])[0], self.decode_max_width)
+        return decode(encimg, codec, scale)
+
+    def release_entry(self, entry):
+        '''
+        Nombre: release_entry
+        Descripcion: Devuelve al pool el buffer de un frame que ha salido del anillo, tras
+                     asegurarse de que no se esta descomprimiendo por adelantado.
+        Argumentos: entry: Tupla (numero de orden, header, frame comprimido).
+        '''
+        if self.decoder is not None:
+            self.decoder.discard(entry[0])
+        self.buffer_pool.release_view(entry[2])
+
+    def update_playout_deadline(self, incoming_fps):
+        '''
+        Nombre: update_playout_deadline
+        Descripcion: Recalcula el retardo maximo de reproduccion (timemax) y la profundidad objetivo
+                     del buffer a partir del jitter estimado. El retardo sube en cuanto crece el jitter
+                     y baja poco a poco, a medida que la reproduccion acelerada vacia el buffer.
+        Argumentos: incoming_fps: FPS a los que envia el otro extremo.
+        '''
+        if incoming_fps <= 0:
+            incoming_fps = 1
+        estimator = self.jitter_estimator
+        jitter_margin = self.config.JITTER_FACTOR * estimator.jitter
+
+        #Frames que hacen falta en el buffer para absorber el jitter actual
+        self.target_depth = min(self.config.BUFFER_THRESHOLD, max(1, math.ceil(jitter_margin * incoming_fps)))
+        target = estimator.transit + jitter_margin + self.target_depth/incoming_fps + self.config.FIXED_DELAY_THRESHOLD
+
+        if(self.timemax == -1):
+            #Al principio el buffer se llena hasta BUFFER_THRESHOLD antes de reproducir
+            self.timemax = estimator.transit + self.config.BUFFER_THRESHOLD/incoming_fps + self.config.FIXED_DELAY_THRESHOLD
+        elif(target > self.timemax):
+            self.timemax = target
+        else:
+            self.timemax += (target - self.timemax) * self.DEADLINE_DECAY
+
     def set_loss_report(self, lost, timestamp):
         '''
         Nombre: set_lost_report
@@ -288,6 +1026,17 @@ class VideoBuffer():
                 self.last_loss_per_second = lost/(timestamp-self.last_timestamp)
             self.last_timestamp = timestamp
 
+    def set_rate_report(self, bitrate):
+        '''
+        Nombre: set_rate_report
+        Descripcion: Ajusta la tasa objetivo que el otro extremo pide para nuestro video.
+        Argumentos:
+            bitrate: Tasa en bits por segundo segun el reporte.
+        '''
+        with self.report_lock:
+            self.peer_bitrate = bitrate
+            self.time_peer_rate = time.time()
+
     def set_control(self, control):
         '''
         Nombre: set_control
@@ -297,6 +1046,15 @@ class VideoBuffer():
         '''
         self.control = control
 
+    def set_group(self, group):
+        '''
+        Nombre: set_group
+        Descripcion: Ajusta la llamada de grupo a la que se envian los frames sin destino.
+        Argumentos:
+            group: Objeto GroupCall.
+        '''
+        self.group = group
+
     def set_using_v1(self):
         '''
         Nombre: set_using_v1
@@ -304,62 +1062,187 @@ class VideoBuffer():
         '''
         self.using_v1 = True
 
+    def set_peer_protocols(self, protocols):
+        '''
+        Nombre: set_peer_protocols
+        Descripcion: Ajusta las extensiones que se usan segun los protocolos que soporta el otro cliente.
+        Argumentos:
+            protocols: Lista de protocolos del otro cliente, tal y como la devuelve el descubrimiento.
+        '''
+        if "V1" in protocols:
+            self.set_using_v1()
+        self.using_frag = "FRAG" in protocols
+        self.prefix_size = 0
+        self.using_binhdr = "BINHDR" in protocols
+        self.using_tiles = bool(self.config.TILE_DELTA) and self.using_binhdr and "TILES" in protocols
+        self.using_fec = bool(self.config.FEC) and self.using_frag and "FEC" in protocols
+        self.using_nack = "NACK" in protocols
+        self.quality_selector.reset()
+        self.using_rate = self.rate_controller is not None and "RATE" in protocols
+        self.frames_resent = 0
+        self.resend_late = 0
+        self.fec_ratio = self.config.FEC_MIN_RATIO
+        self.tile_encoder.reset()
+        self.codec = choose_codec(self.codecs, self.config.CODEC, protocols, self.using_binhdr)
+
     def empty_buffer(self):
         '''
         Nombre: empty_buffer
         Descripcion: Vacia el buffer.
         '''
-        self.buffer_heap = []
+        decodes_saved = self.decodes_saved + self.late_arrivals
+        if self.frames_decoded + decodes_saved > 0:
+            print("Frames descomprimidos: " + str(self.frames_decoded) + ", descompresiones ahorradas: " + str(decodes_saved))
+        if self.reassembler.recovered > 0:
+            print("Frames recuperados con FEC: " + str(self.reassembler.recovered))
+        if self.nacks_sent > 0:
+            print("Frames pedidos con NACK: " + str(self.nacks_sent) + ", recibidos a tiempo: " + str(self.nack_recovered))
+        if self.frames_resent + self.resend_late > 0:
+            print("Frames reenviados: " + str(self.frames_resent) + ", pedidos demasiado tarde: " + str(self.resend_late))
+        if self.quality_selector.frames > 0:
+            print("Frames comprimidos con presupuesto: " + str(self.quality_selector.frames) +
+                  ", recompresiones: " + str(self.quality_selector.reencodes) + ", saltados: " + str(self.quality_selector.skipped))
+        if self.tile_decoder.missing_key > 0:
+            print("Frames delta sin frame clave: " + str(self.tile_decoder.missing_key))
+        self.tile_decoder.reset()
+        self.buffer_ring.clear()
+        if self.decoder is not None:
+            self.decoder.clear()
         self.buffer_block = True
+        self.playout_rate = 1.0
+        self.last_decoded = (-1, None)
         self.last_loss_per_second = 0
         self.using_v1 = False
+        self.using_frag = False
+        self.using_binhdr = False
+        self.using_tiles = False
+        self.using_fec = False
+        self.using_nack = False
+        self.using_rate = False
+        with self.report_lock:
+            self.time_peer_rate = -1
+        with self.history_lock:
+            self.sent_history = {}
+        self.codec = self.codecs[CODEC_JPEG]
+        self.frame_id = 0
 
-def compress(frame,quality):
+def parse_resolution(resolution):
+    '''
+    Nombre: parse_resolution
+    Descripcion: Convierte una resolucion en cadena a enteros.
+    Argumentos: resolution: Resolucion en anchura x altura, por ejemplo "640x480".
+    Retorno:
+        Tupla (ancho, alto).
+    '''
+    width, height = resolution.split('x')
+    return int(width), int(height)
+
+def resize_to(frame, resolution, interpolation):
+    '''
+    Nombre: resize_to
+    Descripcion: Reescala un frame a la resolucion indicada, solo si no la tiene ya.
+    Argumentos: frame: Frame a reescalar.
+                resolution: Resolucion en anchura x altura, por ejemplo "640x480".
+                interpolation: Filtro de OpenCV (cv2.INTER_AREA para reducir, cv2.INTER_LINEAR para ampliar...).
+    Retorno:
+        El frame con la resolucion pedida (el mismo objeto si ya la tenia).
+    '''
+    size = parse_resolution(resolution)
+    if frame.shape[1] == size[0] and frame.shape[0] == size[1]:
+        return frame
+    return cv2.resize(frame, size, interpolation=interpolation)
+
+def drain_socket(socket_video_rec, buf):
+    '''
+    Nombre: drain_socket
+    Descripcion: Descarta los datagramas que haya pendientes en un socket, sin bloquear.
+    Argumentos: socket_video_rec: Socket UDP a vaciar.
+                buf: Buffer en el que recibir lo que se descarta.
+    '''
+    socket_video_rec.setblocking(0)
+    try:
+        while socket_video_rec.recv_into(buf):
+            pass
+    except OSError:
+        #No queda nada que vaciar
+        pass
+    socket_video_rec.setblocking(1)
+
+def compress(frame,quality,codec=None):
     '''
     Nombre: compress
     Descripcion: Comprime un frame.
     Argumentos: frame: Frame que se va a comprimir.
                 quality: String que indica la calidad a la que se va a comprimir.
+                codec: Codec con el que se comprime (ver codec.py), None para el JPEG de OpenCV.
     Retorno:
-        - Si no hay errores se devuelve el frame comprimido.
+        - Si no hay errores se devuelve el frame comprimido, como memoryview de bytes sobre el
+          buffer que devuelve el codec (sin copiarlo).
         - Si hay error al comprimir se devuelve None.
     '''
-    # Compresión JPG al 50% de resolución (se puede variar)
-    encode_param = [cv2.IMWRITE_JPEG_QUALITY,quality]
-    result,encimg = cv2.imencode('.jpg',frame,encode_param)
+    if codec is None:
+        codec = DEFAULT_CODEC
+    encimg = codec.encode(frame, quality)
 
-    if(result == False):
+    if encimg is None:
         print('Error al codificar imagen')
         return None
 
-    return encimg.tostring()
+    return byte_view(encimg)
 
 
+def split_frame(encimg):
+    '''
+    Nombre: split_frame
+    Descripcion: Separa la cabecera del frame comprimido, sin descomprimirlo.
+    Argumentos: encimg: Mensaje con la cabecera de texto (V0) o binaria y el frame comprimido.
+    Retorno:
+        - Si no hay errores se devuelve el header del mensaje y el frame comprimido (como memoryview).
+          El header es la lista [num, ts, resolucion, fps, flags] (ver packet.py).
+        - Si la cabecera es invalida se devuelve None.
+    '''
+    parsed = parse_header(encimg)
+    if parsed is None:
+        print("Error en el datagrama.")
+        return None
+
+    header, offset = parsed
+    return header, memoryview(encimg)[offset:]
+
+def decode(content, codec=None, scale=1):
+    '''
+    Nombre: decode
+    Descripcion: Descomprime un frame sin cabecera.
+    Argumentos: content: Frame comprimido (bytes o memoryview).
+                codec: Codec con el que se comprimio (ver codec.py), None para el JPEG de OpenCV.
+                scale: Factor de reduccion con el que se descomprime (ver codec.DECODE_SCALES).
+    Retorno:
+        - Si no hay errores se devuelve el frame descomprimido.
+        - Si hay error al descomprimir se devuelve None.
+    '''
+    if codec is None:
+        codec = DEFAULT_CODEC
+    decimg = codec.decode(content, scale)
+    if decimg is None:
+        print("Error al decodificar imagen")
+    return decimg
+
 def decompress(encimg):
     '''
     Nombre: decompress
     Descripcion: Descomprime un frame.
-    Argumentos: frame: Frame que se va a descomprimir.
+    Argumentos: frame: Frame que se va a descomprimir, con la cabecera de texto (V0) o binaria.
     Retorno:
         - Si no hay errores se devuelve el header del mensaje y el frame descomprimido.
         - Si hay error al comprimir se devuelve None.
     '''
-    count = 0
-    ENCODED_HASHTAG = 35 #Codigo de la almohadilla (Si no no funciona)
-    for i in range(0, len(encimg)):
-        if encimg[i] == ENCODED_HASHTAG:
-            count +=1
-            if count == 4:
-                break
-
-    if(i == len(encimg)):
-        print("Error en el datagrama.")
+    parsed = split_frame(encimg)
+    if parsed is None:
         return None
 
-    header = encimg[:i]
-    content = encimg[i+1:]
-    header = header.decode()
-    header = header.split("#")
-    decimg = cv2.imdecode(np.frombuffer(content,np.uint8), 1)
+    header, content = parsed
+    decimg = decode(content)
+    if decimg is None:
+        return None
 
     return header, decimg